@@ -0,0 +1,114 @@
+"""Benchmark: latency p50/p99 theo từng lệnh trên AsyncBusBookingServer
+
+So sánh 2 cách dispatch (chạy lần lượt trên cùng dữ liệu copy):
+- executor: mọi lệnh qua run_in_executor (ASYNC_INLINE_COMMANDS=false, cách cũ)
+- inline:   lệnh CPU-only chạy thẳng trên event loop, lệnh blocking qua executor riêng
+
+Ví dụ:
+    python benchmarks/async_command_latency.py --clients 16 --duration 8
+"""
+
+import argparse
+import shutil
+import os
+import threading
+import time
+from collections import defaultdict
+
+from bench_utils import copy_server_dir, start_server, stop_server, connect, request, percentile
+
+
+def build_workload(sock, session: str, seat_id: str) -> list:
+    """Chuỗi request lặp lại của 1 client (dữ liệu lấy từ chính server)"""
+    cities = request(sock, {'command': 'GET_CITIES', 'session_id': session})
+    routes = request(sock, {'command': 'SEARCH_ROUTES', 'session_id': session})['routes']
+    route_id = routes[0]['id']
+    date = request(sock, {'command': 'GET_DATES', 'route_id': route_id, 'session_id': session})['dates'][0]
+    trips = request(sock, {'command': 'SEARCH_TRIPS', 'route_id': route_id, 'date': date,
+                           'session_id': session})['trips']
+    trip_id = trips[0]['id']
+    phone = '0955673201'
+    listed = request(sock, {'command': 'LIST_BOOKINGS', 'phone': phone, 'session_id': session})
+    booking_id = listed['bookings'][0]['id'] if listed.get('bookings') else 'BK00000000'
+
+    return [
+        {'command': 'GET_CITIES'},
+        {'command': 'SEARCH_ROUTES', 'from_city': cities['from_cities'][0]},
+        {'command': 'GET_DATES', 'route_id': route_id},
+        {'command': 'SEARCH_TRIPS', 'route_id': route_id, 'date': date},
+        {'command': 'GET_TRIP_INFO', 'trip_id': trip_id},
+        {'command': 'GET_SEATS', 'trip_id': trip_id},
+        {'command': 'SELECT_SEAT', 'trip_id': trip_id, 'seat_id': seat_id},
+        {'command': 'UNSELECT_SEAT', 'trip_id': trip_id, 'seat_id': seat_id},
+        {'command': 'GET_BOOKING', 'booking_id': booking_id},
+        {'command': 'LIST_BOOKINGS', 'phone': phone},
+    ]
+
+
+def client_worker(port: int, idx: int, duration: float, results: dict, lock: threading.Lock, errors: list):
+    session = f'bench-{idx}'
+    seat_id = f"T{1 + idx // 20}-{'A' if idx < 20 else 'B'}{idx % 20 + 1:02d}"
+    local = defaultdict(list)
+    try:
+        sock = connect(port)
+        workload = build_workload(sock, session, seat_id)
+        end = time.perf_counter() + duration
+        while time.perf_counter() < end:
+            for payload in workload:
+                t0 = time.perf_counter()
+                request(sock, dict(payload, session_id=session))
+                local[payload['command']].append(time.perf_counter() - t0)
+        sock.close()
+    except Exception as e:
+        errors.append(str(e))
+    with lock:
+        for command, samples in local.items():
+            results[command].extend(samples)
+
+
+def run(mode: str, port: int, clients: int, duration: float) -> dict:
+    server_dir = copy_server_dir()
+    proc = start_server('async', port, {'ASYNC_INLINE_COMMANDS': 'true' if mode == 'inline' else 'false'},
+                        server_dir=server_dir)
+    results, errors, lock = defaultdict(list), [], threading.Lock()
+    try:
+        threads = [threading.Thread(target=client_worker, args=(port, i, duration, results, lock, errors))
+                   for i in range(clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        stop_server(proc)
+        shutil.rmtree(os.path.dirname(server_dir), ignore_errors=True)
+    if errors:
+        print(f"[Bench] {mode}: {len(errors)} lỗi, ví dụ: {errors[0]}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=8.0)
+    parser.add_argument('--port', type=int, default=57655)
+    args = parser.parse_args()
+
+    before = run('executor', args.port, args.clients, args.duration)
+    after = run('inline', args.port + 10, args.clients, args.duration)
+
+    print(f"[Bench] clients={args.clients} duration={args.duration}s (latency ms, phía client)")
+    print(f"{'command':<15}{'executor p50':>14}{'p99':>9}{'inline p50':>13}{'p99':>9}{'req':>8}{'req':>8}")
+    for command in before:
+        b, a = before[command], after.get(command, [])
+        print(f"{command:<15}"
+              f"{percentile(b, 50) * 1000:>14.2f}{percentile(b, 99) * 1000:>9.2f}"
+              f"{percentile(a, 50) * 1000:>13.2f}{percentile(a, 99) * 1000:>9.2f}"
+              f"{len(b):>8}{len(a):>8}")
+    total_b = sum(len(v) for v in before.values())
+    total_a = sum(len(v) for v in after.values())
+    print(f"[Bench] Throughput: executor {total_b / args.duration:.0f} req/s, "
+          f"inline {total_a / args.duration:.0f} req/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Hàm dùng chung cho các benchmark: chạy server trong process con, gửi request framing, percentile"""
+
+import json
+import os
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_DIR = os.path.join(ROOT_DIR, 'server')
+
+SERVER_CODE = {
+    'threaded': "from server import BusBookingServer as S\nS(tcp_port={port}, udp_port={udp_port}).start()\n",
+    'async': ("import asyncio\nfrom async_server import AsyncBusBookingServer as S\n"
+              "asyncio.run(S(tcp_port={port}, udp_port={udp_port}).start())\n"),
+    # Số worker lấy từ env WORKER_PROCESSES
+    'multiprocess': ("from worker_processes import serve_multiprocess\n"
+                     "serve_multiprocess('tcp', tcp_port={port}, udp_port={udp_port})\n"),
+    # Số shard (= số front end) lấy từ env CLUSTER_LOCAL_SHARDS
+    'cluster': ("import os\nfrom cluster import serve_local_cluster\n"
+                "serve_local_cluster(int(os.environ['CLUSTER_LOCAL_SHARDS']), tcp_port={port}, udp_port={udp_port})\n"),
+}
+
+
+def raise_fd_limit():
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        return hard
+    except (ImportError, ValueError, OSError):
+        return None
+
+
+def copy_server_dir() -> str:
+    """Copy thư mục server sang thư mục tạm để benchmark ghi dữ liệu không đụng data thật"""
+    work_dir = tempfile.mkdtemp(prefix='bus-bench-')
+    target = os.path.join(work_dir, 'server')
+    shutil.copytree(SERVER_DIR, target, ignore=shutil.ignore_patterns('__pycache__', 'uploads'))
+    return target
+
+
+def start_server(variant: str, port: int, env_overrides: dict = None, server_dir: str = None, stdout=None):
+    """Chạy server trong process con, đợi đến khi cổng TCP nhận kết nối
+
+    Rate limit tắt mặc định (mỗi kết nối benchmark gửi nhanh hơn giới hạn của 1 người dùng);
+    bật lại qua env_overrides={'RATE_LIMIT_ENABLED': 'true'}.
+    stdout: file / subprocess.PIPE nhận log console của server (mặc định bỏ đi).
+    """
+    env = dict(os.environ, EMAIL_USERNAME='', EMAIL_PASSWORD='', RATE_LIMIT_ENABLED='false')
+    env.update(env_overrides or {})
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [ROOT_DIR, env.get('PYTHONPATH')]))
+    code = (
+        "import resource\n"
+        "soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)\n"
+        "resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))\n"
+    ) + SERVER_CODE[variant].format(port=port, udp_port=port + 1)
+    proc = subprocess.Popen([sys.executable, '-c', code], cwd=server_dir or SERVER_DIR, env=env,
+                            stdout=stdout or subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(300):
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return proc
+        except OSError:
+            if proc.poll() is not None:
+                break
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError('Server không khởi động được')
+
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def server_usage(pid: int) -> dict:
+    """RSS (MB) và số thread của server (chỉ Linux)"""
+    usage = {}
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    usage['rss_mb'] = int(line.split()[1]) / 1024
+                elif line.startswith('Threads:'):
+                    usage['threads'] = int(line.split()[1])
+    except OSError:
+        pass
+    return usage
+
+
+def connect(port: int, timeout: float = 30) -> socket.socket:
+    sock = socket.create_connection(('127.0.0.1', port), timeout=timeout)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+
+def recv_exact(sock, n):
+    data = b''
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise ConnectionError('Server đóng kết nối')
+        data += chunk
+    return data
+
+
+def request(sock, payload: dict) -> dict:
+    body = json.dumps(payload).encode('utf-8')
+    sock.sendall(struct.pack('!I', len(body)) + body)
+    length = struct.unpack('!I', recv_exact(sock, 4))[0]
+    return json.loads(recv_exact(sock, length))
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
@@ -0,0 +1,132 @@
+"""Benchmark: throughput đặt vé theo số shard của cluster (server/cluster.py)
+
+So sánh server 1 process (mode thread) với cluster cục bộ 1, 2, 4 shard (mỗi shard 1 front end)
+trên cùng dữ liệu copy. Tải sinh bởi nhiều process client, mỗi kết nối đặt vé trên nhóm chuyến riêng
+(không tranh ghế giữa các kết nối). Mỗi vé: GET_SEATS -> SELECT_SEAT -> BOOK_SEATS.
+
+Lưu ý: số liệu chỉ có ý nghĩa khi máy có ít nhất (2 x shard + client process) core.
+
+Ví dụ:
+    python benchmarks/cluster_benchmark.py --client-processes 8 --threads 4 --duration 8
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import time
+
+from bench_utils import copy_server_dir, start_server, stop_server, connect, request
+
+
+def list_trips(sock, session: str, limit: int) -> list:
+    """Tối đa `limit` trip_id trải trên nhiều tuyến / ngày"""
+    trip_ids = []
+    for route in request(sock, {'command': 'SEARCH_ROUTES', 'session_id': session})['routes']:
+        dates = request(sock, {'command': 'GET_DATES', 'route_id': route['id'], 'session_id': session})['dates']
+        for date in dates[:2]:
+            trips = request(sock, {'command': 'SEARCH_TRIPS', 'route_id': route['id'], 'date': date,
+                                   'session_id': session})['trips']
+            trip_ids.extend(trip['id'] for trip in trips)
+            if len(trip_ids) >= limit:
+                return trip_ids[:limit]
+    return trip_ids
+
+
+def book_one(sock, session: str, trip_id: str, customer: dict) -> bool:
+    seats = request(sock, {'command': 'GET_SEATS', 'trip_id': trip_id, 'session_id': session})['seats']
+    free = [seat_id for seat_id, seat in seats.items() if seat.get('status', 'available') == 'available']
+    if not free:
+        return False
+    seat_id = free[0]
+    if not request(sock, {'command': 'SELECT_SEAT', 'trip_id': trip_id, 'seat_id': seat_id,
+                          'session_id': session}).get('success'):
+        return False
+    return bool(request(sock, {'command': 'BOOK_SEATS', 'trip_id': trip_id, 'seat_ids': [seat_id],
+                               'customer_info': customer, 'session_id': session}).get('success'))
+
+
+def client_process(port: int, proc_idx: int, threads: int, connections: int, duration: float, results):
+    import threading
+
+    counts, errors = [], []
+
+    def worker(idx: int):
+        session = f'cluster-bench-{idx}'
+        customer = {'name': f'Khách {idx}', 'phone': f'09{idx:08d}', 'cccd': f'{idx:012d}'}
+        booked = 0
+        try:
+            sock = connect(port)
+            trip_ids = list_trips(sock, session, 4 * connections)[idx::connections] or ['T0001']
+            end = time.perf_counter() + duration
+            turn = 0
+            while time.perf_counter() < end:
+                if book_one(sock, session, trip_ids[turn % len(trip_ids)], customer):
+                    booked += 1
+                turn += 1
+            sock.close()
+        except Exception as e:
+            errors.append(str(e))
+        counts.append(booked)
+
+    pool = [threading.Thread(target=worker, args=(proc_idx * threads + i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    results.put((sum(counts), errors))
+
+
+def run(shards: int, port: int, client_processes: int, threads: int, duration: float) -> float:
+    """shards = 0: server 1 process; trả về số vé đặt được / giây"""
+    server_dir = copy_server_dir()
+    if shards:
+        proc = start_server('cluster', port, {'CLUSTER_LOCAL_SHARDS': str(shards)}, server_dir=server_dir)
+        time.sleep(1.0 + 0.5 * shards)  # Đợi mọi front end bind cổng (start_server chỉ chờ front end đầu tiên)
+    else:
+        proc = start_server('threaded', port, server_dir=server_dir)
+
+    results = multiprocessing.Queue()
+    connections = client_processes * threads
+    clients = [multiprocessing.Process(target=client_process,
+                                       args=(port, i, threads, connections, duration, results))
+               for i in range(client_processes)]
+    try:
+        for c in clients:
+            c.start()
+        total, errors = 0, []
+        for _ in clients:
+            count, errs = results.get()
+            total += count
+            errors.extend(errs)
+        for c in clients:
+            c.join()
+    finally:
+        stop_server(proc)
+        shutil.rmtree(os.path.dirname(server_dir), ignore_errors=True)
+    if errors:
+        print(f"[Bench] shards={shards}: {len(errors)} lỗi, ví dụ: {errors[0]}")
+    return total / duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--client-processes', type=int, default=8)
+    parser.add_argument('--threads', type=int, default=4, help='Số kết nối mỗi process client')
+    parser.add_argument('--duration', type=float, default=8.0)
+    parser.add_argument('--port', type=int, default=57855)
+    args = parser.parse_args()
+
+    print(f"[Bench] CPU: {os.cpu_count()}, client: {args.client_processes} process x {args.threads} kết nối, "
+          f"{args.duration}s mỗi cấu hình")
+    baseline = run(0, args.port, args.client_processes, args.threads, args.duration)
+    print(f"{'cấu hình':<18}{'vé/s':>10}{'x 1 process':>14}")
+    print(f"{'1 process':<18}{baseline:>10.0f}{1.0:>14.2f}")
+    for i, shards in enumerate(args.shards):
+        rate = run(shards, args.port + 10 * (i + 1), args.client_processes, args.threads, args.duration)
+        print(f"{f'{shards} shard':<18}{rate:>10.0f}{rate / baseline if baseline else 0:>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""Benchmark: CPU encode/decode và số bytes trên dây theo encoding (json / msgpack / protobuf)
++ kích thước / CPU khi nén thêm body (common/compression.py, mỗi thuật toán có sẵn)
+
+Dùng dữ liệu thật trong server/data:
+- SEARCH_TRIPS: mọi chuyến của ngày đông nhất (mô phỏng ngày cao điểm)
+- GET_SEATS: sơ đồ 40 ghế của 1 chuyến đã có ghế được đặt
+
+Ví dụ:
+    python benchmarks/encoding_benchmark.py --iterations 2000
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import timeit
+from collections import Counter
+
+from bench_utils import ROOT_DIR, SERVER_DIR
+
+sys.path.insert(0, ROOT_DIR)
+
+from common import codec, compression
+
+
+def load_payloads() -> dict:
+    data_dir = os.path.join(SERVER_DIR, 'data')
+    with open(os.path.join(data_dir, 'trips.json'), 'r', encoding='utf-8') as f:
+        trips = json.load(f)
+    busiest_date = Counter(t['date'] for t in trips).most_common(1)[0][0]
+    day_trips = [dict(t, available_seats=t.get('total_seats', 40)) for t in trips if t['date'] == busiest_date]
+
+    seats = {}
+    for path in sorted(glob.glob(os.path.join(data_dir, 'seats', '*.json'))):
+        with open(path, 'r', encoding='utf-8') as f:
+            seats = json.load(f)
+        if any(s['status'] != 'available' for s in seats.values()):
+            break
+
+    return {
+        'SEARCH_TRIPS': {'trips': day_trips},
+        'GET_SEATS': {'seats': seats},
+    }
+
+
+def bench(command: str, response: dict, encoding: str, use_protobuf: bool, iterations: int) -> dict:
+    body, flags = codec.encode_response(command, response, encoding, use_protobuf)
+    encode = timeit.timeit(lambda: codec.encode_response(command, response, encoding, use_protobuf),
+                           number=iterations) / iterations
+    decode = timeit.timeit(lambda: codec.decode_response(command, body, flags, encoding),
+                           number=iterations) / iterations
+    result = {'bytes': len(body), 'encode_us': encode * 1e6, 'decode_us': decode * 1e6}
+    for algorithm in compression.available_compressions():
+        packed = compression.compress(body, algorithm)
+        result[algorithm] = {
+            'bytes': len(packed),
+            'compress_us': timeit.timeit(lambda: compression.compress(body, algorithm),
+                                         number=iterations) / iterations * 1e6,
+            'decompress_us': timeit.timeit(lambda: compression.decompress(packed, algorithm),
+                                           number=iterations) / iterations * 1e6,
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    variants = [('json', codec.ENCODING_JSON, False)]
+    if codec.ENCODING_MSGPACK in codec.available_encodings():
+        variants.append(('msgpack', codec.ENCODING_MSGPACK, False))
+    if codec.ENCODING_PROTOBUF in codec.available_encodings():
+        variants.append(('protobuf', codec.ENCODING_JSON, True))
+    missing = {codec.ENCODING_MSGPACK, codec.ENCODING_PROTOBUF} - set(codec.available_encodings())
+    if missing:
+        print(f"[Bench] Bỏ qua (chưa cài): {', '.join(sorted(missing))}")
+
+    for command, response in load_payloads().items():
+        size_hint = len(response.get('trips') or response.get('seats') or [])
+        print(f"\n{command} ({size_hint} phần tử)")
+        print(f"{'encoding':<10}{'bytes':>8}{'vs json':>9}{'encode µs':>11}{'decode µs':>11}"
+              + ''.join(f"{a + ' B':>10}{'nén µs':>9}{'giải µs':>9}" for a in compression.available_compressions()))
+        baseline = None
+        for name, encoding, use_protobuf in variants:
+            result = bench(command, response, encoding, use_protobuf, args.iterations)
+            baseline = baseline or result['bytes']
+            print(f"{name:<10}{result['bytes']:>8}{result['bytes'] / baseline:>8.0%} "
+                  f"{result['encode_us']:>10.1f}{result['decode_us']:>11.1f}"
+                  + ''.join(f"{result[a]['bytes']:>10}{result[a]['compress_us']:>9.1f}{result[a]['decompress_us']:>9.1f}"
+                            for a in compression.available_compressions()))
+
+
+if __name__ == '__main__':
+    main()
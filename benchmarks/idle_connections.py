@@ -0,0 +1,121 @@
+"""Benchmark: nhiều kết nối idle + tải active trên TCP server
+
+Chạy server (mode 'thread' hoặc 'selector') trong process con, mở N kết nối idle
+(giống trình duyệt mở sẵn mà không gửi gì), rồi chạy C client gửi request liên tục.
+In ra throughput, latency p50/p99, RSS và số thread của server.
+
+Ví dụ:
+    python benchmarks/idle_connections.py --mode selector --idle 10000 --clients 16
+    python benchmarks/idle_connections.py --mode thread --idle 10000 --clients 16
+
+Cần ulimit -n đủ lớn (> idle + clients cho mỗi process).
+"""
+
+import argparse
+import socket
+import threading
+import time
+
+from bench_utils import (raise_fd_limit, start_server, stop_server, server_usage,
+                         connect, request, percentile)
+
+
+def open_idle(port: int, count: int) -> list:
+    sockets = []
+    for i in range(count):
+        try:
+            sockets.append(socket.create_connection(('127.0.0.1', port), timeout=10))
+        except OSError as e:
+            print(f"[Bench] Chỉ mở được {i} kết nối idle: {e}")
+            break
+    return sockets
+
+
+def active_worker(port: int, duration: float, latencies: list, errors: list, idx: int):
+    payloads = [
+        {'command': 'GET_CITIES'},
+        {'command': 'SEARCH_ROUTES'},
+        {'command': 'GET_SEATS', 'trip_id': 'T0041'},
+    ]
+    try:
+        sock = connect(port)
+    except OSError as e:
+        errors.append(str(e))
+        return
+    session = f'bench-{idx}'
+    end = time.perf_counter() + duration
+    i = 0
+    local = []
+    try:
+        while time.perf_counter() < end:
+            payload = dict(payloads[i % len(payloads)], session_id=session)
+            t0 = time.perf_counter()
+            request(sock, payload)
+            local.append(time.perf_counter() - t0)
+            i += 1
+    except Exception as e:
+        errors.append(str(e))
+    finally:
+        sock.close()
+        latencies.extend(local)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['thread', 'selector'], default='selector')
+    parser.add_argument('--idle', type=int, default=10000, help='Số kết nối idle')
+    parser.add_argument('--clients', type=int, default=16, help='Số client gửi request liên tục')
+    parser.add_argument('--duration', type=float, default=10.0, help='Thời gian tải active (giây)')
+    parser.add_argument('--workers', type=int, default=32, help='WORKER_THREADS cho mode selector')
+    parser.add_argument('--port', type=int, default=57555)
+    args = parser.parse_args()
+
+    limit = raise_fd_limit()
+    print(f"[Bench] mode={args.mode} idle={args.idle} clients={args.clients} fd_limit={limit}")
+
+    proc = start_server('threaded', args.port, {
+        'SERVING_MODE': args.mode,
+        'WORKER_THREADS': str(args.workers),
+        'MAX_CONNECTIONS': str(args.idle + args.clients + 100),
+        'LISTEN_BACKLOG': '4096',
+    })
+    idle = []
+    try:
+        print(f"[Bench] Server (baseline): {server_usage(proc.pid)}")
+
+        t0 = time.perf_counter()
+        idle = open_idle(args.port, args.idle)
+        time.sleep(1.0)
+        print(f"[Bench] Mở {len(idle)} kết nối idle trong {time.perf_counter() - t0:.2f}s")
+        print(f"[Bench] Server (idle): {server_usage(proc.pid)}")
+
+        latencies, errors = [], []
+        threads = [threading.Thread(target=active_worker,
+                                    args=(args.port, args.duration, latencies, errors, i))
+                   for i in range(args.clients)]
+        for t in threads:
+            t.start()
+        time.sleep(args.duration / 2)
+        usage = server_usage(proc.pid)
+        for t in threads:
+            t.join()
+
+        print(f"[Bench] Server (idle + active): {usage}")
+        print(f"[Bench] Requests: {len(latencies)}  Errors: {len(errors)}")
+        print(f"[Bench] Throughput: {len(latencies) / args.duration:.0f} req/s")
+        print(f"[Bench] Latency p50: {percentile(latencies, 50) * 1000:.2f}ms  "
+              f"p99: {percentile(latencies, 99) * 1000:.2f}ms")
+        if errors:
+            print(f"[Bench] Lỗi đầu tiên: {errors[0]}")
+
+        # Kết nối idle vẫn phải dùng được sau khi chạy tải
+        alive = request(idle[-1], {'command': 'GET_CITIES', 'session_id': 'bench-idle'}) if idle else None
+        print(f"[Bench] Kết nối idle cuối vẫn phục vụ: {bool(alive and 'from_cities' in alive)}")
+    finally:
+        for sock in idle:
+            sock.close()
+        stop_server(proc)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Benchmark: throughput của server khi log mỗi request ('[TCP] <client> -> <lệnh>', common/logger.py)
+
+So sánh (chạy lần lượt trên cùng dữ liệu copy, log console của server ghi vào file như khi chạy thật):
+- sync:    LOG_ASYNC=false - format + ghi stdout ngay trên thread xử lý request (như print cũ)
+- async:   record vào ring buffer, thread nền ghi theo lô (mặc định)
+- sampled: async + LOG_SAMPLING=TCP=<rate> (chỉ giữ 1 phần log mỗi request)
+- off:     LOG_LEVELS=TCP=warning (không log mỗi request) - trần của throughput
+--jsonl: cả 4 mode ghi thêm file JSONL (LOG_FILE)
+--console-kbps N: stdout của server là pipe được đọc chậm N KiB/s (như terminal / log shipper chậm)
+  thay vì file - print / sync chặn thread request khi pipe đầy, async chỉ chặn thread ghi nền
+
+Ví dụ:
+    python benchmarks/logging_benchmark.py --clients 16 --duration 8
+    python benchmarks/logging_benchmark.py --console-kbps 512
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+from bench_utils import copy_server_dir, start_server, stop_server, connect, request
+
+MODES = ('sync', 'async', 'sampled', 'off')
+
+
+def client_worker(port: int, idx: int, duration: float, counts: list, errors: list):
+    session = f'bench-{idx}'
+    done = 0
+    try:
+        sock = connect(port)
+        trip_id = 'T0001'  # Chuyến đầu tiên trong server/data/trips.json
+        workload = [{'command': 'GET_CITIES'}, {'command': 'GET_SEATS', 'trip_id': trip_id},
+                    {'command': 'GET_TRIP_INFO', 'trip_id': trip_id}]
+        end = time.perf_counter() + duration
+        while time.perf_counter() < end:
+            for payload in workload:
+                request(sock, dict(payload, session_id=session))
+                done += 1
+        sock.close()
+    except Exception as e:
+        errors.append(str(e))
+    counts.append(done)
+
+
+def console_reader(stream, kbps: float, lines: list):
+    """Đọc stdout của server với tốc độ giới hạn (giả lập terminal chậm)"""
+    chunk = 4096
+    count = 0
+    while True:
+        data = stream.read1(chunk)
+        if not data:
+            break
+        count += data.count(b'\n')
+        time.sleep(len(data) / (kbps * 1024))
+    lines.append(count)
+
+
+def run(mode: str, port: int, clients: int, duration: float, sample_rate: float, jsonl: bool,
+        console_kbps: float = 0) -> dict:
+    server_dir = copy_server_dir()
+    work_dir = os.path.dirname(server_dir)
+    env = {'LOG_ASYNC': 'false' if mode == 'sync' else 'true'}
+    if mode == 'sampled':
+        env['LOG_SAMPLING'] = f'TCP={sample_rate}'
+    elif mode == 'off':
+        env['LOG_LEVELS'] = 'TCP=warning'
+    if jsonl:
+        env['LOG_FILE'] = os.path.join(work_dir, 'server.jsonl')
+    console_path = os.path.join(work_dir, 'console.log')
+    counts, errors, lines = [], [], []
+    with open(console_path, 'wb') as console:
+        proc = start_server('threaded', port, env, server_dir=server_dir,
+                            stdout=subprocess.PIPE if console_kbps else console)
+        reader = None
+        if console_kbps:
+            reader = threading.Thread(target=console_reader, args=(proc.stdout, console_kbps, lines), daemon=True)
+            reader.start()
+        try:
+            threads = [threading.Thread(target=client_worker, args=(port, i, duration, counts, errors))
+                       for i in range(clients)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            stop_server(proc)
+            if reader:
+                reader.join()
+    if not console_kbps:
+        lines.append(sum(1 for _ in open(console_path, 'rb')))
+    shutil.rmtree(work_dir, ignore_errors=True)
+    if errors:
+        print(f"[Bench] {mode}: {len(errors)} lỗi, ví dụ: {errors[0]}")
+    return {'requests': sum(counts), 'console_lines': lines[0] if lines else 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=8.0)
+    parser.add_argument('--port', type=int, default=57755)
+    parser.add_argument('--sample-rate', type=float, default=0.01)
+    parser.add_argument('--jsonl', action='store_true', help='Ghi thêm file JSONL (LOG_FILE)')
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--console-kbps', type=float, default=0, help='stdout là pipe đọc chậm N KiB/s (0: file)')
+    args = parser.parse_args()
+
+    results = {}
+    for i, mode in enumerate(m.strip() for m in args.modes.split(',')):
+        results[mode] = run(mode, args.port + 10 * i, args.clients, args.duration, args.sample_rate, args.jsonl,
+                            args.console_kbps)
+
+    print(f"[Bench] clients={args.clients} duration={args.duration}s jsonl={args.jsonl} "
+          f"console={'pipe %g KiB/s' % args.console_kbps if args.console_kbps else 'file'}")
+    print(f"{'mode':<10}{'req/s':>10}{'dòng console':>15}")
+    for mode, result in results.items():
+        print(f"{mode:<10}{result['requests'] / args.duration:>10.0f}{result['console_lines']:>15}")
+
+
+if __name__ == '__main__':
+    main()
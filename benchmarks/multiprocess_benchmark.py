@@ -0,0 +1,123 @@
+"""Benchmark: throughput theo số process worker (WORKER_PROCESSES, SO_REUSEPORT + seat authority)
+
+So sánh server 1 process (mode thread) với 1, 2, 4, 8 worker trên cùng dữ liệu copy.
+Tải sinh bởi nhiều process client (mỗi process vài thread, 1 kết nối / thread) để chính client
+không bị giới hạn bởi GIL. Workload mỗi vòng:
+- đọc tại worker: GET_CITIES, SEARCH_ROUTES, SEARCH_TRIPS, GET_SEATS x 3
+- ghi chuyển tiếp sang authority: SELECT_SEAT, UNSELECT_SEAT
+
+Lưu ý: số liệu chỉ có ý nghĩa khi máy có ít nhất (worker + client process) core.
+
+Ví dụ:
+    python benchmarks/multiprocess_benchmark.py --client-processes 8 --threads 4 --duration 8
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import time
+
+from bench_utils import copy_server_dir, start_server, stop_server, connect, request
+
+
+def build_workload(sock, session: str, seat_id: str) -> list:
+    routes = request(sock, {'command': 'SEARCH_ROUTES', 'session_id': session})['routes']
+    route_id = routes[0]['id']
+    date = request(sock, {'command': 'GET_DATES', 'route_id': route_id, 'session_id': session})['dates'][0]
+    trips = request(sock, {'command': 'SEARCH_TRIPS', 'route_id': route_id, 'date': date,
+                           'session_id': session})['trips']
+    trip_id = trips[0]['id']
+    return [
+        {'command': 'GET_CITIES'},
+        {'command': 'SEARCH_ROUTES', 'from_city': routes[0]['from_city']},
+        {'command': 'SEARCH_TRIPS', 'route_id': route_id, 'date': date},
+        {'command': 'GET_SEATS', 'trip_id': trip_id},
+        {'command': 'SELECT_SEAT', 'trip_id': trip_id, 'seat_id': seat_id},
+        {'command': 'GET_SEATS', 'trip_id': trip_id},
+        {'command': 'UNSELECT_SEAT', 'trip_id': trip_id, 'seat_id': seat_id},
+        {'command': 'GET_SEATS', 'trip_id': trip_id},
+    ]
+
+
+def client_process(port: int, proc_idx: int, threads: int, duration: float, results):
+    import threading
+
+    counts, errors = [], []
+
+    def worker(idx: int):
+        session = f'mp-bench-{idx}'
+        seat_id = f"T{1 + (idx % 40) // 20}-{'A' if idx % 40 < 20 else 'B'}{idx % 20 + 1:02d}"
+        done = 0
+        try:
+            sock = connect(port)
+            workload = build_workload(sock, session, seat_id)
+            end = time.perf_counter() + duration
+            while time.perf_counter() < end:
+                for payload in workload:
+                    request(sock, dict(payload, session_id=session))
+                    done += 1
+            sock.close()
+        except Exception as e:
+            errors.append(str(e))
+        counts.append(done)
+
+    pool = [threading.Thread(target=worker, args=(proc_idx * threads + i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    results.put((sum(counts), errors))
+
+
+def run(workers: int, port: int, client_processes: int, threads: int, duration: float) -> float:
+    """workers = 0: server 1 process (không authority); trả về req/s"""
+    server_dir = copy_server_dir()
+    if workers:
+        proc = start_server('multiprocess', port, {'WORKER_PROCESSES': str(workers)}, server_dir=server_dir)
+        time.sleep(1.0 + 0.5 * workers)  # Đợi mọi worker bind cổng (start_server chỉ chờ worker đầu tiên)
+    else:
+        proc = start_server('threaded', port, server_dir=server_dir)
+
+    results = multiprocessing.Queue()
+    clients = [multiprocessing.Process(target=client_process, args=(port, i, threads, duration, results))
+               for i in range(client_processes)]
+    try:
+        for c in clients:
+            c.start()
+        total, errors = 0, []
+        for _ in clients:
+            count, errs = results.get()
+            total += count
+            errors.extend(errs)
+        for c in clients:
+            c.join()
+    finally:
+        stop_server(proc)
+        shutil.rmtree(os.path.dirname(server_dir), ignore_errors=True)
+    if errors:
+        print(f"[Bench] workers={workers}: {len(errors)} lỗi, ví dụ: {errors[0]}")
+    return total / duration
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--client-processes', type=int, default=8)
+    parser.add_argument('--threads', type=int, default=4, help='Số kết nối mỗi process client')
+    parser.add_argument('--duration', type=float, default=8.0)
+    parser.add_argument('--port', type=int, default=57755)
+    args = parser.parse_args()
+
+    print(f"[Bench] CPU: {os.cpu_count()}, client: {args.client_processes} process x {args.threads} kết nối, "
+          f"{args.duration}s mỗi cấu hình")
+    baseline = run(0, args.port, args.client_processes, args.threads, args.duration)
+    print(f"{'cấu hình':<18}{'req/s':>10}{'x 1 process':>14}")
+    print(f"{'1 process':<18}{baseline:>10.0f}{1.0:>14.2f}")
+    for i, workers in enumerate(args.workers):
+        rate = run(workers, args.port + 10 * (i + 1), args.client_processes, args.threads, args.duration)
+        print(f"{f'{workers} worker':<18}{rate:>10.0f}{rate / baseline if baseline else 0:>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""Benchmark: latency đặt vé khi server quá tải bởi lệnh tra cứu, có / không có lane ưu tiên
+
+Cùng 1 tải hỗn hợp trên server mode thread, 3 cấu hình scheduler (priority_scheduler.py):
+- off: không scheduler (mọi handler chạy ngay trên thread kết nối)
+- fifo: giới hạn slot như priority nhưng mọi lane cùng trọng số, không shed
+- priority: cấu hình mặc định (lane ghế trọng số cao, shed lane catalog)
+
+Tải:
+- flood: nhiều kết nối gửi liên tục SEARCH_TRIPS / GET_TRIP_INFO (không đi qua response cache) và
+  LIST_BOOKINGS (blocking: đọc file chuyến, tranh slot blocking với BOOK_SEATS)
+- booking: vài kết nối đặt vé liên tục (GET_SEATS -> SELECT_SEAT -> BOOK_SEATS), đo latency
+  SELECT_SEAT + BOOK_SEATS của mỗi vé
+
+Ví dụ:
+    python benchmarks/priority_benchmark.py --flood-processes 4 --flood-threads 16 --duration 8
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import time
+
+from bench_utils import copy_server_dir, start_server, stop_server, connect, request, percentile
+
+CONFIGS = {
+    'off': {'SCHEDULER_ENABLED': 'false'},
+    'fifo': {'SCHEDULER_SEAT_WEIGHT': '1', 'SCHEDULER_UPLOAD_WEIGHT': '1', 'SCHEDULER_CATALOG_WEIGHT': '1',
+             'SCHEDULER_SHED_LANES': '', 'SCHEDULER_MAX_QUEUE': '100000'},
+    'priority': {},
+}
+
+
+def list_trips(sock, session: str, limit: int) -> list:
+    """Tối đa `limit` chuyến (route_id, date, trip_id) trải trên nhiều tuyến / ngày"""
+    trips = []
+    for route in request(sock, {'command': 'SEARCH_ROUTES', 'session_id': session})['routes']:
+        dates = request(sock, {'command': 'GET_DATES', 'route_id': route['id'], 'session_id': session})['dates']
+        for date in dates[:2]:
+            found = request(sock, {'command': 'SEARCH_TRIPS', 'route_id': route['id'], 'date': date,
+                                   'session_id': session})['trips']
+            trips.extend((route['id'], date, trip['id']) for trip in found)
+            if len(trips) >= limit:
+                return trips[:limit]
+    return trips
+
+
+def flood_process(port: int, proc_idx: int, threads: int, duration: float, results):
+    import threading
+
+    counts, shed, errors = [], [], []
+
+    def worker(idx: int):
+        session = f'flood-{idx}'
+        done = overloaded = 0
+        try:
+            sock = connect(port)
+            trips = list_trips(sock, session, 16)
+            end = time.perf_counter() + duration
+            turn = 0
+            while time.perf_counter() < end:
+                route_id, date, trip_id = trips[turn % len(trips)]
+                for payload in ({'command': 'SEARCH_TRIPS', 'route_id': route_id, 'date': date},
+                                {'command': 'GET_TRIP_INFO', 'trip_id': trip_id},
+                                {'command': 'LIST_BOOKINGS', 'phone': f'09{turn % 4:08d}'}):
+                    if request(sock, dict(payload, session_id=session)).get('overloaded'):
+                        overloaded += 1
+                    done += 1
+                turn += 1
+            sock.close()
+        except Exception as e:
+            errors.append(str(e))
+        counts.append(done)
+        shed.append(overloaded)
+
+    pool = [threading.Thread(target=worker, args=(proc_idx * threads + i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    results.put(('flood', sum(counts), sum(shed), errors))
+
+
+def booking_process(port: int, threads: int, duration: float, results):
+    import threading
+
+    latencies, errors = [], []
+
+    def worker(idx: int):
+        session = f'priority-bench-{idx}'
+        customer = {'name': f'Khách {idx}', 'phone': f'09{idx:08d}', 'cccd': f'{idx:012d}'}
+        try:
+            sock = connect(port)
+            trip_ids = [trip[2] for trip in list_trips(sock, session, 8 * threads)][idx::threads] or ['T0001']
+            end = time.perf_counter() + duration
+            turn = 0
+            while time.perf_counter() < end:
+                trip_id = trip_ids[turn % len(trip_ids)]
+                turn += 1
+                seats = request(sock, {'command': 'GET_SEATS', 'trip_id': trip_id, 'session_id': session})['seats']
+                free = [seat_id for seat_id, seat in seats.items() if seat.get('status', 'available') == 'available']
+                if not free:
+                    continue
+                t_start = time.perf_counter()
+                if request(sock, {'command': 'SELECT_SEAT', 'trip_id': trip_id, 'seat_id': free[0],
+                                  'session_id': session}).get('success'):
+                    if request(sock, {'command': 'BOOK_SEATS', 'trip_id': trip_id, 'seat_ids': [free[0]],
+                                      'customer_info': customer, 'session_id': session}).get('success'):
+                        latencies.append(time.perf_counter() - t_start)
+            sock.close()
+        except Exception as e:
+            errors.append(str(e))
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    results.put(('booking', latencies, 0, errors))
+
+
+def run(config: str, port: int, args) -> dict:
+    server_dir = copy_server_dir()
+    proc = start_server('threaded', port, CONFIGS[config], server_dir=server_dir)
+
+    results = multiprocessing.Queue()
+    clients = [multiprocessing.Process(target=flood_process,
+                                       args=(port, i, args.flood_threads, args.duration, results))
+               for i in range(args.flood_processes)]
+    clients.append(multiprocessing.Process(target=booking_process,
+                                           args=(port, args.booking_threads, args.duration, results)))
+    summary = {'catalog': 0, 'shed': 0, 'latencies': [], 'errors': []}
+    try:
+        for c in clients:
+            c.start()
+        for _ in clients:
+            kind, value, shed, errors = results.get()
+            if kind == 'flood':
+                summary['catalog'] += value
+                summary['shed'] += shed
+            else:
+                summary['latencies'] = value
+            summary['errors'].extend(errors)
+        for c in clients:
+            c.join()
+    finally:
+        stop_server(proc)
+        shutil.rmtree(os.path.dirname(server_dir), ignore_errors=True)
+    if summary['errors']:
+        print(f"[Bench] {config}: {len(summary['errors'])} lỗi, ví dụ: {summary['errors'][0]}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--configs', nargs='+', default=list(CONFIGS), choices=list(CONFIGS))
+    parser.add_argument('--flood-processes', type=int, default=4)
+    parser.add_argument('--flood-threads', type=int, default=16, help='Số kết nối tra cứu mỗi process')
+    parser.add_argument('--booking-threads', type=int, default=4, help='Số kết nối đặt vé')
+    parser.add_argument('--duration', type=float, default=8.0)
+    parser.add_argument('--port', type=int, default=57955)
+    args = parser.parse_args()
+
+    print(f"[Bench] CPU: {os.cpu_count()}, flood: {args.flood_processes} process x {args.flood_threads} kết nối, "
+          f"booking: {args.booking_threads} kết nối, {args.duration}s mỗi cấu hình")
+    print(f"{'cấu hình':<10}{'vé/s':>8}{'book p50 ms':>13}{'p99 ms':>9}{'tra cứu/s':>11}{'shed':>8}")
+    for i, config in enumerate(args.configs):
+        summary = run(config, args.port + 10 * i, args)
+        latencies = summary['latencies']
+        print(f"{config:<10}{len(latencies) / args.duration:>8.0f}"
+              f"{percentile(latencies, 50) * 1000:>13.1f}{percentile(latencies, 99) * 1000:>9.1f}"
+              f"{summary['catalog'] / args.duration:>11.0f}{summary['shed']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -24,7 +24,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x11\x62us_booking.proto\x12\x0b\x62us_booking\"\x07\n\x05\x45mpty\"8\n\x0e\x43itiesResponse\x12\x13\n\x0b\x66rom_cities\x18\x01 \x03(\t\x12\x11\n\tto_cities\x18\x02 \x03(\t\"9\n\x13SearchRoutesRequest\x12\x11\n\tfrom_city\x18\x01 \x01(\t\x12\x0f\n\x07to_city\x18\x02 \x01(\t\"`\n\x05Route\x12\n\n\x02id\x18\x01 \x01(\t\x12\x11\n\tfrom_city\x18\x02 \x01(\t\x12\x0f\n\x07to_city\x18\x03 \x01(\t\x12\x13\n\x0b\x64istance_km\x18\x04 \x01(\x05\x12\x12\n\nbase_price\x18\x05 \x01(\x03\"4\n\x0eRoutesResponse\x12\"\n\x06routes\x18\x01 \x03(\x0b\x32\x12.bus_booking.Route\"#\n\x0fGetDatesRequest\x12\x10\n\x08route_id\x18\x01 \x01(\t\"\x1e\n\rDatesResponse\x12\r\n\x05\x64\x61tes\x18\x01 \x03(\t\"4\n\x12SearchTripsRequest\x12\x10\n\x08route_id\x18\x01 \x01(\t\x12\x0c\n\x04\x64\x61te\x18\x02 \x01(\t\"\x9c\x01\n\x04Trip\x12\n\n\x02id\x18\x01 \x01(\t\x12\x10\n\x08route_id\x18\x02 \x01(\t\x12\x0c\n\x04\x64\x61te\x18\x03 \x01(\t\x12\x16\n\x0e\x64\x65parture_time\x18\x04 \x01(\t\x12\x10\n\x08\x62us_code\x18\x05 \x01(\t\x12\x10\n\x08\x62us_type\x18\x06 \x01(\t\x12\x13\n\x0btotal_seats\x18\x07 \x01(\x05\x12\x17\n\x0f\x61vailable_seats\x18\x08 \x01(\x05\"1\n\rTripsResponse\x12 \n\x05trips\x18\x01 \x03(\x0b\x32\x11.bus_booking.Trip\"\"\n\x0fGetSeatsRequest\x12\x0f\n\x07trip_id\x18\x01 \x01(\t\"E\n\nSeatStatus\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x11\n\tlocked_by\x18\x02 \x01(\t\x12\x14\n\x0clocked_until\x18\x03 \x01(\x03\"\x8c\x01\n\rSeatsResponse\x12\x34\n\x05seats\x18\x01 \x03(\x0b\x32%.bus_booking.SeatsResponse.SeatsEntry\x1a\x45\n\nSeatsEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12&\n\x05value\x18\x02 \x01(\x0b\x32\x17.bus_booking.SeatStatus:\x02\x38\x01\"I\n\x11SelectSeatRequest\x12\x0f\n\x07trip_id\x18\x01 \x01(\t\x12\x0f\n\x07seat_id\x18\x02 \x01(\t\x12\x12\n\nsession_id\x18\x03 \x01(\t\"6\n\x12SelectSeatResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\"K\n\x13UnselectSeatRequest\x12\x0f\n\x07trip_id\x18\x01 \x01(\t\x12\x0f\n\x07seat_id\x18\x02 \x01(\t\x12\x12\n\nsession_id\x18\x03 \x01(\t\"H\n\x0c\x43ustomerInfo\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\r\n\x05phone\x18\x02 \x01(\t\x12\x0c\n\x04\x63\x63\x63\x64\x18\x03 \x01(\t\x12\r\n\x05\x65mail\x18\x04 \x01(\t\"{\n\x10\x42ookSeatsRequest\x12\x0f\n\x07trip_id\x18\x01 \x01(\t\x12\x10\n\x08seat_ids\x18\x02 \x03(\t\x12\x30\n\rcustomer_info\x18\x03 \x01(\x0b\x32\x19.bus_booking.CustomerInfo\x12\x12\n\nsession_id\x18\x04 \x01(\t\"I\n\x11\x42ookSeatsResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x12\n\nbooking_id\x18\x02 \x01(\t\x12\x0f\n\x07message\x18\x03 \x01(\t\"L\n\x11UploadFileRequest\x12\x10\n\x08\x66ilename\x18\x01 \x01(\t\x12\x11\n\tfile_data\x18\x02 \x01(\x0c\x12\x12\n\nbooking_id\x18\x03 \x01(\t\"H\n\x12UploadFileResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x10\n\x08\x66ilepath\x18\x02 \x01(\t\x12\x0f\n\x07message\x18\x03 \x01(\t\"!\n\rStreamRequest\x12\x10\n\x08trip_ids\x18\x01 \x03(\t\"\xaa\x01\n\nSeatUpdate\x12\x0f\n\x07trip_id\x18\x01 \x01(\t\x12\x31\n\x05seats\x18\x02 \x03(\x0b\x32\".bus_booking.SeatUpdate.SeatsEntry\x12\x11\n\ttimestamp\x18\x03 \x01(\x03\x1a\x45\n\nSeatsEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12&\n\x05value\x18\x02 \x01(\x0b\x32\x17.bus_booking.SeatStatus:\x02\x38\x01\x32\x81\x06\n\x11\x42usBookingService\x12<\n\tGetCities\x12\x12.bus_booking.Empty\x1a\x1b.bus_booking.CitiesResponse\x12M\n\x0cSearchRoutes\x12 .bus_booking.SearchRoutesRequest\x1a\x1b.bus_booking.RoutesResponse\x12\x44\n\x08GetDates\x12\x1c.bus_booking.GetDatesRequest\x1a\x1a.bus_booking.DatesResponse\x12J\n\x0bSearchTrips\x12\x1f.bus_booking.SearchTripsRequest\x1a\x1a.bus_booking.TripsResponse\x12\x44\n\x08GetSeats\x12\x1c.bus_booking.GetSeatsRequest\x1a\x1a.bus_booking.SeatsResponse\x12M\n\nSelectSeat\x12\x1e.bus_booking.SelectSeatRequest\x1a\x1f.bus_booking.SelectSeatResponse\x12Q\n\x0cUnselectSeat\x12 .bus_booking.UnselectSeatRequest\x1a\x1f.bus_booking.SelectSeatResponse\x12J\n\tBookSeats\x12\x1d.bus_booking.BookSeatsRequest\x1a\x1e.bus_booking.BookSeatsResponse\x12M\n\nUploadFile\x12\x1e.bus_booking.UploadFileRequest\x1a\x1f.bus_booking.UploadFileResponse\x12J\n\x11StreamSeatUpdates\x12\x1a.bus_booking.StreamRequest\x1a\x17.bus_booking.SeatUpdate0\x01\x62\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x11\x62us_booking.proto\x12\x0b\x62us_booking\"\x07\n\x05\x45mpty\"8\n\x0e\x43itiesResponse\x12\x13\n\x0b\x66rom_cities\x18\x01 \x03(\t\x12\x11\n\tto_cities\x18\x02 \x03(\t\"9\n\x13SearchRoutesRequest\x12\x11\n\tfrom_city\x18\x01 \x01(\t\x12\x0f\n\x07to_city\x18\x02 \x01(\t\"`\n\x05Route\x12\n\n\x02id\x18\x01 \x01(\t\x12\x11\n\tfrom_city\x18\x02 \x01(\t\x12\x0f\n\x07to_city\x18\x03 \x01(\t\x12\x13\n\x0b\x64istance_km\x18\x04 \x01(\x05\x12\x12\n\nbase_price\x18\x05 \x01(\x03\"4\n\x0eRoutesResponse\x12\"\n\x06routes\x18\x01 \x03(\x0b\x32\x12.bus_booking.Route\"#\n\x0fGetDatesRequest\x12\x10\n\x08route_id\x18\x01 \x01(\t\"\x1e\n\rDatesResponse\x12\r\n\x05\x64\x61tes\x18\x01 \x03(\t\"4\n\x12SearchTripsRequest\x12\x10\n\x08route_id\x18\x01 \x01(\t\x12\x0c\n\x04\x64\x61te\x18\x02 \x01(\t\"\x9c\x01\n\x04Trip\x12\n\n\x02id\x18\x01 \x01(\t\x12\x10\n\x08route_id\x18\x02 \x01(\t\x12\x0c\n\x04\x64\x61te\x18\x03 \x01(\t\x12\x16\n\x0e\x64\x65parture_time\x18\x04 \x01(\t\x12\x10\n\x08\x62us_code\x18\x05 \x01(\t\x12\x10\n\x08\x62us_type\x18\x06 \x01(\t\x12\x13\n\x0btotal_seats\x18\x07 \x01(\x05\x12\x17\n\x0f\x61vailable_seats\x18\x08 \x01(\x05\"1\n\rTripsResponse\x12 \n\x05trips\x18\x01 \x03(\x0b\x32\x11.bus_booking.Trip\"\"\n\x0fGetSeatsRequest\x12\x0f\n\x07trip_id\x18\x01 \x01(\t\"~\n\nSeatStatus\x12\x0e\n\x06status\x18\x01 \x01(\t\x12\x16\n\tlocked_by\x18\x02 \x01(\tH\x00\x88\x01\x01\x12\x14\n\x0clocked_until\x18\x03 \x01(\x03\x12\x16\n\tlocked_at\x18\x04 \x01(\x01H\x01\x88\x01\x01\x42\x0c\n\n_locked_byB\x0c\n\n_locked_at\"\x8c\x01\n\rSeatsResponse\x12\x34\n\x05seats\x18\x01 \x03(\x0b\x32%.bus_booking.SeatsResponse.SeatsEntry\x1a\x45\n\nSeatsEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12&\n\x05value\x18\x02 \x01(\x0b\x32\x17.bus_booking.SeatStatus:\x02\x38\x01\"I\n\x11SelectSeatRequest\x12\x0f\n\x07trip_id\x18\x01 \x01(\t\x12\x0f\n\x07seat_id\x18\x02 \x01(\t\x12\x12\n\nsession_id\x18\x03 \x01(\t\"6\n\x12SelectSeatResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\"K\n\x13UnselectSeatRequest\x12\x0f\n\x07trip_id\x18\x01 \x01(\t\x12\x0f\n\x07seat_id\x18\x02 \x01(\t\x12\x12\n\nsession_id\x18\x03 \x01(\t\"H\n\x0c\x43ustomerInfo\x12\x0c\n\x04name\x18\x01 \x01(\t\x12\r\n\x05phone\x18\x02 \x01(\t\x12\x0c\n\x04\x63\x63\x63\x64\x18\x03 \x01(\t\x12\r\n\x05\x65mail\x18\x04 \x01(\t\"\x94\x01\n\x10\x42ookSeatsRequest\x12\x0f\n\x07trip_id\x18\x01 \x01(\t\x12\x10\n\x08seat_ids\x18\x02 \x03(\t\x12\x30\n\rcustomer_info\x18\x03 \x01(\x0b\x32\x19.bus_booking.CustomerInfo\x12\x12\n\nsession_id\x18\x04 \x01(\t\x12\x17\n\x0fidempotency_key\x18\x05 \x01(\t\"I\n\x11\x42ookSeatsResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x12\n\nbooking_id\x18\x02 \x01(\t\x12\x0f\n\x07message\x18\x03 \x01(\t\"1\n\x0cItineraryLeg\x12\x0f\n\x07trip_id\x18\x01 \x01(\t\x12\x10\n\x08seat_ids\x18\x02 \x03(\t\"\x9e\x01\n\x14\x42ookItineraryRequest\x12\'\n\x04legs\x18\x01 \x03(\x0b\x32\x19.bus_booking.ItineraryLeg\x12\x30\n\rcustomer_info\x18\x02 \x01(\x0b\x32\x19.bus_booking.CustomerInfo\x12\x12\n\nsession_id\x18\x03 \x01(\t\x12\x17\n\x0fidempotency_key\x18\x04 \x01(\t\"d\n\x15\x42ookItineraryResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x14\n\x0citinerary_id\x18\x02 \x01(\t\x12\x13\n\x0b\x62ooking_ids\x18\x03 \x03(\t\x12\x0f\n\x07message\x18\x04 \x01(\t\"L\n\x11UploadFileRequest\x12\x10\n\x08\x66ilename\x18\x01 \x01(\t\x12\x11\n\tfile_data\x18\x02 \x01(\x0c\x12\x12\n\nbooking_id\x18\x03 \x01(\t\"k\n\x12UploadFileResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x10\n\x08\x66ilepath\x18\x02 \x01(\t\x12\x0f\n\x07message\x18\x03 \x01(\t\x12\x11\n\tupload_id\x18\x04 \x01(\t\x12\x0e\n\x06offset\x18\x05 \x01(\x03\"\x82\x01\n\x0bUploadChunk\x12\x11\n\tupload_id\x18\x01 \x01(\t\x12\x10\n\x08\x66ilename\x18\x02 \x01(\t\x12\x12\n\nbooking_id\x18\x03 \x01(\t\x12\x0c\n\x04size\x18\x04 \x01(\x03\x12\x0e\n\x06sha256\x18\x05 \x01(\t\x12\x0e\n\x06offset\x18\x06 \x01(\x03\x12\x0c\n\x04\x64\x61ta\x18\x07 \x01(\x0c\"!\n\rStreamRequest\x12\x10\n\x08trip_ids\x18\x01 \x03(\t\"\xaa\x01\n\nSeatUpdate\x12\x0f\n\x07trip_id\x18\x01 \x01(\t\x12\x31\n\x05seats\x18\x02 \x03(\x0b\x32\".bus_booking.SeatUpdate.SeatsEntry\x12\x11\n\ttimestamp\x18\x03 \x01(\x03\x1a\x45\n\nSeatsEntry\x12\x0b\n\x03key\x18\x01 \x01(\t\x12&\n\x05value\x18\x02 \x01(\x0b\x32\x17.bus_booking.SeatStatus:\x02\x38\x01\"\xbc\x01\n\x07\x42ooking\x12\n\n\x02id\x18\x01 \x01(\t\x12\x0f\n\x07trip_id\x18\x02 \x01(\t\x12\x10\n\x08seat_ids\x18\x03 \x03(\t\x12\x15\n\rcustomer_name\x18\x04 \x01(\t\x12\x16\n\x0e\x63ustomer_phone\x18\x05 \x01(\t\x12\x15\n\rcustomer_cccd\x18\x06 \x01(\t\x12\x16\n\x0euploaded_files\x18\x07 \x03(\t\x12\x14\n\x0c\x62ooking_time\x18\x08 \x01(\t\x12\x0e\n\x06status\x18\t \x01(\t\"\'\n\x11GetBookingRequest\x12\x12\n\nbooking_id\x18\x01 \x01(\t\"Z\n\x0f\x42ookingResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12%\n\x07\x62ooking\x18\x02 \x01(\x0b\x32\x14.bus_booking.Booking\x12\x0f\n\x07message\x18\x03 \x01(\t\"S\n\x13ListBookingsRequest\x12\r\n\x05phone\x18\x01 \x01(\t\x12\x0c\n\x04\x63\x63\x63\x64\x18\x02 \x01(\t\x12\x0c\n\x04page\x18\x03 \x01(\x05\x12\x11\n\tpage_size\x18\x04 \x01(\x05\"\x90\x01\n\x14ListBookingsResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12&\n\x08\x62ookings\x18\x02 \x03(\x0b\x32\x14.bus_booking.Booking\x12\r\n\x05total\x18\x03 \x01(\x05\x12\x0c\n\x04page\x18\x04 \x01(\x05\x12\x11\n\tpage_size\x18\x05 \x01(\x05\x12\x0f\n\x07message\x18\x06 \x01(\t2\xcb\x08\n\x11\x42usBookingService\x12<\n\tGetCities\x12\x12.bus_booking.Empty\x1a\x1b.bus_booking.CitiesResponse\x12M\n\x0cSearchRoutes\x12 .bus_booking.SearchRoutesRequest\x1a\x1b.bus_booking.RoutesResponse\x12\x44\n\x08GetDates\x12\x1c.bus_booking.GetDatesRequest\x1a\x1a.bus_booking.DatesResponse\x12J\n\x0bSearchTrips\x12\x1f.bus_booking.SearchTripsRequest\x1a\x1a.bus_booking.TripsResponse\x12\x44\n\x08GetSeats\x12\x1c.bus_booking.GetSeatsRequest\x1a\x1a.bus_booking.SeatsResponse\x12M\n\nSelectSeat\x12\x1e.bus_booking.SelectSeatRequest\x1a\x1f.bus_booking.SelectSeatResponse\x12Q\n\x0cUnselectSeat\x12 .bus_booking.UnselectSeatRequest\x1a\x1f.bus_booking.SelectSeatResponse\x12J\n\tBookSeats\x12\x1d.bus_booking.BookSeatsRequest\x1a\x1e.bus_booking.BookSeatsResponse\x12V\n\rBookItinerary\x12!.bus_booking.BookItineraryRequest\x1a\".bus_booking.BookItineraryResponse\x12M\n\nUploadFile\x12\x1e.bus_booking.UploadFileRequest\x1a\x1f.bus_booking.UploadFileResponse\x12O\n\x10UploadFileStream\x12\x18.bus_booking.UploadChunk\x1a\x1f.bus_booking.UploadFileResponse(\x01\x12J\n\x11StreamSeatUpdates\x12\x1a.bus_booking.StreamRequest\x1a\x17.bus_booking.SeatUpdate0\x01\x12J\n\nGetBooking\x12\x1e.bus_booking.GetBookingRequest\x1a\x1c.bus_booking.BookingResponse\x12S\n\x0cListBookings\x12 .bus_booking.ListBookingsRequest\x1a!.bus_booking.ListBookingsResponseb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -58,33 +58,51 @@ if not _descriptor._USE_C_DESCRIPTORS:
   _globals['_GETSEATSREQUEST']._serialized_start=645
   _globals['_GETSEATSREQUEST']._serialized_end=679
   _globals['_SEATSTATUS']._serialized_start=681
-  _globals['_SEATSTATUS']._serialized_end=750
-  _globals['_SEATSRESPONSE']._serialized_start=753
-  _globals['_SEATSRESPONSE']._serialized_end=893
-  _globals['_SEATSRESPONSE_SEATSENTRY']._serialized_start=824
-  _globals['_SEATSRESPONSE_SEATSENTRY']._serialized_end=893
-  _globals['_SELECTSEATREQUEST']._serialized_start=895
-  _globals['_SELECTSEATREQUEST']._serialized_end=968
-  _globals['_SELECTSEATRESPONSE']._serialized_start=970
-  _globals['_SELECTSEATRESPONSE']._serialized_end=1024
-  _globals['_UNSELECTSEATREQUEST']._serialized_start=1026
-  _globals['_UNSELECTSEATREQUEST']._serialized_end=1101
-  _globals['_CUSTOMERINFO']._serialized_start=1103
-  _globals['_CUSTOMERINFO']._serialized_end=1175
-  _globals['_BOOKSEATSREQUEST']._serialized_start=1177
-  _globals['_BOOKSEATSREQUEST']._serialized_end=1300
-  _globals['_BOOKSEATSRESPONSE']._serialized_start=1302
-  _globals['_BOOKSEATSRESPONSE']._serialized_end=1375
-  _globals['_UPLOADFILEREQUEST']._serialized_start=1377
-  _globals['_UPLOADFILEREQUEST']._serialized_end=1453
-  _globals['_UPLOADFILERESPONSE']._serialized_start=1455
-  _globals['_UPLOADFILERESPONSE']._serialized_end=1527
-  _globals['_STREAMREQUEST']._serialized_start=1529
-  _globals['_STREAMREQUEST']._serialized_end=1562
-  _globals['_SEATUPDATE']._serialized_start=1565
-  _globals['_SEATUPDATE']._serialized_end=1735
-  _globals['_SEATUPDATE_SEATSENTRY']._serialized_start=824
-  _globals['_SEATUPDATE_SEATSENTRY']._serialized_end=893
-  _globals['_BUSBOOKINGSERVICE']._serialized_start=1738
-  _globals['_BUSBOOKINGSERVICE']._serialized_end=2507
+  _globals['_SEATSTATUS']._serialized_end=807
+  _globals['_SEATSRESPONSE']._serialized_start=810
+  _globals['_SEATSRESPONSE']._serialized_end=950
+  _globals['_SEATSRESPONSE_SEATSENTRY']._serialized_start=881
+  _globals['_SEATSRESPONSE_SEATSENTRY']._serialized_end=950
+  _globals['_SELECTSEATREQUEST']._serialized_start=952
+  _globals['_SELECTSEATREQUEST']._serialized_end=1025
+  _globals['_SELECTSEATRESPONSE']._serialized_start=1027
+  _globals['_SELECTSEATRESPONSE']._serialized_end=1081
+  _globals['_UNSELECTSEATREQUEST']._serialized_start=1083
+  _globals['_UNSELECTSEATREQUEST']._serialized_end=1158
+  _globals['_CUSTOMERINFO']._serialized_start=1160
+  _globals['_CUSTOMERINFO']._serialized_end=1232
+  _globals['_BOOKSEATSREQUEST']._serialized_start=1235
+  _globals['_BOOKSEATSREQUEST']._serialized_end=1383
+  _globals['_BOOKSEATSRESPONSE']._serialized_start=1385
+  _globals['_BOOKSEATSRESPONSE']._serialized_end=1458
+  _globals['_ITINERARYLEG']._serialized_start=1460
+  _globals['_ITINERARYLEG']._serialized_end=1509
+  _globals['_BOOKITINERARYREQUEST']._serialized_start=1512
+  _globals['_BOOKITINERARYREQUEST']._serialized_end=1670
+  _globals['_BOOKITINERARYRESPONSE']._serialized_start=1672
+  _globals['_BOOKITINERARYRESPONSE']._serialized_end=1772
+  _globals['_UPLOADFILEREQUEST']._serialized_start=1774
+  _globals['_UPLOADFILEREQUEST']._serialized_end=1850
+  _globals['_UPLOADFILERESPONSE']._serialized_start=1852
+  _globals['_UPLOADFILERESPONSE']._serialized_end=1959
+  _globals['_UPLOADCHUNK']._serialized_start=1962
+  _globals['_UPLOADCHUNK']._serialized_end=2092
+  _globals['_STREAMREQUEST']._serialized_start=2094
+  _globals['_STREAMREQUEST']._serialized_end=2127
+  _globals['_SEATUPDATE']._serialized_start=2130
+  _globals['_SEATUPDATE']._serialized_end=2300
+  _globals['_SEATUPDATE_SEATSENTRY']._serialized_start=881
+  _globals['_SEATUPDATE_SEATSENTRY']._serialized_end=950
+  _globals['_BOOKING']._serialized_start=2303
+  _globals['_BOOKING']._serialized_end=2491
+  _globals['_GETBOOKINGREQUEST']._serialized_start=2493
+  _globals['_GETBOOKINGREQUEST']._serialized_end=2532
+  _globals['_BOOKINGRESPONSE']._serialized_start=2534
+  _globals['_BOOKINGRESPONSE']._serialized_end=2624
+  _globals['_LISTBOOKINGSREQUEST']._serialized_start=2626
+  _globals['_LISTBOOKINGSREQUEST']._serialized_end=2709
+  _globals['_LISTBOOKINGSRESPONSE']._serialized_start=2712
+  _globals['_LISTBOOKINGSRESPONSE']._serialized_end=2856
+  _globals['_BUSBOOKINGSERVICE']._serialized_start=2859
+  _globals['_BUSBOOKINGSERVICE']._serialized_end=3958
 # @@protoc_insertion_point(module_scope)
@@ -75,16 +75,36 @@ class BusBookingServiceStub(object):
                 request_serializer=bus__booking__pb2.BookSeatsRequest.SerializeToString,
                 response_deserializer=bus__booking__pb2.BookSeatsResponse.FromString,
                 _registered_method=True)
+        self.BookItinerary = channel.unary_unary(
+                '/bus_booking.BusBookingService/BookItinerary',
+                request_serializer=bus__booking__pb2.BookItineraryRequest.SerializeToString,
+                response_deserializer=bus__booking__pb2.BookItineraryResponse.FromString,
+                _registered_method=True)
         self.UploadFile = channel.unary_unary(
                 '/bus_booking.BusBookingService/UploadFile',
                 request_serializer=bus__booking__pb2.UploadFileRequest.SerializeToString,
                 response_deserializer=bus__booking__pb2.UploadFileResponse.FromString,
                 _registered_method=True)
+        self.UploadFileStream = channel.stream_unary(
+                '/bus_booking.BusBookingService/UploadFileStream',
+                request_serializer=bus__booking__pb2.UploadChunk.SerializeToString,
+                response_deserializer=bus__booking__pb2.UploadFileResponse.FromString,
+                _registered_method=True)
         self.StreamSeatUpdates = channel.unary_stream(
                 '/bus_booking.BusBookingService/StreamSeatUpdates',
                 request_serializer=bus__booking__pb2.StreamRequest.SerializeToString,
                 response_deserializer=bus__booking__pb2.SeatUpdate.FromString,
                 _registered_method=True)
+        self.GetBooking = channel.unary_unary(
+                '/bus_booking.BusBookingService/GetBooking',
+                request_serializer=bus__booking__pb2.GetBookingRequest.SerializeToString,
+                response_deserializer=bus__booking__pb2.BookingResponse.FromString,
+                _registered_method=True)
+        self.ListBookings = channel.unary_unary(
+                '/bus_booking.BusBookingService/ListBookings',
+                request_serializer=bus__booking__pb2.ListBookingsRequest.SerializeToString,
+                response_deserializer=bus__booking__pb2.ListBookingsResponse.FromString,
+                _registered_method=True)
 
 
 class BusBookingServiceServicer(object):
@@ -147,6 +167,13 @@ class BusBookingServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def BookItinerary(self, request, context):
+        """Đặt vé nhiều chặng (khứ hồi / trung chuyển) - tất cả hoặc không
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def UploadFile(self, request, context):
         """Upload file
         """
@@ -154,6 +181,13 @@ class BusBookingServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def UploadFileStream(self, request_iterator, context):
+        """Upload file theo chunk (client streaming) - resume bằng cùng upload_id
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def StreamSeatUpdates(self, request, context):
         """Stream realtime seat updates
         """
@@ -161,6 +195,20 @@ class BusBookingServiceServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def GetBooking(self, request, context):
+        """Tra cứu đơn đặt vé theo mã vé
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def ListBookings(self, request, context):
+        """Liệt kê đơn đặt vé theo phone hoặc CCCD (phân trang)
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_BusBookingServiceServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -204,16 +252,36 @@ def add_BusBookingServiceServicer_to_server(servicer, server):
                     request_deserializer=bus__booking__pb2.BookSeatsRequest.FromString,
                     response_serializer=bus__booking__pb2.BookSeatsResponse.SerializeToString,
             ),
+            'BookItinerary': grpc.unary_unary_rpc_method_handler(
+                    servicer.BookItinerary,
+                    request_deserializer=bus__booking__pb2.BookItineraryRequest.FromString,
+                    response_serializer=bus__booking__pb2.BookItineraryResponse.SerializeToString,
+            ),
             'UploadFile': grpc.unary_unary_rpc_method_handler(
                     servicer.UploadFile,
                     request_deserializer=bus__booking__pb2.UploadFileRequest.FromString,
                     response_serializer=bus__booking__pb2.UploadFileResponse.SerializeToString,
             ),
+            'UploadFileStream': grpc.stream_unary_rpc_method_handler(
+                    servicer.UploadFileStream,
+                    request_deserializer=bus__booking__pb2.UploadChunk.FromString,
+                    response_serializer=bus__booking__pb2.UploadFileResponse.SerializeToString,
+            ),
             'StreamSeatUpdates': grpc.unary_stream_rpc_method_handler(
                     servicer.StreamSeatUpdates,
                     request_deserializer=bus__booking__pb2.StreamRequest.FromString,
                     response_serializer=bus__booking__pb2.SeatUpdate.SerializeToString,
             ),
+            'GetBooking': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetBooking,
+                    request_deserializer=bus__booking__pb2.GetBookingRequest.FromString,
+                    response_serializer=bus__booking__pb2.BookingResponse.SerializeToString,
+            ),
+            'ListBookings': grpc.unary_unary_rpc_method_handler(
+                    servicer.ListBookings,
+                    request_deserializer=bus__booking__pb2.ListBookingsRequest.FromString,
+                    response_serializer=bus__booking__pb2.ListBookingsResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'bus_booking.BusBookingService', rpc_method_handlers)
@@ -442,6 +510,33 @@ class BusBookingService(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def BookItinerary(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/bus_booking.BusBookingService/BookItinerary',
+            bus__booking__pb2.BookItineraryRequest.SerializeToString,
+            bus__booking__pb2.BookItineraryResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def UploadFile(request,
             target,
@@ -469,6 +564,33 @@ class BusBookingService(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def UploadFileStream(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_unary(
+            request_iterator,
+            target,
+            '/bus_booking.BusBookingService/UploadFileStream',
+            bus__booking__pb2.UploadChunk.SerializeToString,
+            bus__booking__pb2.UploadFileResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def StreamSeatUpdates(request,
             target,
@@ -495,3 +617,57 @@ class BusBookingService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def GetBooking(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/bus_booking.BusBookingService/GetBooking',
+            bus__booking__pb2.GetBookingRequest.SerializeToString,
+            bus__booking__pb2.BookingResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def ListBookings(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/bus_booking.BusBookingService/ListBookings',
+            bus__booking__pb2.ListBookingsRequest.SerializeToString,
+            bus__booking__pb2.ListBookingsResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -6,9 +6,10 @@ Kiến trúc:
 - Network handler để giao tiếp với bus booking server
 """
 
-from flask import Flask, render_template, jsonify, request, send_from_directory
+from flask import Flask, g, render_template, jsonify, request, send_from_directory
 from flask_socketio import SocketIO, emit
 from flask_cors import CORS
+import hmac
 import os
 import sys
 
@@ -25,6 +26,10 @@ if USE_SSL:
 else:
     from network import NetworkHandler
     print("[Client] ⚠️ Sử dụng kết nối không mã hóa (non-SSL)")
+from network import (REQUEST_TIMEOUT, set_request_deadline, clear_request_deadline, set_request_user,
+                     clear_request_user)
+from common import tracing
+from config import STAFF_CONFIG, TRACING_CONFIG
 
 # Khởi tạo Flask app
 # static_folder phải là đường dẫn tuyệt đối hoặc tương đối từ client directory
@@ -56,6 +61,53 @@ def ignore_invalid_requests():
             from flask import abort
             abort(400)  # Bad Request, nhưng không log chi tiết
 
+# Hạn chót cho mọi lệnh TCP của 1 request HTTP: header X-Request-Timeout (giây), mặc định REQUEST_TIMEOUT
+@app.before_request
+def start_request_deadline():
+    try:
+        timeout = float(request.headers.get('X-Request-Timeout', REQUEST_TIMEOUT))
+    except ValueError:
+        timeout = REQUEST_TIMEOUT
+    set_request_deadline(min(max(timeout, 0.1), REQUEST_TIMEOUT))
+
+@app.teardown_request
+def end_request_deadline(exc=None):
+    clear_request_deadline()
+
+# Mọi người dùng web đi chung 1 session TCP: gửi kèm địa chỉ IP người dùng (END_USER_FIELD) để server giới hạn
+# tốc độ theo từng người thay vì cả site. Không dùng cookie: bỏ cookie là có định danh mới -> né được giới hạn
+@app.before_request
+def start_request_user():
+    set_request_user(request.remote_addr)
+
+@app.teardown_request
+def end_request_user(exc=None):
+    clear_request_user()
+
+# Trace của request HTTP (TRACING_ENABLED): nối tiếp header traceparent của trình duyệt nếu có, không thì trace mới;
+# mọi lệnh TCP / gRPC trong request gửi kèm traceparent -> span phía server nằm chung trace (trace_report.py)
+tracing.configure(**TRACING_CONFIG)
+
+@app.before_request
+def start_request_trace():
+    name = request.url_rule.rule if request.url_rule else request.path
+    g.trace = tracing.start_trace(f'{request.method} {name}',
+                                  request.headers.get(tracing.TRACEPARENT_HEADER)).begin()
+
+@app.after_request
+def add_trace_header(response):
+    trace = g.get('trace')
+    if trace:
+        trace.set('status', response.status_code)
+        response.headers[tracing.TRACE_ID_HEADER] = trace.trace_id
+    return response
+
+@app.teardown_request
+def end_request_trace(exc=None):
+    trace = g.pop('trace', None)
+    if trace:
+        trace.end(type(exc).__name__ if exc is not None else None)
+
 # Custom error handler để không log các lỗi TLS handshake
 @app.errorhandler(400)
 def handle_bad_request(e):
@@ -191,7 +243,8 @@ def book_seats():
         'BOOK_SEATS',
         trip_id=data.get('trip_id'),
         seat_ids=data.get('seat_ids'),
-        customer_info=data.get('customer_info')
+        customer_info=data.get('customer_info'),
+        idempotency_key=data.get('idempotency_key')  # None -> NetworkHandler tự sinh
     )
     
     # Reset selection sau khi đặt thành công
@@ -202,6 +255,25 @@ def book_seats():
     return jsonify(response or {'success': False, 'message': 'Lỗi kết nối'})
 
 
+@app.route('/api/book-itinerary', methods=['POST'])
+def book_itinerary():
+    """Đặt vé nhiều chặng (khứ hồi / trung chuyển) - tất cả hoặc không"""
+    data = request.json
+    
+    response = network.send_request(
+        'BOOK_ITINERARY',
+        legs=data.get('legs'),
+        customer_info=data.get('customer_info'),
+        idempotency_key=data.get('idempotency_key')
+    )
+    
+    if response and response.get('success'):
+        current_selection['trip_id'] = None
+        current_selection['selected_seats'] = []
+    
+    return jsonify(response or {'success': False, 'message': 'Lỗi kết nối'})
+
+
 @app.route('/api/trip-info/<trip_id>', methods=['GET'])
 def get_trip_info(trip_id):
     """Lấy thông tin chuyến"""
@@ -209,6 +281,51 @@ def get_trip_info(trip_id):
     return jsonify(response or {'error': 'Không kết nối được server'})
 
 
+STAFF_TOKEN_HEADER = 'X-Staff-Token'
+BOOKING_NOT_FOUND = {'success': False, 'message': 'Không tìm thấy đơn'}
+
+
+def is_staff() -> bool:
+    """Request mang đúng STAFF_TOKEN (STAFF_CONFIG rỗng = không ai là nhân viên)"""
+    token = request.headers.get(STAFF_TOKEN_HEADER, '')
+    return bool(STAFF_CONFIG['token']) and hmac.compare_digest(token.encode(), STAFF_CONFIG['token'].encode())
+
+
+@app.route('/api/bookings/<booking_id>', methods=['GET'])
+def get_booking(booking_id):
+    """Tra cứu đơn theo mã vé: nhân viên (X-Staff-Token) xem đầy đủ; khách cần ?phone= đúng số đặt vé,
+    response không kèm CCCD. Sai số điện thoại trả giống đơn không tồn tại (không dò được mã vé)"""
+    staff = is_staff()
+    phone = request.args.get('phone', '')
+    if not staff and not phone:
+        return jsonify({'success': False, 'message': 'Cần số điện thoại đặt vé'}), 400
+    response = network.send_request('GET_BOOKING', booking_id=booking_id)
+    if not response:
+        return jsonify({'success': False, 'message': 'Không kết nối được server'})
+    if staff:
+        return jsonify(response)
+    booking = response.get('booking') or {}
+    if not response.get('success') or not hmac.compare_digest(str(booking.get('customer_phone', '')).encode(), phone.encode()):
+        return jsonify(BOOKING_NOT_FOUND), 404
+    booking = {key: value for key, value in booking.items() if key != 'customer_cccd'}
+    return jsonify({'success': True, 'booking': booking})
+
+
+@app.route('/api/bookings', methods=['GET'])
+def list_bookings():
+    """Liệt kê đơn đặt vé theo phone hoặc CCCD (?phone=...&page=1&page_size=20) - chỉ nhân viên"""
+    if not is_staff():
+        return jsonify({'success': False, 'message': 'Chỉ nhân viên được tra cứu danh sách đơn'}), 403
+    response = network.send_request(
+        'LIST_BOOKINGS',
+        phone=request.args.get('phone'),
+        cccd=request.args.get('cccd'),
+        page=request.args.get('page', 1, type=int),
+        page_size=request.args.get('page_size', 20, type=int)
+    )
+    return jsonify(response or {'success': False, 'message': 'Không kết nối được server'})
+
+
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
     """Upload file qua TCP"""
@@ -221,16 +338,17 @@ def upload_file():
     if file.filename == '':
         return jsonify({'success': False, 'message': 'Chưa chọn file'})
     
-    # Đọc nội dung file
-    file_data = file.read()
-    
-    # Gửi qua TCP (convert bytes to hex string để JSON serialize)
-    response = network.send_request(
-        'UPLOAD_FILE',
-        filename=file.filename,
-        file_data=file_data.hex(),
-        booking_id=booking_id
-    )
+    if hasattr(network, 'upload_stream'):
+        # Gửi theo chunk nhị phân (file đã được Flask lưu tạm, không đọc hết vào RAM)
+        response = network.upload_stream(file.stream, file.filename, booking_id=booking_id)
+    else:
+        # SSL client (protocol v2): 1 frame JSON, bytes -> hex string
+        response = network.send_request(
+            'UPLOAD_FILE',
+            filename=file.filename,
+            file_data=file.read().hex(),
+            booking_id=booking_id
+        )
     
     return jsonify(response or {'success': False, 'message': 'Lỗi upload'})
 
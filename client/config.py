@@ -13,3 +13,19 @@ SSL_CLIENT_CONFIG = {
     'verify_cert': os.getenv('SSL_VERIFY_CERT', 'false').lower() == 'true'  # False cho dev với self-signed certs
 }
 
+# Tra cứu đơn cho nhân viên (/api/bookings, /api/bookings/<id> đầy đủ): header X-Staff-Token phải khớp;
+# '' = tắt, khách chỉ tra được 1 đơn bằng mã vé + số điện thoại đặt vé (không kèm CCCD)
+STAFF_CONFIG = {
+    'token': os.getenv('STAFF_TOKEN', '')
+}
+
+
+# Tracing: mỗi request HTTP mở 1 trace (header X-Trace-Id của response), traceparent đi kèm request TCP / gRPC
+TRACING_CONFIG = {
+    'service': os.getenv('TRACE_SERVICE', 'flask-client'),
+    'enabled': os.getenv('TRACING_ENABLED', 'false').lower() == 'true',
+    'path': os.getenv('TRACE_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'traces', 'client.jsonl')),
+    'collector': os.getenv('TRACE_COLLECTOR_URL', ''),  # vd http://localhost:4318/v1/traces
+    'sample_rate': float(os.getenv('TRACE_SAMPLE_RATE', '1.0')),  # tỉ lệ request HTTP được trace
+    'max_queue': int(os.getenv('TRACE_MAX_QUEUE', '10000'))
+}
@@ -7,10 +7,16 @@ Chức năng:
 """
 
 import grpc
+import hashlib
+import time
 import uuid
 from typing import Optional, Dict, List, Callable
 import threading
 
+from network import request_timeout
+from common import tracing
+from common.codec import seat_status_from_pb
+
 # Import generated gRPC code
 try:
     import bus_booking_pb2
@@ -52,11 +58,22 @@ class gRPCClient:
         
         print(f"[gRPC Client] ✅ Đã kết nối với {server_address}")
     
+    @staticmethod
+    def _timeout() -> float:
+        """Deadline của RPC unary: phần còn lại của hạn chót request (network.set_request_deadline)"""
+        return max(0.0, request_timeout())
+    
+    @staticmethod
+    def _metadata():
+        """Metadata 'traceparent' khi request HTTP đang được trace -> span phía server nằm chung trace"""
+        traceparent = tracing.traceparent()
+        return ((tracing.TRACEPARENT_HEADER, traceparent),) if traceparent is not None else None
+    
     def get_cities(self) -> Optional[Dict]:
         """Lấy danh sách thành phố"""
         try:
             request = bus_booking_pb2.Empty()
-            response = self.stub.GetCities(request)
+            response = self.stub.GetCities(request, timeout=self._timeout(), metadata=self._metadata())
             return {
                 'from_cities': list(response.from_cities),
                 'to_cities': list(response.to_cities)
@@ -72,7 +89,7 @@ class gRPCClient:
                 from_city=from_city or '',
                 to_city=to_city or ''
             )
-            response = self.stub.SearchRoutes(request)
+            response = self.stub.SearchRoutes(request, timeout=self._timeout(), metadata=self._metadata())
             
             routes = []
             for route in response.routes:
@@ -93,7 +110,7 @@ class gRPCClient:
         """Lấy ngày có chuyến"""
         try:
             request = bus_booking_pb2.GetDatesRequest(route_id=route_id)
-            response = self.stub.GetDates(request)
+            response = self.stub.GetDates(request, timeout=self._timeout(), metadata=self._metadata())
             return list(response.dates)
         except Exception as e:
             print(f"[gRPC Client] Lỗi GetDates: {e}")
@@ -106,7 +123,7 @@ class gRPCClient:
                 route_id=route_id,
                 date=date
             )
-            response = self.stub.SearchTrips(request)
+            response = self.stub.SearchTrips(request, timeout=self._timeout(), metadata=self._metadata())
             
             trips = []
             for trip in response.trips:
@@ -130,15 +147,11 @@ class gRPCClient:
         """Lấy trạng thái ghế"""
         try:
             request = bus_booking_pb2.GetSeatsRequest(trip_id=trip_id)
-            response = self.stub.GetSeats(request)
+            response = self.stub.GetSeats(request, timeout=self._timeout(), metadata=self._metadata())
             
             seats = {}
             for seat_id, seat_status in response.seats.items():
-                seats[seat_id] = {
-                    'status': seat_status.status,
-                    'locked_by': seat_status.locked_by,
-                    'locked_until': seat_status.locked_until
-                }
+                seats[seat_id] = seat_status_from_pb(seat_status)
             
             return seats
         except Exception as e:
@@ -153,7 +166,7 @@ class gRPCClient:
                 seat_id=seat_id,
                 session_id=self.session_id
             )
-            response = self.stub.SelectSeat(request)
+            response = self.stub.SelectSeat(request, timeout=self._timeout(), metadata=self._metadata())
             return {
                 'success': response.success,
                 'message': response.message
@@ -170,7 +183,7 @@ class gRPCClient:
                 seat_id=seat_id,
                 session_id=self.session_id
             )
-            response = self.stub.UnselectSeat(request)
+            response = self.stub.UnselectSeat(request, timeout=self._timeout(), metadata=self._metadata())
             return {
                 'success': response.success,
                 'message': response.message
@@ -179,29 +192,74 @@ class gRPCClient:
             print(f"[gRPC Client] Lỗi UnselectSeat: {e}")
             return None
     
-    def book_seats(self, trip_id: str, seat_ids: List[str], customer_info: Dict) -> Optional[Dict]:
-        """Đặt vé"""
-        try:
-            request = bus_booking_pb2.BookSeatsRequest(
-                trip_id=trip_id,
-                seat_ids=seat_ids,
-                customer_info=bus_booking_pb2.CustomerInfo(
-                    name=customer_info['name'],
-                    phone=customer_info['phone'],
-                    cccd=customer_info['cccd'],
-                    email=customer_info.get('email', '')
-                ),
-                session_id=self.session_id
-            )
-            response = self.stub.BookSeats(request)
-            return {
-                'success': response.success,
-                'booking_id': response.booking_id,
-                'message': response.message
-            }
-        except Exception as e:
-            print(f"[gRPC Client] Lỗi BookSeats: {e}")
-            return None
+    def book_seats(self, trip_id: str, seat_ids: List[str], customer_info: Dict,
+                   idempotency_key: str = None, max_retries: int = 2) -> Optional[Dict]:
+        """Đặt vé - có idempotency key nên retry an toàn khi lỗi mạng"""
+        request = bus_booking_pb2.BookSeatsRequest(
+            trip_id=trip_id,
+            seat_ids=seat_ids,
+            customer_info=bus_booking_pb2.CustomerInfo(
+                name=customer_info['name'],
+                phone=customer_info['phone'],
+                cccd=customer_info['cccd'],
+                email=customer_info.get('email', '')
+            ),
+            session_id=self.session_id,
+            idempotency_key=idempotency_key or str(uuid.uuid4())
+        )
+        for attempt in range(max_retries + 1):
+            try:
+                response = self.stub.BookSeats(request, timeout=self._timeout(), metadata=self._metadata())
+                return {
+                    'success': response.success,
+                    'booking_id': response.booking_id,
+                    'message': response.message
+                }
+            except grpc.RpcError as e:
+                print(f"[gRPC Client] Lỗi BookSeats (lần {attempt+1}): {e}")
+                if e.code() not in (grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED):
+                    return None
+                if attempt < max_retries:
+                    time.sleep(0.5)
+            except Exception as e:
+                print(f"[gRPC Client] Lỗi BookSeats: {e}")
+                return None
+        return None
+    
+    def book_itinerary(self, legs: List[Dict], customer_info: Dict,
+                       idempotency_key: str = None, max_retries: int = 2) -> Optional[Dict]:
+        """Đặt vé nhiều chặng: legs = [{'trip_id': ..., 'seat_ids': [...]}]"""
+        request = bus_booking_pb2.BookItineraryRequest(
+            legs=[bus_booking_pb2.ItineraryLeg(trip_id=leg['trip_id'], seat_ids=leg['seat_ids'])
+                  for leg in legs],
+            customer_info=bus_booking_pb2.CustomerInfo(
+                name=customer_info['name'],
+                phone=customer_info['phone'],
+                cccd=customer_info['cccd'],
+                email=customer_info.get('email', '')
+            ),
+            session_id=self.session_id,
+            idempotency_key=idempotency_key or str(uuid.uuid4())
+        )
+        for attempt in range(max_retries + 1):
+            try:
+                response = self.stub.BookItinerary(request, timeout=self._timeout(), metadata=self._metadata())
+                return {
+                    'success': response.success,
+                    'itinerary_id': response.itinerary_id,
+                    'booking_ids': list(response.booking_ids),
+                    'message': response.message
+                }
+            except grpc.RpcError as e:
+                print(f"[gRPC Client] Lỗi BookItinerary (lần {attempt+1}): {e}")
+                if e.code() not in (grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED):
+                    return None
+                if attempt < max_retries:
+                    time.sleep(0.5)
+            except Exception as e:
+                print(f"[gRPC Client] Lỗi BookItinerary: {e}")
+                return None
+        return None
     
     def upload_file(self, filename: str, file_data: bytes, booking_id: str = None) -> Optional[Dict]:
         """Upload file"""
@@ -211,7 +269,7 @@ class gRPCClient:
                 file_data=file_data,
                 booking_id=booking_id or ''
             )
-            response = self.stub.UploadFile(request)
+            response = self.stub.UploadFile(request, timeout=self._timeout(), metadata=self._metadata())
             return {
                 'success': response.success,
                 'filepath': response.filepath,
@@ -221,6 +279,127 @@ class gRPCClient:
             print(f"[gRPC Client] Lỗi UploadFile: {e}")
             return None
     
+    UPLOAD_CHUNK_SIZE = 256 * 1024
+    UPLOAD_MAX_RESUMES = 3
+    
+    def upload_file_stream(self, fileobj, filename: str, booking_id: str = None) -> Optional[Dict]:
+        """Upload file theo chunk qua UploadFileStream (fileobj phải seek được, RAM ~ 1 chunk)
+        
+        Stream lỗi / server báo sai offset -> hỏi server offset đã nhận (như UPLOAD_BEGIN của TCP) rồi mở
+        stream mới với cùng upload_id từ offset đó.
+        """
+        hasher = hashlib.sha256()
+        fileobj.seek(0)
+        for block in iter(lambda: fileobj.read(1024 * 1024), b''):
+            hasher.update(block)
+        size = fileobj.tell()
+        upload_id = uuid.uuid4().hex
+        offset = 0
+        
+        def chunks(start: int):
+            fileobj.seek(start)
+            first = bus_booking_pb2.UploadChunk(
+                upload_id=upload_id, filename=filename, booking_id=booking_id or '',
+                size=size, sha256=hasher.hexdigest(), offset=start
+            )
+            position = start
+            while True:
+                data = fileobj.read(self.UPLOAD_CHUNK_SIZE)
+                if first is not None:
+                    first.data = data
+                    yield first
+                    first = None
+                elif data:
+                    yield bus_booking_pb2.UploadChunk(offset=position, data=data)
+                if not data:
+                    return
+                position += len(data)
+        
+        def status():
+            # Stream chỉ có chunk metadata: server begin (cùng upload_id) rồi finish -> chưa đủ thì trả offset đã nhận
+            probe = bus_booking_pb2.UploadChunk(
+                upload_id=upload_id, filename=filename, booking_id=booking_id or '',
+                size=size, sha256=hasher.hexdigest(), offset=0
+            )
+            return self.stub.UploadFileStream(iter([probe]), timeout=self._timeout(), metadata=self._metadata())
+        
+        result = None
+        for attempt in range(self.UPLOAD_MAX_RESUMES + 1):
+            try:
+                if attempt:
+                    # Resume: gửi tiếp từ offset server đã nhận, không gửi lại phần đã có
+                    response = status()
+                    if not response.success:
+                        offset = response.offset
+                if not attempt or not response.success:
+                    response = self.stub.UploadFileStream(chunks(offset), metadata=self._metadata())
+            except grpc.RpcError as e:
+                print(f"[gRPC Client] UploadFileStream lỗi (lần {attempt + 1}): {e.code()}")
+                time.sleep(0.5)
+                continue
+            result = {
+                'success': response.success,
+                'filepath': response.filepath,
+                'message': response.message,
+                'upload_id': response.upload_id
+            }
+            if response.success or response.offset == offset:
+                return result
+        return result
+    
+    @staticmethod
+    def _booking_to_dict(booking) -> Dict:
+        return {
+            'id': booking.id,
+            'trip_id': booking.trip_id,
+            'seat_ids': list(booking.seat_ids),
+            'customer_name': booking.customer_name,
+            'customer_phone': booking.customer_phone,
+            'customer_cccd': booking.customer_cccd,
+            'uploaded_files': list(booking.uploaded_files),
+            'booking_time': booking.booking_time,
+            'status': booking.status
+        }
+    
+    def get_booking(self, booking_id: str) -> Optional[Dict]:
+        """Tra cứu đơn đặt vé theo mã vé"""
+        try:
+            request = bus_booking_pb2.GetBookingRequest(booking_id=booking_id)
+            response = self.stub.GetBooking(request, timeout=self._timeout(), metadata=self._metadata())
+            result = {
+                'success': response.success,
+                'message': response.message
+            }
+            if response.HasField('booking'):
+                result['booking'] = self._booking_to_dict(response.booking)
+            return result
+        except Exception as e:
+            print(f"[gRPC Client] Lỗi GetBooking: {e}")
+            return None
+    
+    def list_bookings(self, phone: str = None, cccd: str = None,
+                      page: int = 1, page_size: int = 20) -> Optional[Dict]:
+        """Liệt kê đơn đặt vé theo phone hoặc CCCD"""
+        try:
+            request = bus_booking_pb2.ListBookingsRequest(
+                phone=phone or '',
+                cccd=cccd or '',
+                page=page,
+                page_size=page_size
+            )
+            response = self.stub.ListBookings(request, timeout=self._timeout(), metadata=self._metadata())
+            return {
+                'success': response.success,
+                'bookings': [self._booking_to_dict(b) for b in response.bookings],
+                'total': response.total,
+                'page': response.page,
+                'page_size': response.page_size,
+                'message': response.message
+            }
+        except Exception as e:
+            print(f"[gRPC Client] Lỗi ListBookings: {e}")
+            return None
+    
     def stream_seat_updates(self, trip_ids: List[str] = None, callback: Callable = None):
         """
         Stream realtime seat updates
@@ -238,11 +417,7 @@ class gRPCClient:
                 for update in self.stub.StreamSeatUpdates(request):
                     seats = {}
                     for seat_id, seat_status in update.seats.items():
-                        seats[seat_id] = {
-                            'status': seat_status.status,
-                            'locked_by': seat_status.locked_by,
-                            'locked_until': seat_status.locked_until
-                        }
+                        seats[seat_id] = seat_status_from_pb(seat_status)
                     
                     if callback:
                         callback(update.trip_id, seats, update.timestamp)
@@ -1,13 +1,95 @@
 import socket
 import json
+import hashlib
 import threading
 import time
-import struct
 import uuid
-from typing import Optional, Callable
+import os
+import sys
+import itertools
+from contextvars import ContextVar
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import BinaryIO, Optional, Callable
+
+# Thư mục gốc cho module common dùng chung với server
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.protocol import BUDGET_FIELD, END_USER_FIELD, TRACE_FIELD, ConnectionState, HELLO_COMMAND, PING_COMMAND, PROTOCOL_V2, PROTOCOL_V3, PROTOCOL_VERSION, MAX_REQUEST_ID
+from common.framing import DEFAULT_MAX_FRAME_SIZE, FrameReader, configure_socket, send_frame
+from common import codec, tracing
+from common.compression import (DEFAULT_THRESHOLD as COMPRESSION_THRESHOLD, FLAG_COMPRESSED,
+                                available_compressions, decompress, maybe_compress)
+
+# Lệnh có thể tự động retry: chỉ đọc, hoặc lệnh ghi có idempotency key
+IDEMPOTENT_WRITE_COMMANDS = {'BOOK_SEATS', 'BOOK_ITINERARY'}
+RETRYABLE_COMMANDS = {
+    'GET_CITIES', 'SEARCH_ROUTES', 'GET_DATES', 'SEARCH_TRIPS', 'GET_SEATS',
+    'GET_TRIP_INFO', 'GET_BOOKING', 'LIST_BOOKINGS',
+    # Upload theo chunk: idempotent theo upload_id + offset
+    'UPLOAD_BEGIN', 'UPLOAD_CHUNK', 'UPLOAD_FINISH'
+} | IDEMPOTENT_WRITE_COMMANDS
+DEFAULT_MAX_RETRIES = 2
+REQUEST_TIMEOUT = 30.0
+UPLOAD_MAX_RESUMES = 3
+KEEPALIVE_INTERVAL = 30.0  # Giây rảnh trước khi gửi PING (nhỏ hơn IDLE_TIMEOUT / IDLE_PRESSURE_TIMEOUT của server)
+KEEPALIVE_TIMEOUT = 5.0    # PING không trả lời trong thời gian này -> coi kết nối hỏng, kết nối lại
+
+# Hạn chót (time.monotonic) của request HTTP đang xử lý: mọi lệnh TCP trong request đó dùng chung,
+# retry không vượt quá hạn chót và server nhận phần còn lại (BUDGET_FIELD) để bỏ việc client đã thôi đợi
+_request_deadline: ContextVar = ContextVar('request_deadline', default=None)
+
+
+def set_request_deadline(seconds: Optional[float]):
+    """Đặt hạn chót = bây giờ + seconds cho context hiện tại (vd đầu mỗi request Flask); None = bỏ hạn chót"""
+    _request_deadline.set(time.monotonic() + seconds if seconds is not None else None)
+
+
+def clear_request_deadline():
+    _request_deadline.set(None)
+
+
+# Người dùng cuối của request HTTP đang xử lý (cookie session / địa chỉ IP): mọi người dùng web đi chung 1 session TCP,
+# server tính rate limit theo trường này (END_USER_FIELD) khi Flask là frontend tin cậy
+_request_user: ContextVar = ContextVar('request_user', default=None)
+
+
+def set_request_user(user: Optional[str]):
+    """Đặt người dùng cuối cho context hiện tại (vd đầu mỗi request Flask); None = không gửi END_USER_FIELD"""
+    _request_user.set(user)
+
+
+def clear_request_user():
+    _request_user.set(None)
+
+
+def request_user() -> Optional[str]:
+    return _request_user.get()
+
+
+def request_timeout() -> float:
+    """Thời gian còn được đợi cho 1 lần gửi: min(REQUEST_TIMEOUT, phần còn lại của hạn chót), <= 0 = đã quá hạn"""
+    deadline = _request_deadline.get()
+    if deadline is None:
+        return REQUEST_TIMEOUT
+    return min(REQUEST_TIMEOUT, deadline - time.monotonic())
+
 
 class NetworkHandler:
-    def __init__(self, tcp_host: str = 'localhost', tcp_port: int = 55555, udp_port: int = 55556):
+    """TCP client dùng chung cho mọi request của Flask app.
+
+    pipelining=True: bắt tay HELLO lên protocol v3, nhiều thread Flask gửi request đồng thời
+    trên 1 kết nối; 1 reader thread nhận response và trả về đúng caller theo request_id.
+    Server cũ (không biết HELLO) -> v2: request được gửi tuần tự (khóa _io_lock).
+    encodings: thứ tự ưu tiên encoding body ở v3 (mặc định: mọi encoding có sẵn, gọn nhất trước).
+    compression: v3 - báo server các thuật toán nén có sẵn; frame lớn 2 chiều được nén (cờ FLAG_COMPRESSED).
+    max_frame_size: response lớn hơn -> coi như kết nối hỏng (common/framing.py).
+    keepalive: kết nối rảnh quá số giây này -> PING; PING lỗi / mất kết nối -> kết nối lại ở thread nền
+    (trước request kế tiếp của người dùng). 0 = tắt.
+    """
+
+    def __init__(self, tcp_host: str = 'localhost', tcp_port: int = 55555, udp_port: int = 55556,
+                 pipelining: bool = True, encodings: Optional[list] = None, compression: bool = True,
+                 max_frame_size: int = DEFAULT_MAX_FRAME_SIZE, keepalive: float = KEEPALIVE_INTERVAL):
         self.tcp_host = tcp_host
         self.tcp_port = tcp_port
         self.udp_port = udp_port
@@ -16,34 +98,166 @@ class NetworkHandler:
         self.connected = False
         self.udp_callback = None
         self.session_id = str(uuid.uuid4())
+        
+        self.pipelining = pipelining
+        self.encodings = [e for e in (encodings or codec.available_encodings())
+                          if e in codec.available_encodings()]
+        self.compressions = available_compressions() if compression else []
+        self.max_frame_size = max_frame_size
+        self._frame_reader = None
+        self.state = ConnectionState()
+        self._connect_lock = threading.Lock()
+        self._io_lock = threading.Lock()        # v2: 1 request / lúc
+        self._send_lock = threading.Lock()      # v3: ghi nguyên frame
+        self._pending = {}                      # v3: request_id -> Future
+        self._pending_lock = threading.Lock()
+        self._request_ids = itertools.count(1)
+        self.keepalive = keepalive
+        self._keepalive_thread = None
+        self._last_used = 0.0                   # time.monotonic() của request gần nhất
 
     def connect(self) -> bool:
+        with self._connect_lock:
+            if self.connected:
+                return True
+            try:
+                if self.tcp_socket:
+                    try: self.tcp_socket.close()
+                    except: pass
+                
+                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                sock.connect((self.tcp_host, self.tcp_port))
+                configure_socket(sock)
+                # Tăng timeout lên 30s để tránh lỗi khi mạng chậm hoặc server xử lý booking lâu
+                sock.settimeout(REQUEST_TIMEOUT)
+                self.tcp_socket = sock
+                self._frame_reader = FrameReader(sock, self.max_frame_size)
+                self.state = ConnectionState()
+                
+                if self.pipelining:
+                    self._hello(sock)
+                if self.state.version >= PROTOCOL_V3:
+                    threading.Thread(target=self._reader_loop, args=(self._frame_reader, self.state),
+                                     daemon=True).start()
+                
+                self.connected = True
+                if self.keepalive > 0 and self._keepalive_thread is None:
+                    self._keepalive_thread = threading.Thread(target=self._keepalive_loop, daemon=True)
+                    self._keepalive_thread.start()
+                print(f"[TCP] Kết nối OK: {self.tcp_host}:{self.tcp_port} "
+                      f"(protocol v{self.state.version}, {self.state.encoding}"
+                      f"{' + protobuf' if self.state.protobuf else ''}"
+                      f"{' + ' + self.state.compression if self.state.compression else ''})")
+                return True
+            except Exception:
+                self.connected = False
+                return False
+
+    def _hello(self, sock):
+        """Bắt tay protocol; server cũ trả Unknown command -> giữ v2"""
+        body = json.dumps({'command': HELLO_COMMAND, 'protocol': PROTOCOL_VERSION,
+                           'encodings': self.encodings, 'compression': self.compressions,
+                           'session_id': self.session_id}).encode('utf-8')
+        send_frame(sock, body, PROTOCOL_V2)
+        response = json.loads(self._read_frame(self._frame_reader, PROTOCOL_V2)[2].decode('utf-8'))
+        if response.get('success') and response.get('protocol', PROTOCOL_V2) >= PROTOCOL_V3:
+            self.state.version = PROTOCOL_V3
+            self.state.encoding = response.get('encoding', codec.ENCODING_JSON)
+            self.state.protobuf = bool(response.get('protobuf'))
+            if response.get('compression') in self.compressions:
+                self.state.compression = response['compression']
+
+    @staticmethod
+    def _read_frame(reader: FrameReader, version: int):
+        frame = reader.read_frame(version)
+        if frame is None: raise ConnectionError("Closed")
+        return frame
+
+    def _next_request_id(self) -> int:
+        return next(self._request_ids) & MAX_REQUEST_ID
+
+    def _reader_loop(self, reader: FrameReader, state):
+        """v3: nhận response, giải mã theo lệnh đã gửi và trả về đúng Future theo request_id"""
+        sock = reader.sock
+        error = None
         try:
-            if self.tcp_socket:
-                try: self.tcp_socket.close()
-                except: pass
-            
-            self.tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.tcp_socket.connect((self.tcp_host, self.tcp_port))
-            # Tăng timeout lên 30s để tránh lỗi khi mạng chậm hoặc server xử lý booking lâu
-            self.tcp_socket.settimeout(30.0)
-            self.connected = True
-            print(f"[TCP] Kết nối OK: {self.tcp_host}:{self.tcp_port}")
-            return True
-        except Exception:
+            while True:
+                try:
+                    request_id, flags, body = self._read_frame(reader, state.version)
+                except socket.timeout:
+                    continue  # Socket vẫn sống; frame đang đọc dở được FrameReader giữ lại, lần sau đọc tiếp
+                with self._pending_lock:
+                    entry = self._pending.pop(request_id, None)
+                if entry is None:
+                    continue  # Caller đã timeout
+                future, command = entry
+                try:
+                    if flags & FLAG_COMPRESSED:
+                        body = decompress(body, state.compression)
+                    future.set_result(codec.decode_response(command, body, flags, state.encoding))
+                except Exception as e:
+                    future.set_exception(e)
+        except Exception as e:
+            error = e
+        
+        # Kết nối hỏng: báo lỗi cho mọi caller đang đợi trên socket này
+        if self.tcp_socket is sock:
             self.connected = False
-            return False
-
-    def _recv_n_bytes(self, n):
-        data = b''
-        while len(data) < n:
-            chunk = self.tcp_socket.recv(n - len(data))
-            if not chunk: raise ConnectionError("Closed")
-            data += chunk
-        return data
-
-    def send_request(self, command: str, max_retries: int = 0, **kwargs) -> Optional[dict]:
-        """Gửi request. Mặc định KHÔNG Retry để tránh duplicate transaction (đặt 2 lần)"""
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+        for future, _ in pending.values():
+            future.set_exception(ConnectionError(f"Mất kết nối: {error}"))
+
+    def _request_v2(self, payload_dict: dict, timeout: float = REQUEST_TIMEOUT) -> dict:
+        with self._io_lock:
+            self.tcp_socket.settimeout(timeout)
+            try:
+                send_frame(self.tcp_socket, json.dumps(payload_dict).encode('utf-8'), PROTOCOL_V2)
+                return json.loads(self._read_frame(self._frame_reader, PROTOCOL_V2)[2].decode('utf-8'))
+            finally:
+                self.tcp_socket.settimeout(REQUEST_TIMEOUT)
+
+    def _request_v3(self, payload_dict: dict, binary: Optional[bytes] = None,
+                    timeout: float = REQUEST_TIMEOUT) -> dict:
+        state = self.state
+        with tracing.span('encode', encoding=state.encoding):
+            if binary is not None:
+                # Dữ liệu file gửi thô, không nén (ảnh / pdf thường đã nén sẵn)
+                payload, flags = codec.pack_binary(payload_dict, binary, state.encoding), codec.FLAG_BINARY
+            else:
+                payload, flags = maybe_compress(codec.dumps(payload_dict, state.encoding),
+                                                state.compression, COMPRESSION_THRESHOLD)
+        request_id = self._next_request_id()
+        future = Future()
+        with self._pending_lock:
+            self._pending[request_id] = (future, payload_dict.get('command'))
+        try:
+            with self._send_lock:
+                send_frame(self.tcp_socket, payload, PROTOCOL_V3, request_id, flags)
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            raise TimeoutError(f"Request {request_id} quá {timeout:.1f}s")
+        finally:
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+
+    def send_request(self, command: str, max_retries: Optional[int] = None,
+                     binary: Optional[bytes] = None, **kwargs) -> Optional[dict]:
+        """Gửi request. Tự retry với lệnh đọc và lệnh ghi có idempotency key.
+
+        Lệnh ghi khác (SELECT_SEAT...) mặc định KHÔNG retry để tránh duplicate transaction.
+        binary: dữ liệu thô (request['data'] phía server) - v3 gửi bằng frame FLAG_BINARY, v2 gửi hex.
+        Có hạn chót (set_request_deadline): mỗi lần gửi chỉ đợi phần còn lại, hết hạn -> None không retry.
+        Đang trong trace (common/tracing.py): request kèm traceparent (TRACE_FIELD).
+        Có người dùng cuối (set_request_user): request kèm END_USER_FIELD.
+        """
+        if command in IDEMPOTENT_WRITE_COMMANDS and not kwargs.get('idempotency_key'):
+            # 1 key cho mọi lần retry -> server trả lại response đầu tiên, không đặt 2 lần
+            kwargs['idempotency_key'] = str(uuid.uuid4())
+        if max_retries is None:
+            max_retries = DEFAULT_MAX_RETRIES if command in RETRYABLE_COMMANDS else 0
+        self._last_used = time.monotonic()
+        
         for attempt in range(max_retries + 1):
             if not self.connected:
                 if not self.connect():
@@ -51,29 +265,101 @@ class NetworkHandler:
                     time.sleep(0.5)
                     continue
 
+            timeout = request_timeout()
+            if timeout <= 0:
+                print(f"[TCP] {command}: đã quá hạn chót của request, không gửi")
+                return None
+
             try:
                 payload_dict = {'command': command, 'session_id': self.session_id, **kwargs}
-                req_body = json.dumps(payload_dict).encode('utf-8')
-                req_header = struct.pack('!I', len(req_body))
-                
-                self.tcp_socket.sendall(req_header)
-                self.tcp_socket.sendall(req_body)
-                
-                length_data = self._recv_n_bytes(4)
-                length = struct.unpack('!I', length_data)[0]
+                # Server bỏ request nếu đã chờ quá thời gian client còn đợi
+                payload_dict[BUDGET_FIELD] = max(1, int(timeout * 1000))
+                user = request_user()
+                if user:
+                    payload_dict[END_USER_FIELD] = user
                 
-                body_data = self._recv_n_bytes(length)
-                return json.loads(body_data.decode('utf-8'))
+                # Request HTTP đang được trace: 1 span / lần gửi, server nối span của nó vào span này
+                with tracing.span(f'tcp {command}', attempt=attempt + 1, protocol=self.state.version):
+                    traceparent = tracing.traceparent()
+                    if traceparent is not None:
+                        payload_dict[TRACE_FIELD] = traceparent
+                    if self.state.version >= PROTOCOL_V3:
+                        return self._request_v3(payload_dict, binary, timeout)
+                    if binary is not None:
+                        payload_dict['data'] = bytes(binary).hex()
+                    return self._request_v2(payload_dict, timeout)
 
+            except TimeoutError as e:
+                print(f"[TCP] Timeout (lần {attempt+1}): {e}")
+                # v2: response trễ sẽ lệch với request sau -> phải bỏ kết nối
+                # v3: response trễ chỉ bị bỏ qua, các request khác trên kết nối không bị ảnh hưởng
+                if self.state.version < PROTOCOL_V3:
+                    self._disconnect()
             except Exception as e:
                 print(f"[TCP] Lỗi IO (lần {attempt+1}): {e}")
-                self.connected = False
+                self._disconnect()
                 # Chỉ retry nếu chưa hết lượt
                 if attempt < max_retries:
                     time.sleep(0.5)
                 
         return None
 
+    def upload_stream(self, fileobj: BinaryIO, filename: str, booking_id: str = '') -> Optional[dict]:
+        """Upload file theo chunk (UPLOAD_BEGIN / UPLOAD_CHUNK / UPLOAD_FINISH), resume khi mất kết nối.
+
+        fileobj phải seek được; chỉ giữ 1 chunk trong RAM.
+        """
+        # Lượt 1: kích thước + SHA-256 (server kiểm tra khi finish)
+        hasher = hashlib.sha256()
+        fileobj.seek(0)
+        for block in iter(lambda: fileobj.read(1024 * 1024), b''):
+            hasher.update(block)
+        size = fileobj.tell()
+        upload_id = uuid.uuid4().hex
+        
+        for _ in range(UPLOAD_MAX_RESUMES + 1):
+            # Begin với cùng upload_id = hỏi server đã nhận tới offset nào
+            response = self.send_request('UPLOAD_BEGIN', upload_id=upload_id, filename=filename,
+                                         size=size, booking_id=booking_id)
+            if not response or not response.get('success'):
+                return response
+            offset = response['offset']
+            chunk_size = response['chunk_size']
+            
+            while offset < size:
+                fileobj.seek(offset)
+                response = self.send_request('UPLOAD_CHUNK', binary=fileobj.read(chunk_size),
+                                             upload_id=upload_id, offset=offset)
+                if not response or 'offset' not in response:
+                    break  # Mất kết nối / upload hết hạn -> begin lại
+                if not response.get('success') and response['offset'] == offset:
+                    return response  # Server từ chối chunk (vd. vượt kích thước đã khai báo)
+                offset = response['offset']  # Sai offset: server báo offset đang chờ
+            else:
+                return self.send_request('UPLOAD_FINISH', upload_id=upload_id, sha256=hasher.hexdigest())
+        return response
+
+    def _keepalive_loop(self):
+        """Thread nền: giữ kết nối sống (PING khi rảnh) và kết nối lại ngay khi kết nối hỏng"""
+        while True:
+            time.sleep(min(self.keepalive, 5.0))
+            if not self.connected:
+                self.connect()
+                continue
+            if time.monotonic() - self._last_used < self.keepalive:
+                continue
+            set_request_deadline(KEEPALIVE_TIMEOUT)
+            if self.send_request(PING_COMMAND, max_retries=0) is None:
+                print("[TCP] PING không có phản hồi, kết nối lại")
+                self._disconnect()
+                self.connect()
+
+    def _disconnect(self):
+        """Đóng kết nối hiện tại; request sau sẽ connect lại"""
+        self.connected = False
+        try: self.tcp_socket.shutdown(socket.SHUT_RDWR)
+        except: pass
+
     def start_udp_listener(self, callback: Callable):
         self.udp_callback = callback
         self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -11,22 +11,35 @@ import ssl
 import json
 import threading
 import time
-import struct
 import uuid
+import os
+import sys
 from typing import Optional, Callable
 from config import SSL_CONFIG
 
+# Thư mục gốc cho module common dùng chung với server
+sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from common.protocol import BUDGET_FIELD, END_USER_FIELD, PROTOCOL_V2, TRACE_FIELD
+from common.framing import DEFAULT_MAX_FRAME_SIZE, FrameReader, configure_socket, send_frame
+from common import tracing
+from network import (DEFAULT_MAX_RETRIES, IDEMPOTENT_WRITE_COMMANDS, REQUEST_TIMEOUT, RETRYABLE_COMMANDS,
+                     request_timeout, request_user)
+
 
 class SSLNetworkHandler:
     """Network handler với SSL/TLS support"""
     
     def __init__(self, tcp_host: str = 'localhost', tcp_port: int = 55555, 
-                 udp_port: int = 55556, verify_cert: bool = False):
+                 udp_port: int = 55556, verify_cert: bool = False,
+                 max_frame_size: int = DEFAULT_MAX_FRAME_SIZE):
         self.tcp_host = tcp_host
         self.tcp_port = tcp_port
         self.udp_port = udp_port
         self.verify_cert = verify_cert  # False cho self-signed certs trong dev
         self.tcp_socket = None
+        self.frame_reader = None
+        self.max_frame_size = max_frame_size
         self.udp_socket = None
         self.connected = False
         self.udp_callback = None
@@ -62,7 +75,9 @@ class SSLNetworkHandler:
             
             # Kết nối
             self.tcp_socket.connect((self.tcp_host, self.tcp_port))
-            self.tcp_socket.settimeout(30.0)
+            configure_socket(self.tcp_socket)
+            self.tcp_socket.settimeout(REQUEST_TIMEOUT)
+            self.frame_reader = FrameReader(self.tcp_socket, self.max_frame_size)
             self.connected = True
             
             # Hiển thị thông tin SSL
@@ -84,18 +99,13 @@ class SSLNetworkHandler:
             self.connected = False
             return False
     
-    def _recv_n_bytes(self, n):
-        """Đọc chính xác n bytes từ socket"""
-        data = b''
-        while len(data) < n:
-            chunk = self.tcp_socket.recv(n - len(data))
-            if not chunk:
-                raise ConnectionError("Closed")
-            data += chunk
-        return data
-    
-    def send_request(self, command: str, max_retries: int = 0, **kwargs) -> Optional[dict]:
-        """Gửi request qua SSL connection"""
+    def send_request(self, command: str, max_retries: Optional[int] = None, **kwargs) -> Optional[dict]:
+        """Gửi request qua SSL connection (retry, hạn chót, traceparent và người dùng cuối như NetworkHandler)"""
+        if command in IDEMPOTENT_WRITE_COMMANDS and not kwargs.get('idempotency_key'):
+            kwargs['idempotency_key'] = str(uuid.uuid4())
+        if max_retries is None:
+            max_retries = DEFAULT_MAX_RETRIES if command in RETRYABLE_COMMANDS else 0
+        
         for attempt in range(max_retries + 1):
             if not self.connected:
                 if not self.connect():
@@ -104,19 +114,33 @@ class SSLNetworkHandler:
                     time.sleep(0.5)
                     continue
             
+            timeout = request_timeout()
+            if timeout <= 0:
+                print(f"[SSL Client] {command}: đã quá hạn chót của request, không gửi")
+                return None
+            
             try:
                 payload_dict = {'command': command, 'session_id': self.session_id, **kwargs}
-                req_body = json.dumps(payload_dict).encode('utf-8')
-                req_header = struct.pack('!I', len(req_body))
-                
-                self.tcp_socket.sendall(req_header)
-                self.tcp_socket.sendall(req_body)
-                
-                length_data = self._recv_n_bytes(4)
-                length = struct.unpack('!I', length_data)[0]
+                payload_dict[BUDGET_FIELD] = max(1, int(timeout * 1000))
+                user = request_user()
+                if user:
+                    payload_dict[END_USER_FIELD] = user
                 
-                body_data = self._recv_n_bytes(length)
-                return json.loads(body_data.decode('utf-8'))
+                with tracing.span(f'ssl {command}', attempt=attempt + 1):
+                    traceparent = tracing.traceparent()
+                    if traceparent is not None:
+                        payload_dict[TRACE_FIELD] = traceparent
+                    req_body = json.dumps(payload_dict).encode('utf-8')
+                    
+                    # Header + body trong 1 lần ghi (1 TLS record)
+                    self.tcp_socket.settimeout(timeout)
+                    send_frame(self.tcp_socket, req_body, PROTOCOL_V2)
+                    
+                    frame = self.frame_reader.read_frame(PROTOCOL_V2)
+                    if frame is None:
+                        raise ConnectionError("Closed")
+                    self.tcp_socket.settimeout(REQUEST_TIMEOUT)
+                    return json.loads(frame[2].decode('utf-8'))
             
             except Exception as e:
                 print(f"[SSL Client] Lỗi IO (lần {attempt+1}): {e}")
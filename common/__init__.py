@@ -0,0 +1 @@
+"""Module dùng chung giữa server và client (protocol TCP)"""
@@ -0,0 +1,205 @@
+"""Codec - Mã hóa body request/response trên TCP (thương lượng theo từng kết nối)
+
+Chức năng:
+- json (mặc định, luôn có): như protocol v2
+- msgpack (nếu cài msgpack): nhị phân, gọn hơn JSON, hỗ trợ bytes (không cần hex)
+- protobuf (nếu có bus_booking_pb2): response của các lệnh catalog / ghế được mã hóa bằng
+  đúng message trong proto/bus_booking.proto (giống gRPC API); frame đó có cờ FLAG_PROTOBUF.
+  Lệnh khác (và response lỗi) dùng encoding gốc của kết nối (json / msgpack).
+
+Encoding chỉ dùng được ở protocol v3 (cần byte flags); HELLO luôn là JSON.
+
+Frame nhị phân (cờ FLAG_BINARY, request UPLOAD_CHUNK): [4 bytes độ dài meta][meta][dữ liệu thô] -
+dữ liệu file đi thẳng trên dây, không hex / không escape, với mọi encoding.
+"""
+
+import json
+import struct
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import bus_booking_pb2
+except Exception:
+    # Chưa generate proto, hoặc runtime protobuf không khớp version lúc generate
+    bus_booking_pb2 = None
+
+ENCODING_JSON = 'json'
+ENCODING_MSGPACK = 'msgpack'
+ENCODING_PROTOBUF = 'protobuf'
+
+FLAG_PROTOBUF = 0x02  # Body là protobuf message của lệnh tương ứng
+FLAG_BINARY = 0x04    # Body = meta (encoding kết nối) + dữ liệu nhị phân thô (request['data'])
+
+_BINARY_META = struct.Struct('!I')
+
+
+def available_encodings() -> List[str]:
+    """Encoding dùng được trong môi trường hiện tại (ưu tiên từ gọn nhất)"""
+    encodings = []
+    if bus_booking_pb2 is not None:
+        encodings.append(ENCODING_PROTOBUF)
+    if msgpack is not None:
+        encodings.append(ENCODING_MSGPACK)
+    encodings.append(ENCODING_JSON)
+    return encodings
+
+
+# ---------- Encoding gốc (json / msgpack) ----------
+
+def dumps(obj, encoding: str) -> bytes:
+    if encoding == ENCODING_MSGPACK:
+        return msgpack.packb(obj, use_bin_type=True)
+    return json.dumps(obj).encode('utf-8')
+
+
+def loads(body: bytes, encoding: str):
+    """Giải mã body; lỗi định dạng -> ValueError"""
+    if encoding == ENCODING_MSGPACK:
+        try:
+            return msgpack.unpackb(body, raw=False)
+        except Exception as e:
+            raise ValueError(f'msgpack không hợp lệ: {e}')
+    return json.loads(body.decode('utf-8'))
+
+
+# ---------- Frame nhị phân ----------
+
+def pack_binary(meta: dict, data: bytes, encoding: str) -> bytes:
+    """Client: ghép meta + dữ liệu thô thành body frame FLAG_BINARY"""
+    meta_bytes = dumps(meta, encoding)
+    return b''.join((_BINARY_META.pack(len(meta_bytes)), meta_bytes, data))
+
+
+def unpack_binary(body, encoding: str) -> dict:
+    """Server: tách body FLAG_BINARY -> meta dict với 'data' là memoryview (không copy) phần dữ liệu"""
+    if len(body) < _BINARY_META.size:
+        raise ValueError('Frame nhị phân thiếu header meta')
+    meta_length = _BINARY_META.unpack_from(body)[0]
+    start = _BINARY_META.size + meta_length
+    if start > len(body):
+        raise ValueError('Frame nhị phân: meta vượt độ dài body')
+    meta = loads(bytes(body[_BINARY_META.size:start]), encoding)
+    if not isinstance(meta, dict):
+        raise ValueError('Meta phải là object')
+    meta['data'] = memoryview(body)[start:]
+    return meta
+
+
+# ---------- Protobuf shape (giống gRPC API) ----------
+
+def seat_status_to_pb(status, seat: dict):
+    """Ghi 1 ghế vào SeatStatus: None giữ nguyên là field không set (decode lại đúng dict ban đầu)"""
+    status.status = seat.get('status') or 'available'
+    if seat.get('locked_by') is not None:
+        status.locked_by = seat['locked_by']
+    if seat.get('locked_at') is not None:
+        status.locked_at = seat['locked_at']
+
+
+def _seats_to_pb(response: dict):
+    pb = bus_booking_pb2.SeatsResponse()
+    for seat_id, seat in response['seats'].items():
+        seat_status_to_pb(pb.seats[seat_id], seat)
+    return pb
+
+
+def seat_status_from_pb(status) -> dict:
+    """Cùng dạng ghế như JSON / msgpack: {'status', 'locked_by', 'locked_at'}, field không set -> None"""
+    return {'status': status.status,
+            'locked_by': status.locked_by if status.HasField('locked_by') else None,
+            'locked_at': status.locked_at if status.HasField('locked_at') else None}
+
+
+def _seats_from_pb(pb) -> dict:
+    return {'seats': {seat_id: seat_status_from_pb(s) for seat_id, s in pb.seats.items()}}
+
+
+def _trips_to_pb(response: dict):
+    return bus_booking_pb2.TripsResponse(trips=[
+        bus_booking_pb2.Trip(
+            id=trip['id'],
+            route_id=trip['route_id'],
+            date=trip['date'],
+            departure_time=trip['departure_time'],
+            bus_code=trip['bus_code'],
+            bus_type=trip.get('bus_type', 'Giường nằm'),
+            total_seats=trip.get('total_seats', 40),
+            available_seats=trip.get('available_seats', 40)
+        ) for trip in response['trips']
+    ])
+
+
+def _trips_from_pb(pb) -> dict:
+    return {'trips': [{
+        'id': t.id, 'route_id': t.route_id, 'date': t.date, 'departure_time': t.departure_time,
+        'bus_code': t.bus_code, 'bus_type': t.bus_type,
+        'total_seats': t.total_seats, 'available_seats': t.available_seats
+    } for t in pb.trips]}
+
+
+def _routes_to_pb(response: dict):
+    return bus_booking_pb2.RoutesResponse(routes=[
+        bus_booking_pb2.Route(
+            id=route['id'],
+            from_city=route['from_city'],
+            to_city=route['to_city'],
+            distance_km=route['distance_km'],
+            base_price=route['base_price']
+        ) for route in response['routes']
+    ])
+
+
+def _routes_from_pb(pb) -> dict:
+    return {'routes': [{
+        'id': r.id, 'from_city': r.from_city, 'to_city': r.to_city,
+        'distance_km': r.distance_km, 'base_price': r.base_price
+    } for r in pb.routes]}
+
+
+# command -> (key bắt buộc trong response, message class name, dict -> pb, pb -> dict)
+_PROTOBUF_SHAPES: Dict[str, Tuple[str, str, Callable, Callable]] = {
+    'GET_CITIES': ('from_cities', 'CitiesResponse',
+                   lambda r: bus_booking_pb2.CitiesResponse(from_cities=r['from_cities'], to_cities=r['to_cities']),
+                   lambda pb: {'from_cities': list(pb.from_cities), 'to_cities': list(pb.to_cities)}),
+    'SEARCH_ROUTES': ('routes', 'RoutesResponse', _routes_to_pb, _routes_from_pb),
+    'GET_DATES': ('dates', 'DatesResponse',
+                  lambda r: bus_booking_pb2.DatesResponse(dates=r['dates']),
+                  lambda pb: {'dates': list(pb.dates)}),
+    'SEARCH_TRIPS': ('trips', 'TripsResponse', _trips_to_pb, _trips_from_pb),
+    'GET_SEATS': ('seats', 'SeatsResponse', _seats_to_pb, _seats_from_pb),
+}
+
+
+# ---------- API cho server / client ----------
+
+def encode_response(command: Optional[str], response: dict, encoding: str,
+                    use_protobuf: bool = False) -> Tuple[bytes, int]:
+    """Server: mã hóa response -> (body, flags)"""
+    if use_protobuf and command in _PROTOBUF_SHAPES:
+        key, _, to_pb, _ = _PROTOBUF_SHAPES[command]
+        if key in response:
+            return to_pb(response).SerializeToString(), FLAG_PROTOBUF
+    return dumps(response, encoding), 0
+
+
+def decode_response(command: Optional[str], body: bytes, flags: int, encoding: str) -> dict:
+    """Client: giải mã response theo lệnh đã gửi"""
+    if flags & FLAG_PROTOBUF:
+        _, message_name, _, from_pb = _PROTOBUF_SHAPES[command]
+        pb = getattr(bus_booking_pb2, message_name)()
+        pb.ParseFromString(body)
+        return from_pb(pb)
+    return loads(body, encoding)
+
+
+def negotiate_encoding(requested: Optional[List[str]]) -> Tuple[str, bool]:
+    """Server: chọn (encoding gốc, có dùng protobuf không) theo thứ tự ưu tiên của client"""
+    supported = available_encodings()
+    requested = [e for e in (requested or []) if e in supported]
+    base = next((e for e in requested if e != ENCODING_PROTOBUF), ENCODING_JSON)
+    return base, ENCODING_PROTOBUF in requested
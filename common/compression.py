@@ -0,0 +1,76 @@
+"""Compression - Nén body frame lớn (cờ FLAG_COMPRESSED trong header v3)
+
+Chức năng:
+- zlib (luôn có), lz4 (nếu cài lz4) - thuật toán thương lượng 1 lần trong HELLO
+- Chỉ nén khi body >= threshold và bản nén thực sự nhỏ hơn
+- Giải nén có giới hạn kích thước (chống "zip bomb")
+"""
+
+import zlib
+from typing import List, Optional, Tuple
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+FLAG_COMPRESSED = 0x01
+
+COMPRESSION_ZLIB = 'zlib'
+COMPRESSION_LZ4 = 'lz4'
+
+DEFAULT_THRESHOLD = 1024            # bytes
+ZLIB_LEVEL = 1                      # Nhanh nhất; JSON lặp key đã nén được ~9 lần
+MAX_DECOMPRESSED_SIZE = 64 * 1024 * 1024
+
+
+def available_compressions() -> List[str]:
+    """Thuật toán dùng được trong môi trường hiện tại (ưu tiên nhanh nhất)"""
+    if lz4_frame is not None:
+        return [COMPRESSION_LZ4, COMPRESSION_ZLIB]
+    return [COMPRESSION_ZLIB]
+
+
+def negotiate_compression(requested: Optional[List[str]]) -> Optional[str]:
+    """Server: chọn thuật toán đầu tiên trong danh sách client mà server cũng có"""
+    supported = available_compressions()
+    return next((c for c in (requested or []) if c in supported), None)
+
+
+def compress(body: bytes, algorithm: str) -> bytes:
+    if algorithm == COMPRESSION_LZ4:
+        return lz4_frame.compress(body)
+    return zlib.compress(body, ZLIB_LEVEL)
+
+
+def decompress(body: bytes, algorithm: Optional[str], max_size: int = MAX_DECOMPRESSED_SIZE) -> bytes:
+    """Giải nén; sai định dạng, chưa thương lượng hoặc vượt max_size -> ValueError"""
+    if algorithm is None:
+        raise ValueError('Frame nén nhưng kết nối chưa thương lượng compression')
+    try:
+        if algorithm == COMPRESSION_LZ4:
+            decompressor = lz4_frame.LZ4FrameDecompressor()
+            data = decompressor.decompress(body, max_length=max_size + 1)
+            if not decompressor.eof and len(data) <= max_size:
+                raise ValueError('Frame lz4 không đầy đủ')
+        else:
+            decompressor = zlib.decompressobj()
+            data = decompressor.decompress(body, max_size + 1)
+            if not decompressor.eof and len(data) <= max_size:
+                raise ValueError('Frame zlib không đầy đủ')
+    except (zlib.error, RuntimeError) as e:
+        raise ValueError(f'Không giải nén được: {e}')
+    if len(data) > max_size:
+        raise ValueError(f'Body giải nén vượt {max_size} bytes')
+    return data
+
+
+def maybe_compress(body: bytes, algorithm: Optional[str],
+                   threshold: int = DEFAULT_THRESHOLD) -> Tuple[bytes, int]:
+    """Nén nếu đáng -> (body, FLAG_COMPRESSED hoặc 0)"""
+    if algorithm is None or len(body) < threshold:
+        return body, 0
+    compressed = compress(body, algorithm)
+    if len(compressed) >= len(body):
+        return body, 0
+    return compressed, FLAG_COMPRESSED
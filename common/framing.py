@@ -0,0 +1,116 @@
+"""Framing - Đọc / ghi frame TCP trên socket blocking (dùng chung server và client)
+
+Chức năng:
+- Đọc đúng n bytes bằng recv_into vào bytearray cấp phát sẵn (không nối bytes từng chunk)
+- Giới hạn kích thước frame (header khai báo quá lớn -> FrameTooLarge, caller đóng kết nối)
+- Ghi header + body bằng 1 lần sendmsg (vectored, không ghép buffer); TLS: 1 lần sendall
+- Bật TCP_NODELAY: request / response nhỏ không bị Nagle giữ lại
+"""
+
+import socket
+import ssl
+from typing import List, Optional, Tuple
+
+from common.protocol import PROTOCOL_V3, V2_HEADER, V3_HEADER, pack_header, unpack_header
+
+DEFAULT_MAX_FRAME_SIZE = 16 * 1024 * 1024  # Đủ cho upload 5MB dạng hex + JSON
+
+
+class FrameTooLarge(ValueError):
+    """Header khai báo body vượt max_frame_size"""
+
+
+def configure_socket(sock: socket.socket):
+    """Tắt Nagle cho kết nối TCP (bỏ qua nếu socket không hỗ trợ)"""
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except (OSError, AttributeError):
+        pass
+
+
+def recv_exact_into(sock: socket.socket, view: memoryview) -> bool:
+    """Đọc cho đến khi đầy view; False nếu kết nối đóng giữa chừng"""
+    received = 0
+    total = len(view)
+    while received < total:
+        n = sock.recv_into(view[received:])
+        if not n:
+            return False
+        received += n
+    return True
+
+
+def recv_exact(sock: socket.socket, n: int) -> Optional[bytearray]:
+    """Đọc đúng n bytes; None nếu kết nối đóng"""
+    buffer = bytearray(n)
+    if n and not recv_exact_into(sock, memoryview(buffer)):
+        return None
+    return buffer
+
+
+class FrameReader:
+    """Đọc từng frame trên 1 socket; header dùng lại 1 buffer, body cấp phát đúng kích thước
+
+    Socket có timeout: socket.timeout giữa 1 frame không làm mất phần đã đọc - lần gọi read_frame
+    sau đọc tiếp đúng frame đó (không lệch stream).
+    """
+
+    def __init__(self, sock: socket.socket, max_frame_size: int = DEFAULT_MAX_FRAME_SIZE):
+        self.sock = sock
+        self.max_frame_size = max_frame_size
+        self._header = bytearray(V3_HEADER.size)
+        self._header_received = 0
+        self._frame = None  # (request_id, flags, body) đang đọc dở body
+        self._body_received = 0
+
+    def read_frame(self, version: int) -> Optional[Tuple[int, int, bytearray]]:
+        """-> (request_id, flags, body) hoặc None nếu kết nối đóng"""
+        sock = self.sock
+        if self._frame is None:
+            # Tiến độ cập nhật sau mỗi recv: socket.timeout giữa chừng không mất bytes đã đọc
+            header_size = V3_HEADER.size if version >= PROTOCOL_V3 else V2_HEADER.size
+            header = memoryview(self._header)[:header_size]
+            while self._header_received < header_size:
+                n = sock.recv_into(header[self._header_received:])
+                if not n:
+                    return None
+                self._header_received += n
+            self._header_received = 0
+            length, request_id, flags = unpack_header(self._header, version)
+            if length > self.max_frame_size:
+                raise FrameTooLarge(f'Frame {length} bytes vượt giới hạn {self.max_frame_size} bytes')
+            self._frame = (request_id, flags, bytearray(length))
+            self._body_received = 0
+        frame = self._frame
+        body = memoryview(frame[2])
+        while self._body_received < len(body):
+            n = sock.recv_into(body[self._body_received:])
+            if not n:
+                return None
+            self._body_received += n
+        self._frame = None
+        return frame
+
+
+def sendmsg_all(sock: socket.socket, buffers: List[bytes]):
+    """sendmsg cho đến khi gửi hết mọi buffer (xử lý gửi thiếu)"""
+    views = [memoryview(b) for b in buffers if len(b)]
+    while views:
+        sent = sock.sendmsg(views)
+        while sent:
+            if sent >= len(views[0]):
+                sent -= len(views[0])
+                views.pop(0)
+            else:
+                views[0] = views[0][sent:]
+                sent = 0
+
+
+def send_frame(sock: socket.socket, body: bytes, version: int, request_id: int = 0, flags: int = 0):
+    """Gửi header + body trong 1 lần ghi"""
+    header = pack_header(len(body), version, request_id, flags)
+    if isinstance(sock, ssl.SSLSocket) or not hasattr(sock, 'sendmsg'):
+        # SSLSocket không có sendmsg (Windows cũng không): ghép 1 lần -> 1 TLS record / 1 segment
+        sock.sendall(header + body)
+    else:
+        sendmsg_all(sock, [header, body])
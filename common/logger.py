@@ -0,0 +1,237 @@
+"""Logger - Log có cấu trúc, ghi bất đồng bộ: thread xử lý request chỉ thêm record vào ring buffer
+
+Chức năng:
+- get(module) -> ModuleLogger; log.info('{client} -> {command}', client=client_id, command=command):
+  template + field, chỉ format ở thread ghi nền (thread request không giữ lock stdout, không ghi console)
+- Level theo module: level mặc định + levels 'TCP=warning,SeatManager=debug' (module = tiền tố '[TCP]' cũ)
+- Lấy mẫu record debug / info theo module: sampling 'TCP=0.01' giữ ~1% (record JSONL mang sample_rate
+  để nhân ngược); warning / error luôn được ghi
+- Ring buffer (deque maxlen): đầy -> bỏ record cũ nhất, đếm 'dropped' (ước lượng); thread nền gom theo lô
+  mỗi flush_interval giây (hoặc sớm hơn khi buffer đầy quá nửa) -> console '[Module] message'
+  và / hoặc file JSONL (1 record / dòng: ts, level, module, msg, event = template, fields, trace_id)
+- async_mode=False: ghi ngay trên thread gọi (giống print cũ, để so sánh / debug)
+- Chưa configure: info, console, bất đồng bộ; flush() khi dừng server và lúc thoát process
+"""
+
+import atexit
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Union
+
+from common import tracing
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVELS = {'debug': DEBUG, 'info': INFO, 'warning': WARNING, 'error': ERROR}
+_LEVEL_NAMES = {value: name for name, value in LEVELS.items()}
+
+
+def _pairs(value: Union[str, Dict, None]) -> Dict[str, str]:
+    """'TCP=warning, SSL TCP=debug' -> {'TCP': 'warning', 'SSL TCP': 'debug'}"""
+    if isinstance(value, dict):
+        return dict(value)
+    pairs = {}
+    for item in (value or '').split(','):
+        if '=' in item:
+            key, _, val = item.partition('=')
+            pairs[key.strip()] = val.strip()
+    return pairs
+
+
+def _level(name) -> int:
+    if isinstance(name, int):
+        return name
+    try:
+        return LEVELS[str(name).strip().lower()]
+    except KeyError:
+        raise ValueError(f'Log level không hợp lệ: {name}') from None
+
+
+class ModuleLogger:
+    """Logger của 1 module; level / sample_rate do Logger.configure đặt"""
+
+    __slots__ = ('pipeline', 'module', 'level', 'sample_rate')
+
+    def __init__(self, pipeline: 'Logger', module: str):
+        self.pipeline = pipeline
+        self.module = module
+        self.level = INFO
+        self.sample_rate = 1.0
+
+    def enabled(self, level: int) -> bool:
+        return level >= self.level
+
+    def log(self, level: int, template: str, fields: Dict):
+        if level < self.level:
+            return
+        rate = self.sample_rate
+        pipeline = self.pipeline
+        if level < WARNING and rate < 1.0 and random.random() >= rate:
+            pipeline.sampled_out += 1
+            return
+        record = (time.time(), level, self.module, template, fields, rate, tracing.trace_id())
+        if not pipeline.async_mode:
+            pipeline.write_now(record)
+            return
+        # Hot path: chỉ append vào deque (thread-safe, không lock); đầy -> deque tự bỏ record cũ nhất
+        buffer = pipeline.buffer
+        if len(buffer) >= pipeline.buffer_size:
+            pipeline.dropped += 1
+        buffer.append(record)
+        if pipeline.writer is None:
+            pipeline.start()
+        if len(buffer) > pipeline.wake_at:
+            pipeline.wake.set()
+
+    def debug(self, template: str, **fields):
+        self.log(DEBUG, template, fields)
+
+    def info(self, template: str, **fields):
+        self.log(INFO, template, fields)
+
+    def warning(self, template: str, **fields):
+        self.log(WARNING, template, fields)
+
+    def error(self, template: str, **fields):
+        self.log(ERROR, template, fields)
+
+
+class Logger:
+    def __init__(self):
+        self.level = INFO
+        self.levels: Dict[str, int] = {}
+        self.sampling: Dict[str, float] = {}
+        self.console = True
+        self.path: Optional[str] = None
+        self.async_mode = True
+        self.flush_interval = 0.1
+        self.buffer_size = 10000
+
+        self._modules: Dict[str, ModuleLogger] = {}
+        self.buffer: deque = deque(maxlen=self.buffer_size)
+        self.wake_at = self.buffer_size // 2  # Buffer đầy quá mức này -> đánh thức thread ghi sớm
+        self.wake = threading.Event()
+        self.writer: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.sampled_out = 0
+        self.errors = 0
+
+    def configure(self, level: str = 'info', levels: Union[str, Dict, None] = None,
+                  sampling: Union[str, Dict, None] = None, console: bool = True, path: Optional[str] = None,
+                  async_mode: bool = True, buffer_size: int = 10000, flush_interval: float = 0.1):
+        """Gọi 1 lần lúc khởi động (trước khi có tải); module đã get() được cập nhật level / sample_rate"""
+        self.flush()
+        self.level = _level(level)
+        self.levels = {module: _level(name) for module, name in _pairs(levels).items()}
+        self.sampling = {module: min(1.0, max(0.0, float(rate))) for module, rate in _pairs(sampling).items()}
+        self.console = console
+        self.path = path or None
+        self.async_mode = async_mode
+        self.flush_interval = flush_interval
+        if buffer_size != self.buffer_size:
+            self.buffer_size = buffer_size
+            self.wake_at = buffer_size // 2
+            self.buffer = deque(self.buffer, maxlen=buffer_size)
+        if self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        for logger in self._modules.values():
+            self._apply(logger)
+
+    def _apply(self, logger: ModuleLogger):
+        logger.level = self.levels.get(logger.module, self.level)
+        logger.sample_rate = self.sampling.get(logger.module, 1.0)
+
+    def get(self, module: str) -> ModuleLogger:
+        logger = self._modules.get(module)
+        if logger is None:
+            logger = self._modules.setdefault(module, ModuleLogger(self, module))
+            self._apply(logger)
+        return logger
+
+    # ---------- Ghi ----------
+
+    def write_now(self, record: tuple):
+        """async_mode=False: ghi trên thread gọi"""
+        with self._write_lock:
+            self._write([record], flush=False)
+
+    def start(self):
+        with self._start_lock:
+            if self.writer is None:
+                self.writer = threading.Thread(target=self._drain_loop, name='log-writer', daemon=True)
+                self.writer.start()
+                atexit.register(self.flush)
+
+    def _drain_loop(self):
+        while True:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Ghi hết record đang chờ (thread nền gọi định kỳ; server gọi khi dừng)"""
+        with self._write_lock:
+            buffer = self.buffer
+            batch = []
+            while buffer:
+                try:
+                    batch.append(buffer.popleft())
+                except IndexError:
+                    break
+            if batch:
+                self._write(batch)
+
+    @staticmethod
+    def _render(template: str, fields: Dict) -> str:
+        try:
+            return template.format_map(fields)
+        except (KeyError, IndexError, ValueError):
+            return f'{template} {fields}'
+
+    def _write(self, batch: List[tuple], flush: bool = True):
+        """Gọi khi đang giữ _write_lock: 1 lần ghi console + 1 lần ghi file cho cả lô"""
+        try:
+            messages = [self._render(record[3], record[4]) for record in batch]
+            if self.console:
+                sys.stdout.write(''.join(f'[{record[2]}] {message}\n' for record, message in zip(batch, messages)))
+                if flush:
+                    sys.stdout.flush()
+            if self.path:
+                pid = os.getpid()
+                lines = []
+                for (ts, level, module, template, fields, rate, trace_id), message in zip(batch, messages):
+                    entry = {'ts': ts, 'level': _LEVEL_NAMES.get(level, level), 'module': module, 'msg': message,
+                             'event': template, 'pid': pid}
+                    if fields:
+                        entry['fields'] = fields
+                    if rate < 1.0:
+                        entry['sample_rate'] = rate
+                    if trace_id is not None:
+                        entry['trace_id'] = trace_id
+                    lines.append(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(''.join(lines))
+            self.written += len(batch)
+        except Exception as e:
+            self.errors += 1
+            print(f"[Logger] Lỗi ghi log ({len(batch)} record): {e}")
+
+    def get_stats(self) -> Dict:
+        return {'async': self.async_mode, 'level': _LEVEL_NAMES.get(self.level, self.level),
+                'buffered': len(self.buffer), 'buffer_size': self.buffer_size, 'written': self.written,
+                'dropped': self.dropped, 'sampled_out': self.sampled_out, 'errors': self.errors}
+
+
+# Logger của process: module dùng log = logger.get('TCP'); log.info(...)
+pipeline = Logger()
+configure = pipeline.configure
+get = pipeline.get
+flush = pipeline.flush
+get_stats = pipeline.get_stats
@@ -0,0 +1,101 @@
+"""Protocol - Định nghĩa frame TCP dùng chung cho server và client
+
+Chức năng:
+- v2 (mặc định, client cũ): [4 bytes độ dài][body JSON], 1 request / lúc trên mỗi kết nối
+- v3 (bật bằng HELLO): [4 bytes độ dài][4 bytes request_id][1 byte flags][body]
+  + Client gửi nhiều request liên tiếp (pipelining), server xử lý song song
+  + Server có thể trả lời không theo thứ tự, client ghép response theo request_id
+
+Bắt tay: client gửi frame v2 {'command': 'HELLO', 'protocol': 3, 'encodings': [...], 'compression': [...]};
+server trả {'success': True, 'protocol': <version>, 'encoding': ..., 'protobuf': bool, 'compression': str|None}
+(vẫn là frame v2 JSON), từ frame tiếp theo 2 bên dùng version + encoding + compression đó
+(xem common/codec.py, common/compression.py).
+Server cũ trả 'Unknown command: HELLO' -> client ở lại v2.
+
+Request (mọi version) có thể mang BUDGET_FIELD: số ms client còn đợi response tính từ lúc gửi frame
+(thời gian tương đối -> không phụ thuộc đồng hồ 2 máy); server bỏ request đã quá hạn (server/deadlines.py).
+Request có thể mang TRACE_FIELD (W3C traceparent): span phía server nối vào trace của client (common/tracing.py).
+Request có thể mang END_USER_FIELD: định danh người dùng cuối do frontend dồn nhiều người dùng qua 1 session
+(web Flask) gửi kèm; server chỉ tin trường này từ kết nối của frontend tin cậy (server/rate_limiter.py).
+Lệnh quản trị (PROFILE / MEMORY) gửi từ máy khác localhost phải mang ADMIN_TOKEN_FIELD (server/profiler.py).
+
+Keepalive: {'command': 'PING'} (mọi version) -> {'success': True, 'pong': True}; client gửi khi kết nối rảnh
+để server không coi là idle (server/idle_reaper.py) và để phát hiện kết nối hỏng trước request thật.
+"""
+
+import struct
+from typing import Tuple
+
+from common.codec import ENCODING_JSON, negotiate_encoding
+from common.compression import negotiate_compression
+
+PROTOCOL_V2 = 2
+PROTOCOL_V3 = 3
+PROTOCOL_VERSION = PROTOCOL_V3  # Version cao nhất hỗ trợ
+
+HELLO_COMMAND = 'HELLO'
+PING_COMMAND = 'PING'  # Keepalive: trả lời ngay ở tầng frame, không qua rate limit / registry
+BUDGET_FIELD = 'budget_ms'
+TRACE_FIELD = 'traceparent'
+ADMIN_TOKEN_FIELD = 'admin_token'
+END_USER_FIELD = 'end_user'
+
+V2_HEADER = struct.Struct('!I')     # length
+V3_HEADER = struct.Struct('!IIB')   # length, request_id, flags
+
+MAX_REQUEST_ID = 0xFFFFFFFF
+
+
+class ConnectionState:
+    """Trạng thái protocol của 1 kết nối (đổi sau HELLO)"""
+    __slots__ = ('version', 'encoding', 'protobuf', 'compression')
+
+    def __init__(self):
+        self.version = PROTOCOL_V2
+        self.encoding = ENCODING_JSON
+        self.protobuf = False   # Response catalog / ghế mã hóa bằng protobuf (cờ FLAG_PROTOBUF)
+        self.compression = None  # Thuật toán nén body lớn (cờ FLAG_COMPRESSED), None = không nén
+
+    @property
+    def header_size(self) -> int:
+        return V3_HEADER.size if self.version >= PROTOCOL_V3 else V2_HEADER.size
+
+
+def negotiate(request: dict, state: ConnectionState) -> dict:
+    """Xử lý HELLO phía server: chọn version cao nhất cả 2 bên cùng hỗ trợ.
+
+    Caller phải gửi response này bằng version CŨ (đọc state.version trước khi gọi).
+    """
+    if state.version != PROTOCOL_V2:
+        return {'success': False, 'message': 'HELLO chỉ được gửi 1 lần, ngay sau khi kết nối'}
+    try:
+        requested = int(request.get('protocol', PROTOCOL_V2))
+    except (TypeError, ValueError):
+        requested = PROTOCOL_V2
+    state.version = max(PROTOCOL_V2, min(requested, PROTOCOL_VERSION))
+    # Encoding nhị phân / nén cần byte flags -> chỉ bật ở v3
+    if state.version >= PROTOCOL_V3:
+        state.encoding, state.protobuf = negotiate_encoding(request.get('encodings'))
+        state.compression = negotiate_compression(request.get('compression'))
+    return {'success': True, 'protocol': state.version,
+            'encoding': state.encoding, 'protobuf': state.protobuf,
+            'compression': state.compression}
+
+
+def pack_header(length: int, version: int, request_id: int = 0, flags: int = 0) -> bytes:
+    """Header của frame có body dài length bytes"""
+    if version >= PROTOCOL_V3:
+        return V3_HEADER.pack(length, request_id, flags)
+    return V2_HEADER.pack(length)
+
+
+def pack_frame(body: bytes, version: int, request_id: int = 0, flags: int = 0) -> bytes:
+    """Ghép header + body theo version"""
+    return pack_header(len(body), version, request_id, flags) + body
+
+
+def unpack_header(header: bytes, version: int) -> Tuple[int, int, int]:
+    """Tách header -> (length, request_id, flags); v2 luôn có request_id = 0, flags = 0"""
+    if version >= PROTOCOL_V3:
+        return V3_HEADER.unpack_from(header)
+    return V2_HEADER.unpack_from(header)[0], 0, 0
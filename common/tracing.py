@@ -0,0 +1,397 @@
+"""Tracing - Theo dõi 1 request từ route Flask qua NetworkHandler, TCP / gRPC, server, lock ghế tới ghi disk
+
+Chức năng:
+- Trace ID (32 hex) sinh ở route Flask (client.py), truyền theo định dạng W3C traceparent
+  '00-<trace_id>-<span_id cha>-01': field TRACE_FIELD của request TCP (common/protocol.py),
+  metadata 'traceparent' của gRPC, message chuyển tiếp tới authority / shard
+- start_trace(name, traceparent): span gốc của 1 process - nối tiếp trace của bên gọi (traceparent hợp lệ),
+  không có traceparent -> trace mới với xác suất sample_rate (server mặc định 0: chỉ nối tiếp trace của client)
+- span(name, **attrs): đo 1 đoạn trong trace đang chạy (ContextVar) -> cây span cha / con
+- locked(lock, name): chờ lock có đo (span), wrap(fn, name): chạy fn trên thread khác vẫn thuộc trace
+- Không có trace đang chạy (request không mang traceparent / không được lấy mẫu / tracing tắt):
+  span() trả scope no-op dùng chung, không cấp phát
+- Span xong vào hàng đợi, thread nền ghi theo lô:
+  + file JSONL (1 span / dòng, thời gian bắt đầu epoch giây + duration_ms) - đọc bằng trace_report.py
+  + collector OpenTelemetry qua OTLP/HTTP JSON (vd http://localhost:4318/v1/traces, hoặc
+    'python trace_report.py collect' làm collector tại chỗ)
+- Hàng đợi đầy (thread nền không theo kịp) -> bỏ span, đếm 'dropped', không chặn request
+"""
+
+import json
+import os
+import queue
+import random
+import re
+import threading
+import time
+import urllib.request
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+TRACEPARENT_HEADER = 'traceparent'  # Header HTTP / metadata gRPC (W3C Trace Context)
+TRACE_ID_HEADER = 'X-Trace-Id'  # Header response của Flask: trace ID để tra trong trace_report.py
+
+_TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+# (trace_id, span_id) của span đang chạy trong context hiện tại, None = không trace
+_current: ContextVar = ContextVar('trace_span', default=None)
+
+
+def new_trace_id() -> str:
+    return '%032x' % random.getrandbits(128)
+
+
+def new_span_id() -> str:
+    return '%016x' % random.getrandbits(64)
+
+
+def parse_traceparent(value) -> Optional[Tuple[str, str, bool]]:
+    """'00-<trace_id>-<span_id>-<flags>' -> (trace_id, span_id, sampled); sai định dạng -> None"""
+    if not isinstance(value, str):
+        return None
+    match = _TRACEPARENT.match(value.strip().lower())
+    if match is None or match.group(1) == '0' * 32 or match.group(2) == '0' * 16:
+        return None
+    return match.group(1), match.group(2), bool(int(match.group(3), 16) & 1)
+
+
+def format_traceparent(trace_id: str, span_id: str) -> str:
+    return f'00-{trace_id}-{span_id}-01'
+
+
+class _NoopScope:
+    """Scope khi không trace: mọi thao tác đều bỏ qua"""
+    __slots__ = ()
+    trace_id = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def __bool__(self):
+        return False
+
+    def begin(self):
+        return self
+
+    def end(self, error: Optional[str] = None):
+        pass
+
+    def set(self, key: str, value):
+        pass
+
+    def child(self, name: str, start: float, end: float, **attrs):
+        pass
+
+
+NOOP = _NoopScope()
+
+
+class _Scope:
+    """1 span đang đo: dùng với `with`, hoặc begin() / end() khi bắt đầu và kết thúc ở 2 hook khác nhau (Flask)"""
+    __slots__ = ('tracer', 'trace_id', 'span_id', 'parent_id', 'name', 'attrs', 'start', '_token')
+
+    def __init__(self, tracer, trace_id: str, parent_id: Optional[str], name: str, attrs: Dict,
+                 start: Optional[float] = None):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.span_id = new_span_id()
+        self.parent_id = parent_id
+        self.name = name
+        self.attrs = attrs
+        self.start = start  # time.monotonic(); None = lúc begin()
+        self._token = None
+
+    def __enter__(self):
+        return self.begin()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end(exc_type.__name__ if exc_type is not None else None)
+        return False
+
+    def begin(self):
+        if self.start is None:
+            self.start = time.monotonic()
+        self._token = _current.set((self.trace_id, self.span_id))
+        return self
+
+    def end(self, error: Optional[str] = None):
+        end = time.monotonic()
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            _current.set(None)  # end() chạy ở context khác begin()
+        if error:
+            self.attrs['error'] = error
+        self.tracer.emit(self.trace_id, self.span_id, self.parent_id, self.name, self.start, end, self.attrs)
+
+    def set(self, key: str, value):
+        """Thêm thuộc tính cho span (vd kết quả biết được giữa chừng)"""
+        self.attrs[key] = value
+
+    def child(self, name: str, start: float, end: float, **attrs):
+        """Span con đã đo sẵn (time.monotonic), vd thời gian nằm trong hàng đợi trước khi xử lý"""
+        self.tracer.emit(self.trace_id, new_span_id(), self.span_id, name, start, end, attrs)
+
+
+class _TimedLock:
+    """Lấy lock có ghi span thời gian chờ; thời gian giữ lock không tính"""
+    __slots__ = ('tracer', 'lock', 'name', 'attrs')
+
+    def __init__(self, tracer, lock, name: str, attrs: Dict):
+        self.tracer = tracer
+        self.lock = lock
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        start = time.monotonic()
+        self.lock.acquire()
+        self.tracer.record(self.name, start, **self.attrs)
+        return self.lock
+
+    def __exit__(self, exc_type, exc, tb):
+        self.lock.release()
+        return False
+
+
+class Tracer:
+    EXPORT_BATCH = 512  # Số span tối đa mỗi lần ghi file / gửi collector
+
+    def __init__(self):
+        self.service = 'unknown'
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.path = None
+        self.collector = None
+        self.exported = 0
+        self.dropped = 0
+        self.export_errors = 0
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = None
+
+    def configure(self, service: str, enabled: bool = True, path: Optional[str] = None,
+                  collector: Optional[str] = None, sample_rate: float = 1.0, max_queue: int = 10000):
+        """Bật tracing cho process (gọi 1 lần lúc khởi động); enabled=False -> mọi span là no-op
+
+        path: file JSONL nhận span; collector: URL OTLP/HTTP JSON; có thể dùng cả 2.
+        sample_rate: xác suất tạo trace mới khi request không mang traceparent.
+        """
+        self.service = service
+        self.enabled = enabled and bool(path or collector)
+        self.sample_rate = sample_rate
+        self.path = path or None
+        self.collector = collector or None
+        if not self.enabled:
+            return
+        if self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if self._thread is None:
+            self._queue = queue.Queue(maxsize=max_queue)
+            self._thread = threading.Thread(target=self._export_loop, name='trace-exporter', daemon=True)
+            self._thread.start()
+        print(f"[Tracing] {service}: ghi span vào {', '.join(filter(None, (self.path, self.collector)))} "
+              f"(trace mới: {sample_rate:.0%} request)")
+
+    # ---------- Tạo span ----------
+
+    def active(self) -> bool:
+        return _current.get() is not None
+
+    def start_trace(self, name: str, traceparent: Optional[str] = None, start: Optional[float] = None,
+                    **attrs):
+        """Span gốc trong process này (chưa bắt đầu: dùng `with` hoặc begin() / end())
+
+        traceparent hợp lệ -> con của span bên gọi; không có -> trace mới theo sample_rate; còn lại -> NOOP.
+        start: time.monotonic() lúc request thực sự tới (vd lúc nhận frame), mặc định lúc begin().
+        """
+        if not self.enabled:
+            return NOOP
+        parent = parse_traceparent(traceparent)
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+            if not sampled:
+                return NOOP
+        elif self.sample_rate > 0 and random.random() < self.sample_rate:
+            trace_id, parent_id = new_trace_id(), None
+        else:
+            return NOOP
+        return _Scope(self, trace_id, parent_id, name, attrs, start)
+
+    def span(self, name: str, **attrs):
+        """Span con của span đang chạy; không có trace -> NOOP"""
+        current = _current.get()
+        if current is None:
+            return NOOP
+        return _Scope(self, current[0], current[1], name, attrs)
+
+    def record(self, name: str, start: float, end: Optional[float] = None, **attrs):
+        """Ghi span con đã đo sẵn (time.monotonic) của span đang chạy"""
+        current = _current.get()
+        if current is not None:
+            self.emit(current[0], new_span_id(), current[1], name, start,
+                      time.monotonic() if end is None else end, attrs)
+
+    def locked(self, lock, name: str, **attrs):
+        """`with tracing.locked(lock, 'seat.lock_wait'):` - như `with lock:`, có trace thì ghi thời gian chờ"""
+        if _current.get() is None:
+            return lock
+        return _TimedLock(self, lock, name, attrs)
+
+    def wrap(self, fn: Callable, name: str, **attrs) -> Callable:
+        """fn sẽ chạy ở thread khác (executor): chạy trong span con của span hiện tại; không có trace -> fn"""
+        current = _current.get()
+        if current is None:
+            return fn
+
+        def traced(*args, **kwargs):
+            token = _current.set(current)
+            try:
+                with self.span(name, **attrs):
+                    return fn(*args, **kwargs)
+            finally:
+                _current.reset(token)
+        return traced
+
+    def traceparent(self) -> Optional[str]:
+        """traceparent của span đang chạy để gửi kèm request ra ngoài; không có trace -> None"""
+        current = _current.get()
+        return format_traceparent(*current) if current is not None else None
+
+    def trace_id(self) -> Optional[str]:
+        current = _current.get()
+        return current[0] if current is not None else None
+
+    # ---------- Xuất span ----------
+
+    def emit(self, trace_id: str, span_id: str, parent_id: Optional[str], name: str, start: float, end: float,
+             attrs: Dict):
+        # Đổi time.monotonic -> epoch để ghép span của nhiều process / máy
+        offset = time.time() - time.monotonic()
+        span = {'trace_id': trace_id, 'span_id': span_id, 'parent_id': parent_id, 'name': name,
+                'service': self.service, 'pid': os.getpid(), 'start': start + offset,
+                'duration_ms': round((end - start) * 1000, 3), 'attrs': attrs}
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _export_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < self.EXPORT_BATCH:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            try:
+                self._export(batch)
+                self.exported += len(batch)
+            except Exception as e:
+                self.export_errors += 1
+                if self.export_errors == 1 or self.export_errors % 100 == 0:
+                    print(f"[Tracing] Lỗi xuất span (lần {self.export_errors}): {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _export(self, batch: List[Dict]):
+        if self.path:
+            lines = ''.join(json.dumps(span, ensure_ascii=False, default=str) + '\n' for span in batch)
+            # 1 lần write / lô ở chế độ append: worker của nhiều process ghi chung file không chèn lẫn dòng
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(lines)
+        if self.collector:
+            body = json.dumps(to_otlp(batch, self.service)).encode('utf-8')
+            request = urllib.request.Request(self.collector, data=body, method='POST',
+                                             headers={'Content-Type': 'application/json'})
+            with urllib.request.urlopen(request, timeout=5) as response:
+                response.read()
+
+    def flush(self, timeout: float = 2.0) -> bool:
+        """Đợi span đã ghi nhận được xuất hết (gọi khi dừng process, sau flush ghi nền)"""
+        if not self.enabled:
+            return True
+        done = self._queue.all_tasks_done
+        with done:
+            return done.wait_for(lambda: not self._queue.unfinished_tasks, timeout)
+
+    def get_stats(self) -> Dict:
+        return {'enabled': self.enabled, 'queued': self._queue.qsize(), 'exported': self.exported,
+                'dropped': self.dropped, 'export_errors': self.export_errors}
+
+
+def _otlp_value(value) -> Dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def to_otlp(spans: List[Dict], service: str) -> Dict:
+    """Span (định dạng JSONL ở trên) -> body OTLP/HTTP JSON (ExportTraceServiceRequest)"""
+    otlp_spans = []
+    for span in spans:
+        start_ns = int(span['start'] * 1e9)
+        attrs = dict(span['attrs'], pid=span['pid'])
+        otlp_spans.append({
+            'traceId': span['trace_id'],
+            'spanId': span['span_id'],
+            'parentSpanId': span['parent_id'] or '',
+            'name': span['name'],
+            'kind': 1,  # SPAN_KIND_INTERNAL
+            'startTimeUnixNano': str(start_ns),
+            'endTimeUnixNano': str(start_ns + int(span['duration_ms'] * 1e6)),
+            'attributes': [{'key': key, 'value': _otlp_value(value)} for key, value in attrs.items()],
+            'status': {'code': 2} if 'error' in attrs else {}
+        })
+    return {'resourceSpans': [{
+        'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': service}}]},
+        'scopeSpans': [{'scope': {'name': 'bus_booking'}, 'spans': otlp_spans}]
+    }]}
+
+
+def from_otlp(body: Dict) -> List[Dict]:
+    """Body OTLP/HTTP JSON -> danh sách span định dạng JSONL (collector tại chỗ của trace_report.py)"""
+    spans = []
+    for resource_spans in body.get('resourceSpans', []):
+        resource = {item['key']: _from_otlp_value(item.get('value', {}))
+                    for item in resource_spans.get('resource', {}).get('attributes', [])}
+        for scope_spans in resource_spans.get('scopeSpans', []):
+            for span in scope_spans.get('spans', []):
+                attrs = {item['key']: _from_otlp_value(item.get('value', {})) for item in span.get('attributes', [])}
+                start_ns, end_ns = int(span['startTimeUnixNano']), int(span['endTimeUnixNano'])
+                spans.append({'trace_id': span['traceId'], 'span_id': span['spanId'],
+                              'parent_id': span.get('parentSpanId') or None, 'name': span['name'],
+                              'service': resource.get('service.name', 'unknown'), 'pid': attrs.pop('pid', None),
+                              'start': start_ns / 1e9, 'duration_ms': (end_ns - start_ns) / 1e6, 'attrs': attrs})
+    return spans
+
+
+def _from_otlp_value(value: Dict):
+    if 'intValue' in value:
+        return int(value['intValue'])
+    for key in ('stringValue', 'boolValue', 'doubleValue'):
+        if key in value:
+            return value[key]
+    return None
+
+
+# Tracer của process: module dùng trực tiếp tracing.span(...), tracing.start_trace(...)
+tracer = Tracer()
+configure = tracer.configure
+active = tracer.active
+start_trace = tracer.start_trace
+span = tracer.span
+record = tracer.record
+locked = tracer.locked
+wrap = tracer.wrap
+traceparent = tracer.traceparent
+trace_id = tracer.trace_id
+flush = tracer.flush
+get_stats = tracer.get_stats
@@ -0,0 +1,124 @@
+"""Profile Server - Gọi lệnh quản trị PROFILE / MEMORY của server đang chạy (server/profiler.py)
+
+Sampling profiler mọi thread trong N giây -> collapsed stacks cho flamegraph:
+    python profile_server.py cpu --seconds 30 --out server.collapsed
+    flamegraph.pl server.collapsed > server.svg          # hoặc mở file trên https://www.speedscope.app
+    python profile_server.py cpu --seconds 10 --mode wall  # tính cả thread đang chờ (recv, lock, select)
+
+tracemalloc (snapshot làm mốc, chạy tải, rồi diff):
+    python profile_server.py memory start --frames 10
+    python profile_server.py memory snapshot
+    python profile_server.py memory diff --top 30
+    python profile_server.py memory stop
+
+Server chỉ nhận từ localhost; máy khác cần --token (= ADMIN_TOKEN của server, hoặc env ADMIN_TOKEN).
+"""
+
+import argparse
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'client'))
+
+from common.protocol import ADMIN_TOKEN_FIELD
+from network import NetworkHandler
+
+
+def _size(value: int) -> str:
+    for unit in ('B', 'KiB', 'MiB'):
+        if abs(value) < 1024:
+            return f'{value:.0f} {unit}' if unit == 'B' else f'{value:.1f} {unit}'
+        value /= 1024
+    return f'{value:.1f} GiB'
+
+
+def _call(network: NetworkHandler, args, command: str, **kwargs) -> dict:
+    if args.token:
+        kwargs[ADMIN_TOKEN_FIELD] = args.token
+    response = network.send_request(command, **kwargs)
+    if response is None:
+        raise SystemExit(f"[Profile] Không kết nối được {args.host}:{args.port}")
+    if not response.get('success'):
+        raise SystemExit(f"[Profile] {command} lỗi: {response.get('message')}")
+    return response
+
+
+def cpu(network: NetworkHandler, args) -> int:
+    started = _call(network, args, 'PROFILE', action='start', seconds=args.seconds,
+                    interval_ms=args.interval_ms, mode=args.mode)
+    print(f"[Profile] Đang lấy mẫu {started['seconds']:g}s ({started['mode']}, "
+          f"mỗi {started['interval'] * 1000:g}ms)... Ctrl+C để dừng sớm")
+    try:
+        while _call(network, args, 'PROFILE', action='status')['running']:
+            time.sleep(min(1.0, args.seconds))
+    except KeyboardInterrupt:
+        pass
+    result = _call(network, args, 'PROFILE', action='stop', top=args.top)
+
+    with open(args.out, 'w', encoding='utf-8') as f:
+        f.write(result['collapsed'])
+    print(f"[Profile] {result['samples']} mẫu / {result['ticks']} lần lấy mẫu trong {result['elapsed']:.1f}s, "
+          f"overhead {result['overhead']:.2%} -> {args.out}")
+    print(f"\n{'tự thân':>16} {'gồm hàm con':>18}  hàm")
+    for row in result['top']:
+        print(f"{row['self']:>7} {row['self_pct']:>7.1%} {row['total']:>8} {row['total_pct']:>8.1%}  {row['function']}")
+    return 0
+
+
+def memory(network: NetworkHandler, args) -> int:
+    kwargs = {'action': args.action, 'top': args.top, 'group_by': args.group_by}
+    if args.action == 'start' and args.frames:
+        kwargs['frames'] = args.frames
+    if args.action == 'diff':
+        kwargs['update'] = args.update
+    result = _call(network, args, 'MEMORY', **kwargs)
+
+    print(f"[Profile] tracemalloc {'bật' if result['tracing'] else 'tắt'} ({result['frames']} frame), "
+          f"đang giữ {_size(result['traced'])}, đỉnh {_size(result['peak'])}")
+    if args.action == 'snapshot':
+        print(f"\nTổng {_size(result['total'])}:")
+        for row in result['top']:
+            print(f"  {_size(row['size']):>10} {row['count']:>9} khối  {row['location']}")
+    elif args.action == 'diff':
+        print(f"\nChênh lệch so với mốc {_size(result['total_diff'])}:")
+        for row in result['top']:
+            print(f"  {'+' if row['size_diff'] >= 0 else '-'}{_size(abs(row['size_diff'])):>10} "
+                  f"{row['count_diff']:>+9} khối  (còn {_size(row['size'])})  {row['location']}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=55555)
+    parser.add_argument('--token', default=os.getenv('ADMIN_TOKEN', ''), help='ADMIN_TOKEN của server')
+    commands = parser.add_subparsers(dest='mode', required=True)
+
+    profile = commands.add_parser('cpu', help='Sampling profiler mọi thread -> collapsed stacks')
+    profile.add_argument('--seconds', type=float, default=30)
+    profile.add_argument('--interval-ms', type=float, help='Mặc định: PROFILE_INTERVAL_MS của server')
+    profile.add_argument('--mode', choices=('cpu', 'wall'), default='cpu')
+    profile.add_argument('--out', default='server.collapsed')
+    profile.add_argument('--top', type=int, default=20)
+    profile.set_defaults(run=cpu)
+
+    heap = commands.add_parser('memory', help='tracemalloc start / snapshot / diff / stop')
+    heap.add_argument('action', choices=('start', 'snapshot', 'diff', 'stop', 'status'))
+    heap.add_argument('--frames', type=int, help='Số frame traceback (start)')
+    heap.add_argument('--top', type=int, default=20)
+    heap.add_argument('--group-by', choices=('lineno', 'filename', 'traceback'), default='lineno')
+    heap.add_argument('--update', action='store_true', help='diff: lấy snapshot hiện tại làm mốc mới')
+    heap.set_defaults(run=memory)
+
+    args = parser.parse_args()
+    network = NetworkHandler(args.host, args.port, keepalive=0)
+    if not network.connect():
+        print(f"[Profile] Không kết nối được {args.host}:{args.port}")
+        return 1
+    return args.run(network, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,28 +2,51 @@
 
 Chức năng:
 - Xử lý TCP connections với asyncio (hiệu quả hơn threading)
-- Giữ nguyên message framing protocol
+- Lệnh CPU-only chạy inline trên event loop, chỉ I/O chặn mới sang executor
+- Giữ nguyên message framing protocol (v2), hỗ trợ pipelining (v3) sau HELLO
 - Tích hợp với các manager hiện có
+- SIGINT / SIGTERM: dừng có drain (ngừng nhận, xong request đang xử lý, flush ghi nền)
 """
 
 import asyncio
-import struct
-import json
+import contextvars
+import signal
 import time
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
-# Thêm thư mục hiện tại vào sys.path
+# Thêm thư mục hiện tại vào sys.path (+ thư mục gốc cho module common dùng chung với client)
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, current_dir)
+sys.path.insert(1, os.path.dirname(current_dir))
 
 from route_manager import RouteManager
 from trip_manager import TripManager
 from seat_manager import SeatManager
+from cluster import check_topology
 from booking_manager import BookingManager
+from idempotency_cache import IdempotencyCache
+from commands import build_command_registry
+from frame_codec import FrameCodec
+from rate_limiter import RateLimiter
+from idle_reaper import IdleReaper
+from metrics import FanoutCounter, ServerMetrics
+import deadlines
+import profiler
+from priority_scheduler import OVERLOADED
+from seat_map_cache import SeatMapCache
 from file_upload import FileUploadHandler
 from email_service import EmailService
-from config import SERVER_CONFIG, EMAIL_CONFIG
+from graceful_shutdown import flush_state, format_report
+from config import SERVER_CONFIG, EMAIL_CONFIG, IDEMPOTENCY_CONFIG, LOGGING_CONFIG, TRACING_CONFIG
+from common.protocol import (ConnectionState, END_USER_FIELD, HELLO_COMMAND, PING_COMMAND, PROTOCOL_V2, PROTOCOL_V3,
+                             TRACE_FIELD,
+                             pack_header, unpack_header)
+from common import logger, tracing
+from common.framing import FrameTooLarge
+
+log = logger.get('Async TCP')
 
 
 class AsyncBusBookingServer:
@@ -33,13 +56,17 @@ class AsyncBusBookingServer:
         self.tcp_port = tcp_port or SERVER_CONFIG['tcp_port']
         self.udp_port = udp_port or SERVER_CONFIG['udp_port']
         self.host = SERVER_CONFIG['host']
+        logger.configure(**LOGGING_CONFIG)
+        tracing.configure(**TRACING_CONFIG)
         
         self.data_dir = os.path.join(current_dir, 'data')
         self.upload_dir = os.path.join(current_dir, 'uploads')
         
         self.route_manager = RouteManager(self.data_dir)
         self.trip_manager = TripManager(self.data_dir)
+        check_topology(self.data_dir)  # data/shards/ còn trạng thái cluster -> không chạy trên data/ cũ
         self.seat_manager = SeatManager(self.data_dir)
+        self.seat_maps = SeatMapCache(self.seat_manager)  # Seat map mã hóa sẵn theo version từng chuyến
         
         # Initialize Email Service với config từ environment variables
         self.email_service = EmailService(
@@ -51,9 +78,36 @@ class AsyncBusBookingServer:
         )
         self.booking_manager = BookingManager(self.data_dir, email_service=self.email_service)
         self.file_handler = FileUploadHandler(self.upload_dir)
+        self.idempotency_cache = IdempotencyCache(
+            self.data_dir,
+            max_entries=IDEMPOTENCY_CONFIG['max_entries'],
+            ttl=IDEMPOTENCY_CONFIG['ttl_seconds']
+        )
+        
+        # Bảng dispatch lệnh dùng chung với các transport khác (TCP/SSL/Async/gRPC)
+        self.commands = build_command_registry(self)
+        self.frame_codec = FrameCodec(self.commands, SERVER_CONFIG['compression_threshold'],
+                                      SERVER_CONFIG['response_cache_size'])
+        self.rate_limiter = RateLimiter(self.commands)  # Token bucket theo session / kết nối
+        self.metrics = ServerMetrics(self)  # Lệnh STATS + HTTP /metrics (METRICS_PORT)
+        self.udp_fanout = FanoutCounter()
+        self.reaper = IdleReaper()  # Đóng kết nối idle (StreamReader không có timeout đọc)
+        
+        # Executor riêng (giới hạn số thread) cho lệnh blocking: disk, fsync, nén ảnh, email
+        self.inline_commands = SERVER_CONFIG['async_inline_commands']
+        self.blocking_executor = ThreadPoolExecutor(
+            max_workers=SERVER_CONFIG['blocking_workers'],
+            thread_name_prefix='async-blocking'
+        )
         
         self.running = False
+        self.stopped = False
         self.clients = {}
+        self.inflight_frames = 0  # Request đã nhận, chưa gửi xong response (shutdown() đợi về 0)
+        self._tcp_server = None
+        self._loop = None
+        self._stop_event = None
+        self.max_frame_size = SERVER_CONFIG['max_frame_size']  # asyncio tự bật TCP_NODELAY cho kết nối TCP
         
         print("="*60)
         print("HỆ THỐNG ĐẶT VÉ XE KHÁCH (ASYNC MODE)")
@@ -64,18 +118,25 @@ class AsyncBusBookingServer:
         client_addr = writer.get_extra_info('peername')
         connection_id = f"{client_addr[0]}:{client_addr[1]}"
         self.clients[connection_id] = writer
+        self.reaper.track(connection_id, writer.close)
+        
+        log.info('Client connected: {connection}', connection=connection_id)
         
-        print(f"[Async TCP] Client connected: {connection_id}")
+        state = ConnectionState()
+        inflight = asyncio.Semaphore(SERVER_CONFIG['pipeline_max_inflight'])
+        tasks = set()
         
         try:
             while self.running:
-                # 1. Đọc header (4 bytes độ dài)
+                # 1. Đọc header (v2: 4 bytes độ dài, v3: + request_id + flags)
                 try:
-                    length_data = await reader.readexactly(4)
+                    header = await reader.readexactly(state.header_size)
                 except asyncio.IncompleteReadError:
                     break
                 
-                length = struct.unpack('!I', length_data)[0]
+                length, request_id, flags = unpack_header(header, state.version)
+                if length > self.max_frame_size:
+                    raise FrameTooLarge(f'Frame {length} bytes vượt giới hạn {self.max_frame_size} bytes')
                 
                 # 2. Đọc body (JSON payload)
                 try:
@@ -83,194 +144,198 @@ class AsyncBusBookingServer:
                 except asyncio.IncompleteReadError:
                     break
                 
-                try:
-                    request = json.loads(body_data.decode('utf-8'))
-                    command = request.get('command')
-                    
-                    session_id = request.get('session_id')
-                    if session_id:
-                        client_id = session_id
-                    else:
-                        client_id = connection_id
-                        print(f"[Async TCP] ⚠️ Client {connection_id} missing SessionID")
-                    
-                    print(f"[Async TCP] {client_id} -> {command}")
-                    
-                    # Xử lý command (async)
-                    response = await self.process_command_async(command, request, client_id)
-                    
-                    # 3. Gửi response (Header + Body)
-                    resp_bytes = json.dumps(response).encode('utf-8')
-                    header = struct.pack('!I', len(resp_bytes))
-                    
-                    writer.write(header + resp_bytes)
-                    await writer.drain()
-                    
-                except json.JSONDecodeError:
-                    print(f"[Async TCP] Lỗi JSON từ {connection_id}")
+                received = time.monotonic()  # Mốc tính hạn chót (budget_ms) của request
+                self.reaper.touch(connection_id)
+                
+                # 3. Gửi response (Header + Body)
+                if state.version == PROTOCOL_V2:
+                    self.inflight_frames += 1
+                    try:
+                        response = await self.handle_frame_async(body_data, connection_id, state, flags, received)
+                        if response:
+                            writer.writelines((pack_header(len(response[0]), PROTOCOL_V2), response[0]))
+                            await writer.drain()
+                        self.reaper.touch(connection_id)
+                    finally:
+                        self.inflight_frames -= 1
                     continue
+                
+                # v3: mỗi request 1 task, trả lời khi xong (có thể không theo thứ tự)
+                await inflight.acquire()
+                self.inflight_frames += 1
+                task = asyncio.create_task(
+                    self._handle_pipelined(writer, inflight, body_data, request_id, flags, connection_id, state,
+                                           received)
+                )
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
                     
         except Exception as e:
-            print(f"[Async TCP] Lỗi {connection_id}: {e}")
+            log.error('Lỗi {connection}: {error}', connection=connection_id, error=e)
         finally:
+            for task in tasks:
+                task.cancel()
             if connection_id in self.clients:
                 del self.clients[connection_id]
+            self.reaper.forget(connection_id)
             writer.close()
-            await writer.wait_closed()
-            print(f"[Async TCP] Ngắt kết nối: {connection_id}")
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+            log.info('Ngắt kết nối: {connection}', connection=connection_id)
     
-    async def process_command_async(self, command: str, request: dict, client_id: str) -> dict:
-        """Process commands với async support"""
-        # Chạy các operations I/O-bound trong thread pool để không block event loop
-        loop = asyncio.get_event_loop()
-        
-        if command == 'GET_CITIES':
-            return await loop.run_in_executor(None, self.route_manager.get_all_cities)
-        
-        elif command == 'SEARCH_ROUTES':
-            result = await loop.run_in_executor(
-                None,
-                self.route_manager.search_routes,
-                request.get('from_city'),
-                request.get('to_city')
-            )
-            return {'routes': result}
-        
-        elif command == 'GET_DATES':
-            result = await loop.run_in_executor(
-                None,
-                self.trip_manager.get_available_dates,
-                request.get('route_id')
-            )
-            return {'dates': result}
+    async def _handle_pipelined(self, writer, inflight, body_data, request_id, request_flags, connection_id, state,
+                                received=None):
+        """Xử lý 1 request v3 rồi gửi response kèm request_id"""
+        try:
+            body, flags = await self.handle_frame_async(body_data, connection_id, state, request_flags, received)
+            # 1 lần ghi / frame (header + body không ghép): event loop đơn luồng nên frame không bị xen kẽ
+            writer.writelines((pack_header(len(body), PROTOCOL_V3, request_id, flags), body))
+            await writer.drain()
+            self.reaper.touch(connection_id)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        except Exception as e:
+            log.error('Lỗi xử lý pipelined {connection}: {error}', connection=connection_id, error=e)
+        finally:
+            self.inflight_frames -= 1
+            inflight.release()
+    
+    async def handle_frame_async(self, body_data: bytes, connection_id: str, state: ConnectionState, flags: int = 0,
+                                 received: float = None):
+        """Xử lý 1 frame request, trả về (body response, flags) hoặc None nếu body lỗi ở v2
+
+        received: lúc nhận frame (time.monotonic) - hạn chót = received + budget_ms của request.
+        Request mang traceparent: span 'async <lệnh>' tính từ lúc nhận frame (con: chờ, giải mã).
+        """
+        decode_start = time.monotonic()
+        try:
+            request = self.frame_codec.decode_request(body_data, flags, state)
+        except (ValueError, UnicodeDecodeError):
+            log.warning('Lỗi JSON từ {connection}', connection=connection_id)
+            if state.version == PROTOCOL_V2:
+                return None
+            return self.frame_codec.invalid_request(state)
+        decoded = time.monotonic()
+        command = request.get('command')
         
-        elif command == 'SEARCH_TRIPS':
-            trips = await loop.run_in_executor(
-                None,
-                self.trip_manager.search_trips,
-                request.get('route_id'),
-                request.get('date')
-            )
-            # Process available seats
-            for trip in trips:
-                if trip['id'] in self.seat_manager.seats_data:
-                    trip['available_seats'] = await loop.run_in_executor(
-                        None,
-                        self.seat_manager.get_available_seats_count,
-                        trip['id']
-                    )
-                else:
-                    trip['available_seats'] = trip.get('total_seats', 40)
-            return {'trips': trips}
+        if command == HELLO_COMMAND:
+            return self.frame_codec.hello(request, state)
+        if command == PING_COMMAND:
+            return self.frame_codec.pong(state)
         
-        elif command == 'GET_SEATS':
-            result = await loop.run_in_executor(
-                None,
-                self.seat_manager.get_trip_seats,
-                request.get('trip_id')
-            )
-            return {'seats': result}
+        with tracing.start_trace(f'async {command}', request.get(TRACE_FIELD), start=received or decode_start,
+                                 connection=connection_id) as trace:
+            if received is not None:
+                trace.child('tcp.queue', received, decode_start)
+            trace.child('decode', decode_start, decoded, bytes=len(body_data))
+            return await self._handle_request_async(command, request, connection_id, state, received)
+    
+    async def _handle_request_async(self, command: str, request: dict, connection_id: str, state: ConnectionState,
+                                    received: float = None):
+        """Request đã giải mã (không phải HELLO / PING) -> (body response, flags)"""
+        session_id = request.get('session_id')
+        if session_id:
+            client_id = session_id
+        else:
+            client_id = connection_id
+            log.warning('⚠️ Client {connection} missing SessionID', connection=connection_id)
         
-        elif command == 'SELECT_SEAT':
-            return await loop.run_in_executor(
-                None,
-                self.seat_manager.select_seat,
-                request.get('trip_id'),
-                request.get('seat_id'),
-                client_id
-            )
+        log.info('{client} -> {command}', client=client_id, command=command)
         
-        elif command == 'UNSELECT_SEAT':
-            return await loop.run_in_executor(
-                None,
-                self.seat_manager.unselect_seat,
-                request.get('trip_id'),
-                request.get('seat_id'),
-                client_id
-            )
+        # Vượt token bucket của session / kết nối: từ chối trước cả cache và handler
+        if not self.rate_limiter.admit(command, client_id, connection_id, request.get(END_USER_FIELD)):
+            return self.frame_codec.rate_limited(state)
         
-        elif command == 'BOOK_SEATS':
-            t_start = time.time()
-            seat_res = await loop.run_in_executor(
-                None,
-                self.seat_manager.book_seats,
-                request.get('trip_id'),
-                request.get('seat_ids', []),
-                client_id
-            )
-            
-            if seat_res['success']:
-                if seat_res.get('action') == 'existing':
-                    print(f"[Profiling] Book Existing took {time.time()-t_start:.4f}s")
-                    return seat_res
-                
-                trip_id = request.get('trip_id')
-                trip_info = await loop.run_in_executor(None, self.trip_manager.get_trip_by_id, trip_id)
-                route_info = None
-                if trip_info:
-                    route_info = await loop.run_in_executor(
-                        None,
-                        self.route_manager.get_route_by_id,
-                        trip_info.get('route_id')
-                    )
-                
-                booking_res = await loop.run_in_executor(
-                    None,
-                    self.booking_manager.create_booking,
-                    trip_id,
-                    request.get('seat_ids'),
-                    request.get('customer_info'),
-                    None,  # uploaded_files
-                    trip_info,
-                    route_info
-                )
-                print(f"[Profiling] Book New took {time.time()-t_start:.4f}s")
-                return booking_res
-                
-            return seat_res
+        # Lệnh catalog: trả thẳng bytes đã mã hóa nếu có trong cache
+        cache_key, cached = self.frame_codec.lookup(command, request, state)
+        if cached:
+            return cached
         
-        elif command == 'UPLOAD_FILE':
-            return await loop.run_in_executor(
-                None,
-                self.file_handler.save_file,
-                request.get('filename'),
-                bytes.fromhex(request.get('file_data')),
-                request.get('booking_id')
-            )
-        elif command == 'GET_TRIP_INFO':
-            trip_info = await loop.run_in_executor(
-                None,
-                self.trip_manager.get_trip_by_id,
-                request.get('trip_id')
-            )
-            if trip_info:
-                return {'success': True, 'trip': trip_info}
-            return {'success': False, 'error': 'Trip not found'}
+        # Xử lý command (async); lệnh quản trị kiểm tra địa chỉ kết nối (context được copy sang executor)
+        with profiler.caller(connection_id):
+            response = await self.process_command_async(command, request, client_id,
+                                                        deadlines.from_request(request, received))
+        return self.frame_codec.encode_response(command, response, state, cache_key)
+    
+    async def process_command_async(self, command: str, request: dict, client_id: str,
+                                    deadline: float = None) -> dict:
+        """Process commands qua command registry dùng chung
         
-        return {'error': f'Unknown command: {command}'}
+        - Lệnh CPU-only (tra dict, chọn ghế): chạy thẳng trên event loop, không tốn thread handoff
+          (không chờ slot scheduler - loop không được block, chỉ shed khi lane đang quá tải)
+        - Lệnh blocking (BOOK_SEATS, UPLOAD_FILE...): chạy trên blocking_executor, chờ slot theo lane
+          (chạy trong bản copy context của task -> span của handler vẫn thuộc trace của request)
+        """
+        if self.inline_commands and not self.commands.is_blocking(command):
+            if self.commands.overloaded(command):
+                return dict(OVERLOADED)
+            return self.commands.dispatch(command, request, client_id, schedule=False, deadline=deadline)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.blocking_executor, contextvars.copy_context().run,
+                                          self.commands.dispatch, command, request, client_id, True, deadline)
     
     async def start(self):
-        """Start async TCP server"""
+        """Start async TCP server, chạy đến khi stop() / SIGINT / SIGTERM rồi shutdown() có drain"""
         self.running = True
+        self._loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self._loop.add_signal_handler(sig, self._stop_event.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows: Ctrl+C vẫn là KeyboardInterrupt (dừng không drain)
         
         # Start UDP broadcaster
         asyncio.create_task(self.udp_broadcast_loop())
         
         # Start cleanup loop
         asyncio.create_task(self.cleanup_loop())
+        asyncio.create_task(self.idle_reap_loop())
         
         # Start TCP server
-        server = await asyncio.start_server(
+        self._tcp_server = await asyncio.start_server(
             self.handle_client,
             self.host,
             self.tcp_port
         )
         
         print(f"[Async TCP Server] Lắng nghe trên {self.host}:{self.tcp_port}")
+        self.metrics.start_http()  # Thread riêng: scrape không chạy trên event loop
         print("\n[Async Server] Sẵn sàng phục vụ!\n")
         
-        async with server:
-            await server.serve_forever()
+        await self._stop_event.wait()
+        await self.shutdown()
+    
+    async def shutdown(self, timeout: float = None):
+        """Dừng có drain (graceful_shutdown.py): ngừng nhận kết nối -> xong request đang xử lý -> flush ghi nền"""
+        if self.stopped:
+            return
+        self.stopped = True
+        self.running = False
+        timeout = SERVER_CONFIG['shutdown_timeout'] if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        inflight = self.inflight_frames
+        print(f"[Async Server] Đang dừng: ngừng nhận kết nối mới, đợi request đang xử lý (tối đa {timeout:g}s)...")
+        
+        self._tcp_server.close()
+        # Ngừng đọc request mới; frame đã nằm trong buffer vẫn được xử lý như request đang chờ
+        for writer in list(self.clients.values()):
+            writer.transport.pause_reading()
+        while self.inflight_frames and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        abandoned = self.inflight_frames
+        for writer in list(self.clients.values()):
+            writer.close()
+        self.blocking_executor.shutdown(wait=False)
+        
+        flushed = await loop.run_in_executor(None, flush_state, self, SERVER_CONFIG['shutdown_flush_timeout'])
+        tracing.flush()
+        logger.flush()
+        self.metrics.stop_http()
+        print(f"[Async Server] ✅ Đã dừng: {format_report(inflight, abandoned, flushed)}")
     
     async def udp_broadcast_loop(self):
         """Async UDP broadcast loop"""
@@ -287,19 +352,14 @@ class AsyncBusBookingServer:
                 try:
                     all_seats = self.seat_manager.seats_data
                     if all_seats:
-                        limited = dict(list(all_seats.items())[:50])
-                        msg = {
-                            'type': 'SEAT_UPDATE',
-                            'timestamp': time.time(),
-                            'seats_data': limited
-                        }
-                        data = json.dumps(msg).encode('utf-8')
+                        data = self.seat_maps.broadcast_payload(list(all_seats)[:50], time.time())
                         if len(data) < 64000:
                             await loop.sock_sendto(
                                 sock,
                                 data,
                                 ('<broadcast>', self.udp_port)
                             )
+                            self.udp_fanout.add(1, len(data))
                     await asyncio.sleep(2)
                 except Exception as e:
                     print(f"[Async UDP] Lỗi broadcast: {e}")
@@ -315,15 +375,25 @@ class AsyncBusBookingServer:
         while self.running:
             loop = asyncio.get_event_loop()
             await loop.run_in_executor(
-                None,
+                self.blocking_executor,
                 self.seat_manager.cleanup_expired_locks,
                 300
             )
+            await loop.run_in_executor(self.blocking_executor, self.file_handler.cleanup_expired_uploads)
             await asyncio.sleep(60)
     
+    async def idle_reap_loop(self):
+        """Đóng kết nối idle: transport đóng -> handle_client đọc được EOF và tự dọn"""
+        while self.running:
+            self.reaper.reap()
+            await asyncio.sleep(self.reaper.interval)
+    
     def stop(self):
-        """Stop server"""
-        self.running = False
+        """Yêu cầu dừng (gọi được từ thread khác): start() chạy shutdown() có drain"""
+        if self._stop_event is None:
+            self.running = False
+            return
+        self._loop.call_soon_threadsafe(self._stop_event.set)
 
 
 async def main():
@@ -2,20 +2,29 @@
 
 Chức năng:
 - Lưu thông tin đặt vé (Tách file Booking theo chuyến)
-- Lưu thông tin khách hàng (Append-Only Log)
+- Lưu thông tin khách hàng (Append-Only Log + Hash Index phone/CCCD -> offset)
 - Tạo mã vé
+- Tra cứu đơn theo mã vé / phone / CCCD (Secondary Index lưu trên disk)
+- Đặt hành trình nhiều chặng: tất cả đơn được ghi bằng 1 lần ghi durable (journal + fsync)
 - OPTIMIZED: Async Disk Write để không block API response
+- Ghi nền (đơn, khách hàng) và email xác nhận đi qua hàng đợi flush được khi dừng server
+- Request đang được trace: span 'booking.create' / 'booking.itinerary', 'booking.journal' (append + fsync)
 """
 
 import json
 import os
+import glob
 import uuid
 from datetime import datetime
 from typing import Dict, List, Optional
 from threading import Lock
-from concurrent.futures import ThreadPoolExecutor
 import copy
-import threading
+
+from common import logger, tracing
+from graceful_shutdown import WriteBehind
+
+log = logger.get('BookingManager')
+booking_log = logger.get('Booking')
 
 
 class BookingManager:
@@ -23,38 +32,171 @@ class BookingManager:
         self.data_dir = data_dir
         self.bookings_dir = os.path.join(data_dir, 'bookings')
         self.clients_file = os.path.join(data_dir, 'clients.json') # Optimized to JSONL
+        self.index_file = os.path.join(self.bookings_dir, 'index.jsonl')  # Secondary index
+        self.journal_file = os.path.join(self.bookings_dir, 'journal.jsonl')  # WAL cho hành trình
         
-        self.clients: List[Dict] = []
+        # OPTIMIZATION: Hash index thay cho list khách hàng
+        # Danh sách đầy đủ nằm trên disk (JSONL), RAM chỉ giữ key -> byte offset
+        self._phone_index: Dict[str, int] = {}   # phone -> offset trong clients.json
+        self._cccd_index: Dict[str, str] = {}    # cccd -> phone (key phụ)
+        self._pending_clients: Dict[str, Dict] = {}  # phone -> record chưa ghi xong
+        self._clients_file_lock = Lock()  # Append tuần tự để offset chính xác
+        
+        # Secondary index cho tra cứu đơn: chỉ đọc đúng file chuyến chứa đơn
+        self._booking_trip: Dict[str, str] = {}             # booking_id -> trip_id
+        self._bookings_by_phone: Dict[str, List[str]] = {}  # phone -> [booking_id]
+        self._bookings_by_cccd: Dict[str, List[str]] = {}   # cccd -> [booking_id]
+        self._pending_bookings: Dict[str, Dict] = {}        # booking_id -> đơn chưa ghi xong
+        self._bookings_file_lock = Lock()  # Tránh 2 worker ghi đè cùng 1 file chuyến
+        self._journal_lock = Lock()
+        self._journal_pending = set()  # booking_id trong journal chưa ghi xong file chuyến + index
+        self._journal_pinned = False   # Khôi phục chưa trọn: không compact journal trong lần chạy này
         self.lock = Lock()
         
         # OPTIMIZATION: Async Disk Write
-        self._write_executor = ThreadPoolExecutor(max_workers=2)
+        self._writes = WriteBehind('booking-writer', max_workers=2)
+        self._emails = WriteBehind('booking-email', max_workers=4)  # SMTP chậm: không chặn ghi đơn
         
         # Email service (optional)
         self.email_service = email_service
         
         self.init_storage()
         self.load_clients()
+        self.load_booking_index()
+        self.recover_journal()
     
     def init_storage(self):
         if not os.path.exists(self.bookings_dir):
             os.makedirs(self.bookings_dir)
             
     def load_clients(self):
-        """Load clients từ file .jsonl"""
-        self.clients = []
+        """Load index khách hàng từ file .jsonl (1 lượt đọc, không giữ record trong RAM)"""
+        self._phone_index = {}
+        self._cccd_index = {}
         try:
             if os.path.exists(self.clients_file):
-                with open(self.clients_file, 'r', encoding='utf-8') as f:
+                with open(self.clients_file, 'rb') as f:
+                    offset = 0
                     for line in f:
                         if line.strip():
                             try:
-                                self.clients.append(json.loads(line))
+                                self._index_customer(json.loads(line), offset)
                             except: pass
-            print(f"[BookingManager] Đã load {len(self.clients)} khách hàng")
+                        offset += len(line)
+            print(f"[BookingManager] Đã load {len(self._phone_index)} khách hàng")
         except Exception as e:
             print(f"[BookingManager] Lỗi load clients: {e}")
 
+    def _index_customer(self, info: Dict, offset: int):
+        """Cập nhật index cho 1 record (gọi khi đang giữ lock hoặc lúc load)"""
+        if not isinstance(info, dict) or not info.get('phone'):
+            return
+        phone = info['phone']
+        # Record đầu tiên của 1 số điện thoại là record chuẩn (giống dedupe cũ)
+        self._phone_index.setdefault(phone, offset)
+        if info.get('cccd'):
+            self._cccd_index[info['cccd']] = phone
+
+    def _read_customer_at(self, offset: int) -> Optional[Dict]:
+        try:
+            with open(self.clients_file, 'rb') as f:
+                f.seek(offset)
+                return json.loads(f.readline())
+        except Exception:
+            return None
+
+    def get_customer(self, phone: str = None, cccd: str = None) -> Optional[Dict]:
+        """Tra cứu khách hàng theo phone hoặc CCCD - O(1) index + 1 lần đọc disk"""
+        with self.lock:
+            if not phone and cccd:
+                phone = self._cccd_index.get(cccd)
+            if not phone:
+                return None
+            pending = self._pending_clients.get(phone)
+            if pending is not None:
+                return copy.deepcopy(pending)
+            offset = self._phone_index.get(phone)
+        if offset is None:
+            return None
+        return self._read_customer_at(offset)
+
+    def get_customer_count(self) -> int:
+        with self.lock:
+            return len(self._phone_index) + len(self._pending_clients)
+
+    def load_booking_index(self):
+        """Load secondary index từ index.jsonl (tự build lại từ bookings/*.json nếu chưa có)
+
+        Index ghi sau file chuyến (2 bước): file chuyến mới hơn index.jsonl = crash giữa 2 bước,
+        quét lại file đó và bổ sung đơn còn thiếu.
+        """
+        self._booking_trip = {}
+        self._bookings_by_phone = {}
+        self._bookings_by_cccd = {}
+        try:
+            trip_files = sorted(glob.glob(os.path.join(self.bookings_dir, "*.json")))
+            if os.path.exists(self.index_file):
+                index_mtime = os.stat(self.index_file).st_mtime_ns
+                with open(self.index_file, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        if line.strip():
+                            try:
+                                self._index_booking(json.loads(line))
+                            except: pass
+                stale = [path for path in trip_files if os.stat(path).st_mtime_ns > index_mtime]
+                missing = [entry for entry in self._scan_trip_files(stale) if entry['id'] not in self._booking_trip]
+                if missing:
+                    print(f"[BookingManager] Bổ sung {len(missing)} đơn thiếu trong index")
+                mode = 'a'
+            else:
+                # Migration: quét 1 lần các file chuyến hiện có rồi ghi index
+                print("[BookingManager] Đang build index đơn đặt vé...")
+                missing = self._scan_trip_files(trip_files)
+                mode = 'w'
+            for entry in missing:
+                self._index_booking(entry)
+            if missing or mode == 'w':
+                with open(self.index_file, mode, encoding='utf-8') as f:
+                    for entry in missing:
+                        f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            print(f"[BookingManager] Đã load index {len(self._booking_trip)} đơn đặt vé")
+        except Exception as e:
+            print(f"[BookingManager] Lỗi load booking index: {e}")
+
+    def _scan_trip_files(self, paths: List[str]) -> List[Dict]:
+        """Entry index của mọi đơn trong các file chuyến, theo booking_time (list_bookings cần cũ -> mới)"""
+        found = []
+        for filepath in paths:
+            trip_id = os.path.splitext(os.path.basename(filepath))[0]
+            try:
+                with open(filepath, 'r', encoding='utf-8') as f:
+                    for booking in json.load(f):
+                        found.append((booking.get('booking_time') or '', self._index_entry(booking, trip_id)))
+            except Exception:
+                pass
+        found.sort(key=lambda item: item[0])
+        return [entry for _, entry in found]
+
+    @staticmethod
+    def _index_entry(booking: Dict, trip_id: str = None) -> Dict:
+        return {
+            'id': booking['id'],
+            'trip_id': trip_id or booking.get('trip_id'),
+            'phone': booking.get('customer_phone'),
+            'cccd': booking.get('customer_cccd')
+        }
+
+    def _index_booking(self, entry: Dict):
+        """Thêm 1 entry vào index trong RAM (gọi khi đang giữ lock hoặc lúc load)"""
+        booking_id = entry['id']
+        if booking_id in self._booking_trip:
+            return
+        self._booking_trip[booking_id] = entry['trip_id']
+        if entry.get('phone'):
+            self._bookings_by_phone.setdefault(entry['phone'], []).append(booking_id)
+        if entry.get('cccd'):
+            self._bookings_by_cccd.setdefault(entry['cccd'], []).append(booking_id)
+
     def get_trip_bookings(self, trip_id: str) -> List[Dict]:
         filepath = os.path.join(self.bookings_dir, f"{trip_id}.json")
         try:
@@ -63,9 +205,13 @@ class BookingManager:
         except:
             return []
 
-    def _async_save_booking(self, filepath: str, booking: Dict):
-        """Background task để ghi booking vào disk"""
-        try:
+    def _write_booking(self, filepath: str, booking: Dict, durable: bool = False):
+        """Ghi đơn vào file chuyến + index; lỗi thì raise (caller quyết định giữ journal hay chỉ log)
+
+        File chuyến ghi ra file tạm rồi rename (như SeatManager._async_write_task): crash giữa chừng không làm
+        hỏng các đơn đã có. durable: fsync file chuyến, thư mục (rename) và index trước khi trả về.
+        """
+        with self._bookings_file_lock:
             bookings = []
             if os.path.exists(filepath):
                 with open(filepath, 'r', encoding='utf-8') as f:
@@ -73,30 +219,134 @@ class BookingManager:
             
             bookings.append(booking)
             
-            with open(filepath, 'w', encoding='utf-8') as f:
+            with open(filepath + '.tmp', 'w', encoding='utf-8') as f:
                 json.dump(bookings, f, ensure_ascii=False, indent=2)
+                if durable:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(filepath + '.tmp', filepath)
+            if durable:
+                self._fsync_dir(self.bookings_dir)
+            
+            with open(self.index_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(self._index_entry(booking), ensure_ascii=False) + '\n')
+                if durable:
+                    f.flush()
+                    os.fsync(f.fileno())
+        
+        with self.lock:
+            self._pending_bookings.pop(booking['id'], None)
+
+    @staticmethod
+    def _fsync_dir(path: str):
+        """fsync thư mục để rename đã nằm trên disk (Windows không mở được thư mục -> bỏ qua)"""
+        if not hasattr(os, 'O_DIRECTORY'):
+            return
+        fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _async_save_booking(self, filepath: str, booking: Dict, durable: bool = False):
+        """Background task để ghi booking vào disk (file chuyến + index)
+
+        durable: đơn đã nằm trong journal - chỉ compact journal khi ghi xong; lỗi thì đơn vẫn chờ trong journal
+        (recover_journal áp dụng lại ở lần khởi động sau).
+        """
+        try:
+            self._write_booking(filepath, booking, durable)
         except Exception as e:
-            print(f"[BookingManager] Async save booking error: {e}")
+            log.error('Async save booking error: {error}', error=e)
+            return
+        if durable:
+            self._journal_done(booking['id'])
 
-    def save_trip_booking(self, trip_id: str, booking: Dict):
+    def save_trip_booking(self, trip_id: str, booking: Dict, durable: bool = False):
         """OPTIMIZED: Async write - return ngay, disk write trong background"""
         filepath = os.path.join(self.bookings_dir, f"{trip_id}.json")
         booking_copy = copy.deepcopy(booking)
-        self._write_executor.submit(self._async_save_booking, filepath, booking_copy)
+        with self.lock:
+            # Index cập nhật ngay để tra cứu được trước khi ghi disk xong
+            self._pending_bookings[booking_copy['id']] = booking_copy
+            self._index_booking(self._index_entry(booking_copy, trip_id))
+        self._writes.submit(self._async_save_booking, filepath, booking_copy, durable)
+
+    def _load_bookings(self, booking_ids: List[str]) -> List[Dict]:
+        """Đọc các đơn theo ID - mỗi file chuyến liên quan chỉ đọc 1 lần"""
+        found: Dict[str, Dict] = {}
+        by_trip: Dict[str, set] = {}
+        with self.lock:
+            for booking_id in booking_ids:
+                if booking_id in self._pending_bookings:
+                    found[booking_id] = copy.deepcopy(self._pending_bookings[booking_id])
+                elif booking_id in self._booking_trip:
+                    by_trip.setdefault(self._booking_trip[booking_id], set()).add(booking_id)
+        
+        for trip_id, wanted in by_trip.items():
+            for booking in self.get_trip_bookings(trip_id):
+                if booking.get('id') in wanted:
+                    found[booking['id']] = booking
+        
+        return [found[b] for b in booking_ids if b in found]
+
+    def get_booking(self, booking_id: str) -> Dict:
+        """Tra cứu 1 đơn theo mã vé"""
+        if not booking_id:
+            return {'success': False, 'message': 'Thiếu mã vé'}
+        bookings = self._load_bookings([booking_id])
+        if not bookings:
+            return {'success': False, 'message': f'Không tìm thấy đơn {booking_id}'}
+        return {'success': True, 'booking': bookings[0]}
+
+    def list_bookings(self, phone: str = None, cccd: str = None,
+                      page: int = 1, page_size: int = 20) -> Dict:
+        """Liệt kê đơn theo phone hoặc CCCD (mới nhất trước, có phân trang)"""
+        if not phone and not cccd:
+            return {'success': False, 'message': 'Cần phone hoặc cccd'}
+        try:
+            page = max(1, int(page or 1))
+            page_size = min(100, max(1, int(page_size or 20)))
+        except (TypeError, ValueError):
+            return {'success': False, 'message': 'Tham số phân trang không hợp lệ'}
+        
+        with self.lock:
+            if phone:
+                ids = list(self._bookings_by_phone.get(phone, []))
+            else:
+                ids = list(self._bookings_by_cccd.get(cccd, []))
+        ids.reverse()
+        
+        start = (page - 1) * page_size
+        page_ids = ids[start:start + page_size]
+        return {
+            'success': True,
+            'bookings': self._load_bookings(page_ids),
+            'total': len(ids),
+            'page': page,
+            'page_size': page_size
+        }
 
     def _async_save_customer(self, info: Dict):
         """Background task để ghi customer vào disk"""
+        phone = info['phone']
         try:
-            with open(self.clients_file, 'a', encoding='utf-8') as f:
-                f.write(json.dumps(info, ensure_ascii=False) + '\n')
+            line = (json.dumps(info, ensure_ascii=False) + '\n').encode('utf-8')
+            with self._clients_file_lock:
+                with open(self.clients_file, 'ab') as f:
+                    offset = f.tell()
+                    f.write(line)
+            with self.lock:
+                self._phone_index[phone] = offset
+                self._pending_clients.pop(phone, None)
         except Exception as e:
-            print(f"[BookingManager] Async save client error: {e}")
+            log.error('Async save client error: {error}', error=e)
 
     def save_customer(self, info: Dict):
-        """OPTIMIZED: Check duplicate in RAM -> Async Append to Disk"""
+        """OPTIMIZED: Check duplicate bằng hash index (O(1)) -> Async Append to Disk"""
         # Validate input
         if not isinstance(info, dict):
-            print(f"[BookingManager] Warning: info is not dict, got {type(info)}")
+            log.warning('Warning: info is not dict, got {type}', type=type(info))
             return
             
         with self.lock:
@@ -105,33 +355,34 @@ class BookingManager:
             if not phone:
                 return
             
-            for c in self.clients:
-                if isinstance(c, dict) and c.get('phone') == phone:
-                    return # Đã tồn tại, không lưu lại
+            if phone in self._phone_index or phone in self._pending_clients:
+                return # Đã tồn tại, không lưu lại
             
-            self.clients.append(info)
+            info_copy = copy.deepcopy(info)
+            self._pending_clients[phone] = info_copy
+            if info_copy.get('cccd'):
+                self._cccd_index[info_copy['cccd']] = phone
         
         # Async write (outside lock to avoid blocking)
-        info_copy = copy.deepcopy(info)
-        self._write_executor.submit(self._async_save_customer, info_copy)
+        self._writes.submit(self._async_save_customer, info_copy)
 
-    def create_booking(self, trip_id: str, seat_ids: List[str], 
-                      customer_info: Dict, uploaded_files: List[str] = None,
-                      trip_info: Dict = None, route_info: Dict = None) -> Dict:
-        """Tạo đơn đặt vé mới - OPTIMIZED với async disk write"""
-        # Validate customer_info
+    @staticmethod
+    def validate_customer_info(customer_info: Dict) -> Optional[str]:
+        """Trả về thông báo lỗi nếu customer_info không hợp lệ, None nếu hợp lệ"""
         if not isinstance(customer_info, dict):
-            return {'success': False, 'message': f'Dữ liệu khách hàng không hợp lệ (got {type(customer_info).__name__})'}
+            return f'Dữ liệu khách hàng không hợp lệ (got {type(customer_info).__name__})'
         
         required_fields = ['name', 'phone', 'cccd']
         for field in required_fields:
             if field not in customer_info:
-                return {'success': False, 'message': f'Thiếu thông tin: {field}'}
-        
-        booking_id = f"BK{uuid.uuid4().hex[:8].upper()}"
-        
-        booking = {
-            'id': booking_id,
+                return f'Thiếu thông tin: {field}'
+        return None
+
+    @staticmethod
+    def _new_booking(trip_id: str, seat_ids: List[str], customer_info: Dict,
+                     uploaded_files: List[str] = None) -> Dict:
+        return {
+            'id': f"BK{uuid.uuid4().hex[:8].upper()}",
             'trip_id': trip_id,
             'seat_ids': seat_ids,
             'customer_name': customer_info['name'],
@@ -141,22 +392,182 @@ class BookingManager:
             'booking_time': datetime.now().isoformat(),
             'status': 'confirmed'
         }
+
+    def create_booking(self, trip_id: str, seat_ids: List[str], 
+                      customer_info: Dict, uploaded_files: List[str] = None,
+                      trip_info: Dict = None, route_info: Dict = None) -> Dict:
+        """Tạo đơn đặt vé mới - OPTIMIZED với async disk write"""
+        # Validate customer_info
+        error = self.validate_customer_info(customer_info)
+        if error:
+            return {'success': False, 'message': error}
+        
+        with tracing.span('booking.create', trip_id=trip_id):
+            booking = self._new_booking(trip_id, seat_ids, customer_info, uploaded_files)
+            booking_id = booking['id']
+            
+            # 1. Save Booking (Async - không block)
+            self.save_trip_booking(trip_id, booking)
+            
+            # 2. Save Customer (Async - không block)
+            self.save_customer(customer_info)
+            
+            # 3. Gửi email xác nhận (nếu có email và email_service)
+            if self.email_service and customer_info.get('email'):
+                self._send_confirmation_email(booking_id, customer_info, seat_ids, trip_info, route_info)
+        
+        booking_log.info('Đã tạo đơn {booking_id} cho chuyến {trip_id}', booking_id=booking_id, trip_id=trip_id)
+        
+        return {
+            'success': True,
+            'booking_id': booking_id,
+            'message': 'Đặt vé thành công'
+        }
+    
+    def _journal_append(self, record: Dict):
+        """1 lần ghi durable (append + fsync) cho cả hành trình"""
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with tracing.locked(self._journal_lock, 'booking.journal_lock'), tracing.span('booking.journal'):
+            with open(self.journal_file, 'a', encoding='utf-8') as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal_pending.update(b['id'] for b in record.get('bookings', []))
+
+    def _journal_done(self, booking_id: str):
+        """Đơn trong journal đã ghi durable vào file chuyến + index; hết đơn chờ -> compact (xóa) journal
+
+        Journal có bản ghi khôi phục chưa áp dụng được (_journal_pinned) thì giữ nguyên tới lần khởi động sau.
+        """
+        with self._journal_lock:
+            if booking_id not in self._journal_pending:
+                return
+            self._journal_pending.discard(booking_id)
+            if self._journal_pending or self._journal_pinned:
+                return
+            try:
+                os.remove(self.journal_file)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                log.error('Lỗi compact journal: {error}', error=e)
+
+    def recover_journal(self):
+        """Áp dụng lại các đơn trong journal chưa kịp ghi vào file chuyến (sau crash)
+
+        Journal chỉ bị xóa khi mọi bản ghi đã áp dụng xong; dòng cuối ghi dở (crash trước fsync, client chưa
+        nhận kết quả) được bỏ qua. Dòng hỏng ở giữa hoặc đơn ghi lỗi -> giữ journal, thử lại lần khởi động sau.
+        """
+        if not os.path.exists(self.journal_file):
+            return
+        recovered = 0
+        records = []
+        damaged = []
+        last_line = 0
+        try:
+            with open(self.journal_file, 'r', encoding='utf-8') as f:
+                for lineno, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    last_line = lineno
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError as e:
+                        log.warning('⚠️ Bỏ dòng {lineno} hỏng trong journal: {error}', lineno=lineno, error=e)
+                        damaged.append(lineno)
+        except OSError as e:
+            log.error('Lỗi đọc journal: {error}', error=e)
+            self._journal_pinned = True
+            return
         
-        # 1. Save Booking (Async - không block)
-        self.save_trip_booking(trip_id, booking)
+        complete = not damaged or damaged == [last_line]
+        for record in records:
+            for booking in record.get('bookings', []):
+                trip_id = booking['trip_id']
+                filepath = os.path.join(self.bookings_dir, f"{trip_id}.json")
+                try:
+                    on_disk = {b.get('id') for b in self.get_trip_bookings(trip_id)}
+                    if booking['id'] in on_disk:
+                        if booking['id'] not in self._booking_trip:
+                            with open(self.index_file, 'a', encoding='utf-8') as f:
+                                f.write(json.dumps(self._index_entry(booking), ensure_ascii=False) + '\n')
+                            self._index_booking(self._index_entry(booking))
+                        continue
+                    self._write_booking(filepath, booking, durable=True)
+                except Exception as e:
+                    log.error('Không khôi phục được đơn {booking_id} từ journal: {error}',
+                              booking_id=booking.get('id'), error=e)
+                    complete = False
+                    continue
+                self._index_booking(self._index_entry(booking))
+                recovered += 1
         
-        # 2. Save Customer (Async - không block)
-        self.save_customer(customer_info)
+        if recovered:
+            log.info('Đã khôi phục {count} đơn từ journal', count=recovered)
+        if not complete:
+            log.error('Journal còn bản ghi chưa áp dụng được, giữ lại {path}', path=self.journal_file)
+            self._journal_pinned = True
+            # Dòng cuối ghi dở không có '\n': kết thúc dòng để bản ghi append sau không dính vào dòng hỏng
+            with open(self.journal_file, 'rb+') as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell():
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        f.write(b'\n')
+            return
+        os.remove(self.journal_file)
+
+    def create_itinerary_bookings(self, legs: List[Dict], customer_info: Dict,
+                                  trip_infos: Dict[str, Dict] = None,
+                                  route_infos: Dict[str, Dict] = None) -> Dict:
+        """Tạo đơn cho mọi chặng của 1 hành trình bằng 1 lần ghi durable.
+
+        legs: [{'trip_id': str, 'seat_ids': [str]}]
+        Journal được fsync trước khi trả về; file chuyến + index ghi async như create_booking (có fsync),
+        journal được xóa khi mọi đơn trong đó đã ghi xong.
+        """
+        error = self.validate_customer_info(customer_info)
+        if error:
+            return {'success': False, 'message': error}
         
-        # 3. Gửi email xác nhận (nếu có email và email_service)
-        if self.email_service and customer_info.get('email'):
-            self._send_confirmation_email(booking_id, customer_info, seat_ids, trip_info, route_info)
+        with tracing.span('booking.itinerary', legs=len(legs)):
+            itinerary_id = f"IT{uuid.uuid4().hex[:8].upper()}"
+            bookings = []
+            for leg in legs:
+                booking = self._new_booking(leg['trip_id'], leg['seat_ids'], customer_info)
+                booking['itinerary_id'] = itinerary_id
+                bookings.append(booking)
+            
+            # 1. Durable write: 1 record cho cả hành trình; lỗi -> chưa có đơn nào (caller trả ghế)
+            try:
+                self._journal_append({'itinerary_id': itinerary_id, 'bookings': bookings})
+            except OSError as e:
+                log.error('Lỗi ghi journal hành trình {itinerary_id}: {error}', itinerary_id=itinerary_id, error=e)
+                return {'success': False, 'message': 'Không lưu được đơn đặt vé, vui lòng thử lại'}
+            
+            # 2. Ghi file chuyến + index (Async - không block)
+            for booking in bookings:
+                self.save_trip_booking(booking['trip_id'], booking, durable=True)
+            
+            # 3. Save Customer (Async - không block)
+            self.save_customer(customer_info)
+            
+            # 4. Email xác nhận cho từng chặng
+            trip_infos = trip_infos or {}
+            route_infos = route_infos or {}
+            if self.email_service and customer_info.get('email'):
+                for booking in bookings:
+                    self._send_confirmation_email(booking['id'], customer_info, booking['seat_ids'],
+                                                  trip_infos.get(booking['trip_id']),
+                                                  route_infos.get(booking['trip_id']))
         
-        print(f"[Booking] Đã tạo đơn {booking_id} cho chuyến {trip_id}")
+        booking_log.info('Đã tạo hành trình {itinerary_id} ({legs} chặng)', itinerary_id=itinerary_id, legs=len(bookings))
         
         return {
             'success': True,
-            'booking_id': booking_id,
+            'itinerary_id': itinerary_id,
+            'booking_ids': [b['id'] for b in bookings],
+            'bookings': [{'trip_id': b['trip_id'], 'booking_id': b['id']} for b in bookings],
             'message': 'Đặt vé thành công'
         }
     
@@ -186,7 +597,22 @@ class BookingManager:
                 
                 self.email_service.send_booking_confirmation(customer_info['email'], email_data)
             except Exception as e:
-                print(f"[BookingManager] Lỗi gửi email: {e}")
+                log.error('Lỗi gửi email: {error}', error=e)
         
-        # Gửi trong thread riêng để không block
-        threading.Thread(target=send_email, daemon=True).start()
+        # Gửi nền để không block; hàng đợi được flush khi dừng server (không mất email như thread daemon)
+        self._emails.submit(send_email)
+
+    def write_queues(self) -> Dict[str, WriteBehind]:
+        """Hàng đợi ghi nền cần flush khi dừng server (email flush sau cùng vì chậm nhất)"""
+        return {'bookings': self._writes, 'emails': self._emails}
+
+    def memory_structures(self) -> Dict[str, object]:
+        """Cấu trúc lớn giữ trong RAM (metrics.py ước lượng kích thước)"""
+        return {
+            'client_index': self._phone_index,
+            'cccd_index': self._cccd_index,
+            'booking_index': self._booking_trip,
+            'bookings_by_phone': self._bookings_by_phone,
+            'bookings_by_cccd': self._bookings_by_cccd,
+            'pending_bookings': self._pending_bookings
+        }
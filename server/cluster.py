@@ -0,0 +1,398 @@
+"""Cluster - Chia trạng thái ghế / đơn cho nhiều shard theo consistent hash của trip_id
+
+Chức năng:
+- HashRing: vòng consistent hash (md5, nhiều điểm ảo / shard) -> trip_id thuộc shard nào
+  (thêm / bớt shard đổi chủ khoảng 1/N chuyến, nhưng trạng thái KHÔNG tự chuyển theo, xem dưới)
+- Shard (serve_shard): server đầy đủ (SeatManager, BookingManager, IdempotencyCache) không lắng nghe
+  client, chỉ giữ các chuyến nó sở hữu trong data/shards/<i>-of-<n>/ (catalog route / trip dùng chung),
+  phục vụ front end qua SeatAuthority (seat_authority.py), tự UDP broadcast + dọn ghế các chuyến của mình
+- Thư mục shard chỉ được seed từ data/seats, data/bookings lúc tạo lần đầu; từ đó ghế / đơn mới chỉ nằm
+  trong thư mục shard. Đổi số shard hoặc quay về chạy 1 process mà bỏ qua các thư mục này sẽ bán lại ghế đã
+  đặt -> shard / server đơn từ chối khởi động khi data/shards/ còn trạng thái của topology khác
+  (check_topology). Đổi topology: dừng cluster, `python server/cluster.py --merge-shards` (gộp ghế / đơn /
+  khách hàng về data/, cất data/shards/ sang data/shards.merged-<thời điểm>), rồi chạy topology mới
+- Front end (ShardRouter): thay AuthorityClient trong worker (worker_processes.py)
+  + SELECT_SEAT / UNSELECT_SEAT / BOOK_SEATS / BOOK_ITINERARY -> shard sở hữu chuyến
+  + UPLOAD_* -> shard theo upload_id (UPLOAD_BEGIN không có upload_id: front end sinh trước)
+  + GET_BOOKING / LIST_BOOKINGS: hỏi song song mọi shard rồi gộp (đơn nằm ở shard của chuyến)
+  + Change feed của mọi shard gộp vào 1 SeatReplica -> GET_SEATS, SEARCH_TRIPS (số ghế trống)
+    và catalog đọc tại front end, không hỏi shard
+- serve_local_cluster: N shard + M front end trên 1 máy (thử nghiệm / benchmark)
+
+Giới hạn: BOOK_ITINERARY có chặng thuộc nhiều shard bị từ chối (chưa có commit 2 pha giữa shard).
+
+Ví dụ:
+    # 1 máy: 4 shard, 4 front end cùng cổng TCP
+    python server/cluster.py --local 4 --front-ends 4
+    # Đổi số shard (4 -> 8): dừng cluster, gộp trạng thái về data/ rồi chạy lại
+    python server/cluster.py --merge-shards && python server/cluster.py --local 8
+    # Nhiều máy: mỗi shard 1 process, front end trỏ tới danh sách shard
+    CLUSTER_SHARDS=10.0.0.1:56001,10.0.0.2:56001 SHARD_INDEX=0 python server/cluster.py
+    CLUSTER_SHARDS=10.0.0.1:56001,10.0.0.2:56001 WORKER_PROCESSES=4 python server/server.py
+"""
+
+import bisect
+import contextvars
+import functools
+import glob
+import hashlib
+import multiprocessing
+import os
+import re
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.insert(0, current_dir)
+
+from config import CLUSTER_CONFIG, SERVER_CONFIG
+from seat_authority import FORWARDED_COMMANDS, AuthorityClient, SeatAuthority
+
+LIST_PAGE_SIZE = 100  # page_size tối đa BookingManager.list_bookings cho phép
+SHARD_DIR_PATTERN = re.compile(r'^(\d+)-of-(\d+)$')  # data/shards/<i>-of-<n>
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """Vòng consistent hash theo chỉ số shard (đổi địa chỉ shard không làm chuyến đổi chủ)"""
+
+    def __init__(self, shard_count: int, virtual_nodes: int = 64):
+        self.shard_count = shard_count
+        points = sorted((_hash(f'shard-{shard}#{node}'), shard)
+                        for shard in range(shard_count) for node in range(virtual_nodes))
+        self._keys = [point for point, _ in points]
+        self._shards = [shard for _, shard in points]
+
+    def owner(self, key: str) -> int:
+        """Chỉ số shard sở hữu key (điểm đầu tiên theo chiều kim đồng hồ)"""
+        index = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._shards[index]
+
+
+def authority_for(addresses: List[str]):
+    """1 địa chỉ -> AuthorityClient (worker_processes > 1), nhiều địa chỉ -> ShardRouter (cluster)"""
+    if len(addresses) == 1:
+        return AuthorityClient(addresses[0])
+    return ShardRouter(addresses)
+
+
+class ShardRouter:
+    """Front end của cluster, cùng giao diện AuthorityClient (install / start_feed / fetch_seats)"""
+
+    def __init__(self, addresses: List[str], virtual_nodes: int = None):
+        self.shards = [AuthorityClient(address) for address in addresses]
+        self.ring = HashRing(len(addresses), virtual_nodes or CLUSTER_CONFIG['virtual_nodes'])
+        self.replica = None
+        # Fan-out song song; mỗi thread giữ 1 kết nối / shard (AuthorityClient dùng thread-local)
+        self._fanout = ThreadPoolExecutor(max_workers=4 * len(addresses), thread_name_prefix='fanout')
+
+    def shard_for(self, key) -> AuthorityClient:
+        return self.shards[self.ring.owner(str(key))]
+
+    def install(self, registry):
+        """Đăng ký handler định tuyến cho mọi FORWARDED_COMMANDS (thiếu route -> KeyError ngay khi khởi động)"""
+        routes = {
+            'SELECT_SEAT': self._by_trip,
+            'UNSELECT_SEAT': self._by_trip,
+            'BOOK_SEATS': self._by_trip,
+            'BOOK_ITINERARY': self._book_itinerary,
+            'GET_BOOKING': self._get_booking,
+            'LIST_BOOKINGS': self._list_bookings,
+            'UPLOAD_BEGIN': self._upload_begin,
+            'UPLOAD_CHUNK': self._by_upload,
+            'UPLOAD_FINISH': self._by_upload,
+        }
+        for command in FORWARDED_COMMANDS:
+            registry.register(command, functools.partial(routes[command], command), blocking=True,
+                              rate_class=registry.get(command).rate_class)
+
+    # ---------- Định tuyến ----------
+
+    def _by_trip(self, command: str, request: dict, client_id: str) -> dict:
+        return self.shard_for(request.get('trip_id')).execute(command, request, client_id)
+
+    def _book_itinerary(self, command: str, request: dict, client_id: str) -> dict:
+        legs = request.get('legs')
+        owners = set()
+        if isinstance(legs, list):
+            owners = {self.ring.owner(str(leg.get('trip_id'))) for leg in legs if isinstance(leg, dict)}
+        if len(owners) > 1:
+            return {'success': False, 'message': 'Không thể đặt chung các chặng này trong 1 lần, vui lòng đặt từng chặng'}
+        # Hành trình không hợp lệ -> shard bất kỳ trả lỗi validate như server đơn
+        shard = self.shards[owners.pop()] if owners else self.shards[0]
+        return shard.execute(command, request, client_id)
+
+    def _upload_begin(self, command: str, request: dict, client_id: str) -> dict:
+        if request.get('upload_id') is None:
+            # Sinh upload_id tại front end để biết shard giữ session (UPLOAD_CHUNK / FINISH sau đó theo id này)
+            request = dict(request, upload_id=uuid.uuid4().hex)
+        return self._by_upload(command, request, client_id)
+
+    def _by_upload(self, command: str, request: dict, client_id: str) -> dict:
+        return self.shard_for(request.get('upload_id')).execute(command, request, client_id)
+
+    # ---------- Fan-out ----------
+
+    def _get_booking(self, command: str, request: dict, client_id: str) -> dict:
+        # copy_context: thread fan-out mang theo hạn chót của request (deadlines.current)
+        futures = [self._fanout.submit(contextvars.copy_context().run, shard.execute, command, request, client_id)
+                   for shard in self.shards]
+        responses = [future.result() for future in futures]
+        return next((response for response in responses if response.get('success')), responses[0])
+
+    def _list_bookings(self, command: str, request: dict, client_id: str) -> dict:
+        """Mỗi shard trả page * page_size đơn mới nhất -> gộp theo booking_time -> cắt trang tại front end"""
+        try:
+            page = max(1, int(request.get('page', 1) or 1))
+            page_size = min(LIST_PAGE_SIZE, max(1, int(request.get('page_size', 20) or 20)))
+        except (TypeError, ValueError):
+            return {'success': False, 'message': 'Tham số phân trang không hợp lệ'}
+
+        futures = [self._fanout.submit(contextvars.copy_context().run, self._newest_bookings, shard, request,
+                                       client_id, page * page_size)
+                   for shard in self.shards]
+        responses = [future.result() for future in futures]
+        for response in responses:
+            if not response.get('success'):
+                return response
+
+        bookings = [booking for response in responses for booking in response['bookings']]
+        bookings.sort(key=lambda booking: booking.get('booking_time') or '', reverse=True)
+        start = (page - 1) * page_size
+        return {
+            'success': True,
+            'bookings': bookings[start:start + page_size],
+            'total': sum(response['total'] for response in responses),
+            'page': page,
+            'page_size': page_size
+        }
+
+    @staticmethod
+    def _newest_bookings(shard: AuthorityClient, request: dict, client_id: str, count: int) -> dict:
+        """`count` đơn mới nhất của 1 shard (nhiều trang LIST_PAGE_SIZE nếu cần)"""
+        bookings = []
+        page = 1
+        while True:
+            response = shard.execute('LIST_BOOKINGS', dict(request, page=page, page_size=LIST_PAGE_SIZE), client_id)
+            if not response.get('success'):
+                return response
+            bookings.extend(response['bookings'])
+            if len(bookings) >= count or page * LIST_PAGE_SIZE >= response['total']:
+                return dict(response, bookings=bookings[:count])
+            page += 1
+
+    # ---------- Ghế ----------
+
+    def fetch_seats(self, trip_id: str) -> list:
+        return self.shard_for(trip_id).fetch_seats(trip_id)
+
+    def start_feed(self, replica, timeout: float = 30.0) -> bool:
+        """Nhận change feed của mọi shard vào cùng 1 bản sao; đợi snapshot đầu tiên của từng shard"""
+        self.replica = replica
+        for shard in self.shards:
+            shard.start_feed(replica, timeout=0)
+        deadline = time.monotonic() + timeout
+        return all(shard.ready.wait(max(0.0, deadline - time.monotonic())) for shard in self.shards)
+
+
+# ---------- Shard ----------
+
+def shard_topologies(data_dir: str) -> Dict[int, List[str]]:
+    """Số shard -> các thư mục data/shards/<i>-of-<n> đang có (bỏ qua thư mục tạm .tmp)"""
+    topologies: Dict[int, List[str]] = {}
+    shards_dir = os.path.join(data_dir, 'shards')
+    if not os.path.isdir(shards_dir):
+        return topologies
+    for name in sorted(os.listdir(shards_dir)):
+        match = SHARD_DIR_PATTERN.match(name)
+        if match and os.path.isdir(os.path.join(shards_dir, name)):
+            topologies.setdefault(int(match.group(2)), []).append(os.path.join(shards_dir, name))
+    return topologies
+
+
+def check_topology(data_dir: str, shard_count: int = 0):
+    """RuntimeError nếu data/shards/ còn trạng thái của topology khác shard_count (0 = chạy không shard)"""
+    others = sorted(count for count in shard_topologies(data_dir) if count != shard_count)
+    if others:
+        current = f'{shard_count} shard' if shard_count else 'không shard'
+        raise RuntimeError(f"{os.path.join(data_dir, 'shards')} còn ghế / đơn của cluster "
+                           f"{', '.join(f'{count} shard' for count in others)}, không chạy {current} được "
+                           f"(sẽ bán lại ghế đã đặt). Dừng cluster cũ rồi chạy "
+                           f"'python server/cluster.py --merge-shards' để gộp trạng thái về {data_dir}")
+
+
+def merge_shards(data_dir: str) -> int:
+    """Gộp ghế / đơn / khách hàng của mọi thư mục shard về data_dir rồi cất data/shards/ đi; trả số chuyến
+
+    Chạy khi cluster đã dừng. Journal đơn của shard được khôi phục trước (BookingManager); còn bản ghi
+    không áp dụng được -> RuntimeError, không gộp gì. Cùng 1 chuyến có ở nhiều thư mục (topology cũ sót
+    lại) -> lấy file mới nhất. Index đơn của data_dir bị xóa để build lại lần chạy sau.
+    """
+    from booking_manager import BookingManager
+
+    shard_dirs = [path for paths in shard_topologies(data_dir).values() for path in paths]
+    if not shard_dirs:
+        return 0
+    for shard_dir in shard_dirs:
+        BookingManager(shard_dir)  # recover_journal chạy đồng bộ trong constructor
+        if os.path.exists(os.path.join(shard_dir, 'bookings', 'journal.jsonl')):
+            raise RuntimeError(f'{shard_dir}: journal còn đơn chưa khôi phục được, không gộp')
+
+    newest: Dict[tuple, str] = {}  # (seats / bookings, trip_id) -> file mới nhất
+    for shard_dir in shard_dirs:
+        for sub in ('seats', 'bookings'):
+            for path in glob.glob(os.path.join(shard_dir, sub, '*.json')):
+                key = (sub, os.path.splitext(os.path.basename(path))[0])
+                if key not in newest or os.path.getmtime(path) > os.path.getmtime(newest[key]):
+                    newest[key] = path
+    for (sub, trip_id), path in newest.items():
+        os.makedirs(os.path.join(data_dir, sub), exist_ok=True)
+        target = os.path.join(data_dir, sub, f'{trip_id}.json')
+        shutil.copyfile(path, target + '.tmp')
+        os.replace(target + '.tmp', target)
+
+    # clients.json là log append-only, record đầu tiên của 1 số điện thoại là chuẩn: nối các dòng chưa có
+    clients_file = os.path.join(data_dir, 'clients.json')
+    existing = b''
+    if os.path.exists(clients_file):
+        with open(clients_file, 'rb') as f:
+            existing = f.read()
+    seen = set(existing.split(b'\n'))
+    with open(clients_file, 'ab') as out:
+        if existing and not existing.endswith(b'\n'):
+            out.write(b'\n')
+        for shard_dir in shard_dirs:
+            path = os.path.join(shard_dir, 'clients.json')
+            if not os.path.exists(path):
+                continue
+            with open(path, 'rb') as f:
+                for line in f:
+                    line = line.rstrip(b'\n')
+                    if line.strip() and line not in seen:
+                        seen.add(line)
+                        out.write(line + b'\n')
+
+    try:
+        os.remove(os.path.join(data_dir, 'bookings', 'index.jsonl'))
+    except FileNotFoundError:
+        pass
+    retired = os.path.join(data_dir, f"shards.merged-{time.strftime('%Y%m%d-%H%M%S')}")
+    os.rename(os.path.join(data_dir, 'shards'), retired)
+    trips = len({trip_id for _, trip_id in newest})
+    print(f"[Cluster] Đã gộp {trips} chuyến từ {len(shard_dirs)} thư mục shard về {data_dir}, cất tại {retired}")
+    return trips
+
+
+def prepare_shard_dir(data_dir: str, index: int, ring: HashRing) -> str:
+    """Thư mục trạng thái của shard; lần đầu copy ghế / đơn của các chuyến shard sở hữu từ data_dir
+
+    data/shards/ còn thư mục của topology khác -> RuntimeError (check_topology).
+    """
+    check_topology(data_dir, ring.shard_count)
+    shard_dir = os.path.join(data_dir, 'shards', f'{index}-of-{ring.shard_count}')
+    if os.path.isdir(shard_dir):
+        return shard_dir
+
+    # Copy vào thư mục tạm rồi rename: shard bị dừng giữa chừng không để lại dữ liệu thiếu
+    staging_dir = shard_dir + '.tmp'
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    for sub in ('seats', 'bookings'):
+        os.makedirs(os.path.join(staging_dir, sub))
+        for path in glob.glob(os.path.join(data_dir, sub, '*.json')):
+            trip_id = os.path.splitext(os.path.basename(path))[0]
+            if ring.owner(trip_id) == index:
+                shutil.copy2(path, os.path.join(staging_dir, sub))
+    owned = len(os.listdir(os.path.join(staging_dir, 'seats')))
+    clients_file = os.path.join(data_dir, 'clients.json')
+    if os.path.exists(clients_file):
+        shutil.copy2(clients_file, staging_dir)
+    os.rename(staging_dir, shard_dir)
+    print(f"[Cluster] Tạo {shard_dir} ({owned} chuyến)")
+    return shard_dir
+
+
+def serve_shard(index: int, addresses: List[str]):
+    """Chạy shard thứ `index` trong process hiện tại (block đến khi dừng)"""
+    from server import BusBookingServer
+
+    ring = HashRing(len(addresses), CLUSTER_CONFIG['virtual_nodes'])
+    state_dir = prepare_shard_dir(os.path.join(current_dir, 'data'), index, ring)
+    app = BusBookingServer(SERVER_CONFIG['tcp_port'], SERVER_CONFIG['udp_port'], state_dir=state_dir)
+    authority = SeatAuthority(app, addresses[index])
+    authority.start()
+    app.running = True
+    # Mỗi shard broadcast / dọn ghế các chuyến của mình (không trùng giữa các shard)
+    threading.Thread(target=app.udp_broadcast_loop, daemon=True).start()
+    threading.Thread(target=app.cleanup_loop, daemon=True).start()
+    print(f"[Cluster] ✅ Shard {index + 1}/{len(addresses)} pid {os.getpid()} trên {addresses[index]}")
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        authority.stop()
+        app.stop()
+
+
+def _shard_main(index: int, addresses: List[str]):
+    """Entry point process shard của serve_local_cluster"""
+    from worker_processes import exit_with_parent
+    exit_with_parent()
+    serve_shard(index, addresses)
+
+
+def serve_local_cluster(shard_count: int, front_ends: int = None, transport: str = 'tcp',
+                        tcp_port: int = None, udp_port: int = None):
+    """N shard (Unix socket) + front end (worker_processes.py) trên 1 máy, block đến khi dừng"""
+    from worker_processes import serve_multiprocess
+
+    tcp_port = tcp_port or SERVER_CONFIG['tcp_port']
+    addresses = [os.path.join(tempfile.gettempdir(), f'bus_booking_shard_{tcp_port}_{index}.sock')
+                 for index in range(shard_count)]
+    context = multiprocessing.get_context('spawn')
+    shards = [context.Process(target=_shard_main, args=(index, addresses), name=f'shard-{index}', daemon=True)
+              for index in range(shard_count)]
+    for process in shards:
+        process.start()
+    try:
+        serve_multiprocess(transport, front_ends or shard_count, tcp_port, udp_port, shards=addresses)
+    finally:
+        for process in shards:
+            process.terminate()
+        for process in shards:
+            process.join(5)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Chạy 1 shard (CLUSTER_SHARDS + SHARD_INDEX) hoặc cluster cục bộ')
+    parser.add_argument('--local', type=int, metavar='N', help='Chạy N shard + front end trên máy này')
+    parser.add_argument('--front-ends', type=int, help='Số process front end (mặc định = số shard)')
+    parser.add_argument('--transport', choices=['tcp', 'ssl'], default='tcp')
+    parser.add_argument('--merge-shards', action='store_true',
+                        help='Gộp trạng thái data/shards/ về data/ (trước khi đổi số shard / chạy không shard)')
+    args = parser.parse_args()
+
+    if args.merge_shards:
+        merge_shards(os.path.join(current_dir, 'data'))
+    elif args.local:
+        serve_local_cluster(args.local, args.front_ends, args.transport)
+    elif CLUSTER_CONFIG['shards']:
+        serve_shard(CLUSTER_CONFIG['shard_index'], CLUSTER_CONFIG['shards'])
+    else:
+        parser.error('Cần --local N hoặc CLUSTER_SHARDS')
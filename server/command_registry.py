@@ -0,0 +1,246 @@
+"""Command Registry - Bảng dispatch lệnh dùng chung cho mọi transport
+
+Chức năng:
+- Mỗi lệnh (GET_CITIES, BOOK_SEATS...) đăng ký đúng 1 handler: handler(request, client_id) -> dict
+- Handler khai báo loại xử lý:
+  + blocking=False: chỉ tính toán / tra cứu trong RAM (chạy inline được)
+  + blocking=True: có I/O chặn (disk, fsync, nén ảnh, email, chờ request trùng key)
+- Đo thời gian xử lý theo từng lệnh (count, error, avg / max, p50 / p99 trên các mẫu gần nhất)
+  + histogram cộng dồn theo LATENCY_BUCKETS (xuất Prometheus, metrics.py)
+- Đo payload response theo từng lệnh: bytes trước / sau nén, tỉ lệ nén, thời gian CPU nén
+- Lệnh catalog khai báo cache_key(request) -> response đã mã hóa được cache (response_cache.py),
+  hết hạn khi cache_version() (version dữ liệu catalog) đổi; cache_tag(request) thêm version riêng của
+  từng entry (vd GET_SEATS: version ghế của chuyến)
+- Mỗi lệnh thuộc 1 nhóm rate limit (rate_class: 'seat' / 'catalog' / 'upload' / 'admin', xem rate_limiter.py)
+- Có scheduler (priority_scheduler.py): handler chỉ chạy khi lấy được slot theo lane ưu tiên; handler
+  non-blocking và blocking lấy slot ở 2 scheduler riêng (blocking_scheduler): request chờ fsync / request
+  trùng key không chiếm slot của lệnh tính toán nhưng vẫn được xếp theo lane (đặt vé trước tra cứu đơn);
+  request bị shed trả OVERLOADED ngay (đếm 'shed' theo lệnh)
+- Request có hạn chót (deadlines.py): quá hạn khi lấy ra / khi chờ slot / trong handler (deadlines.check())
+  -> trả EXPIRED, không chạy tiếp (đếm 'expired' theo lệnh)
+- Request đang được trace (common/tracing.py): span 'schedule' (chờ slot theo lane) và 'handler'
+- Đếm lệnh đang chạy / chờ slot (inflight) -> stop() của server đợi về 0 trước khi flush (graceful_shutdown.py)
+- TCP, SSL, Async và gRPC server đều dispatch qua registry này
+"""
+
+import bisect
+import itertools
+import time
+from collections import deque
+from typing import Callable, Dict, Hashable, Optional
+from threading import Lock
+
+import deadlines
+from common import logger, tracing
+from deadlines import EXPIRED, DeadlineExceeded
+from priority_scheduler import OVERLOADED, Overloaded, PriorityScheduler
+
+log = logger.get('Command')
+slow_log = logger.get('Profiling')
+
+
+class CommandSpec:
+    """Thông tin 1 lệnh đã đăng ký"""
+
+    def __init__(self, name: str, handler: Callable[[dict, str], dict], blocking: bool = False,
+                 cache_key: Optional[Callable[[dict], Hashable]] = None,
+                 cache_tag: Optional[Callable[[dict], Hashable]] = None, rate_class: str = 'catalog'):
+        self.name = name
+        self.handler = handler
+        self.blocking = blocking
+        self.cache_key = cache_key  # request -> tham số đã chuẩn hóa (trả None = request này không cache)
+        self.cache_tag = cache_tag  # request -> version dữ liệu của riêng entry (đọc TRƯỚC khi chạy handler)
+        self.rate_class = rate_class  # Nhóm token bucket của rate limiter
+
+
+class CommandRegistry:
+    LATENCY_SAMPLES = 1024  # Số mẫu gần nhất giữ lại để tính percentile
+    LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # Giây
+
+    def __init__(self, slow_threshold: float = 0.5, cache_version: Optional[Callable[[], Hashable]] = None,
+                 scheduler: Optional[PriorityScheduler] = None,
+                 blocking_scheduler: Optional[PriorityScheduler] = None):
+        self.commands: Dict[str, CommandSpec] = {}
+        self.slow_threshold = slow_threshold  # Giây - in [Profiling] nếu lệnh chậm hơn
+        self.cache_version = cache_version or (lambda: 0)  # Version dữ liệu của các lệnh có cache_key
+        self.scheduler = scheduler  # None = handler chạy ngay trên thread gọi dispatch
+        self.blocking_scheduler = blocking_scheduler  # Slot riêng cho handler blocking (None = không giới hạn)
+
+        self._stats: Dict[str, Dict] = {}
+        self._stats_lock = Lock()
+        self.inflight = 0  # Số lệnh đang chạy handler hoặc chờ slot scheduler (mọi transport)
+
+    def register(self, name: str, handler: Callable[[dict, str], dict], blocking: bool = False,
+                 cache_key: Optional[Callable[[dict], Hashable]] = None,
+                 cache_tag: Optional[Callable[[dict], Hashable]] = None, rate_class: str = 'catalog'):
+        """Đăng ký handler cho 1 lệnh"""
+        self.commands[name] = CommandSpec(name, handler, blocking, cache_key, cache_tag, rate_class)
+        self._stats[name] = {'count': 0, 'errors': 0, 'total_time': 0.0, 'max_time': 0.0,
+                             'samples': deque(maxlen=self.LATENCY_SAMPLES),
+                             'buckets': [0] * (len(self.LATENCY_BUCKETS) + 1),  # Ô cuối: > bucket lớn nhất
+                             'shed': 0, 'expired': 0, 'raw_bytes': 0, 'wire_bytes': 0, 'compressed_frames': 0, 'compress_time': 0.0}
+
+    def get(self, name: str) -> Optional[CommandSpec]:
+        return self.commands.get(name)
+
+    def is_blocking(self, name: str) -> bool:
+        spec = self.commands.get(name)
+        return spec.blocking if spec else False
+
+    def cache_key(self, command: str, request: dict) -> Optional[Hashable]:
+        """Key cache (lệnh, tham số chuẩn hóa) hoặc None nếu lệnh không cache được"""
+        spec = self.commands.get(command)
+        if spec is None or spec.cache_key is None:
+            return None
+        args = spec.cache_key(request)
+        return None if args is None else (command, args)
+
+    def cache_tag(self, command: str, request: dict) -> Hashable:
+        """Version riêng của entry cache (None nếu lệnh chỉ phụ thuộc version catalog)"""
+        spec = self.commands.get(command)
+        if spec is None or spec.cache_tag is None:
+            return None
+        return spec.cache_tag(request)
+
+    def scheduler_for(self, command: str) -> Optional[PriorityScheduler]:
+        """Scheduler cấp slot cho lệnh: blocking_scheduler với handler blocking, scheduler với lệnh còn lại"""
+        spec = self.commands.get(command)
+        if spec is None:
+            return None
+        return self.blocking_scheduler if spec.blocking else self.scheduler
+
+    def overloaded(self, command: str) -> bool:
+        """Kiểm tra shed không chờ slot (caller không được block, vd event loop của Async server)"""
+        spec = self.commands.get(command)
+        scheduler = self.scheduler_for(command)
+        if scheduler is None or not scheduler.overloaded(spec.rate_class):
+            return False
+        with self._stats_lock:
+            self._stats[command]['shed'] += 1
+        return True
+
+    def dispatch(self, command: str, request: dict, client_id: str, schedule: bool = True,
+                 deadline: Optional[float] = None) -> dict:
+        """Chạy handler của lệnh, đo thời gian và bắt lỗi
+
+        schedule=False: không qua scheduler (caller đã giữ slot, hoặc không được block và đã gọi overloaded()).
+        deadline: hạn chót time.monotonic; None = lấy hạn chót trong context (vd interceptor gRPC đã đặt).
+        """
+        spec = self.commands.get(command)
+        if spec is None:
+            return {'error': f'Unknown command: {command}'}
+        if deadline is None:
+            deadline = deadlines.current.get()
+
+        with self._stats_lock:
+            self.inflight += 1
+        if deadlines.expired(deadline):
+            return self._drop(command, 'expired', EXPIRED)
+        scheduler = self.scheduler_for(command) if schedule else None
+        if scheduler is not None:
+            try:
+                with tracing.span('schedule', lane=spec.rate_class):
+                    scheduler.acquire(spec.rate_class, deadline)
+            except Overloaded:
+                return self._drop(command, 'shed', OVERLOADED)
+            except DeadlineExceeded:
+                return self._drop(command, 'expired', EXPIRED)
+            if deadlines.expired(deadline):
+                scheduler.release()
+                return self._drop(command, 'expired', EXPIRED)
+
+        token = deadlines.current.set(deadline)
+        t_start = time.perf_counter()
+        failed = expired = False
+        try:
+            with tracing.span('handler', command=command):
+                return spec.handler(request, client_id)
+        except DeadlineExceeded:
+            expired = True
+            return dict(EXPIRED)
+        except Exception as e:
+            failed = True
+            log.error('Lỗi xử lý {command}: {error}', command=command, error=e)
+            return {'success': False, 'message': f'Lỗi server: {e}'}
+        finally:
+            elapsed = time.perf_counter() - t_start
+            deadlines.current.reset(token)
+            if scheduler is not None:
+                scheduler.release()
+            self._record(command, elapsed, failed, expired)
+
+    def _drop(self, command: str, counter: str, response: dict) -> dict:
+        """Request không chạy handler (shed / quá hạn): bỏ khỏi inflight, đếm theo lệnh"""
+        with self._stats_lock:
+            self.inflight -= 1
+            self._stats[command][counter] += 1
+        return dict(response)
+
+    def _record(self, command: str, elapsed: float, failed: bool, expired: bool = False):
+        with self._stats_lock:
+            self.inflight -= 1
+            stats = self._stats[command]
+            stats['count'] += 1
+            if expired:
+                stats['expired'] += 1
+            stats['total_time'] += elapsed
+            stats['samples'].append(elapsed)
+            stats['buckets'][bisect.bisect_left(self.LATENCY_BUCKETS, elapsed)] += 1
+            if elapsed > stats['max_time']:
+                stats['max_time'] = elapsed
+            if failed:
+                stats['errors'] += 1
+        if elapsed > self.slow_threshold:
+            slow_log.warning('{command} took {elapsed:.4f}s', command=command, elapsed=elapsed)
+
+    def record_payload(self, command: str, raw_bytes: int, wire_bytes: int,
+                       compress_time: float, compressed: bool):
+        """Ghi kích thước response trước / sau nén và thời gian nén (giây)"""
+        with self._stats_lock:
+            stats = self._stats.get(command)
+            if stats is None:
+                return
+            stats['raw_bytes'] += raw_bytes
+            stats['wire_bytes'] += wire_bytes
+            stats['compress_time'] += compress_time
+            if compressed:
+                stats['compressed_frames'] += 1
+
+    @staticmethod
+    def _percentile(sorted_samples, p: float) -> float:
+        if not sorted_samples:
+            return 0.0
+        return sorted_samples[min(len(sorted_samples) - 1, int(len(sorted_samples) * p / 100))]
+
+    def get_stats(self) -> Dict[str, Dict]:
+        """Thống kê theo lệnh: count, errors, shed, expired, avg_time, max_time, p50, p99 (giây, không gồm thời gian chờ slot)
+        + histogram: total_time, buckets (số lệnh <= từng mốc LATENCY_BUCKETS, cộng dồn)
+        + payload: raw_bytes, wire_bytes, compression_ratio (wire / raw), compressed_frames, compress_time_avg
+        """
+        with self._stats_lock:
+            snapshot = {name: (dict(stats, buckets=list(stats['buckets'])), list(stats['samples']))
+                        for name, stats in self._stats.items()}
+
+        result = {}
+        for name, (stats, samples) in snapshot.items():
+            samples.sort()
+            result[name] = {
+                'count': stats['count'],
+                'errors': stats['errors'],
+                'shed': stats['shed'],
+                'expired': stats['expired'],
+                'avg_time': stats['total_time'] / stats['count'] if stats['count'] else 0.0,
+                'max_time': stats['max_time'],
+                'p50': self._percentile(samples, 50),
+                'p99': self._percentile(samples, 99),
+                'total_time': stats['total_time'],
+                'buckets': list(itertools.accumulate(stats['buckets'][:-1])),
+                'blocking': self.commands[name].blocking,
+                'raw_bytes': stats['raw_bytes'],
+                'wire_bytes': stats['wire_bytes'],
+                'compression_ratio': stats['wire_bytes'] / stats['raw_bytes'] if stats['raw_bytes'] else 1.0,
+                'compressed_frames': stats['compressed_frames'],
+                'compress_time_avg': (stats['compress_time'] / stats['compressed_frames']
+                                      if stats['compressed_frames'] else 0.0)
+            }
+        return result
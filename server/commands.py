@@ -0,0 +1,259 @@
+"""Commands - Handler cho từng lệnh của hệ thống đặt vé
+
+Chức năng:
+- Gom toàn bộ logic xử lý lệnh (trước đây copy-paste trong server.py, ssl_server.py,
+  async_server.py và grpc_server.py) vào 1 chỗ
+- build_command_registry(app) đăng ký handler + loại xử lý (CPU-only / blocking I/O)
+  cho từng lệnh; app là server bất kỳ có các manager:
+  route_manager, trip_manager, seat_manager, booking_manager, file_handler, idempotency_cache
+- Lệnh catalog (GET_CITIES, SEARCH_ROUTES, GET_DATES) khai báo cache_key: response đã mã hóa
+  được cache theo tham số chuẩn hóa cho đến khi routes.json / trips.json load lại
+- GET_SEATS cache theo trip_id, gắn tag = version ghế của chuyến (mã hóa lại chỉ khi ghế đổi)
+- rate_class của lệnh vừa là nhóm rate limit vừa là lane ưu tiên của scheduler (SCHEDULER_CONFIG)
+- Lệnh quản trị: STATS (metrics.py), PROFILE / MEMORY (profiler.py)
+"""
+
+from command_registry import CommandRegistry
+from config import SERVER_CONFIG, SCHEDULER_CONFIG
+from priority_scheduler import PriorityScheduler
+from profiler import Profiler
+
+
+class BookingCommands:
+    """Handler cho các lệnh: handler(request, client_id) -> dict"""
+
+    def __init__(self, app):
+        self.route_manager = app.route_manager
+        self.trip_manager = app.trip_manager
+        self.seat_manager = app.seat_manager
+        self.booking_manager = app.booking_manager
+        self.file_handler = app.file_handler
+        self.idempotency_cache = app.idempotency_cache
+
+    # ---------- Catalog (CPU-only) ----------
+
+    def catalog_version(self) -> tuple:
+        """Đổi khi routes.json / trips.json được load lại"""
+        return self.route_manager.version, self.trip_manager.version
+
+    def seats_version(self, request: dict) -> int:
+        """Tag cache của GET_SEATS: version trạng thái ghế của chuyến"""
+        return self.seat_manager.trip_version(request.get('trip_id'))
+
+    def get_cities(self, request: dict, client_id: str) -> dict:
+        return self.route_manager.get_all_cities()
+
+    def search_routes(self, request: dict, client_id: str) -> dict:
+        return {'routes': self.route_manager.search_routes(request.get('from_city'), request.get('to_city'))}
+
+    def get_dates(self, request: dict, client_id: str) -> dict:
+        return {'dates': self.trip_manager.get_available_dates(request.get('route_id'))}
+
+    def search_trips(self, request: dict, client_id: str) -> dict:
+        trips = []
+        for trip in self.trip_manager.search_trips(request.get('route_id'), request.get('date')):
+            # Copy để không ghi available_seats vào dữ liệu dùng chung của TripManager
+            trip = dict(trip)
+            # OPTIMIZATION: Không init ghế ở đây để tránh IO disk chậm
+            # Nếu chưa init -> coi như còn trống tất cả
+            if trip['id'] in self.seat_manager.seats_data:
+                trip['available_seats'] = self.seat_manager.get_available_seats_count(trip['id'])
+            else:
+                trip['available_seats'] = trip.get('total_seats', 40)
+            trips.append(trip)
+        return {'trips': trips}
+
+    def get_trip_info(self, request: dict, client_id: str) -> dict:
+        trip_info = self.trip_manager.get_trip_by_id(request.get('trip_id'))
+        if trip_info:
+            return {'success': True, 'trip': trip_info}
+        return {'success': False, 'error': 'Trip not found'}
+
+    # ---------- Ghế (CPU-only: lock ngắn, ghi disk async) ----------
+
+    def get_seats(self, request: dict, client_id: str) -> dict:
+        return {'seats': self.seat_manager.get_trip_seats(request.get('trip_id'))}
+
+    def select_seat(self, request: dict, client_id: str) -> dict:
+        return self.seat_manager.select_seat(request.get('trip_id'), request.get('seat_id'), client_id)
+
+    def unselect_seat(self, request: dict, client_id: str) -> dict:
+        return self.seat_manager.unselect_seat(request.get('trip_id'), request.get('seat_id'), client_id)
+
+    # ---------- Đặt vé (blocking: fsync journal, chờ request trùng idempotency key) ----------
+
+    def book_seats(self, request: dict, client_id: str) -> dict:
+        # Idempotency key: retry (kể cả qua transport khác) nhận lại đúng response đầu tiên
+        return self.idempotency_cache.execute(
+            request.get('idempotency_key'),
+            lambda: self._book_seats(request, client_id),
+            scope=client_id
+        )
+
+    def _book_seats(self, request: dict, client_id: str) -> dict:
+        """Đặt vé: commit ghế rồi tạo booking"""
+        seat_res = self.seat_manager.book_seats(request.get('trip_id'), request.get('seat_ids', []), client_id)
+
+        # action='existing': ghế đã được chính client này book -> không tạo booking trùng
+        if not seat_res['success'] or seat_res.get('action') == 'existing':
+            return seat_res
+
+        # Lấy thông tin trip và route để gửi email
+        trip_id = request.get('trip_id')
+        trip_info = self.trip_manager.get_trip_by_id(trip_id)
+        route_info = None
+        if trip_info:
+            route_info = self.route_manager.get_route_by_id(trip_info.get('route_id'))
+
+        return self.booking_manager.create_booking(
+            trip_id,
+            request.get('seat_ids'),
+            request.get('customer_info'),
+            trip_info=trip_info,
+            route_info=route_info
+        )
+
+    def book_itinerary(self, request: dict, client_id: str) -> dict:
+        return self.idempotency_cache.execute(
+            request.get('idempotency_key'),
+            lambda: self._book_itinerary(request, client_id),
+            scope=client_id
+        )
+
+    def _book_itinerary(self, request: dict, client_id: str) -> dict:
+        """Đặt vé nhiều chặng (khứ hồi / trung chuyển): commit tất cả hoặc không"""
+        legs = request.get('legs') or []
+        if not isinstance(legs, list) or not legs:
+            return {'success': False, 'message': 'Hành trình không có chặng nào'}
+        for leg in legs:
+            if not isinstance(leg, dict) or not leg.get('trip_id') or not leg.get('seat_ids'):
+                return {'success': False, 'message': 'Chặng không hợp lệ (cần trip_id và seat_ids)'}
+
+        # Validate khách hàng trước khi giữ ghế để không commit ghế rồi mới báo lỗi
+        customer_info = request.get('customer_info')
+        error = self.booking_manager.validate_customer_info(customer_info)
+        if error:
+            return {'success': False, 'message': error}
+
+        seat_res = self.seat_manager.book_itinerary(legs, client_id)
+        if not seat_res['success'] or seat_res.get('action') == 'existing':
+            return seat_res
+
+        trip_infos, route_infos = {}, {}
+        for leg in legs:
+            trip_info = self.trip_manager.get_trip_by_id(leg['trip_id'])
+            trip_infos[leg['trip_id']] = trip_info
+            if trip_info:
+                route_infos[leg['trip_id']] = self.route_manager.get_route_by_id(trip_info.get('route_id'))
+
+        result = self.booking_manager.create_itinerary_bookings(legs, customer_info, trip_infos, route_infos)
+        if not result['success']:
+            # Journal chưa ghi được -> không có đơn nào: trả ghế lại cho client thay vì để ghế 'booked' không đơn
+            self.seat_manager.revert_itinerary(legs, client_id)
+        return result
+
+    # ---------- Tra cứu đơn (blocking: đọc file chuyến) ----------
+
+    def get_booking(self, request: dict, client_id: str) -> dict:
+        return self.booking_manager.get_booking(request.get('booking_id'))
+
+    def list_bookings(self, request: dict, client_id: str) -> dict:
+        return self.booking_manager.list_bookings(
+            phone=request.get('phone'),
+            cccd=request.get('cccd'),
+            page=request.get('page', 1),
+            page_size=request.get('page_size', 20)
+        )
+
+    # ---------- Upload (blocking: nén ảnh + ghi disk) ----------
+
+    def upload_file(self, request: dict, client_id: str) -> dict:
+        file_data = request.get('file_data') or b''
+        # TCP gửi hex string (JSON), gRPC gửi bytes
+        if isinstance(file_data, str):
+            file_data = bytes.fromhex(file_data)
+        return self.file_handler.save_file(request.get('filename'), file_data, request.get('booking_id'))
+
+    def upload_begin(self, request: dict, client_id: str) -> dict:
+        return self.file_handler.begin_upload(
+            request.get('filename'),
+            request.get('size'),
+            booking_id=request.get('booking_id'),
+            upload_id=request.get('upload_id')
+        )
+
+    def upload_chunk(self, request: dict, client_id: str) -> dict:
+        data = request.get('data') or b''
+        # Frame nhị phân (FLAG_BINARY) / msgpack: bytes; JSON v2: hex string
+        if isinstance(data, str):
+            data = bytes.fromhex(data)
+        return self.file_handler.write_chunk(request.get('upload_id'), request.get('offset'), data)
+
+    def upload_finish(self, request: dict, client_id: str) -> dict:
+        return self.file_handler.finish_upload(request.get('upload_id'), request.get('sha256'))
+
+
+# ---------- Cache key (tham số chuẩn hóa theo đúng cách handler so sánh) ----------
+
+def _search_routes_key(request: dict):
+    from_city = request.get('from_city') or ''
+    to_city = request.get('to_city') or ''
+    if not isinstance(from_city, str) or not isinstance(to_city, str):
+        return None
+    # RouteManager so sánh không phân biệt hoa thường
+    return from_city.lower(), to_city.lower()
+
+
+def _get_dates_key(request: dict):
+    route_id = request.get('route_id') or ''
+    return route_id if isinstance(route_id, str) else None
+
+
+def _get_seats_key(request: dict):
+    trip_id = request.get('trip_id')
+    return trip_id if isinstance(trip_id, str) and trip_id else None
+
+
+def build_command_registry(app) -> CommandRegistry:
+    """Tạo registry với toàn bộ lệnh của hệ thống"""
+    handlers = BookingCommands(app)
+    scheduler = blocking_scheduler = None
+    if SCHEDULER_CONFIG['enabled']:
+        scheduler = PriorityScheduler(SCHEDULER_CONFIG['slots'], SCHEDULER_CONFIG['weights'],
+                                      SCHEDULER_CONFIG['shed_lanes'], SCHEDULER_CONFIG['max_queue'],
+                                      SCHEDULER_CONFIG['max_delay'])
+        blocking_scheduler = PriorityScheduler(SCHEDULER_CONFIG['blocking_slots'], SCHEDULER_CONFIG['weights'],
+                                               SCHEDULER_CONFIG['shed_lanes'], SCHEDULER_CONFIG['max_queue'],
+                                               SCHEDULER_CONFIG['max_delay'])
+    registry = CommandRegistry(slow_threshold=SERVER_CONFIG['slow_command_threshold'],
+                               cache_version=handlers.catalog_version, scheduler=scheduler,
+                               blocking_scheduler=blocking_scheduler)
+
+    registry.register('GET_CITIES', handlers.get_cities, cache_key=lambda request: ())
+    registry.register('SEARCH_ROUTES', handlers.search_routes, cache_key=_search_routes_key)
+    registry.register('GET_DATES', handlers.get_dates, cache_key=_get_dates_key)
+    registry.register('SEARCH_TRIPS', handlers.search_trips)
+    registry.register('GET_TRIP_INFO', handlers.get_trip_info)
+    registry.register('GET_SEATS', handlers.get_seats, cache_key=_get_seats_key, cache_tag=handlers.seats_version)
+    registry.register('SELECT_SEAT', handlers.select_seat, rate_class='seat')
+    registry.register('UNSELECT_SEAT', handlers.unselect_seat, rate_class='seat')
+
+    registry.register('BOOK_SEATS', handlers.book_seats, blocking=True, rate_class='seat')
+    registry.register('BOOK_ITINERARY', handlers.book_itinerary, blocking=True, rate_class='seat')
+    registry.register('GET_BOOKING', handlers.get_booking, blocking=True)
+    registry.register('LIST_BOOKINGS', handlers.list_bookings, blocking=True)
+    registry.register('UPLOAD_FILE', handlers.upload_file, blocking=True, rate_class='upload')
+    registry.register('UPLOAD_BEGIN', handlers.upload_begin, blocking=True, rate_class='upload')
+    registry.register('UPLOAD_CHUNK', handlers.upload_chunk, blocking=True, rate_class='upload')
+    registry.register('UPLOAD_FINISH', handlers.upload_finish, blocking=True, rate_class='upload')
+
+    # Số liệu vận hành (metrics.py); app.metrics tạo sau registry nên tra lúc gọi
+    registry.register('STATS', lambda request, client_id: app.metrics.handle_stats(request, client_id),
+                      blocking=True, rate_class='admin')
+
+    # Profiler / tracemalloc của process (profiler.py): chỉ localhost hoặc admin token
+    profiler = Profiler()
+    registry.register('PROFILE', profiler.handle_profile, blocking=True, rate_class='admin')
+    registry.register('MEMORY', profiler.handle_memory, blocking=True, rate_class='admin')
+
+    return registry
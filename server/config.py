@@ -3,7 +3,11 @@
 Cấu hình cho các service:
 - Email Service
 - SSL/TLS
-- Server ports
+- Server ports, serving mode (thread / selector), giới hạn kết nối, số process worker
+- Cluster: shard ghế / đơn theo trip_id
+- Rate limit: token bucket theo session / kết nối
+- Scheduler: lane ưu tiên (đặt ghế trước tra cứu) + shed khi quá tải
+- Idempotency cache (chống đặt vé trùng khi retry)
 """
 
 import os
@@ -36,7 +40,166 @@ SERVER_CONFIG = {
     'tcp_port': int(os.getenv('TCP_PORT', '55555')),
     'udp_port': int(os.getenv('UDP_PORT', '55556')),
     'grpc_port': int(os.getenv('GRPC_PORT', '50051')),
-    'host': os.getenv('SERVER_HOST', '0.0.0.0')
+    'host': os.getenv('SERVER_HOST', '0.0.0.0'),
+    'slow_command_threshold': float(os.getenv('SLOW_COMMAND_THRESHOLD', '0.5')),  # giây
+    # 'thread': 1 thread / kết nối (mặc định) | 'selector': selectors (epoll) + worker pool giới hạn
+    'serving_mode': os.getenv('SERVING_MODE', 'thread').lower(),
+    'listen_backlog': int(os.getenv('LISTEN_BACKLOG', '1024')),
+    'max_connections': int(os.getenv('MAX_CONNECTIONS', '10000')),
+    'worker_threads': int(os.getenv('WORKER_THREADS', '32')),
+    'idle_timeout': float(os.getenv('IDLE_TIMEOUT', '300')),  # giây - đóng kết nối không gửi gì
+    # Áp lực (số kết nối / RSS vượt ngưỡng, 0 = bỏ điều kiện): đóng kết nối idle sớm hơn (idle_reaper.py)
+    'idle_pressure_timeout': float(os.getenv('IDLE_PRESSURE_TIMEOUT', '60')),
+    'idle_pressure_connections': int(os.getenv('IDLE_PRESSURE_CONNECTIONS', '8000')),
+    'idle_pressure_memory_mb': float(os.getenv('IDLE_PRESSURE_MEMORY_MB', '1024')),
+    'idle_reap_interval': float(os.getenv('IDLE_REAP_INTERVAL', '5')),
+    'pipeline_max_inflight': int(os.getenv('PIPELINE_MAX_INFLIGHT', '32')),  # request v3 đang xử lý / kết nối
+    # Mode 'selector': response chờ gửi / kết nối vượt ngưỡng này (bytes) -> ngừng đọc request mới của kết nối đó
+    'send_buffer_limit': int(os.getenv('SEND_BUFFER_LIMIT', str(4 * 1024 * 1024))),
+    # Async server: lệnh CPU-only chạy thẳng trên event loop, lệnh blocking sang executor riêng
+    'async_inline_commands': os.getenv('ASYNC_INLINE_COMMANDS', 'true').lower() == 'true',
+    'blocking_workers': int(os.getenv('BLOCKING_WORKERS', '16')),
+    # v3: nén response >= ngưỡng này (bytes) nếu client hỗ trợ; 0 = tắt nén
+    'compression_threshold': int(os.getenv('COMPRESSION_THRESHOLD', '1024')),
+    # Body 1 frame tối đa (bytes); frame lớn hơn -> đóng kết nối. Mặc định đủ cho upload 5MB dạng hex
+    'max_frame_size': int(os.getenv('MAX_FRAME_SIZE', str(16 * 1024 * 1024))),
+    # Số response catalog đã mã hóa được cache (GET_CITIES, SEARCH_ROUTES, GET_DATES); 0 = tắt
+    'response_cache_size': int(os.getenv('RESPONSE_CACHE_SIZE', '1024')),
+    # > 1: N process worker cùng lắng nghe cổng TCP/SSL/gRPC (SO_REUSEPORT) + 1 process authority
+    # giữ trạng thái ghế / đơn (seat_authority.py, worker_processes.py)
+    'worker_processes': int(os.getenv('WORKER_PROCESSES', '1')),
+    # Unix socket worker <-> authority; rỗng = bus_booking_authority_<tcp_port>.sock trong thư mục tạm
+    'authority_socket': os.getenv('AUTHORITY_SOCKET', ''),
+    # Dừng server (Ctrl+C / SIGTERM): đợi request đang xử lý tối đa SHUTDOWN_TIMEOUT giây,
+    # sau đó flush ghi nền (ghế, đơn, idempotency, email) tối đa SHUTDOWN_FLUSH_TIMEOUT giây
+    'shutdown_timeout': float(os.getenv('SHUTDOWN_TIMEOUT', '10')),
+    'shutdown_flush_timeout': float(os.getenv('SHUTDOWN_FLUSH_TIMEOUT', '30'))
+}
+
+# ============================
+# CLUSTER CONFIGURATION
+# ============================
+# Chia ghế / đơn cho nhiều shard theo consistent hash của trip_id (cluster.py)
+CLUSTER_CONFIG = {
+    # Địa chỉ shard, cách nhau dấu phẩy ('host:port' hoặc đường dẫn Unix socket); rỗng = không chạy cluster
+    'shards': [address.strip() for address in os.getenv('CLUSTER_SHARDS', '').split(',') if address.strip()],
+    # python server/cluster.py: process này là shard thứ mấy trong CLUSTER_SHARDS
+    'shard_index': int(os.getenv('SHARD_INDEX', '0')),
+    'virtual_nodes': int(os.getenv('CLUSTER_VIRTUAL_NODES', '64'))  # điểm trên vòng hash / shard
+}
+
+# ============================
+# RATE LIMIT CONFIGURATION
+# ============================
+# Token bucket theo session và theo kết nối, kiểm tra trước khi dispatch (rate_limiter.py)
+RATE_LIMIT_CONFIG = {
+    'enabled': os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true',
+    # Lệnh giữ / đặt ghế: token / giây và burst của 1 session; rate 0 = không giới hạn nhóm
+    'seat_rate': float(os.getenv('RATE_LIMIT_SEAT_RATE', '5')),
+    'seat_burst': float(os.getenv('RATE_LIMIT_SEAT_BURST', '20')),
+    # Tra cứu chỉ đọc (tuyến, chuyến, ghế, đơn)
+    'catalog_rate': float(os.getenv('RATE_LIMIT_CATALOG_RATE', '50')),
+    'catalog_burst': float(os.getenv('RATE_LIMIT_CATALOG_BURST', '100')),
+    # Upload file / chunk
+    'upload_rate': float(os.getenv('RATE_LIMIT_UPLOAD_RATE', '50')),
+    'upload_burst': float(os.getenv('RATE_LIMIT_UPLOAD_BURST', '100')),
+    # Lệnh quản trị / giám sát (STATS, PROFILE, MEMORY)
+    'admin_rate': float(os.getenv('RATE_LIMIT_ADMIN_RATE', '10')),
+    'admin_burst': float(os.getenv('RATE_LIMIT_ADMIN_BURST', '20')),
+    # Bucket theo kết nối = N x bucket session (1 kết nối có thể mang nhiều session)
+    'connection_factor': float(os.getenv('RATE_LIMIT_CONNECTION_FACTOR', '4')),
+    # Địa chỉ / dải mạng của frontend dồn nhiều người dùng qua 1 session (web Flask): request từ đây mang
+    # END_USER_FIELD thì bucket session tính theo người dùng cuối và bỏ bucket kết nối (cách nhau dấu phẩy)
+    'trusted_frontends': [net.strip() for net in
+                          os.getenv('RATE_LIMIT_TRUSTED_FRONTENDS', '127.0.0.1,::1').split(',') if net.strip()],
+    'max_buckets': int(os.getenv('RATE_LIMIT_MAX_BUCKETS', '100000'))
+}
+
+# ============================
+# SCHEDULER CONFIGURATION
+# ============================
+# Hàng đợi ưu tiên trước khi chạy handler, lane = nhóm lệnh của rate limiter (priority_scheduler.py)
+SCHEDULER_CONFIG = {
+    'enabled': os.getenv('SCHEDULER_ENABLED', 'true').lower() == 'true',
+    # Handler non-blocking chạy đồng thời (mọi transport): 1 process chỉ chạy Python trên 1 core (GIL), slot dư
+    # chỉ có ích cho handler chờ I/O (chuyển tiếp tới authority / shard); ít slot -> thread chờ không tranh GIL.
+    'slots': int(os.getenv('SCHEDULER_SLOTS', '4')),
+    # Handler blocking (fsync, chờ request trùng idempotency key...) lấy slot ở hàng đợi ưu tiên riêng: không
+    # chiếm slot lệnh tính toán, đặt vé vẫn đi trước tra cứu đơn / upload. Phải nhỏ hơn số thread của pool
+    # (WORKER_THREADS, BLOCKING_WORKERS) để request chờ xếp hàng ở đây thay vì ở hàng đợi FIFO của pool
+    'blocking_slots': int(os.getenv('SCHEDULER_BLOCKING_SLOTS', '8')),
+    # Trọng số chia slot khi nhiều lane cùng chờ
+    'weights': {
+        'seat': float(os.getenv('SCHEDULER_SEAT_WEIGHT', '8')),
+        'upload': float(os.getenv('SCHEDULER_UPLOAD_WEIGHT', '2')),
+        'catalog': float(os.getenv('SCHEDULER_CATALOG_WEIGHT', '1')),
+        'admin': float(os.getenv('SCHEDULER_ADMIN_WEIGHT', '8'))
+    },
+    # Lane được shed khi quá tải (cách nhau dấu phẩy); lệnh giữ / đặt ghế không bao giờ bị shed,
+    # lane 'admin' (STATS, PROFILE, MEMORY) không bao giờ bị shed kể cả khi có trong danh sách
+    'shed_lanes': [lane.strip() for lane in os.getenv('SCHEDULER_SHED_LANES', 'catalog').split(',') if lane.strip()],
+    'max_queue': int(os.getenv('SCHEDULER_MAX_QUEUE', '1024')),  # tổng request chờ slot
+    'max_delay': float(os.getenv('SCHEDULER_MAX_DELAY', '1.0'))  # giây - chờ lâu hơn -> shed
+}
+
+# ============================
+# METRICS CONFIGURATION
+# ============================
+# Lệnh STATS (JSON / Prometheus) luôn bật; endpoint HTTP /metrics chỉ bật khi METRICS_PORT > 0 (metrics.py)
+METRICS_CONFIG = {
+    'host': os.getenv('METRICS_HOST', '127.0.0.1'),
+    'port': int(os.getenv('METRICS_PORT', '0')),
+    # Giây - ước lượng RAM của cấu trúc lớn (duyệt toàn bộ dict) tối đa 1 lần / khoảng này
+    'memory_interval': float(os.getenv('METRICS_MEMORY_INTERVAL', '30'))
+}
+
+# ============================
+# TRACING CONFIGURATION
+# ============================
+# Span của request mang traceparent (client.py sinh trace ID) -> file JSONL và / hoặc collector OTLP (common/tracing.py)
+TRACING_CONFIG = {
+    'service': os.getenv('TRACE_SERVICE', 'bus-server'),
+    'enabled': os.getenv('TRACING_ENABLED', 'false').lower() == 'true',
+    'path': os.getenv('TRACE_FILE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'traces', 'server.jsonl')),
+    'collector': os.getenv('TRACE_COLLECTOR_URL', ''),  # vd http://localhost:4318/v1/traces
+    # Xác suất tự mở trace cho request KHÔNG mang traceparent (0 = chỉ nối tiếp trace của client)
+    'sample_rate': float(os.getenv('TRACE_SAMPLE_RATE', '0')),
+    'max_queue': int(os.getenv('TRACE_MAX_QUEUE', '10000'))  # span chờ ghi, đầy -> bỏ span
+}
+
+# ============================
+# LOGGING CONFIGURATION
+# ============================
+# Log có cấu trúc, ghi bất đồng bộ (common/logger.py); module = tiền tố trên console: TCP, SSL TCP, Booking...
+LOGGING_CONFIG = {
+    'level': os.getenv('LOG_LEVEL', 'info'),  # debug / info / warning / error
+    'levels': os.getenv('LOG_LEVELS', ''),  # level riêng theo module, vd 'TCP=warning,SeatManager=debug'
+    'sampling': os.getenv('LOG_SAMPLING', ''),  # tỉ lệ giữ record debug / info theo module, vd 'TCP=0.01'
+    'console': os.getenv('LOG_CONSOLE', 'true').lower() == 'true',
+    'path': os.getenv('LOG_FILE', ''),  # file JSONL ('' = không ghi file)
+    'async_mode': os.getenv('LOG_ASYNC', 'true').lower() == 'true',  # false = ghi ngay trên thread gọi
+    'buffer_size': int(os.getenv('LOG_BUFFER_SIZE', '10000')),  # record chờ ghi, đầy -> bỏ record cũ nhất
+    'flush_interval': float(os.getenv('LOG_FLUSH_INTERVAL', '0.1'))  # giây giữa 2 lần ghi theo lô
+}
+
+# ============================
+# ADMIN CONFIGURATION
+# ============================
+# Lệnh PROFILE / MEMORY (profiler.py): nhận từ kết nối localhost hoặc request mang đúng ADMIN_TOKEN
+ADMIN_CONFIG = {
+    'token': os.getenv('ADMIN_TOKEN', ''),  # '' = chỉ localhost
+    'allow_localhost': os.getenv('ADMIN_ALLOW_LOCALHOST', 'true').lower() == 'true',
+    'profile_interval': float(os.getenv('PROFILE_INTERVAL_MS', '10')) / 1000,  # giây giữa 2 lần lấy mẫu stack
+    'profile_max_seconds': float(os.getenv('PROFILE_MAX_SECONDS', '300')),  # 1 lần profile chạy tối đa
+    'memory_frames': int(os.getenv('TRACEMALLOC_FRAMES', '10'))  # số frame traceback tracemalloc giữ / cấp phát
+}
+
+# ============================
+# IDEMPOTENCY CONFIGURATION
+# ============================
+IDEMPOTENCY_CONFIG = {
+    'max_entries': int(os.getenv('IDEMPOTENCY_MAX_ENTRIES', '10000')),
+    'ttl_seconds': int(os.getenv('IDEMPOTENCY_TTL', '86400'))  # 24h
 }
 
 # ============================
@@ -54,6 +217,9 @@ CLIENT_CONFIG = {
 MULTIMEDIA_CONFIG = {
     'upload_dir': os.getenv('UPLOAD_DIR', 'server/uploads'),
     'max_file_size': int(os.getenv('MAX_FILE_SIZE', '5242880')),  # 5MB default
+    # Upload theo chunk (UPLOAD_BEGIN / UPLOAD_CHUNK / UPLOAD_FINISH, gRPC UploadFileStream)
+    'upload_chunk_size': int(os.getenv('UPLOAD_CHUNK_SIZE', '262144')),  # 256KB
+    'upload_session_ttl': int(os.getenv('UPLOAD_SESSION_TTL', '3600')),  # giây - giữ upload dở để resume
     'allowed_image_types': ['image/jpeg', 'image/png', 'image/gif'],
     'allowed_document_types': ['application/pdf'],
     'image_compression': {
@@ -0,0 +1,60 @@
+"""Deadlines - Hạn chót của request: bỏ việc mà client đã không còn đợi
+
+Chức năng:
+- Client gửi thời gian còn đợi (BUDGET_FIELD, ms) trong request; gRPC dùng deadline có sẵn của RPC
+- Transport đổi budget thành hạn chót tuyệt đối (time.monotonic) tính từ lúc NHẬN frame, không phải
+  lúc worker lấy ra khỏi hàng đợi
+- CommandRegistry.dispatch kiểm tra khi lấy request ra (trước và sau khi chờ slot scheduler), đặt
+  hạn chót vào context (ContextVar) trong lúc chạy handler
+- Bước tốn kém (nén ảnh...) gọi check(): quá hạn -> DeadlineExceeded, registry trả EXPIRED
+  và đếm 'expired' theo lệnh
+- Chuyển tiếp sang authority / shard: gửi kèm budget_ms() còn lại
+"""
+
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from common.protocol import BUDGET_FIELD
+
+EXPIRED = {'success': False, 'expired': True, 'message': 'Yêu cầu đã quá thời gian chờ, vui lòng thử lại'}
+
+MAX_BUDGET = 24 * 3600.0  # Giây - budget lớn hơn coi như không có hạn chót
+
+current: ContextVar = ContextVar('deadline', default=None)  # Hạn chót của lệnh đang chạy (None = không có)
+
+
+class DeadlineExceeded(Exception):
+    """Request đã quá hạn chót: bỏ phần việc còn lại"""
+
+
+def from_budget(budget_ms, received: Optional[float] = None) -> Optional[float]:
+    """budget_ms (client gửi) -> hạn chót time.monotonic; budget không hợp lệ -> None"""
+    if isinstance(budget_ms, bool) or not isinstance(budget_ms, (int, float)):
+        return None
+    seconds = budget_ms / 1000.0
+    if not 0 < seconds < MAX_BUDGET:
+        return None
+    return (time.monotonic() if received is None else received) + seconds
+
+
+def from_request(request: dict, received: Optional[float] = None) -> Optional[float]:
+    return from_budget(request.get(BUDGET_FIELD), received)
+
+
+def expired(deadline: Optional[float]) -> bool:
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def check():
+    """Gọi trước bước tốn kém trong handler: lệnh đang chạy đã quá hạn -> DeadlineExceeded"""
+    if expired(current.get()):
+        raise DeadlineExceeded
+
+
+def budget_ms() -> Optional[int]:
+    """Thời gian còn lại (ms) của lệnh đang chạy, gửi kèm khi chuyển tiếp; None = không có hạn chót"""
+    deadline = current.get()
+    if deadline is None:
+        return None
+    return max(1, int((deadline - time.monotonic()) * 1000))
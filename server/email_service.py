@@ -12,6 +12,10 @@ from email.mime.multipart import MIMEMultipart
 from typing import Dict, Optional
 import os
 
+from common import logger
+
+log = logger.get('EmailService')
+
 
 class EmailService:
     def __init__(self, smtp_server: str = 'smtp.gmail.com', smtp_port: int = 587,
@@ -58,11 +62,11 @@ class EmailService:
             True nếu gửi thành công, False nếu có lỗi
         """
         if not self.enabled:
-            print(f"[EmailService] ⚠️ Bỏ qua gửi email vì service chưa được cấu hình")
+            log.info('⚠️ Bỏ qua gửi email vì service chưa được cấu hình')
             return False
         
         if not to_email or '@' not in to_email:
-            print(f"[EmailService] ⚠️ Email không hợp lệ: {to_email}")
+            log.warning('⚠️ Email không hợp lệ: {email}', email=to_email)
             return False
         
         try:
@@ -92,18 +96,18 @@ class EmailService:
                 server.login(self.username, self.password)
                 server.send_message(msg)
             
-            print(f"[EmailService] ✅ Đã gửi email xác nhận đến {to_email}")
+            log.info('✅ Đã gửi email xác nhận đến {email}', email=to_email)
             return True
             
         except smtplib.SMTPAuthenticationError as e:
-            print(f"[EmailService] ❌ Lỗi xác thực SMTP: {e}")
-            print("[EmailService] 💡 Gợi ý: Kiểm tra lại username/password hoặc sử dụng App Password cho Gmail")
+            log.error('❌ Lỗi xác thực SMTP: {error}', error=e)
+            log.error('💡 Gợi ý: Kiểm tra lại username/password hoặc sử dụng App Password cho Gmail')
             return False
         except smtplib.SMTPException as e:
-            print(f"[EmailService] ❌ Lỗi SMTP: {e}")
+            log.error('❌ Lỗi SMTP: {error}', error=e)
             return False
         except Exception as e:
-            print(f"[EmailService] ❌ Lỗi gửi email: {e}")
+            log.error('❌ Lỗi gửi email: {error}', error=e)
             return False
     
     def _create_booking_email_html(self, booking_data: Dict) -> str:
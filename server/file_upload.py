@@ -4,18 +4,57 @@ Chức năng:
 - Nhận file qua TCP socket
 - Lưu file vào thư mục uploads
 - Hỗ trợ nhiều file cùng lúc
+- Upload theo chunk (resume được): begin -> chunk(offset, data) x N -> finish
+  + Chunk ghi thẳng vào file tạm uploads/.partial/<upload_id>.part, hash SHA-256 cộng dồn
+  + Mất kết nối: begin lại với cùng upload_id -> server trả offset đã nhận, client gửi tiếp
+  + Bộ nhớ mỗi upload ~ 1 chunk (trừ ảnh: nén ảnh cần đọc cả file)
+- Request đã quá hạn chót (deadlines.py) thì không nén ảnh: DeadlineExceeded, upload chunk giữ nguyên
+  để client gửi lại FINISH
 """
 
 import os
+import re
+import time
+import uuid
 import hashlib
-from typing import Dict
+import threading
+from typing import Dict, Optional
 from image_processor import ImageProcessor
 from config import MULTIMEDIA_CONFIG
+from deadlines import DeadlineExceeded
+import deadlines
+from common import logger
+
+log = logger.get('FileUpload')
+
+IMAGE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.gif']
+UPLOAD_ID_PATTERN = re.compile(r'[0-9A-Za-z_-]{8,64}')
+
+
+class _UploadSession:
+    """1 upload đang dở"""
+
+    def __init__(self, upload_id: str, filename: str, size: int, booking_id: Optional[str], part_path: str):
+        self.upload_id = upload_id
+        self.filename = filename
+        self.size = size
+        self.booking_id = booking_id
+        self.part_path = part_path
+        self.offset = 0
+        self.hasher = hashlib.sha256()
+        self.result = None          # Response của finish (finish lặp lại trả lại kết quả này)
+        self.last_active = time.time()
+        self.lock = threading.Lock()
 
 
 class FileUploadHandler:
     def __init__(self, upload_dir: str):
         self.upload_dir = upload_dir
+        self.partial_dir = os.path.join(upload_dir, '.partial')
+        self.chunk_size = MULTIMEDIA_CONFIG['upload_chunk_size']
+        self.session_ttl = MULTIMEDIA_CONFIG['upload_session_ttl']
+        self.sessions: Dict[str, _UploadSession] = {}
+        self.sessions_lock = threading.Lock()
         self.ensure_upload_dir()
     
     def ensure_upload_dir(self):
@@ -50,21 +89,18 @@ class FileUploadHandler:
             original_size = len(file_data)
             base_name, ext = os.path.splitext(filename)
             
-            if compress_image and ext.lower() in ['.jpg', '.jpeg', '.png', '.gif']:
+            if compress_image and ext.lower() in IMAGE_EXTENSIONS:
                 # Kiểm tra xem có phải ảnh hợp lệ không
                 if ImageProcessor.validate_image(file_data):
+                    deadlines.check()  # Nén ảnh tốn CPU: bỏ nếu client đã thôi đợi
                     compressed = ImageProcessor.compress_image(file_data)
                     if compressed:
                         file_data = compressed
-                        print(f"[FileUpload] Đã nén ảnh: {original_size} → {len(file_data)} bytes")
+                        log.info('Đã nén ảnh: {original} → {size} bytes', original=original_size, size=len(file_data))
             
             # Tạo tên file duy nhất (thêm hash để tránh trùng)
             file_hash = hashlib.md5(file_data).hexdigest()[:8]
-            
-            if booking_id:
-                unique_filename = f"{booking_id}_{base_name}_{file_hash}{ext}"
-            else:
-                unique_filename = f"{base_name}_{file_hash}{ext}"
+            unique_filename = self._unique_filename(base_name, ext, file_hash, booking_id)
             
             filepath = os.path.join(self.upload_dir, unique_filename)
             
@@ -72,7 +108,7 @@ class FileUploadHandler:
             with open(filepath, 'wb') as f:
                 f.write(file_data)
             
-            print(f"[FileUpload] Đã lưu file: {unique_filename} ({len(file_data)} bytes)")
+            log.info('Đã lưu file: {filename} ({size} bytes)', filename=unique_filename, size=len(file_data))
             
             return {
                 'success': True,
@@ -81,14 +117,148 @@ class FileUploadHandler:
                 'message': 'Upload thành công'
             }
         
+        except DeadlineExceeded:
+            raise
         except Exception as e:
-            print(f"[FileUpload] Lỗi lưu file: {e}")
+            log.error('Lỗi lưu file: {error}', error=e)
             return {
                 'success': False,
                 'filepath': None,
                 'message': f'Lỗi: {str(e)}'
             }
     
+    @staticmethod
+    def _unique_filename(base_name: str, ext: str, file_hash: str, booking_id: str = None) -> str:
+        if booking_id:
+            return f"{booking_id}_{base_name}_{file_hash}{ext}"
+        return f"{base_name}_{file_hash}{ext}"
+    
+    # ---------- Upload theo chunk ----------
+    
+    def begin_upload(self, filename: str, size: int, booking_id: str = None,
+                     upload_id: str = None) -> Dict:
+        """Tạo upload mới, hoặc resume nếu upload_id đã tồn tại
+        
+        Returns:
+            {'success': bool, 'upload_id': str, 'offset': int, 'chunk_size': int}
+        """
+        if upload_id is not None and not UPLOAD_ID_PATTERN.fullmatch(str(upload_id)):
+            return {'success': False, 'message': 'upload_id không hợp lệ'}
+        try:
+            size = int(size)
+        except (TypeError, ValueError):
+            return {'success': False, 'message': 'Thiếu kích thước file'}
+        max_size = MULTIMEDIA_CONFIG['max_file_size']
+        if size < 0 or size > max_size:
+            return {'success': False, 'message': f'File quá lớn. Kích thước tối đa: {max_size // 1024 // 1024}MB'}
+        if not filename:
+            return {'success': False, 'message': 'Thiếu tên file'}
+        
+        with self.sessions_lock:
+            session = self.sessions.get(upload_id) if upload_id else None
+            if session is None:
+                upload_id = upload_id or uuid.uuid4().hex
+                os.makedirs(self.partial_dir, exist_ok=True)
+                part_path = os.path.join(self.partial_dir, f"{upload_id}.part")
+                open(part_path, 'wb').close()
+                # basename: không cho tên file trỏ ra ngoài thư mục uploads
+                session = _UploadSession(upload_id, os.path.basename(filename), size, booking_id or None, part_path)
+                self.sessions[upload_id] = session
+                log.info('Bắt đầu upload {upload_id}: {filename} ({size} bytes)', upload_id=upload_id,
+                         filename=session.filename, size=size)
+            elif session.size != size:
+                return {'success': False, 'message': 'upload_id đã dùng cho file khác'}
+            session.last_active = time.time()
+        
+        return {'success': True, 'upload_id': upload_id, 'offset': session.offset, 'chunk_size': self.chunk_size}
+    
+    def write_chunk(self, upload_id: str, offset: int, data) -> Dict:
+        """Ghi 1 chunk tại offset (phải đúng bằng số bytes đã nhận)
+        
+        Sai offset (chunk gửi lại / bị mất) -> success False kèm offset server đang chờ.
+        """
+        session = self.sessions.get(upload_id)
+        if session is None:
+            return {'success': False, 'message': 'Upload không tồn tại hoặc đã hết hạn'}
+        with session.lock:
+            if session.result is not None:
+                return {'success': False, 'offset': session.offset, 'message': 'Upload đã hoàn tất'}
+            if offset != session.offset:
+                return {'success': False, 'offset': session.offset,
+                        'message': f'Sai offset, server đang chờ offset {session.offset}'}
+            if session.offset + len(data) > session.size:
+                return {'success': False, 'offset': session.offset, 'message': 'Chunk vượt kích thước file đã khai báo'}
+            
+            with open(session.part_path, 'ab') as f:
+                f.write(data)
+            session.hasher.update(data)
+            session.offset += len(data)
+            session.last_active = time.time()
+            return {'success': True, 'offset': session.offset}
+    
+    def finish_upload(self, upload_id: str, sha256: str = None, compress_image: bool = True) -> Dict:
+        """Kiểm tra đủ bytes + hash rồi chuyển file tạm vào thư mục uploads
+        
+        Returns:
+            Như save_file, kèm 'sha256'
+        """
+        session = self.sessions.get(upload_id)
+        if session is None:
+            return {'success': False, 'filepath': None, 'message': 'Upload không tồn tại hoặc đã hết hạn'}
+        with session.lock:
+            if session.result is not None:
+                return session.result
+            if session.offset != session.size:
+                return {'success': False, 'filepath': None, 'offset': session.offset,
+                        'message': f'Chưa nhận đủ file ({session.offset}/{session.size} bytes)'}
+            digest = session.hasher.hexdigest()
+            if sha256 and sha256.lower() != digest:
+                self._discard_session(session)
+                return {'success': False, 'filepath': None, 'message': 'SHA-256 không khớp, hãy upload lại'}
+            
+            base_name, ext = os.path.splitext(session.filename)
+            if compress_image and ext.lower() in IMAGE_EXTENSIONS:
+                # Nén ảnh cần cả file trong RAM (giới hạn bởi max_file_size)
+                deadlines.check()
+                with open(session.part_path, 'rb') as f:
+                    result = self.save_file(session.filename, f.read(), session.booking_id, compress_image)
+                os.remove(session.part_path)
+            else:
+                unique_filename = self._unique_filename(base_name, ext, digest[:8], session.booking_id)
+                filepath = os.path.join(self.upload_dir, unique_filename)
+                os.replace(session.part_path, filepath)
+                log.info('Đã lưu file: {filename} ({size} bytes, chunked)', filename=unique_filename, size=session.size)
+                result = {
+                    'success': True,
+                    'filepath': filepath,
+                    'filename': unique_filename,
+                    'message': 'Upload thành công'
+                }
+            result['sha256'] = digest
+            session.result = result
+            session.last_active = time.time()
+            return result
+    
+    def _discard_session(self, session: _UploadSession):
+        with self.sessions_lock:
+            self.sessions.pop(session.upload_id, None)
+        try:
+            os.remove(session.part_path)
+        except OSError:
+            pass
+    
+    def cleanup_expired_uploads(self) -> int:
+        """Xóa upload dở / đã xong quá session_ttl giây không hoạt động"""
+        now = time.time()
+        with self.sessions_lock:
+            expired = [s for s in self.sessions.values() if now - s.last_active > self.session_ttl]
+        for session in expired:
+            with session.lock:
+                self._discard_session(session)
+        if expired:
+            log.info('Đã xóa {count} upload hết hạn', count=len(expired))
+        return len(expired)
+    
     def save_multiple_files(self, files: list, booking_id: str = None) -> Dict:
         """Lưu nhiều file cùng lúc
         
@@ -0,0 +1,99 @@
+"""Frame Codec - Giải mã request / mã hóa response của 1 frame TCP (dùng chung TCP/SSL/Async)
+
+Chức năng:
+- Request: giải nén (cờ FLAG_COMPRESSED) -> giải mã theo encoding của kết nối -> dict
+  (frame FLAG_BINARY: meta + dữ liệu thô, xem common/codec.py)
+- Response: mã hóa (json / msgpack / protobuf) -> nén nếu body lớn và client hỗ trợ
+- Ghi kích thước trước / sau nén + thời gian nén theo lệnh vào CommandRegistry
+- Lệnh có cache_key (catalog, GET_SEATS): (body, flags) cuối cùng được cache theo version dữ liệu
+  (response_cache.py); GET_SEATS gắn thêm tag = version ghế của chuyến
+- Request đang được trace (common/tracing.py): span 'encode' cho mã hóa + nén response
+- Response từ chối của rate limiter và PONG (keepalive) mã hóa sẵn theo encoding (không tốn CPU khi bị spam)
+"""
+
+import json
+import time
+from typing import Hashable, Optional, Tuple
+
+from common import codec, tracing
+from common.compression import FLAG_COMPRESSED, decompress, maybe_compress
+from common.protocol import ConnectionState, negotiate
+from rate_limiter import REJECTION
+from response_cache import ResponseCache
+
+PONG = {'success': True, 'pong': True}
+
+
+class FrameCodec:
+    def __init__(self, registry, compression_threshold: int = 1024, cache_size: int = 0):
+        self.registry = registry
+        self.compression_threshold = compression_threshold  # 0 = không nén response
+        self.response_cache = ResponseCache(cache_size, registry.cache_version)
+        self._rejections = {}  # encoding -> body response từ chối của rate limiter
+        self._pongs = {}  # encoding -> body response PING
+
+    def decode_request(self, body: bytes, flags: int, state: ConnectionState) -> dict:
+        """Body frame -> request dict; lỗi định dạng -> ValueError / UnicodeDecodeError"""
+        if flags & FLAG_COMPRESSED:
+            body = decompress(body, state.compression)
+        if flags & codec.FLAG_BINARY:
+            return codec.unpack_binary(body, state.encoding)
+        request = codec.loads(body, state.encoding)
+        if not isinstance(request, dict):
+            raise ValueError('Request phải là object')
+        return request
+
+    def hello(self, request: dict, state: ConnectionState) -> Tuple[bytes, int]:
+        """HELLO luôn trả JSON, không nén (encoding / compression mới chỉ áp dụng từ frame sau)"""
+        return json.dumps(negotiate(request, state)).encode('utf-8'), 0
+
+    def invalid_request(self, state: ConnectionState) -> Tuple[bytes, int]:
+        return codec.dumps({'success': False, 'message': 'Request không hợp lệ'}, state.encoding), 0
+
+    def rate_limited(self, state: ConnectionState) -> Tuple[bytes, int]:
+        """Response từ chối (rate_limiter.py): JSON / msgpack, không nén, mã hóa 1 lần cho mỗi encoding"""
+        body = self._rejections.get(state.encoding)
+        if body is None:
+            body = self._rejections[state.encoding] = codec.dumps(REJECTION, state.encoding)
+        return body, 0
+
+    def pong(self, state: ConnectionState) -> Tuple[bytes, int]:
+        """Response PING (keepalive của client): mã hóa 1 lần cho mỗi encoding"""
+        body = self._pongs.get(state.encoding)
+        if body is None:
+            body = self._pongs[state.encoding] = codec.dumps(PONG, state.encoding)
+        return body, 0
+
+    def lookup(self, command: Optional[str], request: dict,
+               state: ConnectionState) -> Tuple[Optional[Hashable], Optional[Tuple[bytes, int]]]:
+        """-> (cache key, (body, flags) đã cache); lệnh không cache được -> (None, None)
+
+        Cache key trả về gồm cả tag, caller chỉ cần chuyển lại nguyên vẹn cho encode_response.
+        """
+        args_key = self.registry.cache_key(command, request)
+        if args_key is None or not self.response_cache.max_entries:
+            return None, None
+        # Version nằm trong key: response tính xong sau khi catalog đổi không bao giờ được hit
+        key = (self.registry.cache_version(), args_key, state.encoding, state.protobuf, state.compression)
+        # Tag đọc trước khi chạy handler: dữ liệu đổi trong lúc xử lý -> entry mang tag cũ -> lần sau miss
+        tag = self.registry.cache_tag(command, request)
+        return (key, tag), self.response_cache.get(key, tag)
+
+    def encode_response(self, command: Optional[str], response: dict,
+                        state: ConnectionState, cache_key: Optional[Hashable] = None) -> Tuple[bytes, int]:
+        """Response dict -> (body, flags); có cache_key (từ lookup) -> lưu vào response cache"""
+        with tracing.span('encode', encoding=state.encoding) as span:
+            body, flags = codec.encode_response(command, response, state.encoding, state.protobuf)
+            raw_size = len(body)
+            compress_time = 0.0
+            if state.compression and self.compression_threshold and raw_size >= self.compression_threshold:
+                t_start = time.perf_counter()
+                body, compressed_flag = maybe_compress(body, state.compression, self.compression_threshold)
+                compress_time = time.perf_counter() - t_start
+                flags |= compressed_flag
+            span.set('bytes', len(body))
+        self.registry.record_payload(command, raw_size, len(body), compress_time, bool(flags & FLAG_COMPRESSED))
+        if cache_key is not None and 'error' not in response and response.get('success', True):
+            key, tag = cache_key
+            self.response_cache.put(key, body, flags, tag)
+        return body, flags
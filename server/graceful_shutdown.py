@@ -0,0 +1,140 @@
+"""Graceful Shutdown - Dừng server không mất đơn / ghế đang ghi nền
+
+Chức năng:
+- WriteBehind: ThreadPoolExecutor cho ghi nền (ghế, đơn, idempotency, email) có đếm việc đang chờ,
+  flush(timeout) đợi mọi việc đã nhận ghi xong; get_stats(): độ sâu hàng đợi + độ trễ ghi (lag)
+  + request đang được trace: span 'persist.enqueue' (submit) và 'persist.write' (việc ghi trên thread nền,
+    cùng trace -> thấy được độ trễ tới lúc dữ liệu nằm trên disk)
+- Trình tự dừng (stop() của mọi server):
+  1. Ngừng nhận kết nối mới (đóng socket lắng nghe, gRPC stop với grace)
+  2. Ngừng đọc request mới, xong request đang xử lý + gửi response (tối đa SHUTDOWN_TIMEOUT giây)
+  3. Flush mọi hàng đợi ghi nền (tối đa SHUTDOWN_FLUSH_TIMEOUT giây), in báo cáo đã flush / còn lại
+- SIGTERM được xử lý như Ctrl+C -> rolling deploy (kill / systemd / docker stop) cũng đi qua trình tự trên
+"""
+
+import itertools
+import signal
+import socket
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Condition
+from typing import Callable, Dict, Tuple
+
+from common import tracing
+
+
+class WriteBehind:
+    """Hàng đợi ghi nền: submit trả về ngay, flush() đợi các việc đã nhận chạy xong"""
+
+    LAG_SAMPLES = 256  # Số việc gần nhất giữ lại để tính lag p50 / p99
+
+    def __init__(self, name: str, max_workers: int):
+        self.name = name
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._pending = 0
+        self._cond = Condition()
+        self._tickets = itertools.count()
+        self._submitted_at: Dict[int, float] = {}  # ticket -> time.monotonic() lúc submit (việc chưa xong)
+        self._lags = deque(maxlen=self.LAG_SAMPLES)  # Giây từ submit tới ghi xong
+        self.submitted = 0
+
+    def submit(self, fn: Callable, *args):
+        ticket = next(self._tickets)
+        with self._cond:
+            self._pending += 1
+            self.submitted += 1
+            self._submitted_at[ticket] = time.monotonic()
+        try:
+            with tracing.span('persist.enqueue', queue=self.name):
+                future = self._executor.submit(tracing.wrap(fn, 'persist.write', queue=self.name), *args)
+        except RuntimeError:
+            # Interpreter đang thoát (executor không nhận việc mới): ghi đồng bộ thay vì bỏ
+            try:
+                fn(*args)
+            finally:
+                self._done(ticket)
+            return
+        future.add_done_callback(lambda _future: self._done(ticket))
+
+    def _done(self, ticket: int):
+        now = time.monotonic()
+        with self._cond:
+            self._lags.append(now - self._submitted_at.pop(ticket, now))
+            self._pending -= 1
+            if not self._pending:
+                self._cond.notify_all()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def flush(self, timeout: float = None) -> Tuple[int, int]:
+        """Đợi hàng đợi rỗng (tối đa timeout giây) -> (số việc đã xong trong lúc đợi, số việc còn lại)"""
+        with self._cond:
+            queued = self._pending
+            self._cond.wait_for(lambda: not self._pending, timeout)
+            remaining = self._pending
+        return max(0, queued - remaining), remaining
+
+    def get_stats(self) -> Dict:
+        """pending: việc chờ / đang ghi, oldest: tuổi việc chưa xong lâu nhất (lag hiện tại), lag p50 / p99 / max"""
+        now = time.monotonic()
+        with self._cond:
+            oldest = now - min(self._submitted_at.values()) if self._submitted_at else 0.0
+            lags = sorted(self._lags)
+            stats = {'pending': self._pending, 'submitted': self.submitted}
+        stats['completed'] = stats['submitted'] - stats['pending']
+        stats['oldest'] = oldest
+        stats['lag_p50'] = lags[len(lags) // 2] if lags else 0.0
+        stats['lag_p99'] = lags[min(len(lags) - 1, len(lags) * 99 // 100)] if lags else 0.0
+        stats['lag_max'] = lags[-1] if lags else 0.0
+        return stats
+
+
+def raise_keyboard_interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def install_signal_handlers():
+    """SIGTERM -> KeyboardInterrupt: đi cùng đường dừng có drain với Ctrl+C (gọi từ main thread)"""
+    signal.signal(signal.SIGTERM, raise_keyboard_interrupt)
+
+
+def close_reading(sock: socket.socket):
+    """Ngừng nhận request mới trên kết nối: thread đang đợi đọc nhận EOF, response vẫn gửi được
+
+    Gọi socket.socket.shutdown trực tiếp: SSLSocket.shutdown bỏ lớp TLS, response sau đó sẽ hỏng.
+    """
+    try:
+        socket.socket.shutdown(sock, socket.SHUT_RD)
+    except OSError:
+        pass
+
+
+def wait_until(predicate: Callable[[], bool], deadline: float, interval: float = 0.05) -> bool:
+    """Đợi predicate() đúng hoặc tới deadline (time.monotonic); trả về predicate() cuối cùng"""
+    while not predicate():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(interval)
+    return True
+
+
+def flush_state(app, timeout: float) -> Dict[str, Tuple[int, int]]:
+    """Flush ghi nền của mọi manager có trên server (process worker không có -> bỏ qua)"""
+    deadline = time.monotonic() + timeout
+    report = {}
+    for manager in (app.seat_manager, app.booking_manager, app.idempotency_cache):
+        if manager is not None:
+            for name, queue in manager.write_queues().items():
+                report[name] = queue.flush(max(0.0, deadline - time.monotonic()))
+    return report
+
+
+def format_report(inflight: int, abandoned: int, flushed: Dict[str, Tuple[int, int]]) -> str:
+    """inflight: lệnh đang chạy lúc bắt đầu dừng, abandoned: lệnh chưa xong khi hết SHUTDOWN_TIMEOUT"""
+    parts = [f"request {max(0, inflight - abandoned)}/{inflight} xong"]
+    for name, (done, remaining) in flushed.items():
+        parts.append(f"{name} {done}" + (f" (còn {remaining})" if remaining else ''))
+    return ', '.join(parts)
@@ -2,8 +2,13 @@
 
 Chức năng:
 - Cung cấp gRPC API song song với TCP/UDP
+- Dispatch qua command registry dùng chung với TCP (cùng logic, cùng số liệu timing)
 - Protocol Buffers cho performance cao hơn
 - Streaming support cho realtime updates
+- Interceptor kiểm tra trước khi vào handler:
+  + rate limit (rate_limiter.py): vượt giới hạn -> RESOURCE_EXHAUSTED
+  + RPC unary giữ 1 slot scheduler (priority_scheduler.py) trong lúc chạy: bị shed -> UNAVAILABLE
+  + metadata 'traceparent' (client đang trace): span 'grpc <lệnh>' nối vào trace của client (common/tracing.py)
 """
 
 import grpc
@@ -34,6 +39,117 @@ from booking_manager import BookingManager
 from file_upload import FileUploadHandler
 from email_service import EmailService
 from config import SERVER_CONFIG
+from rate_limiter import REJECTION
+from priority_scheduler import OVERLOADED, Overloaded
+from deadlines import EXPIRED, DeadlineExceeded
+import deadlines
+from metrics import FanoutCounter
+from common import logger, tracing
+
+log = logger.get('gRPC Stream')
+
+# Method gRPC -> lệnh trong registry (xác định nhóm rate limit); 1 RPC (kể cả stream) = 1 token
+GRPC_COMMANDS = {
+    'GetCities': 'GET_CITIES',
+    'SearchRoutes': 'SEARCH_ROUTES',
+    'GetDates': 'GET_DATES',
+    'SearchTrips': 'SEARCH_TRIPS',
+    'GetSeats': 'GET_SEATS',
+    'SelectSeat': 'SELECT_SEAT',
+    'UnselectSeat': 'UNSELECT_SEAT',
+    'BookSeats': 'BOOK_SEATS',
+    'BookItinerary': 'BOOK_ITINERARY',
+    'UploadFile': 'UPLOAD_FILE',
+    'UploadFileStream': 'UPLOAD_BEGIN',
+    'StreamSeatUpdates': 'GET_SEATS',
+    'GetBooking': 'GET_BOOKING',
+    'ListBookings': 'LIST_BOOKINGS',
+}
+
+
+class AdmissionInterceptor(grpc.ServerInterceptor):
+    """Rate limit + scheduler của server TCP cho gRPC
+
+    Token bucket: session = session_id của request (nếu có), kết nối = peer.
+    Slot scheduler giữ suốt RPC unary (handler gọi registry với schedule=False); RPC stream không giữ slot
+    (UploadFileStream lấy slot cho từng chunk, StreamSeatUpdates không chạy lệnh). Lệnh blocking
+    (BookSeats, GetBooking...) giữ slot của blocking_scheduler như CommandRegistry.dispatch.
+    Deadline của RPC (client truyền timeout=) thành hạn chót của lệnh (deadlines.current), hết hạn khi
+    đang chờ slot -> DEADLINE_EXCEEDED.
+    Metadata 'traceparent' -> span của RPC (và của lệnh bên trong) thuộc trace của client.
+    """
+    
+    def __init__(self, rate_limiter, scheduler=None, blocking_scheduler=None):
+        self.rate_limiter = rate_limiter
+        self.scheduler = scheduler
+        self.blocking_scheduler = blocking_scheduler
+    
+    def intercept_service(self, continuation, handler_call_details):
+        handler = continuation(handler_call_details)
+        command = GRPC_COMMANDS.get(handler_call_details.method.rsplit('/', 1)[-1])
+        if handler is None or command is None:
+            return handler
+        
+        if handler.unary_unary:
+            return grpc.unary_unary_rpc_method_handler(
+                self._guard(command, handler.unary_unary, scheduled=True),
+                request_deserializer=handler.request_deserializer,
+                response_serializer=handler.response_serializer)
+        if handler.unary_stream:
+            return grpc.unary_stream_rpc_method_handler(
+                self._guard(command, handler.unary_stream),
+                request_deserializer=handler.request_deserializer,
+                response_serializer=handler.response_serializer)
+        if handler.stream_unary:
+            return grpc.stream_unary_rpc_method_handler(
+                self._guard(command, handler.stream_unary, streaming=True),
+                request_deserializer=handler.request_deserializer,
+                response_serializer=handler.response_serializer)
+        return handler
+    
+    def _guard(self, command: str, behavior, streaming: bool = False, scheduled: bool = False):
+        lane = self.rate_limiter.rate_class(command)
+        blocking = self.rate_limiter.registry.is_blocking(command)
+        scheduler = (self.blocking_scheduler if blocking else self.scheduler) if scheduled else None
+        
+        def guarded(request, context):
+            peer = context.peer()
+            session_id = '' if streaming else getattr(request, 'session_id', '')
+            if not self.rate_limiter.admit(command, session_id or peer, peer):
+                context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, REJECTION['message'])
+            remaining = context.time_remaining()
+            deadline = time.monotonic() + remaining if remaining is not None else None
+            if deadlines.expired(deadline):
+                context.abort(grpc.StatusCode.DEADLINE_EXCEEDED, EXPIRED['message'])
+            token = deadlines.current.set(deadline)
+            try:
+                with tracing.start_trace(f'grpc {command}', self._traceparent(context), peer=peer):
+                    if scheduler is None:
+                        return behavior(request, context)
+                    try:
+                        with tracing.span('schedule', lane=lane):
+                            scheduler.acquire(lane, deadline)
+                    except Overloaded:
+                        context.abort(grpc.StatusCode.UNAVAILABLE, OVERLOADED['message'])
+                    except DeadlineExceeded:
+                        context.abort(grpc.StatusCode.DEADLINE_EXCEEDED, EXPIRED['message'])
+                    try:
+                        return behavior(request, context)
+                    finally:
+                        scheduler.release()
+            finally:
+                deadlines.current.reset(token)
+        return guarded
+    
+    @staticmethod
+    def _traceparent(context):
+        """traceparent trong metadata của RPC (None nếu tracing tắt / client không gửi)"""
+        if not tracing.tracer.enabled:
+            return None
+        for key, value in context.invocation_metadata():
+            if key == tracing.TRACEPARENT_HEADER:
+                return value
+        return None
 
 
 class BusBookingService(bus_booking_pb2_grpc.BusBookingServiceServicer):
@@ -43,11 +159,29 @@ class BusBookingService(bus_booking_pb2_grpc.BusBookingServiceServicer):
         self.server = booking_server
         self.stream_subscribers = {}  # {trip_id: [contexts]}
         self.stream_lock = threading.Lock()
+        # Fan-out của StreamSeatUpdates: metrics.py đọc qua booking_server.grpc_fanout
+        self.fanout = booking_server.grpc_fanout = FanoutCounter()
+    
+    def _dispatch(self, command: str, request_dict: dict, session_id: str = '', schedule: bool = False) -> dict:
+        """Chạy lệnh qua command registry dùng chung với TCP server
+
+        RPC unary đã giữ slot scheduler từ AdmissionInterceptor -> mặc định không xin slot lần nữa.
+        """
+        return self.server.commands.dispatch(command, request_dict, session_id, schedule)
+    
+    @staticmethod
+    def _customer_info(customer_info) -> dict:
+        return {
+            'name': customer_info.name,
+            'phone': customer_info.phone,
+            'cccd': customer_info.cccd,
+            'email': customer_info.email if customer_info.email else ''
+        }
     
     def GetCities(self, request, context):
         """Lấy danh sách thành phố"""
         try:
-            cities = self.server.route_manager.get_all_cities()
+            cities = self._dispatch('GET_CITIES', {})
             return bus_booking_pb2.CitiesResponse(
                 from_cities=cities['from_cities'],
                 to_cities=cities['to_cities']
@@ -60,13 +194,13 @@ class BusBookingService(bus_booking_pb2_grpc.BusBookingServiceServicer):
     def SearchRoutes(self, request, context):
         """Tìm kiếm tuyến đường"""
         try:
-            routes = self.server.route_manager.search_routes(
-                request.from_city if request.from_city else None,
-                request.to_city if request.to_city else None
-            )
+            result = self._dispatch('SEARCH_ROUTES', {
+                'from_city': request.from_city if request.from_city else None,
+                'to_city': request.to_city if request.to_city else None
+            })
             
             pb_routes = []
-            for route in routes:
+            for route in result['routes']:
                 pb_routes.append(bus_booking_pb2.Route(
                     id=route['id'],
                     from_city=route['from_city'],
@@ -84,8 +218,8 @@ class BusBookingService(bus_booking_pb2_grpc.BusBookingServiceServicer):
     def GetDates(self, request, context):
         """Lấy ngày có chuyến"""
         try:
-            dates = self.server.trip_manager.get_available_dates(request.route_id)
-            return bus_booking_pb2.DatesResponse(dates=dates)
+            result = self._dispatch('GET_DATES', {'route_id': request.route_id})
+            return bus_booking_pb2.DatesResponse(dates=result['dates'])
         except Exception as e:
             context.set_code(grpc.StatusCode.INTERNAL)
             context.set_details(f"Error: {str(e)}")
@@ -94,20 +228,13 @@ class BusBookingService(bus_booking_pb2_grpc.BusBookingServiceServicer):
     def SearchTrips(self, request, context):
         """Tìm kiếm chuyến xe"""
         try:
-            trips = self.server.trip_manager.search_trips(
-                request.route_id,
-                request.date
-            )
-            
-            # Add available seats count
-            for trip in trips:
-                if trip['id'] in self.server.seat_manager.seats_data:
-                    trip['available_seats'] = self.server.seat_manager.get_available_seats_count(trip['id'])
-                else:
-                    trip['available_seats'] = trip.get('total_seats', 40)
+            result = self._dispatch('SEARCH_TRIPS', {
+                'route_id': request.route_id,
+                'date': request.date
+            })
             
             pb_trips = []
-            for trip in trips:
+            for trip in result['trips']:
                 pb_trips.append(bus_booking_pb2.Trip(
                     id=trip['id'],
                     route_id=trip['route_id'],
@@ -128,19 +255,10 @@ class BusBookingService(bus_booking_pb2_grpc.BusBookingServiceServicer):
     def GetSeats(self, request, context):
         """Lấy trạng thái ghế"""
         try:
-            seats = self.server.seat_manager.get_trip_seats(request.trip_id)
+            # Dispatch giữ số liệu timing chung (và khởi tạo ghế chuyến mới); message lấy từ seat map cache
+            self._dispatch('GET_SEATS', {'trip_id': request.trip_id})
             
-            pb_seats = {}
-            for seat_id, seat_info in seats.items():
-                pb_seats[seat_id] = bus_booking_pb2.SeatStatus(
-                    status=seat_info.get('status', 'available'),
-                    locked_by=seat_info.get('locked_by', ''),
-                    locked_until=int(seat_info.get('locked_until', 0))
-                )
-            
-            response = bus_booking_pb2.SeatsResponse()
-            response.seats.update(pb_seats)
-            return response
+            return self.server.seat_maps.seats_message(request.trip_id)
         except Exception as e:
             context.set_code(grpc.StatusCode.INTERNAL)
             context.set_details(f"Error: {str(e)}")
@@ -149,11 +267,10 @@ class BusBookingService(bus_booking_pb2_grpc.BusBookingServiceServicer):
     def SelectSeat(self, request, context):
         """Chọn ghế"""
         try:
-            result = self.server.seat_manager.select_seat(
-                request.trip_id,
-                request.seat_id,
-                request.session_id
-            )
+            result = self._dispatch('SELECT_SEAT', {
+                'trip_id': request.trip_id,
+                'seat_id': request.seat_id
+            }, request.session_id)
             return bus_booking_pb2.SelectSeatResponse(
                 success=result.get('success', False),
                 message=result.get('message', '')
@@ -166,11 +283,10 @@ class BusBookingService(bus_booking_pb2_grpc.BusBookingServiceServicer):
     def UnselectSeat(self, request, context):
         """Bỏ chọn ghế"""
         try:
-            result = self.server.seat_manager.unselect_seat(
-                request.trip_id,
-                request.seat_id,
-                request.session_id
-            )
+            result = self._dispatch('UNSELECT_SEAT', {
+                'trip_id': request.trip_id,
+                'seat_id': request.seat_id
+            }, request.session_id)
             return bus_booking_pb2.SelectSeatResponse(
                 success=result.get('success', False),
                 message=result.get('message', '')
@@ -181,29 +297,14 @@ class BusBookingService(bus_booking_pb2_grpc.BusBookingServiceServicer):
             return bus_booking_pb2.SelectSeatResponse(success=False, message=str(e))
     
     def BookSeats(self, request, context):
-        """Đặt vé"""
+        """Đặt vé (qua seat_manager.book_seats như TCP: ghế phải được session này chọn trước)"""
         try:
-            # Get trip and route info
-            trip_info = self.server.trip_manager.get_trip_by_id(request.trip_id)
-            route_info = None
-            if trip_info:
-                route_info = self.server.route_manager.get_route_by_id(trip_info.get('route_id'))
-            
-            customer_info = {
-                'name': request.customer_info.name,
-                'phone': request.customer_info.phone,
-                'cccd': request.customer_info.cccd,
-                'email': request.customer_info.email if request.customer_info.email else ''
-            }
-            
-            result = self.server.booking_manager.create_booking(
-                request.trip_id,
-                list(request.seat_ids),
-                customer_info,
-                uploaded_files=None,
-                trip_info=trip_info,
-                route_info=route_info
-            )
+            result = self._dispatch('BOOK_SEATS', {
+                'trip_id': request.trip_id,
+                'seat_ids': list(request.seat_ids),
+                'customer_info': self._customer_info(request.customer_info),
+                'idempotency_key': request.idempotency_key or None
+            }, request.session_id)
             
             return bus_booking_pb2.BookSeatsResponse(
                 success=result.get('success', False),
@@ -219,17 +320,36 @@ class BusBookingService(bus_booking_pb2_grpc.BusBookingServiceServicer):
                 message=str(e)
             )
     
+    def BookItinerary(self, request, context):
+        """Đặt vé nhiều chặng - tất cả hoặc không"""
+        try:
+            result = self._dispatch('BOOK_ITINERARY', {
+                'legs': [{'trip_id': leg.trip_id, 'seat_ids': list(leg.seat_ids)} for leg in request.legs],
+                'customer_info': self._customer_info(request.customer_info),
+                'idempotency_key': request.idempotency_key or None
+            }, request.session_id)
+            return bus_booking_pb2.BookItineraryResponse(
+                success=result.get('success', False),
+                itinerary_id=result.get('itinerary_id', ''),
+                booking_ids=result.get('booking_ids', []),
+                message=result.get('message', '')
+            )
+        except Exception as e:
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"Error: {str(e)}")
+            return bus_booking_pb2.BookItineraryResponse(success=False, message=str(e))
+    
     def UploadFile(self, request, context):
         """Upload file"""
         try:
-            result = self.server.file_handler.save_file(
-                request.filename,
-                request.file_data,
-                request.booking_id if request.booking_id else None
-            )
+            result = self._dispatch('UPLOAD_FILE', {
+                'filename': request.filename,
+                'file_data': request.file_data,
+                'booking_id': request.booking_id if request.booking_id else None
+            })
             return bus_booking_pb2.UploadFileResponse(
                 success=result.get('success', False),
-                filepath=result.get('filepath', ''),
+                filepath=result.get('filepath') or '',
                 message=result.get('message', '')
             )
         except Exception as e:
@@ -241,12 +361,61 @@ class BusBookingService(bus_booking_pb2_grpc.BusBookingServiceServicer):
                 message=str(e)
             )
     
+    def UploadFileStream(self, request_iterator, context):
+        """Upload file theo chunk (client streaming); chunk đầu mang metadata
+        
+        Sai offset / upload hết hạn -> trả success=False kèm offset server đã nhận để client resume.
+        """
+        upload_id = None
+        sha256 = ''
+        try:
+            for chunk in request_iterator:
+                if upload_id is None:
+                    result = self._dispatch('UPLOAD_BEGIN', {
+                        'upload_id': chunk.upload_id or None,
+                        'filename': chunk.filename,
+                        'size': chunk.size,
+                        'booking_id': chunk.booking_id or None
+                    }, schedule=True)
+                    if not result.get('success'):
+                        return self._upload_response(result)
+                    upload_id = result['upload_id']
+                    sha256 = chunk.sha256
+                if chunk.data:
+                    result = self._dispatch('UPLOAD_CHUNK', {
+                        'upload_id': upload_id,
+                        'offset': chunk.offset,
+                        'data': chunk.data
+                    }, schedule=True)
+                    if not result.get('success'):
+                        return self._upload_response(result, upload_id)
+            if upload_id is None:
+                return bus_booking_pb2.UploadFileResponse(success=False, message='Stream rỗng')
+            return self._upload_response(
+                self._dispatch('UPLOAD_FINISH', {'upload_id': upload_id, 'sha256': sha256}, schedule=True), upload_id
+            )
+        except Exception as e:
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"Error: {str(e)}")
+            return bus_booking_pb2.UploadFileResponse(success=False, message=str(e), upload_id=upload_id or '')
+    
+    @staticmethod
+    def _upload_response(result: dict, upload_id: str = None):
+        return bus_booking_pb2.UploadFileResponse(
+            success=result.get('success', False),
+            filepath=result.get('filepath') or '',
+            message=result.get('message', ''),
+            upload_id=upload_id or '',
+            offset=result.get('offset') or 0
+        )
+    
     def StreamSeatUpdates(self, request, context):
         """Stream realtime seat updates"""
+        self.fanout.subscribe()
         try:
             filter_trip_ids = set(request.trip_ids) if request.trip_ids else None
             
-            last_seats_data = {}
+            last_versions = {}  # trip_id -> version ghế đã gửi
             
             while context.is_active():
                 try:
@@ -263,44 +432,95 @@ class BusBookingService(bus_booking_pb2_grpc.BusBookingServiceServicer):
                     else:
                         seats_data = dict(list(all_seats.items())[:50])  # Limit 50 trips
                     
-                    # Send updates for changed trips
-                    for trip_id, seats in seats_data.items():
-                        if trip_id not in last_seats_data or seats != last_seats_data[trip_id]:
-                            pb_seats = {}
-                            for seat_id, seat_info in seats.items():
-                                pb_seats[seat_id] = bus_booking_pb2.SeatStatus(
-                                    status=seat_info.get('status', 'available'),
-                                    locked_by=seat_info.get('locked_by', ''),
-                                    locked_until=int(seat_info.get('locked_until', 0))
-                                )
-                            
+                    # Send updates for changed trips (so version: dict ghế bị sửa tại chỗ nên so nội dung không phát hiện được)
+                    for trip_id in seats_data:
+                        version = self.server.seat_manager.trip_version(trip_id)
+                        if last_versions.get(trip_id) != version:
                             update = bus_booking_pb2.SeatUpdate(
                                 trip_id=trip_id,
                                 timestamp=int(time.time()),
                             )
-                            update.seats.update(pb_seats)
+                            update.seats.MergeFrom(self.server.seat_maps.seats_message(trip_id).seats)
                             
-                            context.write(update)
-                            last_seats_data[trip_id] = seats
+                            yield update
+                            self.fanout.add(1, update.ByteSize())
+                            last_versions[trip_id] = version
                     
                     # Wait before next update
                     time.sleep(2)
                     
                 except Exception as e:
-                    print(f"[gRPC Stream] Lỗi: {e}")
+                    log.error('Lỗi: {error}', error=e)
                     break
             
         except Exception as e:
-            print(f"[gRPC Stream] Lỗi stream: {e}")
+            log.error('Lỗi stream: {error}', error=e)
         finally:
-            print(f"[gRPC Stream] Client disconnected")
+            self.fanout.subscribe(-1)
+            log.info('Client disconnected')
+    
+    @staticmethod
+    def _to_pb_booking(booking):
+        return bus_booking_pb2.Booking(
+            id=booking.get('id', ''),
+            trip_id=booking.get('trip_id', ''),
+            seat_ids=booking.get('seat_ids') or [],
+            customer_name=booking.get('customer_name', ''),
+            customer_phone=booking.get('customer_phone', ''),
+            customer_cccd=booking.get('customer_cccd', ''),
+            uploaded_files=booking.get('uploaded_files') or [],
+            booking_time=booking.get('booking_time', ''),
+            status=booking.get('status', '')
+        )
+    
+    def GetBooking(self, request, context):
+        """Tra cứu đơn đặt vé theo mã vé"""
+        try:
+            result = self._dispatch('GET_BOOKING', {'booking_id': request.booking_id})
+            response = bus_booking_pb2.BookingResponse(
+                success=result.get('success', False),
+                message=result.get('message', '')
+            )
+            if result.get('booking'):
+                response.booking.CopyFrom(self._to_pb_booking(result['booking']))
+            return response
+        except Exception as e:
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"Error: {str(e)}")
+            return bus_booking_pb2.BookingResponse(success=False, message=str(e))
+    
+    def ListBookings(self, request, context):
+        """Liệt kê đơn đặt vé theo phone hoặc CCCD"""
+        try:
+            result = self._dispatch('LIST_BOOKINGS', {
+                'phone': request.phone or None,
+                'cccd': request.cccd or None,
+                'page': request.page or 1,
+                'page_size': request.page_size or 20
+            })
+            return bus_booking_pb2.ListBookingsResponse(
+                success=result.get('success', False),
+                bookings=[self._to_pb_booking(b) for b in result.get('bookings', [])],
+                total=result.get('total', 0),
+                page=result.get('page', 0),
+                page_size=result.get('page_size', 0),
+                message=result.get('message', '')
+            )
+        except Exception as e:
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(f"Error: {str(e)}")
+            return bus_booking_pb2.ListBookingsResponse(success=False, message=str(e))
 
 
 def serve_grpc(booking_server, port=None):
     """Start gRPC server"""
     port = port or SERVER_CONFIG['grpc_port']
     
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    # so_reuseport: chế độ nhiều process, mọi worker bind cùng cổng gRPC
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10), options=[('grpc.so_reuseport', 1)],
+                         interceptors=[AdmissionInterceptor(booking_server.rate_limiter,
+                                                            booking_server.commands.scheduler,
+                                                            booking_server.commands.blocking_scheduler)])
     bus_booking_pb2_grpc.add_BusBookingServiceServicer_to_server(
         BusBookingService(booking_server), server
     )
@@ -328,6 +548,8 @@ if __name__ == '__main__':
             time.sleep(86400)  # Run for 24 hours
     except KeyboardInterrupt:
         print("\n[gRPC] Đang dừng...")
-        grpc_server.stop(0)
+        # grace: RPC đang chạy được xong, sau đó flush ghi nền của server
+        grpc_server.stop(SERVER_CONFIG['shutdown_timeout']).wait()
+        main_server.stop()
         print("[gRPC] Đã dừng")
 
@@ -0,0 +1,158 @@
+"""Idempotency Cache - Chống đặt vé trùng khi client retry
+
+Chức năng:
+- Lưu response ĐẦU TIÊN của lệnh ghi (BOOK_SEATS...) theo (session, idempotency key do client gửi):
+  session khác gửi trùng key không nhận được response (booking_id, thông tin khách) của người khác
+- Replay nguyên văn response đó khi cùng key được gửi lại (qua TCP hoặc gRPC)
+- Request trùng key đang chạy song song sẽ đợi request đầu tiên xong rồi nhận cùng kết quả
+- Giới hạn số entry (LRU) + TTL, lưu trên disk (JSONL, append-only) cạnh dữ liệu bookings
+"""
+
+import json
+import os
+import time
+import copy
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+from threading import Lock, Event
+
+from common import logger
+from graceful_shutdown import WriteBehind
+
+log = logger.get('IdempotencyCache')
+
+
+class IdempotencyCache:
+    def __init__(self, data_dir: str, max_entries: int = 10000, ttl: int = 86400):
+        self.cache_file = os.path.join(data_dir, 'bookings', 'idempotency.jsonl')
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, response)
+        self._inflight: Dict[str, Event] = {}
+        self._lines_on_disk = 0
+        self.lock = Lock()
+
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+
+        # 1 worker để các dòng append giữ đúng thứ tự
+        self._writes = WriteBehind('idempotency-writer', max_workers=1)
+
+        self.load()
+
+    def load(self):
+        """Load cache từ disk, bỏ entry hết hạn và compact lại file"""
+        self._entries = OrderedDict()
+        now = time.time()
+        try:
+            if os.path.exists(self.cache_file):
+                with open(self.cache_file, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        try:
+                            record = json.loads(line)
+                        except:
+                            continue
+                        if record.get('expires_at', 0) > now:
+                            self._entries[record['key']] = (record['expires_at'], record['response'])
+                            self._entries.move_to_end(record['key'])
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                self._rewrite_file(list(self._entries.items()))
+                print(f"[IdempotencyCache] Đã load {len(self._entries)} key")
+        except Exception as e:
+            print(f"[IdempotencyCache] Lỗi load cache: {e}")
+
+    def _rewrite_file(self, items):
+        """Ghi lại toàn bộ file chỉ với các entry còn hiệu lực"""
+        tmp_file = self.cache_file + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            for key, (expires_at, response) in items:
+                f.write(json.dumps({'key': key, 'expires_at': expires_at, 'response': response},
+                                   ensure_ascii=False) + '\n')
+        os.replace(tmp_file, self.cache_file)
+        self._lines_on_disk = len(items)
+
+    def _async_append(self, key: str, expires_at: float, response: Dict):
+        """Background task: append 1 entry, compact khi file phình quá 2x giới hạn"""
+        try:
+            with open(self.cache_file, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'key': key, 'expires_at': expires_at, 'response': response},
+                                   ensure_ascii=False) + '\n')
+            self._lines_on_disk += 1
+
+            if self._lines_on_disk > 2 * self.max_entries:
+                now = time.time()
+                with self.lock:
+                    items = [(k, v) for k, v in self._entries.items() if v[0] > now]
+                self._rewrite_file(items)
+        except Exception as e:
+            log.error('Async write error: {error}', error=e)
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Lấy response đã lưu (None nếu chưa có hoặc đã hết hạn)"""
+        with self.lock:
+            return self._get_locked(key)
+
+    def _get_locked(self, key: str) -> Optional[Dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return copy.deepcopy(entry[1])
+
+    def _put_locked(self, key: str, response: Dict):
+        expires_at = time.time() + self.ttl
+        stored = copy.deepcopy(response)
+        self._entries[key] = (expires_at, stored)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._writes.submit(self._async_append, key, expires_at, stored)
+
+    def write_queues(self) -> Dict[str, WriteBehind]:
+        """Hàng đợi ghi nền cần flush khi dừng server"""
+        return {'idempotency': self._writes}
+
+    def memory_structures(self) -> Dict[str, object]:
+        """Cấu trúc lớn giữ trong RAM (metrics.py ước lượng kích thước)"""
+        return {'idempotency': self._entries}
+
+    def execute(self, key: Optional[str], func: Callable[[], Dict], wait_timeout: float = 30.0,
+                scope: str = '') -> Dict:
+        """Chạy func() đúng 1 lần cho mỗi (scope, key); các lần gọi sau trả lại response đầu tiên.
+
+        scope: người gửi (session_id / client_id) - cache key = '<scope>:<key>'.
+        Không có key -> chạy func() bình thường (client cũ).
+        """
+        if not key:
+            return func()
+        key = f'{scope}:{key}'
+
+        while True:
+            with self.lock:
+                cached = self._get_locked(key)
+                if cached is not None:
+                    return cached
+                event = self._inflight.get(key)
+                if event is None:
+                    event = Event()
+                    self._inflight[key] = event
+                    break
+            # Request cùng key đang chạy: đợi kết quả của nó
+            if not event.wait(wait_timeout):
+                return {'success': False, 'message': 'Yêu cầu trùng đang được xử lý, vui lòng thử lại'}
+
+        try:
+            response = func()
+            with self.lock:
+                self._put_locked(key, response)
+            return response
+        finally:
+            with self.lock:
+                self._inflight.pop(key, None)
+            event.set()
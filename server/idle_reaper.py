@@ -0,0 +1,114 @@
+"""Idle Reaper - Đóng kết nối TCP không hoạt động, chặt hơn khi server chịu áp lực bộ nhớ / số kết nối
+
+Chức năng:
+- Transport ghi lại lần hoạt động cuối của từng kết nối (nhận frame, gửi xong response, PING)
+- Bình thường: đóng kết nối idle quá IDLE_TIMEOUT giây
+- Áp lực (số kết nối >= IDLE_PRESSURE_CONNECTIONS hoặc RSS >= IDLE_PRESSURE_MEMORY_MB):
+  đóng kết nối idle quá IDLE_PRESSURE_TIMEOUT giây -> giải phóng thread / buffer của kết nối bỏ rơi
+- Client còn sống gửi PING định kỳ (client/network.py) nên không bị đóng
+- Thống kê: số kết nối đang theo dõi, đã đóng (idle / áp lực), RSS hiện tại
+
+Mode 'thread' và Async: reaper chạy định kỳ (IDLE_REAP_INTERVAL) trên thread / task riêng.
+Mode 'selector': selector loop tự quét kết nối của nó, chỉ hỏi reaper timeout hiện tại.
+"""
+
+import os
+import time
+from threading import Lock
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+from common import logger
+from config import SERVER_CONFIG
+
+log = logger.get('Reaper')
+
+try:
+    _PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = 4096
+
+
+def rss_mb() -> Optional[float]:
+    """RSS hiện tại của process (MB) từ /proc; hệ điều hành không có /proc -> None (bỏ điều kiện bộ nhớ)"""
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class IdleReaper:
+    def __init__(self, config: Optional[Dict] = None):
+        config = config or SERVER_CONFIG
+        self.idle_timeout = config['idle_timeout']
+        self.pressure_timeout = config['idle_pressure_timeout']
+        self.pressure_connections = config['idle_pressure_connections']
+        self.pressure_memory_mb = config['idle_pressure_memory_mb']
+        self.interval = config['idle_reap_interval']
+
+        # connection_id -> [lần hoạt động cuối (time.monotonic), hàm đóng kết nối]
+        self._connections: Dict[Hashable, list] = {}
+        self._lock = Lock()
+        self.reaped = {'idle': 0, 'pressure': 0}
+
+    def track(self, connection_id: Hashable, close: Callable[[], None]):
+        with self._lock:
+            self._connections[connection_id] = [time.monotonic(), close]
+
+    def touch(self, connection_id: Hashable):
+        """Gọi trên hot path: không lấy lock (gán 1 phần tử list là atomic)"""
+        entry = self._connections.get(connection_id)
+        if entry is not None:
+            entry[0] = time.monotonic()
+
+    def forget(self, connection_id: Hashable):
+        with self._lock:
+            self._connections.pop(connection_id, None)
+
+    def under_pressure(self, connections: int) -> bool:
+        if self.pressure_connections > 0 and connections >= self.pressure_connections:
+            return True
+        if self.pressure_memory_mb > 0:
+            rss = rss_mb()
+            return rss is not None and rss >= self.pressure_memory_mb
+        return False
+
+    def timeout(self, connections: int) -> Tuple[float, bool]:
+        """-> (timeout idle hiện tại, đang chịu áp lực); timeout <= 0 = không đóng kết nối idle"""
+        if self.under_pressure(connections):
+            return self.pressure_timeout, True
+        return self.idle_timeout, False
+
+    def record(self, count: int, pressure: bool):
+        """Kết nối do caller tự đóng (mode 'selector')"""
+        self.reaped['pressure' if pressure else 'idle'] += count
+
+    def reap(self) -> List[Hashable]:
+        """Đóng các kết nối đang theo dõi đã idle quá timeout hiện tại, trả về connection_id đã đóng"""
+        with self._lock:
+            timeout, pressure = self.timeout(len(self._connections))
+            if timeout <= 0:
+                return []
+            cutoff = time.monotonic() - timeout
+            expired = [(connection_id, entry[1]) for connection_id, entry in self._connections.items()
+                       if entry[0] < cutoff]
+            for connection_id, _ in expired:
+                del self._connections[connection_id]
+        for connection_id, close in expired:
+            log.info('Đóng kết nối idle{reason}: {connection}', reason=' (áp lực bộ nhớ / kết nối)' if pressure else '',
+                     connection=connection_id)
+            close()
+        self.record(len(expired), pressure)
+        return [connection_id for connection_id, _ in expired]
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            tracked = len(self._connections)
+        timeout, pressure = self.timeout(tracked)
+        return {
+            'tracked': tracked,
+            'timeout': timeout,
+            'under_pressure': pressure,
+            'rss_mb': rss_mb(),
+            'reaped': dict(self.reaped)
+        }
@@ -10,6 +10,9 @@ from PIL import Image
 import io
 from typing import Optional, Tuple
 from config import MULTIMEDIA_CONFIG
+from common import logger
+
+log = logger.get('ImageProcessor')
 
 
 class ImageProcessor:
@@ -58,14 +61,14 @@ class ImageProcessor:
             
             # Kiểm tra xem có thực sự nhỏ hơn không
             if len(compressed_data) < len(image_data):
-                print(f"[ImageProcessor] ✅ Đã nén ảnh: {len(image_data)} → {len(compressed_data)} bytes")
+                log.info('✅ Đã nén ảnh: {original} → {size} bytes', original=len(image_data), size=len(compressed_data))
                 return compressed_data
             else:
-                print(f"[ImageProcessor] ⚠️ Ảnh không nhỏ hơn sau khi nén, giữ nguyên")
+                log.info('⚠️ Ảnh không nhỏ hơn sau khi nén, giữ nguyên')
                 return image_data
                 
         except Exception as e:
-            print(f"[ImageProcessor] ❌ Lỗi xử lý ảnh: {e}")
+            log.error('❌ Lỗi xử lý ảnh: {error}', error=e)
             return image_data  # Trả về ảnh gốc nếu có lỗi
     
     @staticmethod
@@ -91,6 +94,6 @@ class ImageProcessor:
                 'height': img.height
             }
         except Exception as e:
-            print(f"[ImageProcessor] Lỗi đọc thông tin ảnh: {e}")
+            log.warning('Lỗi đọc thông tin ảnh: {error}', error=e)
             return None
 
@@ -0,0 +1,389 @@
+"""Metrics - Số liệu vận hành của server: lệnh STATS (JSON / Prometheus) và endpoint HTTP /metrics
+
+Chức năng:
+- ServerMetrics.collect(): gom thống kê sẵn có (registry, scheduler, rate limiter, response cache,
+  seat map cache, idle reaper, tracing, logger) + kết nối đang mở, độ sâu hàng đợi executor, hàng đợi ghi nền
+  (ghế / đơn / email / idempotency) và lag ghi nền, tốc độ fan-out UDP / gRPC, RAM ước lượng
+  của cấu trúc lớn (memory_structures() của manager) và RSS của process
+- render_prometheus(snapshot): text format 0.0.4; latency theo lệnh là histogram (_bucket / _sum / _count)
+- FanoutCounter: đếm message / bytes phát ra (UDP broadcast, gRPC stream), tốc độ trên cửa sổ 60 giây
+- HTTP /metrics (Prometheus) + /stats (JSON) trên METRICS_HOST:METRICS_PORT (METRICS_PORT = 0: tắt)
+
+Lệnh STATS: {'command': 'STATS'} -> snapshot JSON; {'command': 'STATS', 'format': 'prometheus'}
+-> {'success': True, 'text': ...}. Chế độ nhiều process: mỗi worker trả số liệu của riêng nó.
+"""
+
+import itertools
+import json
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+from common import logger, tracing
+from config import METRICS_CONFIG
+from idle_reaper import rss_mb
+
+PREFIX = 'bus_booking_'
+_STARTED = time.monotonic()
+
+
+class FanoutCounter:
+    """Đếm message / bytes phát ra; rate() = message / giây trung bình trong WINDOW giây gần nhất"""
+
+    WINDOW = 60
+
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+        self.subscribers = 0  # Stream đang nhận (gRPC); UDP broadcast không biết số người nghe
+        self._seconds = deque()  # [giây (time.monotonic), số message trong giây đó]
+        self._lock = Lock()
+
+    def add(self, messages: int = 1, size: int = 0):
+        now = int(time.monotonic())
+        with self._lock:
+            self.messages += messages
+            self.bytes += size
+            if self._seconds and self._seconds[-1][0] == now:
+                self._seconds[-1][1] += messages
+            else:
+                self._seconds.append([now, messages])
+            self._trim(now)
+
+    def subscribe(self, delta: int = 1):
+        with self._lock:
+            self.subscribers += delta
+
+    def _trim(self, now: int):
+        while self._seconds and self._seconds[0][0] <= now - self.WINDOW:
+            self._seconds.popleft()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            self._trim(int(time.monotonic()))
+            recent = sum(count for _, count in self._seconds)
+            return {'messages': self.messages, 'bytes': self.bytes, 'subscribers': self.subscribers,
+                    'rate': recent / self.WINDOW}
+
+
+def deep_size(obj) -> int:
+    """Ước lượng bytes của obj + mọi phần tử (dict / list / tuple / set), object dùng chung tính 1 lần
+
+    Chụp phần tử bằng list(...) (1 lệnh C, không nhả GIL) -> không lỗi khi thread khác đang sửa dict.
+    """
+    seen = set()
+    stack = [obj]
+    size = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(itertools.chain.from_iterable(list(item.items())))
+        elif isinstance(item, (list, tuple, set, frozenset, deque)):
+            stack.extend(list(item))
+    return size
+
+
+class ServerMetrics:
+    """Số liệu của 1 server (app: BusBookingServer / SSL / Async - đọc thuộc tính nếu có)"""
+
+    def __init__(self, app, config: Optional[Dict] = None):
+        config = config or METRICS_CONFIG
+        self.app = app
+        self.host = config['host']
+        self.port = config['port']
+        self.memory_interval = config['memory_interval']
+        self._memory: Optional[Tuple[float, Dict]] = None  # (time.monotonic lúc đo, kết quả)
+        self._memory_lock = Lock()
+        self._http = None
+
+    # ---------- Thu thập ----------
+
+    def collect(self) -> Dict:
+        app = self.app
+        registry = app.commands
+        snapshot = {
+            'uptime': time.monotonic() - _STARTED,
+            'inflight': registry.inflight,
+            'latency_buckets': list(registry.LATENCY_BUCKETS),
+            'commands': registry.get_stats(),
+            'connections': self._connections(),
+            'executors': self._executors(),
+            'write_behind': self._write_behind(),
+            'fanout': {name: counter.get_stats() for name, counter in
+                       (('udp', getattr(app, 'udp_fanout', None)), ('grpc', getattr(app, 'grpc_fanout', None)))
+                       if counter is not None},
+            'memory': self._memory_stats(),
+            'response_cache': app.frame_codec.response_cache.get_stats(),
+            'seat_maps': app.seat_maps.get_stats(),
+            'rate_limiter': app.rate_limiter.get_stats(),
+            'tracing': tracing.get_stats(),
+            'logging': logger.get_stats()
+        }
+        if registry.scheduler is not None:
+            snapshot['scheduler'] = registry.scheduler.get_stats()
+        if registry.blocking_scheduler is not None:
+            snapshot['blocking_scheduler'] = registry.blocking_scheduler.get_stats()
+        if getattr(app, 'reaper', None) is not None:
+            snapshot['reaper'] = app.reaper.get_stats()
+        return snapshot
+
+    def _connections(self) -> Dict[str, int]:
+        app = self.app
+        connections = {}
+        selector_loop = getattr(app, 'selector_loop', None)
+        if selector_loop is not None:
+            connections['tcp'] = len(selector_loop.connections)
+        elif hasattr(app, 'clients'):
+            connections['tcp'] = len(app.clients)
+        grpc_fanout = getattr(app, 'grpc_fanout', None)
+        if grpc_fanout is not None:
+            connections['grpc_stream'] = grpc_fanout.subscribers
+        return connections
+
+    def _executors(self) -> Dict[str, int]:
+        """Số việc đang xếp hàng (chưa có thread nhận) của từng pool"""
+        app = self.app
+        selector_loop = getattr(app, 'selector_loop', None)
+        pools = (('pipeline', getattr(app, 'pipeline_executor', None)),
+                 ('selector', selector_loop.executor if selector_loop is not None else None),
+                 ('blocking', getattr(app, 'blocking_executor', None)))
+        return {name: pool._work_queue.qsize() for name, pool in pools if pool is not None}
+
+    def _managers(self) -> List:
+        app = self.app
+        return [manager for manager in (getattr(app, 'seat_manager', None), getattr(app, 'booking_manager', None),
+                                        getattr(app, 'idempotency_cache', None)) if manager is not None]
+
+    def _write_behind(self) -> Dict[str, Dict]:
+        """Hàng đợi ghi nền của SeatManager / BookingManager / IdempotencyCache (worker không có -> rỗng)"""
+        return {name: queue.get_stats() for manager in self._managers() if hasattr(manager, 'write_queues')
+                for name, queue in manager.write_queues().items()}
+
+    def _memory_stats(self) -> Dict:
+        """RSS (đọc mỗi lần) + kích thước cấu trúc lớn (duyệt toàn bộ -> tối đa 1 lần / memory_interval)"""
+        now = time.monotonic()
+        with self._memory_lock:
+            if self._memory is None or now - self._memory[0] >= self.memory_interval:
+                structures = {}
+                for manager in self._managers():
+                    if hasattr(manager, 'memory_structures'):
+                        for name, structure in manager.memory_structures().items():
+                            structures[name] = {'entries': len(structure), 'bytes': deep_size(structure)}
+                self._memory = (now, structures)
+            measured_at, structures = self._memory
+        rss = rss_mb()
+        return {'rss_bytes': int(rss * 1024 * 1024) if rss is not None else None,
+                'structures': structures, 'age': now - measured_at}
+
+    # ---------- Lệnh STATS ----------
+
+    def handle_stats(self, request: dict, client_id: str) -> dict:
+        snapshot = self.collect()
+        if request.get('format') == 'prometheus':
+            return {'success': True, 'text': render_prometheus(snapshot)}
+        return dict(snapshot, success=True)
+
+    # ---------- HTTP ----------
+
+    def start_http(self):
+        """Mở /metrics + /stats nếu METRICS_PORT > 0; cổng bận (vd nhiều worker) -> chỉ cảnh báo"""
+        if self.port <= 0 or self._http is not None:
+            return
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path == '/metrics':
+                    body = render_prometheus(metrics.collect()).encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif path == '/stats':
+                    body = json.dumps(metrics.collect(), ensure_ascii=False).encode('utf-8')
+                    content_type = 'application/json; charset=utf-8'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Prometheus scrape định kỳ: không in mỗi request
+
+        try:
+            self._http = ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            print(f"[Metrics] ⚠️ Không mở được {self.host}:{self.port}: {e}")
+            return
+        self._http.daemon_threads = True
+        threading.Thread(target=self._http.serve_forever, daemon=True).start()
+        print(f"[Metrics] HTTP /metrics trên {self.host}:{self.port}")
+
+    def stop_http(self):
+        if self._http is not None:
+            self._http.shutdown()
+            self._http.server_close()
+            self._http = None
+
+
+# ---------- Prometheus text format ----------
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels: Dict) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _number(value) -> str:
+    if value is None:
+        return 'NaN'
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Writer:
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def metric(self, name: str, kind: str, help_text: str, samples):
+        """samples: [(labels dict, giá trị)] hoặc [(hậu tố tên, labels, giá trị)] cho histogram"""
+        samples = list(samples)
+        if not samples:
+            return
+        self.lines.append(f'# HELP {PREFIX}{name} {help_text}')
+        self.lines.append(f'# TYPE {PREFIX}{name} {kind}')
+        for sample in samples:
+            suffix, labels, value = sample if len(sample) == 3 else ('', sample[0], sample[1])
+            self.lines.append(f'{PREFIX}{name}{suffix}{_labels(labels)} {_number(value)}')
+
+    def text(self) -> str:
+        return '\n'.join(self.lines) + '\n'
+
+
+def render_prometheus(snapshot: Dict) -> str:
+    out = _Writer()
+    commands = snapshot['commands']
+    bounds = snapshot['latency_buckets']
+
+    out.metric('uptime_seconds', 'gauge', 'Thời gian process đã chạy', [({}, snapshot['uptime'])])
+    out.metric('commands_total', 'counter', 'Số lệnh đã chạy handler',
+               [({'command': name}, stats['count']) for name, stats in commands.items()])
+    out.metric('command_errors_total', 'counter', 'Số lệnh handler lỗi (exception)',
+               [({'command': name}, stats['errors']) for name, stats in commands.items()])
+    out.metric('commands_shed_total', 'counter', 'Số lệnh bị shed (OVERLOADED) trước khi chạy',
+               [({'command': name}, stats['shed']) for name, stats in commands.items()])
+    out.metric('commands_expired_total', 'counter', 'Số lệnh bị bỏ vì quá hạn chót của client',
+               [({'command': name}, stats['expired']) for name, stats in commands.items()])
+
+    histogram = []
+    for name, stats in commands.items():
+        for bound, count in zip(bounds, stats['buckets']):
+            histogram.append(('_bucket', {'command': name, 'le': bound}, count))
+        histogram.append(('_bucket', {'command': name, 'le': '+Inf'}, stats['count']))
+        histogram.append(('_sum', {'command': name}, stats['total_time']))
+        histogram.append(('_count', {'command': name}, stats['count']))
+    out.metric('command_duration_seconds', 'histogram', 'Thời gian chạy handler (không gồm chờ slot)', histogram)
+    out.metric('response_bytes_total', 'counter', 'Bytes response trước / sau nén',
+               [({'command': name, 'stage': stage}, stats[f'{stage}_bytes'])
+                for name, stats in commands.items() for stage in ('raw', 'wire')])
+
+    out.metric('inflight_commands', 'gauge', 'Lệnh đang chạy hoặc chờ slot', [({}, snapshot['inflight'])])
+    out.metric('active_connections', 'gauge', 'Kết nối đang mở',
+               [({'transport': name}, count) for name, count in snapshot['connections'].items()])
+    out.metric('executor_queue_depth', 'gauge', 'Việc chờ thread trong pool',
+               [({'executor': name}, depth) for name, depth in snapshot['executors'].items()])
+
+    write_behind = snapshot['write_behind']
+    out.metric('write_queue_depth', 'gauge', 'Việc ghi nền chưa xong',
+               [({'queue': name}, stats['pending']) for name, stats in write_behind.items()])
+    out.metric('write_queue_submitted_total', 'counter', 'Việc ghi nền đã nhận',
+               [({'queue': name}, stats['submitted']) for name, stats in write_behind.items()])
+    out.metric('write_lag_seconds', 'gauge', 'Lag ghi nền: tuổi việc chưa xong lâu nhất',
+               [({'queue': name}, stats['oldest']) for name, stats in write_behind.items()])
+    out.metric('write_lag_recent_seconds', 'gauge', 'Lag ghi nền (submit -> ghi xong) của các việc gần nhất',
+               [({'queue': name, 'quantile': quantile}, stats[key]) for name, stats in write_behind.items()
+                for quantile, key in (('0.5', 'lag_p50'), ('0.99', 'lag_p99'), ('1', 'lag_max'))])
+
+    fanout = snapshot['fanout']
+    out.metric('fanout_messages_total', 'counter', 'Message fan-out đã gửi (UDP broadcast / gRPC stream)',
+               [({'channel': name}, stats['messages']) for name, stats in fanout.items()])
+    out.metric('fanout_bytes_total', 'counter', 'Bytes fan-out đã gửi',
+               [({'channel': name}, stats['bytes']) for name, stats in fanout.items()])
+    out.metric('fanout_rate', 'gauge', 'Message fan-out / giây (trung bình 60 giây)',
+               [({'channel': name}, stats['rate']) for name, stats in fanout.items()])
+
+    memory = snapshot['memory']
+    if memory['rss_bytes'] is not None:
+        out.metric('process_resident_memory_bytes', 'gauge', 'RSS của process', [({}, memory['rss_bytes'])])
+    structures = memory['structures']
+    out.metric('structure_entries', 'gauge', 'Số phần tử của cấu trúc lớn trong RAM',
+               [({'structure': name}, stats['entries']) for name, stats in structures.items()])
+    out.metric('structure_bytes', 'gauge', 'RAM ước lượng của cấu trúc lớn (sys.getsizeof đệ quy)',
+               [({'structure': name}, stats['bytes']) for name, stats in structures.items()])
+
+    response_cache = snapshot['response_cache']
+    out.metric('response_cache_lookups_total', 'counter', 'Tra response cache',
+               [({'result': 'hit'}, response_cache['hits']), ({'result': 'miss'}, response_cache['misses'])])
+    out.metric('response_cache_entries', 'gauge', 'Response đã mã hóa trong cache', [({}, response_cache['entries'])])
+    out.metric('response_cache_bytes', 'gauge', 'Bytes response trong cache', [({}, response_cache['bytes'])])
+    seat_maps = snapshot['seat_maps']
+    out.metric('seat_map_cache_lookups_total', 'counter', 'Tra seat map cache',
+               [({'result': 'hit'}, seat_maps['hits']), ({'result': 'encode'}, seat_maps['encodes'])])
+
+    rate_limiter = snapshot['rate_limiter']
+    out.metric('rate_limit_decisions_total', 'counter', 'Quyết định của rate limiter theo nhóm lệnh',
+               [({'class': rate_class, 'result': result}, count)
+                for result in ('admitted', 'rejected') for rate_class, count in rate_limiter[result].items()])
+    out.metric('rate_limit_buckets', 'gauge', 'Token bucket đang giữ', [({}, rate_limiter['buckets'])])
+
+    # pool 'compute': lệnh non-blocking, 'blocking': lệnh blocking (slot riêng)
+    pools = [(pool, snapshot[key]) for pool, key in (('compute', 'scheduler'), ('blocking', 'blocking_scheduler'))
+             if snapshot.get(key) is not None]
+    if pools:
+        out.metric('scheduler_busy_slots', 'gauge', 'Slot scheduler đang dùng',
+                   [({'pool': pool}, scheduler['busy']) for pool, scheduler in pools])
+        out.metric('scheduler_queue_depth', 'gauge', 'Request chờ slot theo lane',
+                   [({'pool': pool, 'lane': lane}, stats['queued'])
+                    for pool, scheduler in pools for lane, stats in scheduler['lanes'].items()])
+        out.metric('scheduler_requests_total', 'counter', 'Request qua scheduler theo lane và kết quả',
+                   [({'pool': pool, 'lane': lane, 'result': result}, stats[result])
+                    for pool, scheduler in pools for lane, stats in scheduler['lanes'].items()
+                    for result in ('admitted', 'shed', 'expired')])
+        out.metric('scheduler_wait_seconds', 'gauge', 'Thời gian chờ slot của các request gần nhất',
+                   [({'pool': pool, 'lane': lane, 'quantile': quantile}, stats[key])
+                    for pool, scheduler in pools for lane, stats in scheduler['lanes'].items()
+                    for quantile, key in (('0.5', 'wait_p50'), ('0.99', 'wait_p99'))])
+
+    reaper = snapshot.get('reaper')
+    if reaper is not None:
+        out.metric('idle_connections_reaped_total', 'counter', 'Kết nối idle đã đóng',
+                   [({'reason': reason}, count) for reason, count in reaper['reaped'].items()])
+        out.metric('idle_pressure', 'gauge', '1 = đang đóng kết nối idle theo timeout áp lực',
+                   [({}, reaper['under_pressure'])])
+
+    spans = snapshot['tracing']
+    if spans['enabled']:
+        out.metric('trace_spans_total', 'counter', 'Span đã xuất / bỏ (hàng đợi đầy) / lỗi xuất',
+                   [({'result': result}, spans[result]) for result in ('exported', 'dropped', 'export_errors')])
+        out.metric('trace_spans_queued', 'gauge', 'Span chờ ghi file / gửi collector', [({}, spans['queued'])])
+
+    logs = snapshot['logging']
+    out.metric('log_records_total', 'counter', 'Record log đã ghi / bỏ (buffer đầy) / bỏ do lấy mẫu / lỗi ghi',
+               [({'result': result}, logs[result]) for result in ('written', 'dropped', 'sampled_out', 'errors')])
+    out.metric('log_buffered', 'gauge', 'Record log chờ thread ghi nền', [({}, logs['buffered'])])
+    return out.text()
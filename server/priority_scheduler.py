@@ -0,0 +1,187 @@
+"""Priority Scheduler - Hàng đợi ưu tiên trước khi chạy handler (CommandRegistry.dispatch)
+
+Chức năng:
+- Giới hạn số handler chạy đồng thời (SCHEDULER_SLOTS); hết slot -> request xếp hàng theo lane
+- Lane = nhóm của lệnh (CommandSpec.rate_class): 'seat' (giữ / đặt ghế), 'upload', 'catalog', 'admin'
+- Lệnh blocking lấy slot ở 1 instance riêng (CommandRegistry.blocking_scheduler, SCHEDULER_BLOCKING_SLOTS):
+  handler chờ I/O / request trùng key tới hàng chục giây không chiếm slot của lệnh tính toán
+- Slot trống được chia theo trọng số lane (stride scheduling): lane trọng số 8 được ~8 slot
+  cho mỗi 1 slot của lane trọng số 1 khi cả hai cùng có request chờ, lane rỗng không tích lũy lượt
+- Shed (bỏ request, trả OVERLOADED ngay, không chạy handler) chỉ với lane trong SCHEDULER_SHED_LANES
+  (trừ ADMIN_LANE: giám sát / profile phải chạy được đúng lúc quá tải):
+  + request đầu lane đã chờ quá SCHEDULER_MAX_DELAY -> request mới của lane bị từ chối ngay
+  + request chờ quá SCHEDULER_MAX_DELAY -> rời hàng đợi
+  + tổng hàng đợi đầy (SCHEDULER_MAX_QUEUE): request mới lane shed được bị từ chối, request lane
+    không shed được đẩy request mới nhất của lane shed được ra khỏi hàng
+- Request có hạn chót (deadlines.py) chờ tối đa tới hạn chót -> DeadlineExceeded (đếm 'expired')
+- Thống kê theo lane: admitted, shed, expired, đang chờ, thời gian chờ p50 / p99
+
+Lưu ý: request chỉ vào hàng đợi này khi đã có thread gọi dispatch; pipeline v3 / mode selector / Async
+executor cần số worker (WORKER_THREADS, BLOCKING_WORKERS) lớn hơn SCHEDULER_SLOTS và SCHEDULER_BLOCKING_SLOTS
+để hàng đợi ưu tiên nằm ở đây thay vì ở hàng đợi FIFO của pool.
+"""
+
+import time
+from collections import deque
+from threading import Event, Lock
+from typing import Dict, Iterable, Optional
+
+from deadlines import DeadlineExceeded
+
+ADMIN_LANE = 'admin'  # Lệnh quản trị (STATS, PROFILE, MEMORY): không bao giờ bị shed
+
+OVERLOADED = {'success': False, 'overloaded': True, 'message': 'Hệ thống đang quá tải, vui lòng thử lại sau'}
+
+
+class Overloaded(Exception):
+    """Request bị shed: caller trả OVERLOADED, không chạy handler"""
+
+
+class _Waiter:
+    __slots__ = ('since', 'event', 'granted', 'shed')
+
+    def __init__(self, since: float):
+        self.since = since
+        self.event = Event()
+        self.granted = False  # release() đã chuyển slot cho waiter này
+        self.shed = False  # Bị đẩy ra khỏi hàng để nhường chỗ cho lane ưu tiên
+
+
+class PriorityScheduler:
+    WAIT_SAMPLES = 1024  # Số mẫu thời gian chờ gần nhất / lane để tính percentile
+
+    def __init__(self, slots: int, weights: Dict[str, float], shed_lanes: Iterable[str] = ('catalog',),
+                 max_queue: int = 1024, max_delay: float = 1.0):
+        self.slots = max(1, slots)
+        self.weights = {lane: max(weight, 0.01) for lane, weight in weights.items()}
+        self.shed_lanes = (set(shed_lanes) & set(self.weights)) - {ADMIN_LANE}
+        self.max_queue = max_queue
+        self.max_delay = max_delay
+        # Lane lạ (lệnh không khai báo) -> lane trọng số thấp nhất
+        self.default_lane = min(self.weights, key=self.weights.get)
+
+        self._free = self.slots
+        self._queues: Dict[str, deque] = {lane: deque() for lane in self.weights}
+        self._queued = 0
+        self._pass = {lane: 0.0 for lane in self.weights}  # Lượt ảo kế tiếp của lane (stride)
+        self._vtime = 0.0  # Lượt ảo của lần cấp slot gần nhất
+        self._lock = Lock()
+
+        self.admitted = {lane: 0 for lane in self.weights}
+        self.shed = {lane: 0 for lane in self.weights}
+        self.expired = {lane: 0 for lane in self.weights}
+        self._waits = {lane: deque(maxlen=self.WAIT_SAMPLES) for lane in self.weights}
+
+    def _lane(self, lane: Optional[str]) -> str:
+        return lane if lane in self._queues else self.default_lane
+
+    def _backed_up(self, lane: str, now: float) -> bool:
+        """Gọi khi đang giữ lock: lane shed được và request đầu lane đã chờ quá max_delay"""
+        queue = self._queues[lane]
+        return lane in self.shed_lanes and bool(queue) and now - queue[0].since > self.max_delay
+
+    def overloaded(self, lane: Optional[str]) -> bool:
+        """Kiểm tra không chờ (caller không được block, vd event loop): True = nên shed request lane này"""
+        lane = self._lane(lane)
+        with self._lock:
+            if lane in self.shed_lanes and (self._backed_up(lane, time.monotonic()) or
+                                            self._queued >= self.max_queue):
+                self.shed[lane] += 1
+                return True
+            return False
+
+    def acquire(self, lane: Optional[str], deadline: Optional[float] = None):
+        """Lấy 1 slot (có thể chờ theo ưu tiên lane); bị shed -> Overloaded, tới hạn chót -> DeadlineExceeded"""
+        lane = self._lane(lane)
+        now = time.monotonic()
+        with self._lock:
+            if self._free and not self._queued:
+                self._free -= 1
+                self.admitted[lane] += 1
+                self._waits[lane].append(0.0)
+                return
+            if self._backed_up(lane, now):
+                self.shed[lane] += 1
+                raise Overloaded
+            if self._queued >= self.max_queue:
+                victim_lane = self._victim_lane(lane)
+                if victim_lane is None:
+                    self.shed[lane] += 1
+                    raise Overloaded
+                victim = self._queues[victim_lane].pop()
+                self._queued -= 1
+                self.shed[victim_lane] += 1
+                victim.shed = True
+                victim.event.set()
+            queue = self._queues[lane]
+            if not queue:
+                # Lane vừa có request: không được dùng lượt tích lũy lúc rỗng
+                self._pass[lane] = max(self._pass[lane], self._vtime)
+            waiter = _Waiter(now)
+            queue.append(waiter)
+            self._queued += 1
+
+        timeout = self.max_delay if lane in self.shed_lanes else None
+        by_deadline = deadline is not None and (timeout is None or deadline - now < timeout)
+        if by_deadline:
+            timeout = max(0.0, deadline - now)
+        if not waiter.event.wait(timeout):
+            with self._lock:
+                if not waiter.granted and not waiter.shed:
+                    self._queues[lane].remove(waiter)
+                    self._queued -= 1
+                    if by_deadline:
+                        self.expired[lane] += 1
+                        raise DeadlineExceeded
+                    self.shed[lane] += 1
+                    raise Overloaded
+        if waiter.shed:
+            raise Overloaded
+        with self._lock:
+            self.admitted[lane] += 1
+            self._waits[lane].append(time.monotonic() - waiter.since)
+
+    def _victim_lane(self, lane: str) -> Optional[str]:
+        """Hàng đợi đầy: lane shed được, trọng số thấp nhất, đang có request chờ (None = shed chính request mới)"""
+        if lane in self.shed_lanes:
+            return None
+        candidates = [name for name in self.shed_lanes if self._queues[name]]
+        return min(candidates, key=self.weights.get) if candidates else None
+
+    def release(self):
+        """Trả slot: chuyển thẳng cho request chờ của lane có lượt ảo nhỏ nhất, không ai chờ -> slot trống"""
+        with self._lock:
+            waiting = [lane for lane, queue in self._queues.items() if queue]
+            if not waiting:
+                self._free += 1
+                return
+            lane = min(waiting, key=lambda name: (self._pass[name], -self.weights[name]))
+            self._vtime = self._pass[lane]
+            self._pass[lane] += 1.0 / self.weights[lane]
+            waiter = self._queues[lane].popleft()
+            self._queued -= 1
+            waiter.granted = True
+            waiter.event.set()
+
+    @staticmethod
+    def _percentile(sorted_samples, p: float) -> float:
+        if not sorted_samples:
+            return 0.0
+        return sorted_samples[min(len(sorted_samples) - 1, int(len(sorted_samples) * p / 100))]
+
+    def get_stats(self) -> Dict:
+        """Slot đang dùng + theo lane: weight, admitted, shed, expired, queued, wait_p50 / wait_p99 (giây)"""
+        with self._lock:
+            lanes = {lane: (self.admitted[lane], self.shed[lane], self.expired[lane], len(self._queues[lane]),
+                            sorted(self._waits[lane])) for lane in self.weights}
+            busy = self.slots - self._free
+        return {
+            'slots': self.slots,
+            'busy': busy,
+            'max_queue': self.max_queue,
+            'max_delay': self.max_delay,
+            'lanes': {lane: {'weight': self.weights[lane], 'shed_allowed': lane in self.shed_lanes,
+                             'admitted': admitted, 'shed': shed, 'expired': expired, 'queued': queued,
+                             'wait_p50': self._percentile(waits, 50), 'wait_p99': self._percentile(waits, 99)}
+                      for lane, (admitted, shed, expired, queued, waits) in lanes.items()}
+        }
@@ -0,0 +1,366 @@
+"""Profiler - Lệnh quản trị PROFILE (sampling profiler) và MEMORY (tracemalloc) trên server đang chạy
+
+Chức năng:
+- PROFILE: lấy mẫu stack của MỌI thread (sys._current_frames) mỗi PROFILE_INTERVAL_MS trên 1 thread nền,
+  chạy tối đa N giây rồi tự dừng -> không cần khởi động lại server với cProfile
+  + mode 'cpu' (mặc định): chỉ tính thread có CPU time tăng từ lần lấy mẫu trước và không đứng ở điểm chờ
+    đã biết (IDLE_FRAMES: recv, select, lấy việc từ hàng đợi của pool...); thread chờ GIL vẫn được tính
+    (đang muốn chạy); hệ điều hành không có time.pthread_getcpuclockid -> chỉ lọc theo IDLE_FRAMES
+  + mode 'wall': tính mọi thread (thấy cả thời gian chờ)
+  + Kết quả: collapsed stacks ("thread;hàm (file:dòng);... số mẫu") cho flamegraph.pl / speedscope,
+    bảng hàm tốn nhiều mẫu tự thân nhất, overhead (thời gian lấy mẫu / thời gian chạy)
+- MEMORY: tracemalloc start / snapshot (lưu làm mốc) / diff (so với mốc) / stop, top N theo dòng code
+- Chỉ nhận lệnh từ localhost (kết nối loopback) hoặc request mang đúng ADMIN_TOKEN (ADMIN_TOKEN_FIELD)
+
+Lệnh:
+    {'command': 'PROFILE', 'action': 'start', 'seconds': 30, 'interval_ms': 10, 'mode': 'cpu'}
+    {'command': 'PROFILE', 'action': 'status' | 'stop'}  # stop: dừng sớm (nếu đang chạy) + trả kết quả
+    {'command': 'MEMORY', 'action': 'start' | 'snapshot' | 'diff' | 'stop', 'top': 20, 'frames': 10}
+Chế độ nhiều process: mỗi worker profile process của riêng nó (như STATS).
+Lưu ý: snapshot tracemalloc giữ GIL trong lúc chụp (vài trăm ms với heap lớn); tracemalloc bật làm
+mọi lần cấp phát chậm hơn -> stop khi xong.
+"""
+
+import hmac
+import ipaddress
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from common.protocol import ADMIN_TOKEN_FIELD
+from config import ADMIN_CONFIG
+
+FORBIDDEN = {'success': False, 'forbidden': True, 'message': 'Lệnh quản trị chỉ nhận từ localhost hoặc kèm admin token'}
+
+# connection_id ("ip:port") của request đang chạy - transport đặt quanh dispatch, lệnh quản trị kiểm tra
+peer: ContextVar = ContextVar('peer', default=None)
+
+_ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_THREAD_NUMBER = re.compile(r'[-_]\d+')  # "pipeline_3" / "Thread-12 (handle_client)" -> gộp thread cùng pool
+
+# (file, hàm) ở đỉnh stack khi thread đang chặn trong hàm C (recv, select, chờ lock / hàng đợi) - mode 'cpu' bỏ qua
+IDLE_FRAMES = {
+    ('threading.py', 'wait'), ('threading.py', '_wait_for_tstate_lock'), ('queue.py', 'get'),
+    ('thread.py', '_worker'), ('selectors.py', 'select'), ('socket.py', 'accept'), ('socket.py', 'readinto'),
+    ('socketserver.py', 'serve_forever'), ('ssl.py', 'read'), ('ssl.py', 'recv'), ('ssl.py', 'do_handshake'),
+    ('framing.py', 'recv_exact_into'), ('framing.py', 'recv_exact'), ('framing.py', 'read_frame'),
+}
+
+
+@contextmanager
+def caller(connection_id: str):
+    token = peer.set(connection_id)
+    try:
+        yield
+    finally:
+        peer.reset(token)
+
+
+def is_loopback(connection_id: Optional[str]) -> bool:
+    if not connection_id:
+        return False
+    host = connection_id.rsplit(':', 1)[0].strip('[]')
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    mapped = getattr(address, 'ipv4_mapped', None)
+    return (mapped or address).is_loopback
+
+
+def _path(filename: str) -> str:
+    """File của repo: đường dẫn tương đối; thư viện: chỉ tên file"""
+    if filename.startswith(_ROOT_DIR):
+        return os.path.relpath(filename, _ROOT_DIR)
+    return os.path.basename(filename)
+
+
+def _label(code) -> str:
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({_path(code.co_filename)}:{code.co_firstlineno})"
+
+
+class _Session:
+    """1 lần profile: stack đã gom + số liệu"""
+
+    def __init__(self, seconds: float, interval: float, mode: str):
+        self.seconds = seconds
+        self.interval = interval
+        self.mode = mode
+        self.started = time.monotonic()
+        self.ended: Optional[float] = None
+        self.stop = threading.Event()
+        self.stacks: Counter = Counter()  # (tên thread, (code lá, ..., code gốc)) -> số mẫu
+        self.ticks = 0
+        self.samples = 0
+        self.skipped = 0  # Mẫu của thread không dùng CPU / đang ở điểm chờ (mode 'cpu')
+        self.busy = 0.0  # Giây - thời gian thread profiler tự tốn để lấy mẫu
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float, max_seconds: float):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self._session: Optional[_Session] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._cpu_clock = hasattr(time, 'pthread_getcpuclockid')
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float, interval: Optional[float] = None, mode: str = 'cpu') -> _Session:
+        with self._lock:
+            if self.running:
+                raise RuntimeError('Profiler đang chạy')
+            session = _Session(min(seconds, self.max_seconds), max(0.001, interval or self.interval), mode)
+            self._session = session
+            self._thread = threading.Thread(target=self._run, args=(session,), name='profiler', daemon=True)
+            self._thread.start()
+        return session
+
+    def stop(self) -> Optional[_Session]:
+        """Dừng lần profile đang chạy (nếu có), trả về lần profile gần nhất"""
+        with self._lock:
+            session, thread = self._session, self._thread
+        if session is not None:
+            session.stop.set()
+        if thread is not None:
+            thread.join()
+        return session
+
+    def _run(self, session: _Session):
+        own = threading.get_ident()
+        skip_idle = session.mode == 'cpu'
+        cpu = skip_idle and self._cpu_clock
+        cpu_times: Dict[int, float] = {}
+        idle: Dict = {}  # code -> có phải điểm chờ không (tra 1 lần / code)
+        deadline = session.started + session.seconds
+        while True:
+            tick = time.monotonic()
+            if tick >= deadline:
+                break
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if cpu:
+                    try:
+                        used = time.clock_gettime(time.pthread_getcpuclockid(ident))
+                    except (OSError, OverflowError):
+                        continue  # Thread vừa kết thúc
+                    previous = cpu_times.get(ident)
+                    cpu_times[ident] = used
+                    if previous is None or used == previous:
+                        session.skipped += 1
+                        continue
+                if skip_idle:
+                    code = frame.f_code
+                    waiting = idle.get(code)
+                    if waiting is None:
+                        waiting = idle[code] = (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES
+                    if waiting:
+                        session.skipped += 1
+                        continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                session.stacks[names.get(ident, 'unknown'), tuple(stack)] += 1
+                session.samples += 1
+            session.ticks += 1
+            elapsed = time.monotonic() - tick
+            session.busy += elapsed
+            if session.stop.wait(max(0.0, session.interval - elapsed)):
+                break
+        session.ended = time.monotonic()
+        print(f"[Profiler] Dừng: {session.samples} mẫu / {session.ticks} lần lấy mẫu")
+
+    @staticmethod
+    def collapsed(session: _Session) -> str:
+        """Collapsed stacks (gốc -> lá, cách nhau ';'), 1 dòng / stack, cho flamegraph.pl / speedscope"""
+        labels = {}
+        lines = Counter()
+        for (thread_name, stack), count in session.stacks.items():
+            frames = [_THREAD_NUMBER.sub('', thread_name)]
+            for code in reversed(stack):
+                label = labels.get(code)
+                if label is None:
+                    label = labels[code] = _label(code)
+                frames.append(label)
+            lines[';'.join(frames)] += count
+        return ''.join(f'{line} {count}\n' for line, count in lines.most_common())
+
+    @staticmethod
+    def top(session: _Session, limit: int = 20) -> List[Dict]:
+        """Hàm có nhiều mẫu tự thân (đang ở đỉnh stack) nhất + số mẫu gồm cả hàm con"""
+        own, total = Counter(), Counter()
+        for (_, stack), count in session.stacks.items():
+            own[stack[0]] += count
+            for code in set(stack):
+                total[code] += count
+        samples = session.samples or 1
+        return [{'function': _label(code), 'self': count, 'self_pct': count / samples,
+                 'total': total[code], 'total_pct': total[code] / samples}
+                for code, count in own.most_common(limit)]
+
+    def status(self) -> Dict:
+        session = self._session
+        if session is None:
+            return {'running': False}
+        ended = session.ended or time.monotonic()
+        duration = ended - session.started
+        return {'running': self.running, 'mode': session.mode, 'seconds': session.seconds,
+                'interval': session.interval, 'elapsed': duration, 'ticks': session.ticks,
+                'samples': session.samples, 'skipped': session.skipped,
+                'overhead': session.busy / duration if duration > 0 else 0.0}
+
+
+class MemoryTracker:
+    """tracemalloc: snapshot làm mốc, diff so với mốc (bỏ cấp phát của chính tracemalloc / importlib)"""
+
+    FILTERS = (tracemalloc.Filter(False, tracemalloc.__file__),
+               tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+               tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+               tracemalloc.Filter(False, '<unknown>'))
+
+    def __init__(self, frames: int):
+        self.frames = frames
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._lock = threading.Lock()
+
+    def start(self, frames: Optional[int] = None) -> Dict:
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames or self.frames)
+                self._baseline = None
+                print(f"[Profiler] Bật tracemalloc ({tracemalloc.get_traceback_limit()} frame)")
+            return self.status()
+
+    def stop(self) -> Dict:
+        with self._lock:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+                print("[Profiler] Tắt tracemalloc")
+            self._baseline = None
+            return self.status()
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        if not tracemalloc.is_tracing():
+            raise RuntimeError('tracemalloc chưa bật (MEMORY action=start)')
+        return tracemalloc.take_snapshot().filter_traces(self.FILTERS)
+
+    def snapshot(self, limit: int = 20, group_by: str = 'lineno') -> Dict:
+        """Chụp heap, lưu làm mốc cho diff, trả top cấp phát theo dòng code"""
+        with self._lock:
+            snapshot = self._snapshot()
+            self._baseline = snapshot
+            stats = snapshot.statistics(group_by)
+        return dict(self.status(), top=[{'location': self._location(stat.traceback), 'size': stat.size,
+                                         'count': stat.count} for stat in stats[:limit]],
+                    total=sum(stat.size for stat in stats))
+
+    def diff(self, limit: int = 20, group_by: str = 'lineno', update: bool = False) -> Dict:
+        """So heap hiện tại với mốc: dòng code tăng / giảm nhiều nhất; update=True -> lấy làm mốc mới"""
+        with self._lock:
+            if self._baseline is None:
+                raise RuntimeError('Chưa có snapshot làm mốc (MEMORY action=snapshot)')
+            snapshot = self._snapshot()
+            stats = snapshot.compare_to(self._baseline, group_by)
+            if update:
+                self._baseline = snapshot
+        return dict(self.status(), top=[{'location': self._location(stat.traceback), 'size': stat.size,
+                                         'size_diff': stat.size_diff, 'count': stat.count,
+                                         'count_diff': stat.count_diff} for stat in stats[:limit]],
+                    total_diff=sum(stat.size_diff for stat in stats))
+
+    @staticmethod
+    def _location(traceback) -> str:
+        frame = traceback[0]
+        return f'{_path(frame.filename)}:{frame.lineno}'
+
+    def status(self) -> Dict:
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        return {'tracing': tracing, 'frames': tracemalloc.get_traceback_limit() if tracing else 0,
+                'traced': current, 'peak': peak, 'has_baseline': self._baseline is not None}
+
+
+class Profiler:
+    """Handler của PROFILE / MEMORY (đăng ký trong commands.py), kiểm tra quyền trước khi chạy"""
+
+    def __init__(self, config: Optional[Dict] = None):
+        config = config or ADMIN_CONFIG
+        self.token = config['token']
+        self.allow_localhost = config['allow_localhost']
+        self.sampler = SamplingProfiler(config['profile_interval'], config['profile_max_seconds'])
+        self.memory = MemoryTracker(config['memory_frames'])
+
+    def authorized(self, request: dict) -> bool:
+        if self.allow_localhost and is_loopback(peer.get()):
+            return True
+        token = request.get(ADMIN_TOKEN_FIELD)
+        return bool(self.token) and isinstance(token, str) and hmac.compare_digest(token, self.token)
+
+    def handle_profile(self, request: dict, client_id: str) -> dict:
+        if not self.authorized(request):
+            print(f"[Profiler] ⚠️ Từ chối PROFILE từ {peer.get() or client_id}")
+            return dict(FORBIDDEN)
+        action = request.get('action', 'status')
+        if action == 'start':
+            mode = request.get('mode', 'cpu')
+            if mode not in ('cpu', 'wall'):
+                return {'success': False, 'message': f'mode không hợp lệ: {mode}'}
+            try:
+                seconds = float(request.get('seconds', 30))
+                interval_ms = request.get('interval_ms')
+                session = self.sampler.start(seconds, float(interval_ms) / 1000 if interval_ms else None, mode)
+            except (TypeError, ValueError) as e:
+                return {'success': False, 'message': f'Tham số không hợp lệ: {e}'}
+            except RuntimeError as e:
+                return {'success': False, 'message': str(e)}
+            print(f"[Profiler] Bắt đầu ({mode}, {session.seconds:g}s, mỗi {session.interval * 1000:g}ms)")
+            return dict(self.sampler.status(), success=True)
+        if action == 'stop':
+            session = self.sampler.stop()
+            if session is None:
+                return {'success': False, 'message': 'Chưa chạy profiler (PROFILE action=start)'}
+            return dict(self.sampler.status(), success=True, collapsed=self.sampler.collapsed(session),
+                        top=self.sampler.top(session, int(request.get('top', 20))))
+        if action == 'status':
+            return dict(self.sampler.status(), success=True)
+        return {'success': False, 'message': f'action không hợp lệ: {action}'}
+
+    def handle_memory(self, request: dict, client_id: str) -> dict:
+        if not self.authorized(request):
+            print(f"[Profiler] ⚠️ Từ chối MEMORY từ {peer.get() or client_id}")
+            return dict(FORBIDDEN)
+        action = request.get('action', 'status')
+        try:
+            limit = int(request.get('top', 20))
+            group_by = request.get('group_by', 'lineno')
+            if group_by not in ('lineno', 'filename', 'traceback'):
+                return {'success': False, 'message': f'group_by không hợp lệ: {group_by}'}
+            if action == 'start':
+                frames = request.get('frames')
+                return dict(self.memory.start(int(frames) if frames else None), success=True)
+            if action == 'snapshot':
+                return dict(self.memory.snapshot(limit, group_by), success=True)
+            if action == 'diff':
+                return dict(self.memory.diff(limit, group_by, bool(request.get('update'))), success=True)
+            if action == 'stop':
+                return dict(self.memory.stop(), success=True)
+            if action == 'status':
+                return dict(self.memory.status(), success=True)
+        except (TypeError, ValueError) as e:
+            return {'success': False, 'message': f'Tham số không hợp lệ: {e}'}
+        except RuntimeError as e:
+            return {'success': False, 'message': str(e)}
+        return {'success': False, 'message': f'action không hợp lệ: {action}'}
@@ -0,0 +1,163 @@
+"""Rate Limiter - Token bucket theo session và theo kết nối, kiểm tra trước khi dispatch
+
+Chức năng:
+- Mỗi lệnh thuộc 1 nhóm giới hạn (CommandRegistry.register(..., rate_class=...)):
+  + 'seat': lệnh giữ / đặt ghế (SELECT_SEAT, UNSELECT_SEAT, BOOK_SEATS, BOOK_ITINERARY) - giới hạn chặt
+  + 'catalog': tra cứu chỉ đọc (tuyến, chuyến, ghế, đơn) - giới hạn rộng
+  + 'upload': upload file / chunk
+  + 'admin': lệnh quản trị / giám sát (STATS, PROFILE, MEMORY)
+- Mỗi (nhóm, session) và (nhóm, kết nối) có 1 bucket riêng: request chỉ được nhận khi cả 2 bucket còn token
+  -> đổi session_id liên tục vẫn bị chặn theo kết nối; bucket kết nối = RATE_LIMIT_CONNECTION_FACTOR x session
+  (1 kết nối có thể mang nhiều session, vd pipelining)
+- Frontend tin cậy (RATE_LIMIT_TRUSTED_FRONTENDS, mặc định localhost): web Flask dồn mọi người dùng trình duyệt
+  qua 1 NetworkHandler / 1 session_id -> request mang END_USER_FIELD (cookie session / địa chỉ IP người dùng)
+  thì bucket session tính theo (session, người dùng cuối) và bỏ bucket kết nối (kết nối là bộ dồn kênh).
+  END_USER_FIELD từ kết nối không tin cậy bị bỏ qua -> client thường không tự đổi định danh để né giới hạn
+- Bị từ chối: không chạy handler, không tra cache, response mã hóa sẵn (FrameCodec.rate_limited)
+- Số bucket giới hạn (LRU): bucket lâu không dùng đã đầy token, bỏ đi không đổi hành vi
+- Thống kê: admitted / rejected theo nhóm, rejected theo loại bucket, mức token hiện tại (min / avg)
+
+Lưu ý: chạy nhiều process worker thì mỗi worker giữ bucket riêng; giới hạn theo kết nối vẫn đúng
+(1 kết nối nằm trọn ở 1 worker), giới hạn theo session tối đa nhân với số worker.
+"""
+
+import ipaddress
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, Hashable, List, Optional
+
+from config import RATE_LIMIT_CONFIG
+
+RATE_CLASSES = ('seat', 'catalog', 'upload', 'admin')
+
+REJECTION = {'success': False, 'rate_limited': True,
+             'message': 'Bạn thao tác quá nhanh, vui lòng thử lại sau giây lát'}
+
+
+class RateLimiter:
+    def __init__(self, registry, config: Optional[Dict] = None):
+        config = config or RATE_LIMIT_CONFIG
+        self.registry = registry
+        self.enabled = config['enabled']
+        self.max_buckets = config['max_buckets']
+        self.trusted_frontends = [ipaddress.ip_network(net, strict=False)
+                                  for net in config.get('trusted_frontends', [])]
+
+        # nhóm -> {'session': (token / giây, burst), 'connection': (...)}; rate <= 0 = không giới hạn nhóm đó
+        self.limits: Dict[str, Dict[str, tuple]] = {}
+        factor = config['connection_factor']
+        for rate_class in RATE_CLASSES:
+            rate, burst = config[f'{rate_class}_rate'], config[f'{rate_class}_burst']
+            if rate > 0:
+                self.limits[rate_class] = {'session': (rate, max(1.0, burst)),
+                                           'connection': (rate * factor, max(1.0, burst * factor))}
+
+        # (loại, nhóm, id) -> [token, thời điểm refill cuối (time.monotonic)]
+        self._buckets: "OrderedDict[Hashable, List[float]]" = OrderedDict()
+        self._lock = Lock()
+
+        self.admitted = {rate_class: 0 for rate_class in RATE_CLASSES}
+        self.rejected = {rate_class: 0 for rate_class in RATE_CLASSES}
+        self.rejected_by = {'session': 0, 'connection': 0}
+        self.end_user_admits = 0  # Request được tính theo người dùng cuối (qua frontend tin cậy)
+        self.evictions = 0
+
+    def rate_class(self, command: Optional[str]) -> str:
+        spec = self.registry.get(command)
+        return spec.rate_class if spec is not None else 'catalog'
+
+    def is_trusted_frontend(self, connection_id: Optional[str]) -> bool:
+        """connection_id dạng 'host:port' / '[host]:port' thuộc RATE_LIMIT_TRUSTED_FRONTENDS"""
+        if not connection_id or not self.trusted_frontends:
+            return False
+        host = connection_id.rsplit(':', 1)[0].strip('[]')
+        try:
+            address = ipaddress.ip_address(host)
+        except ValueError:
+            return False
+        address = getattr(address, 'ipv4_mapped', None) or address
+        return any(address in net for net in self.trusted_frontends)
+
+    def admit(self, command: Optional[str], session_id: str, connection_id: str,
+              end_user: Optional[str] = None) -> bool:
+        """True = cho chạy lệnh (đã trừ 1 token ở mọi bucket liên quan); False = từ chối, không trừ token
+
+        end_user (END_USER_FIELD) chỉ có tác dụng khi kết nối đến từ frontend tin cậy: bucket session theo
+        (session, end_user), không dùng bucket kết nối.
+        """
+        if not self.enabled:
+            return True
+        rate_class = self.rate_class(command)
+        limits = self.limits.get(rate_class)
+        if limits is None:
+            return True
+
+        multiplexed = bool(end_user) and self.is_trusted_frontend(connection_id)
+        now = time.monotonic()
+        with self._lock:
+            if multiplexed:
+                session = self._bucket(('session', rate_class, (session_id, end_user)), limits['session'], now)
+                connection = None
+            else:
+                session = self._bucket(('session', rate_class, session_id), limits['session'], now)
+                connection = self._bucket(('connection', rate_class, connection_id), limits['connection'], now)
+            if session[0] < 1.0 or (connection is not None and connection[0] < 1.0):
+                self.rejected[rate_class] += 1
+                self.rejected_by['session' if session[0] < 1.0 else 'connection'] += 1
+                return False
+            session[0] -= 1.0
+            if connection is not None:
+                connection[0] -= 1.0
+            else:
+                self.end_user_admits += 1
+            self.admitted[rate_class] += 1
+            return True
+
+    def _bucket(self, key: Hashable, limit: tuple, now: float) -> List[float]:
+        """Gọi khi đang giữ lock: bucket của key, đã nạp thêm token theo thời gian trôi qua"""
+        rate, burst = limit
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [burst, now]
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+            return bucket
+        bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        self._buckets.move_to_end(key)
+        return bucket
+
+    def get_stats(self) -> Dict:
+        """admitted / rejected theo nhóm + mức token hiện tại của bucket (đã tính phần nạp tới lúc này)"""
+        now = time.monotonic()
+        with self._lock:
+            snapshot = [(key, bucket[0], bucket[1]) for key, bucket in self._buckets.items()]
+            stats = {
+                'enabled': self.enabled,
+                'admitted': dict(self.admitted),
+                'rejected': dict(self.rejected),
+                'rejected_by': dict(self.rejected_by),
+                'end_user_admits': self.end_user_admits,
+                'trusted_frontends': [str(net) for net in self.trusted_frontends],
+                'buckets': len(snapshot),
+                'max_buckets': self.max_buckets,
+                'evictions': self.evictions
+            }
+
+        levels = {}
+        for (kind, rate_class, _), tokens, stamp in snapshot:
+            rate, burst = self.limits[rate_class][kind]
+            level = min(burst, tokens + (now - stamp) * rate)
+            entry = levels.setdefault(f'{rate_class}.{kind}', {'buckets': 0, 'burst': burst, 'min': burst,
+                                                                 'total': 0.0, 'empty': 0})
+            entry['buckets'] += 1
+            entry['total'] += level
+            entry['min'] = min(entry['min'], level)
+            if level < 1.0:
+                entry['empty'] += 1
+        for entry in levels.values():
+            entry['avg'] = entry.pop('total') / entry['buckets']
+        stats['levels'] = levels
+        return stats
@@ -0,0 +1,84 @@
+"""Response Cache - Cache body response đã mã hóa (+ nén) của lệnh catalog
+
+Chức năng:
+- Key: (lệnh, tham số chuẩn hóa, encoding / protobuf / compression của kết nối)
+- Value: (body, flags) đúng như gửi lên dây -> hit bỏ qua cả handler lẫn mã hóa
+- Version dữ liệu catalog đổi (load lại routes.json / trips.json) -> xóa toàn bộ cache
+- Entry có thể gắn tag (vd version ghế của chuyến cho GET_SEATS): tag khác -> miss, put ghi đè đúng entry đó
+- Giới hạn số entry (LRU), thống kê hit / miss / eviction
+"""
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 1024, version: Callable[[], Hashable] = lambda: 0):
+        self.max_entries = max_entries  # 0 = tắt cache
+        self.version = version
+
+        self._entries: "OrderedDict[Hashable, Tuple[bytes, int, Hashable]]" = OrderedDict()
+        self._version = None
+        self.lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale = 0  # Miss do tag cũ (dữ liệu của entry đã đổi)
+
+    def _check_version(self):
+        """Gọi khi đang giữ lock: dữ liệu catalog đã đổi -> bỏ mọi entry cũ"""
+        current = self.version()
+        if current != self._version:
+            if self._entries:
+                self.invalidations += 1
+                self._entries.clear()
+            self._version = current
+
+    def get(self, key: Hashable, tag: Hashable = None) -> Optional[Tuple[bytes, int]]:
+        if not self.max_entries:
+            return None
+        with self.lock:
+            self._check_version()
+            entry = self._entries.get(key)
+            if entry is None or entry[2] != tag:
+                self.misses += 1
+                if entry is not None:
+                    self.stale += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def put(self, key: Hashable, body: bytes, flags: int, tag: Hashable = None):
+        if not self.max_entries:
+            return
+        with self.lock:
+            self._check_version()
+            self._entries[key] = (bytes(body), flags, tag)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'stale': self.stale,
+                'bytes': sum(len(entry[0]) for entry in self._entries.values())
+            }
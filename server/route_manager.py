@@ -16,6 +16,7 @@ class RouteManager:
         self.data_dir = data_dir
         self.routes_file = os.path.join(data_dir, 'routes.json')
         self.routes: List[Dict] = []
+        self.version = 0  # Tăng mỗi lần load lại -> cache response catalog hết hạn
         self.load_routes()
     
     def load_routes(self):
@@ -30,6 +31,7 @@ class RouteManager:
         except json.JSONDecodeError as e:
             print(f"[RouteManager] Lỗi đọc file JSON: {e}")
             self.routes = []
+        self.version += 1
     
     def get_all_routes(self) -> List[Dict]:
         """Lấy tất cả tuyến"""
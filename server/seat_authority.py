@@ -0,0 +1,326 @@
+"""Seat Authority - Trạng thái ghế / đơn dùng chung cho nhiều process worker (chế độ worker_processes > 1)
+
+Chức năng:
+- SeatAuthority (process chính): giữ server đầy đủ (SeatManager, BookingManager, IdempotencyCache,
+  upload theo chunk), chạy các lệnh ghi do worker chuyển tiếp qua Unix socket
+- Change feed: mỗi lần version ghế của 1 chuyến đổi, authority đẩy (trip_id, version, ghế) cho mọi worker
+- AuthorityClient (worker): chuyển tiếp FORWARDED_COMMANDS (đăng ký lại là blocking), mỗi thread 1 kết nối
+- SeatReplica (worker): bản sao ghế chỉ đọc -> GET_SEATS / SEARCH_TRIPS / seat map cache đọc tại chỗ
+- Read-your-writes: reply của lệnh chuyển tiếp kèm thay đổi ghế do chính lệnh đó tạo, worker áp dụng
+  ngay (không đợi feed) -> client đọc lại trên cùng worker thấy đúng kết quả
+
+Giao thức nội bộ: frame v3 (common/framing.py), body msgpack nếu có (không thì JSON);
+UPLOAD_CHUNK gửi dữ liệu thô bằng frame FLAG_BINARY như client.
+Lệnh chuyển tiếp kèm budget_ms còn lại của request gốc (deadlines.py): authority bỏ lệnh đã quá hạn,
+và traceparent của span đang chạy (common/tracing.py): span của authority / shard thuộc cùng trace.
+Địa chỉ: đường dẫn Unix socket, hoặc 'host:port' (TCP - shard chạy trên máy khác, xem cluster.py).
+"""
+
+import copy
+import os
+import socket
+import threading
+import time
+from queue import Queue
+from threading import Lock
+from typing import Dict, List, Optional
+
+from common import codec, logger, tracing
+from common.framing import DEFAULT_MAX_FRAME_SIZE, FrameReader, configure_socket, send_frame
+from common.protocol import BUDGET_FIELD, PROTOCOL_V3, TRACE_FIELD
+from seat_manager import SeatManager
+import deadlines
+
+log = logger.get('Worker')
+
+LINK_ENCODING = codec.ENCODING_MSGPACK if codec.msgpack is not None else codec.ENCODING_JSON
+
+# Lệnh worker không tự xử lý được: đổi trạng thái ghế / đơn, đọc đơn, upload theo chunk (session trong RAM)
+FORWARDED_COMMANDS = [
+    'SELECT_SEAT', 'UNSELECT_SEAT', 'BOOK_SEATS', 'BOOK_ITINERARY',
+    'GET_BOOKING', 'LIST_BOOKINGS',
+    'UPLOAD_BEGIN', 'UPLOAD_CHUNK', 'UPLOAD_FINISH',
+]
+
+
+def _socket_for(address: str):
+    """'host:port' -> (socket TCP, (host, port)); còn lại -> (socket Unix, đường dẫn)"""
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit() and '/' not in address:
+        return socket.socket(socket.AF_INET, socket.SOCK_STREAM), (host or '127.0.0.1', int(port))
+    return socket.socket(socket.AF_UNIX, socket.SOCK_STREAM), address
+
+
+def _send_message(sock: socket.socket, message: dict):
+    """Gửi 1 message; request có 'data' nhị phân -> frame FLAG_BINARY (không hex / không copy sang JSON)"""
+    request = message.get('request')
+    data = request.get('data') if isinstance(request, dict) else None
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        meta = dict(message, request={k: v for k, v in request.items() if k != 'data'})
+        send_frame(sock, codec.pack_binary(meta, data, LINK_ENCODING), PROTOCOL_V3, 0, codec.FLAG_BINARY)
+    else:
+        send_frame(sock, codec.dumps(message, LINK_ENCODING), PROTOCOL_V3)
+
+
+def _decode_message(body, flags: int) -> dict:
+    if flags & codec.FLAG_BINARY:
+        message = codec.unpack_binary(body, LINK_ENCODING)
+        message['request']['data'] = message.pop('data')
+        return message
+    return codec.loads(body, LINK_ENCODING)
+
+
+class SeatAuthority:
+    """Phía process chính: nhận lệnh chuyển tiếp + phát change feed"""
+
+    def __init__(self, app, address: str):
+        self.app = app  # Server đầy đủ (BusBookingServer / SSLBusBookingServer), không lắng nghe client
+        self.address = address
+        self.running = False
+        self.listen_socket = None
+
+        self._subscribers: List[Queue] = []
+        self._subscribers_lock = Lock()
+        self._local = threading.local()  # changes: thay đổi ghế do lệnh đang chạy trên thread này tạo
+        app.seat_manager.listeners.append(self._on_seats_changed)
+
+    def start(self):
+        """Lắng nghe Unix socket, accept trong thread riêng"""
+        self.listen_socket, bind_address = _socket_for(self.address)
+        if isinstance(bind_address, str):
+            if os.path.exists(bind_address):
+                os.remove(bind_address)
+        else:
+            self.listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listen_socket.bind(bind_address)
+        self.listen_socket.listen(1024)
+        self.running = True
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        print(f"[Authority] Lắng nghe worker trên {self.address}")
+
+    def stop(self):
+        self.running = False
+        try:
+            self.listen_socket.close()
+            if self.listen_socket.family == socket.AF_UNIX:
+                os.remove(self.address)
+        except (AttributeError, OSError):
+            pass
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                sock, _ = self.listen_socket.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._handle_connection, args=(sock,), daemon=True).start()
+
+    def _handle_connection(self, sock: socket.socket):
+        configure_socket(sock)
+        reader = FrameReader(sock, DEFAULT_MAX_FRAME_SIZE)
+        try:
+            while self.running:
+                frame = reader.read_frame(PROTOCOL_V3)
+                if frame is None:
+                    break
+                _, flags, body = frame
+                message = _decode_message(body, flags)
+                op = message.get('op')
+                if op == 'SUBSCRIBE':
+                    self._serve_feed(sock)
+                    break
+                if op == 'COMMAND':
+                    reply = self._execute(message)
+                elif op == 'SEATS':
+                    self.app.seat_manager.get_trip_seats(message.get('trip_id'))  # Khởi tạo nếu chuyến mới
+                    reply = {'changes': [self._copy_trip(message.get('trip_id'))]}
+                else:
+                    reply = {'error': f'Unknown op: {op}'}
+                send_frame(sock, codec.dumps(reply, LINK_ENCODING), PROTOCOL_V3)
+        except (OSError, ValueError) as e:
+            print(f"[Authority] Lỗi kết nối worker: {e}")
+        finally:
+            sock.close()
+
+    def _execute(self, message: dict) -> dict:
+        """Chạy lệnh qua registry đầy đủ, gom thay đổi ghế mà lệnh tạo ra"""
+        self._local.changes = []
+        try:
+            with tracing.start_trace(f"authority {message.get('command')}", message.get(TRACE_FIELD)):
+                response = self.app.commands.dispatch(message.get('command'), message.get('request') or {},
+                                                      message.get('client_id') or '',
+                                                      deadline=deadlines.from_budget(message.get(BUDGET_FIELD)))
+            return {'response': response, 'changes': self._local.changes}
+        finally:
+            self._local.changes = None
+
+    def _copy_trip(self, trip_id: str) -> list:
+        """[trip_id, version, bản copy ghế]; version đọc trước dữ liệu (thay đổi giữa chừng tới sau qua feed)"""
+        seat_manager = self.app.seat_manager
+        version = seat_manager.trip_version(trip_id)
+        return [trip_id, version, copy.deepcopy(seat_manager.seats_data.get(trip_id, {}))]
+
+    # ---------- Change feed ----------
+
+    def _on_seats_changed(self, trip_id: str, version: int, seats: Dict):
+        """Listener của SeatManager (chạy trong lock chuyến): mã hóa 1 lần, đẩy cho mọi worker"""
+        change = [trip_id, version, seats]
+        changes = getattr(self._local, 'changes', None)
+        if changes is not None:
+            changes.append(change)
+        with self._subscribers_lock:
+            if not self._subscribers:
+                return
+            body = codec.dumps({'changes': [change]}, LINK_ENCODING)
+            for queue in self._subscribers:
+                queue.put(body)
+
+    def _serve_feed(self, sock: socket.socket):
+        """Gửi snapshot mọi chuyến rồi từng thay đổi; đăng ký queue TRƯỚC snapshot để không sót thay đổi"""
+        queue = Queue()
+        with self._subscribers_lock:
+            self._subscribers.append(queue)
+        try:
+            snapshot = [self._copy_trip(trip_id) for trip_id in list(self.app.seat_manager.seats_data)]
+            send_frame(sock, codec.dumps({'changes': snapshot}, LINK_ENCODING), PROTOCOL_V3)
+            while self.running:
+                send_frame(sock, queue.get(), PROTOCOL_V3)
+        finally:
+            with self._subscribers_lock:
+                self._subscribers.remove(queue)
+
+
+class AuthorityClient:
+    """Phía worker: chuyển tiếp lệnh + nhận change feed vào SeatReplica"""
+
+    def __init__(self, address: str):
+        self.address = address
+        self.replica: Optional['SeatReplica'] = None
+        self.ready = threading.Event()  # Đã nhận snapshot đầu tiên
+        self._local = threading.local()
+
+    def _connect(self) -> socket.socket:
+        sock, address = _socket_for(self.address)
+        sock.connect(address)
+        configure_socket(sock)
+        return sock
+
+    def call(self, message: dict) -> dict:
+        """Gửi 1 message trên kết nối của thread hiện tại; lỗi kết nối -> OSError (lần sau kết nối lại)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            sock = self._connect()
+            conn = self._local.conn = (sock, FrameReader(sock, DEFAULT_MAX_FRAME_SIZE))
+        sock, reader = conn
+        try:
+            _send_message(sock, message)
+            frame = reader.read_frame(PROTOCOL_V3)
+            if frame is None:
+                raise ConnectionError('Authority đã đóng kết nối')
+        except OSError:
+            self._local.conn = None
+            sock.close()
+            raise
+        return codec.loads(frame[2], LINK_ENCODING)
+
+    def install(self, registry):
+        """Thay handler của FORWARDED_COMMANDS bằng bản chuyển tiếp (blocking: chờ I/O socket)"""
+        for command in FORWARDED_COMMANDS:
+            registry.register(command, self._forwarder(command), blocking=True,
+                              rate_class=registry.get(command).rate_class)
+
+    def _forwarder(self, command: str):
+        return lambda request, client_id: self.execute(command, request, client_id)
+
+    def execute(self, command: str, request: dict, client_id: str) -> dict:
+        """Chạy 1 lệnh ở authority, áp dụng ngay thay đổi ghế lệnh đó tạo vào bản sao"""
+        try:
+            message = {'op': 'COMMAND', 'command': command, 'request': request, 'client_id': client_id}
+            budget = deadlines.budget_ms()
+            if budget is not None:
+                message[BUDGET_FIELD] = budget
+            traceparent = tracing.traceparent()
+            if traceparent is not None:
+                message[TRACE_FIELD] = traceparent
+            with tracing.span('authority.call', address=self.address):
+                reply = self.call(message)
+        except OSError as e:
+            log.error('Lỗi chuyển tiếp {command} tới {address}: {error}', command=command, address=self.address, error=e)
+            return {'success': False, 'message': 'Máy chủ trạng thái ghế không phản hồi, vui lòng thử lại'}
+        self.replica.apply(reply['changes'])
+        return reply['response']
+
+    def fetch_seats(self, trip_id: str) -> list:
+        return self.call({'op': 'SEATS', 'trip_id': trip_id})['changes']
+
+    def start_feed(self, replica: 'SeatReplica', timeout: float = 30.0) -> bool:
+        """Chạy thread nhận change feed; đợi snapshot đầu tiên (False nếu quá timeout)"""
+        self.replica = replica
+        threading.Thread(target=self._feed_loop, daemon=True).start()
+        return self.ready.wait(timeout)
+
+    def _feed_loop(self):
+        while True:
+            try:
+                sock = self._connect()
+                try:
+                    _send_message(sock, {'op': 'SUBSCRIBE'})
+                    reader = FrameReader(sock, DEFAULT_MAX_FRAME_SIZE)
+                    snapshot = True
+                    while True:
+                        frame = reader.read_frame(PROTOCOL_V3)
+                        if frame is None:
+                            break
+                        # Frame đầu là snapshot: ghi đè kể cả version nhỏ hơn (authority khởi động lại đếm từ đầu)
+                        self.replica.apply(codec.loads(frame[2], LINK_ENCODING)['changes'], force=snapshot)
+                        snapshot = False
+                        self.ready.set()
+                finally:
+                    sock.close()
+                print("[Worker] Mất change feed, kết nối lại...")
+            except OSError:
+                pass  # Authority chưa lắng nghe / đã dừng
+            time.sleep(0.5)
+
+
+class SeatReplica(SeatManager):
+    """Bản sao ghế trong worker: chỉ nhận thay đổi từ authority, không đọc / ghi disk
+
+    Lệnh đổi ghế không chạy ở đây (được chuyển tiếp), version là version của authority.
+    """
+
+    def __init__(self, authority: AuthorityClient):
+        # Không gọi SeatManager.__init__: dữ liệu đến từ snapshot của change feed
+        self.authority = authority
+        self.seats_data: Dict = {}
+        self.lock = Lock()
+        self._trip_locks: Dict[str, Lock] = {}
+        self._versions: Dict[str, int] = {}
+        self.listeners = []
+
+    def apply(self, changes: list, force: bool = False):
+        """Áp dụng [trip_id, version, ghế]; bỏ qua bản cũ hơn (reply và feed có thể tới lệch thứ tự)"""
+        with self.lock:
+            for trip_id, version, seats in changes:
+                if force or version > self._versions.get(trip_id, 0):
+                    self.seats_data[trip_id] = seats  # Gán dữ liệu trước version (reader đọc version trước)
+                    self._versions[trip_id] = version
+
+    def get_trip_seats(self, trip_id: str) -> Dict:
+        seats = self.seats_data.get(trip_id)
+        if seats is None and isinstance(trip_id, str):
+            # Chuyến chưa có: authority khởi tạo như SeatManager.get_trip_seats (1 lần / chuyến)
+            try:
+                self.apply(self.authority.fetch_seats(trip_id))
+            except OSError as e:
+                log.error('Không lấy được ghế chuyến {trip_id}: {error}', trip_id=trip_id, error=e)
+            seats = self.seats_data.get(trip_id)
+        return seats or {}
+
+    def cleanup_expired_locks(self, timeout: int = 300):
+        """Authority dọn ghế hết hạn, bản sao nhận kết quả qua feed"""
+        return
+
+    def write_queues(self) -> Dict:
+        """Bản sao không ghi disk"""
+        return {}
@@ -5,16 +5,27 @@ Chức năng:
 - Tối ưu I/O: 
   + Lưu trữ mỗi chuyến xe ra 1 file JSON riêng biệt.
   + Async Disk Write: Ghi file trong background thread, không block response.
+- Lock theo từng chuyến (per-trip lock): các chuyến khác nhau không tranh chấp nhau
+- Đặt vé nhiều chặng (khứ hồi / trung chuyển): giữ lock các chuyến theo thứ tự, commit tất cả hoặc không
+- Version thay đổi theo từng chuyến: tăng sau mỗi lần trạng thái ghế đổi (cache seat map đã mã hóa dựa vào đây)
+- listeners: nhận (trip_id, version, bản copy ghế) sau mỗi thay đổi (change feed của seat_authority.py)
+- Request đang được trace: span 'seat.lock_wait' = thời gian chờ lock chuyến (common/tracing.py)
 """
 
+import copy
 import json
 import os
 import time
 import glob
-from typing import List, Dict, Optional
+import itertools
+from typing import Callable, List, Dict, Optional
 from threading import Lock, Thread
 from queue import Queue
-from concurrent.futures import ThreadPoolExecutor
+
+from common import logger, tracing
+from graceful_shutdown import WriteBehind
+
+log = logger.get('SeatManager')
 
 
 class SeatManager:
@@ -24,11 +35,16 @@ class SeatManager:
         self.seats_dir = os.path.join(data_dir, 'seats')       # New storage dir
         
         self.seats_data: Dict = {}  # Cache in Memory
-        self.lock = Lock()
+        self.lock = Lock()  # Bảo vệ cấu trúc seats_data / _trip_locks
+        self._trip_locks: Dict[str, Lock] = {}  # trip_id -> lock trạng thái ghế của chuyến
+        self._versions: Dict[str, int] = {}  # trip_id -> version thay đổi (0 = chưa có dữ liệu)
+        self._version_counter = itertools.count(1)  # Tăng toàn cục: reload không bao giờ dùng lại version cũ
+        self.listeners: List[Callable[[str, int, Dict], None]] = []  # Gọi trong lock chuyến -> đúng thứ tự
         
         # OPTIMIZATION: Async Disk Write
-        self._write_executor = ThreadPoolExecutor(max_workers=2)
-        self._pending_writes: Dict[str, dict] = {}  # Debounce: chỉ lưu version cuối
+        self._writes = WriteBehind('seat-writer', max_workers=2)
+        self._file_locks: Dict[str, Lock] = {}  # trip_id -> lock ghi file của chuyến
+        self._written_versions: Dict[str, int] = {}  # trip_id -> version đã nằm trên disk
         
         self.init_storage()
         self.load_seats()
@@ -64,6 +80,7 @@ class SeatManager:
                 trip_id = os.path.splitext(os.path.basename(filepath))[0]
                 with open(filepath, 'r', encoding='utf-8') as f:
                     self.seats_data[trip_id] = json.load(f)
+                self._bump_version(trip_id)
             except Exception:
                 pass
 
@@ -76,21 +93,53 @@ class SeatManager:
         except Exception as e:
             print(f"[SeatManager] Lỗi lưu chuyến {trip_id}: {e}")
 
-    def _async_write_task(self, trip_id: str, data: dict):
-        """Background task để ghi disk"""
+    def _async_write_task(self, trip_id: str, data: dict, version: int = 0):
+        """Background task để ghi disk
+
+        2 worker có thể nhận 2 bản của cùng chuyến: bản cũ tới sau bị bỏ qua, ghi file tạm rồi rename
+        (không còn 2 thread cùng ghi đè 1 file -> file JSON hỏng).
+        """
         try:
-            filepath = os.path.join(self.seats_dir, f"{trip_id}.json")
-            with open(filepath, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            with self.lock:
+                file_lock = self._file_locks.setdefault(trip_id, Lock())
+            with file_lock:
+                if version and version <= self._written_versions.get(trip_id, 0):
+                    return
+                filepath = os.path.join(self.seats_dir, f"{trip_id}.json")
+                with open(filepath + '.tmp', 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False, indent=2)
+                os.replace(filepath + '.tmp', filepath)
+                self._written_versions[trip_id] = version
         except Exception as e:
-            print(f"[SeatManager] Async write error for {trip_id}: {e}")
+            log.error('Async write error for {trip_id}: {error}', trip_id=trip_id, error=e)
+
+    def _bump_version(self, trip_id: str):
+        """Gọi SAU khi sửa xong ghế của chuyến: reader đọc version trước dữ liệu nên không cache nhầm bản cũ"""
+        version = next(self._version_counter)
+        self._versions[trip_id] = version
+        if self.listeners:
+            snapshot = copy.deepcopy(self.seats_data[trip_id])
+            for listener in self.listeners:
+                listener(trip_id, version, snapshot)
+
+    def trip_version(self, trip_id: str) -> int:
+        """Version trạng thái ghế hiện tại của chuyến (đổi mỗi khi có ghế thay đổi)"""
+        return self._versions.get(trip_id, 0)
 
     def save_trip_data(self, trip_id: str, data: dict):
-        """OPTIMIZED: Ghi async - return ngay, disk write trong background"""
+        """OPTIMIZED: Ghi async - return ngay, disk write trong background (mọi thay đổi ghế đều đi qua đây)"""
+        self._bump_version(trip_id)
         # Deep copy để tránh race condition
-        import copy
         data_copy = copy.deepcopy(data)
-        self._write_executor.submit(self._async_write_task, trip_id, data_copy)
+        self._writes.submit(self._async_write_task, trip_id, data_copy, self._versions[trip_id])
+
+    def write_queues(self) -> Dict[str, WriteBehind]:
+        """Hàng đợi ghi nền cần flush khi dừng server"""
+        return {'seats': self._writes}
+
+    def memory_structures(self) -> Dict[str, object]:
+        """Cấu trúc lớn giữ trong RAM (metrics.py ước lượng kích thước)"""
+        return {'seats': self.seats_data}
 
     def initialize_trip_seats(self, trip_id: str, total_seats: int = 40):
         if trip_id in self.seats_data: return
@@ -103,6 +152,7 @@ class SeatManager:
                 seats[f"T2-B{i:02d}"] = {'status': 'available', 'locked_by': None, 'locked_at': None}
             
             self.seats_data[trip_id] = seats
+            self._bump_version(trip_id)
             # Lazy init (No Save)
 
     def get_trip_seats(self, trip_id: str) -> Dict:
@@ -110,9 +160,17 @@ class SeatManager:
             self.initialize_trip_seats(trip_id)
         return self.seats_data.get(trip_id, {})
 
-    def select_seat(self, trip_id: str, seat_id: str, client_id: str) -> Dict:
+    def _get_trip_lock(self, trip_id: str) -> Lock:
         with self.lock:
-            if trip_id not in self.seats_data: return {'success': False, 'message': 'Chuyến không tồn tại'}
+            lock = self._trip_locks.get(trip_id)
+            if lock is None:
+                lock = Lock()
+                self._trip_locks[trip_id] = lock
+            return lock
+
+    def select_seat(self, trip_id: str, seat_id: str, client_id: str) -> Dict:
+        if trip_id not in self.seats_data: return {'success': False, 'message': 'Chuyến không tồn tại'}
+        with tracing.locked(self._get_trip_lock(trip_id), 'seat.lock_wait', trip_id=trip_id):
             if seat_id not in self.seats_data[trip_id]: return {'success': False, 'message': 'Ghế không tồn tại'}
             
             seat = self.seats_data[trip_id][seat_id]
@@ -127,8 +185,9 @@ class SeatManager:
             return {'success': True, 'message': 'Chọn ghế thành công'}
 
     def unselect_seat(self, trip_id: str, seat_id: str, client_id: str) -> Dict:
-        with self.lock:
-            if trip_id not in self.seats_data or seat_id not in self.seats_data[trip_id]:
+        if trip_id not in self.seats_data: return {'success': False, 'message': 'Lỗi dữ liệu'}
+        with tracing.locked(self._get_trip_lock(trip_id), 'seat.lock_wait', trip_id=trip_id):
+            if seat_id not in self.seats_data[trip_id]:
                 return {'success': False, 'message': 'Lỗi dữ liệu'}
             
             seat = self.seats_data[trip_id][seat_id]
@@ -142,50 +201,124 @@ class SeatManager:
             self.save_trip_data(trip_id, self.seats_data[trip_id])
             return {'success': True, 'message': 'Đã bỏ chọn'}
 
-    def book_seats(self, trip_id: str, seat_ids: List[str], client_id: str) -> Dict:
-        with self.lock:
-            if trip_id not in self.seats_data: return {'success': False, 'message': 'Lỗi trip'}
+    def _check_booking_locked(self, trip_id: str, seat_ids: List[str], client_id: str) -> Optional[Dict]:
+        """Kiểm tra ghế sẵn sàng để book (phải giữ lock chuyến). None = hợp lệ"""
+        if trip_id not in self.seats_data: return {'success': False, 'message': 'Lỗi trip'}
+        
+        for sid in seat_ids:
+            if sid not in self.seats_data[trip_id]: return {'success': False, 'message': 'Lỗi seat'}
+            s = self.seats_data[trip_id][sid]
             
-            for sid in seat_ids:
-                if sid not in self.seats_data[trip_id]: return {'success': False, 'message': 'Lỗi seat'}
-                s = self.seats_data[trip_id][sid]
-                
-                # Check Lock Ownership
-                if s['status'] != 'selecting' or s['locked_by'] != client_id:
-                    # Idempotency: Nếu đã book rồi -> Báo thành công (để Client không lỗi)
-                    # Và báo action='existing' để Server không tạo Booking trùng
-                    if s['status'] == 'booked' and s['locked_by'] == client_id:
-                         return {'success': True, 'message': 'Vé đã được đặt thành công!', 'action': 'existing'}
-                         
-                    print(f"[Debug] BOOK FAIL: Seat={sid}, Status={s['status']}, LockedBy={s['locked_by']}, ReqClient={client_id}")
-                    if s['status'] == 'booked' and s['locked_by'] == client_id:
-                        return {'success': True, 'message': 'Vé đã được đặt thành công!', 'action': 'existing'}
-                    return {'success': False, 'message': f'Ghế {sid} lỗi trạng thái'}
+            # Check Lock Ownership
+            if s['status'] != 'selecting' or s['locked_by'] != client_id:
+                # Idempotency: Nếu đã book rồi -> Báo thành công (để Client không lỗi)
+                # Và báo action='existing' để Server không tạo Booking trùng
+                if s['status'] == 'booked' and s['locked_by'] == client_id:
+                     return {'success': True, 'message': 'Vé đã được đặt thành công!', 'action': 'existing'}
+                     
+                log.debug('BOOK FAIL: Seat={seat}, Status={status}, LockedBy={locked_by}, ReqClient={client}',
+                          seat=sid, status=s['status'], locked_by=s['locked_by'], client=client_id)
+                return {'success': False, 'message': f'Ghế {sid} lỗi trạng thái'}
+        return None
+
+    def _commit_booking_locked(self, trip_id: str, seat_ids: List[str]):
+        now = time.time()
+        for sid in seat_ids:
+            s = self.seats_data[trip_id][sid]
+            s['status'] = 'booked'
+            s['locked_at'] = now
+
+    def book_seats(self, trip_id: str, seat_ids: List[str], client_id: str) -> Dict:
+        if trip_id not in self.seats_data: return {'success': False, 'message': 'Lỗi trip'}
+        with tracing.locked(self._get_trip_lock(trip_id), 'seat.lock_wait', trip_id=trip_id):
+            check = self._check_booking_locked(trip_id, seat_ids, client_id)
+            if check is not None:
+                return check
             
             # Commit Booking
-            for sid in seat_ids:
-                s = self.seats_data[trip_id][sid]
-                s['status'] = 'booked'
-                s['locked_at'] = time.time()
+            self._commit_booking_locked(trip_id, seat_ids)
             
             self.save_trip_data(trip_id, self.seats_data[trip_id])
             return {'success': True, 'message': 'Đặt vé thành công'}
 
+    def book_itinerary(self, legs: List[Dict], client_id: str) -> Dict:
+        """Đặt ghế cho nhiều chuyến cùng lúc: tất cả thành công hoặc không chặng nào được commit
+
+        legs: [{'trip_id': str, 'seat_ids': [str]}]
+        Lock các chuyến được lấy theo thứ tự trip_id để 2 hành trình ngược chiều không deadlock.
+        """
+        trip_ids = sorted({leg['trip_id'] for leg in legs})
+        for trip_id in trip_ids:
+            if trip_id not in self.seats_data:
+                return {'success': False, 'message': f'Chuyến {trip_id} không tồn tại'}
+        
+        locks = [self._get_trip_lock(trip_id) for trip_id in trip_ids]
+        with tracing.span('seat.lock_wait', trips=len(locks)):
+            for lock in locks:
+                lock.acquire()
+        try:
+            existing = 0
+            for leg in legs:
+                check = self._check_booking_locked(leg['trip_id'], leg['seat_ids'], client_id)
+                if check is None:
+                    continue
+                if check.get('action') == 'existing':
+                    existing += 1
+                    continue
+                return {'success': False, 'message': f"Chuyến {leg['trip_id']}: {check['message']}"}
+            
+            if existing == len(legs):
+                return {'success': True, 'message': 'Vé đã được đặt thành công!', 'action': 'existing'}
+            if existing:
+                return {'success': False, 'message': 'Một phần hành trình đã được đặt trước đó'}
+            
+            # Commit tất cả chặng
+            for leg in legs:
+                self._commit_booking_locked(leg['trip_id'], leg['seat_ids'])
+            for trip_id in trip_ids:
+                self.save_trip_data(trip_id, self.seats_data[trip_id])
+            return {'success': True, 'message': 'Đặt vé thành công'}
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def revert_itinerary(self, legs: List[Dict], client_id: str):
+        """Hoàn tác book_itinerary khi không ghi được đơn: ghế client vừa book trở lại 'selecting' của client đó
+        (client đặt lại được ngay, hết hạn giữ thì cleanup_expired_locks trả ghế)"""
+        trip_ids = sorted({leg['trip_id'] for leg in legs if leg['trip_id'] in self.seats_data})
+        locks = [self._get_trip_lock(trip_id) for trip_id in trip_ids]
+        for lock in locks:
+            lock.acquire()
+        try:
+            now = time.time()
+            for leg in legs:
+                seats = self.seats_data.get(leg['trip_id'], {})
+                for sid in leg['seat_ids']:
+                    s = seats.get(sid)
+                    if s and s['status'] == 'booked' and s['locked_by'] == client_id:
+                        s['status'] = 'selecting'
+                        s['locked_at'] = now
+            for trip_id in trip_ids:
+                self.save_trip_data(trip_id, self.seats_data[trip_id])
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
     def cleanup_expired_locks(self, timeout: int = 300):
         current_time = time.time()
-        modified_trips = set()
         
-        with self.lock:
-            for trip_id, seats in self.seats_data.items():
+        for trip_id, seats in list(self.seats_data.items()):
+            with self._get_trip_lock(trip_id):
+                modified = False
                 for seat in seats.values():
                     if seat['status'] == 'selecting' and seat['locked_at'] and (current_time - seat['locked_at'] > timeout):
                         seat['status'] = 'available'
                         seat['locked_by'] = None
                         seat['locked_at'] = None
-                        modified_trips.add(trip_id)
-            
-            for trip_id in modified_trips:
-                self.save_trip_data(trip_id, self.seats_data[trip_id])
+                        modified = True
+                
+                if modified:
+                    self.save_trip_data(trip_id, seats)
 
     def get_available_seats_count(self, trip_id: str) -> int:
         if trip_id not in self.seats_data: return 0
@@ -0,0 +1,98 @@
+"""Seat Map Cache - Seat map đã mã hóa sẵn theo từng chuyến (dùng cho UDP broadcast và gRPC)
+
+Chức năng:
+- Mỗi chuyến giữ 1 entry gắn version thay đổi của chuyến (SeatManager.trip_version)
+- JSON bytes của seat map + message protobuf SeatsResponse chỉ mã hóa lại (lazy) khi version đổi
+  -> chuyến nhiều người xem: 1 lần mã hóa cho mỗi thay đổi, không phải mỗi lần xem
+- UDP SEAT_UPDATE: ghép từ JSON bytes của từng chuyến (không json.dumps lại toàn bộ seats_data)
+
+GET_SEATS trên TCP/SSL/Async cache (body, flags) cuối cùng qua response_cache.py với cùng version.
+"""
+
+import json
+from threading import Lock
+from typing import Dict, List, Optional
+
+from common.codec import seat_status_to_pb
+
+try:
+    import bus_booking_pb2
+except Exception:
+    bus_booking_pb2 = None
+
+
+class _SeatMapEntry:
+    __slots__ = ('version', 'json', 'message')
+
+    def __init__(self, version: int):
+        self.version = version
+        self.json: Optional[bytes] = None
+        self.message = None
+
+
+class SeatMapCache:
+    def __init__(self, seat_manager):
+        self.seat_manager = seat_manager
+        self._entries: Dict[str, _SeatMapEntry] = {}
+        self.lock = Lock()
+
+        self.hits = 0
+        self.encodes = 0
+
+    def _entry(self, trip_id: str) -> _SeatMapEntry:
+        """Entry đúng version hiện tại của chuyến (version cũ -> entry rỗng, mã hóa lại khi cần)"""
+        # Đọc version TRƯỚC dữ liệu: ghế đổi giữa chừng -> version tăng -> lần sau mã hóa lại
+        version = self.seat_manager.trip_version(trip_id)
+        with self.lock:
+            entry = self._entries.get(trip_id)
+            if entry is None or entry.version != version:
+                entry = _SeatMapEntry(version)
+                self._entries[trip_id] = entry
+            return entry
+
+    def seats_json(self, trip_id: str) -> bytes:
+        """JSON bytes của seat map 1 chuyến (giống json.dumps(seats))"""
+        entry = self._entry(trip_id)
+        data = entry.json
+        if data is None:
+            data = json.dumps(self.seat_manager.get_trip_seats(trip_id)).encode('utf-8')
+            entry.json = data
+            self.encodes += 1
+        else:
+            self.hits += 1
+        return data
+
+    def seats_message(self, trip_id: str):
+        """SeatsResponse protobuf của 1 chuyến - message dùng chung giữa các request, KHÔNG được sửa"""
+        if bus_booking_pb2 is None:
+            return None
+        entry = self._entry(trip_id)
+        message = entry.message
+        if message is None:
+            message = bus_booking_pb2.SeatsResponse()
+            for seat_id, seat in self.seat_manager.get_trip_seats(trip_id).items():
+                seat_status_to_pb(message.seats[seat_id], seat)
+            entry.message = message
+            self.encodes += 1
+        else:
+            self.hits += 1
+        return message
+
+    def broadcast_payload(self, trip_ids: List[str], timestamp: float) -> bytes:
+        """Message UDP SEAT_UPDATE (cùng định dạng json.dumps cũ) ghép từ JSON đã cache của từng chuyến"""
+        parts = [json.dumps(trip_id).encode('utf-8') + b': ' + self.seats_json(trip_id) for trip_id in trip_ids]
+        return b''.join((
+            b'{"type": "SEAT_UPDATE", "timestamp": ', json.dumps(timestamp).encode('utf-8'),
+            b', "seats_data": {', b', '.join(parts), b'}}'
+        ))
+
+    def get_stats(self) -> Dict:
+        with self.lock:
+            entries = len(self._entries)
+        lookups = self.hits + self.encodes
+        return {
+            'entries': entries,
+            'hits': self.hits,
+            'encodes': self.encodes,
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
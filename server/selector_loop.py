@@ -0,0 +1,350 @@
+"""Selector Serving Loop - Phục vụ TCP bằng selectors (epoll/kqueue) + worker pool giới hạn
+
+Chức năng:
+- 1 thread I/O: accept, đọc và tách frame (4 bytes độ dài + JSON) cho mọi kết nối
+- Request hoàn chỉnh được đẩy sang ThreadPoolExecutor có số worker cố định
+- Kết nối idle chỉ tốn 1 entry trong selector + buffer (không tốn 1 thread như mode 'thread')
+- Giới hạn số kết nối đồng thời, đóng kết nối idle quá lâu (reaper: timeout ngắn hơn khi chịu áp lực,
+  xem idle_reaper.py), đóng kết nối gửi frame quá lớn
+- Protocol v2: mỗi kết nối xử lý tuần tự từng request (response đúng thứ tự)
+- Protocol v3: request pipelined chạy song song (tối đa max_inflight / kết nối), trả lời khi xong
+- Backpressure: frame chờ worker (tối đa max_inflight) hoặc response chờ gửi (send_buffer_limit) đầy
+  -> bỏ EVENT_READ của kết nối, đọc lại khi đã vơi (như semaphore của mode 'thread')
+- drain(): ngừng accept + ngừng đọc request mới, gửi xong response đang xử lý rồi đóng (dừng server)
+"""
+
+import selectors
+import socket
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from common import logger
+from common.framing import FrameTooLarge, configure_socket
+from common.protocol import ConnectionState, PROTOCOL_V2, pack_header, unpack_header
+
+log = logger.get('Selector')
+
+
+class _Connection:
+    """Trạng thái 1 kết nối trong selector loop"""
+    __slots__ = ('sock', 'connection_id', 'state', 'recv_buffer', 'send_buffer', 'pending',
+                 'inflight', 'events', 'last_active', 'closed')
+
+    def __init__(self, sock: socket.socket, connection_id: str):
+        self.sock = sock
+        self.connection_id = connection_id
+        self.state = ConnectionState()
+        self.recv_buffer = bytearray()
+        self.send_buffer = bytearray()
+        self.pending = deque()      # (request_id, flags, body) các frame đã nhận đủ, chờ worker xử lý
+        self.inflight = 0           # Số request đang ở worker
+        self.events = selectors.EVENT_READ  # Event đang đăng ký trong selector (0 = đã unregister)
+        self.last_active = time.monotonic()
+        self.closed = False
+
+
+class SelectorServingLoop:
+    """Event loop dựa trên selectors cho BusBookingServer
+
+    server cần có: running, handle_frame(body, connection_id, state, flags, received) -> Optional[(bytes, flags)]
+    """
+
+    RECV_SIZE = 65536
+    ACCEPT_BATCH = 64
+
+    def __init__(self, server, listen_socket: socket.socket, max_workers: int = 32,
+                 max_connections: int = 10000, idle_timeout: float = 300.0, max_inflight: int = 32,
+                 max_frame_size: int = 16 * 1024 * 1024, reaper=None, send_buffer_limit: int = 4 * 1024 * 1024):
+        self.server = server
+        self.listen_socket = listen_socket
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.reaper = reaper  # IdleReaper: timeout idle theo áp lực bộ nhớ / số kết nối (None = idle_timeout)
+        self.max_inflight = max_inflight
+        self.max_frame_size = max_frame_size
+        self.max_pending = max_inflight  # Frame đã tách, chờ worker / kết nối
+        self.send_buffer_limit = send_buffer_limit
+
+        self.selector = selectors.DefaultSelector()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='tcp-worker')
+        self.connections = {}       # fd -> _Connection
+        self.rejected = 0
+        self.draining = False
+        self._next_sweep = 0.0
+
+        # Buffer đọc dùng chung (chỉ thread I/O dùng): recv_into rồi nối vào recv_buffer của kết nối
+        self._recv_view = memoryview(bytearray(self.RECV_SIZE))
+
+        # Worker trả kết quả qua deque + đánh thức selector bằng socketpair
+        self._completed = deque()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+
+    def serve_forever(self):
+        """Chạy loop cho đến khi server.running = False; sau đó server gọi drain() (dừng có drain)"""
+        self.listen_socket.setblocking(False)
+        self.selector.register(self.listen_socket, selectors.EVENT_READ, None)
+        self.selector.register(self._wakeup_r, selectors.EVENT_READ, self._wakeup_r)
+
+        self._next_sweep = time.monotonic() + 1.0
+        while self.server.running:
+            self._poll(1.0)
+
+    def _poll(self, timeout: float):
+        for key, mask in self.selector.select(timeout=timeout):
+            if key.data is None:
+                self._accept()
+            elif key.data is self._wakeup_r:
+                self._drain_wakeup()
+            else:
+                conn = key.data
+                if mask & selectors.EVENT_READ:
+                    self._on_readable(conn)
+                if mask & selectors.EVENT_WRITE and not conn.closed:
+                    self._flush(conn)
+                    if conn.pending:
+                        self._dispatch_next(conn)  # Send buffer vơi: chạy tiếp frame đang chờ
+
+        self._process_completed()
+
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._close_idle(now)
+            self._next_sweep = now + 1.0
+
+    def drain(self, deadline: float):
+        """Ngừng accept, chạy loop đến khi mọi kết nối gửi xong response đang xử lý (hoặc tới deadline) rồi đóng"""
+        self.draining = True
+        try:
+            self.selector.unregister(self.listen_socket)
+        except (KeyError, ValueError):
+            pass
+        try:
+            while time.monotonic() < deadline:
+                for conn in list(self.connections.values()):
+                    if not conn.inflight and not conn.pending and not conn.send_buffer:
+                        self._close(conn)
+                if not self.connections:
+                    break
+                self._poll(min(0.1, max(0.0, deadline - time.monotonic())))
+        finally:
+            self.close()
+
+    # ---------- Accept / đọc ----------
+
+    def _accept(self):
+        for _ in range(self.ACCEPT_BATCH):
+            try:
+                client_socket, addr = self.listen_socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                if self.server.running:
+                    print(f"[Selector] Lỗi accept: {e}")
+                return
+
+            if len(self.connections) >= self.max_connections:
+                # Quá giới hạn: đóng ngay thay vì giữ kết nối không phục vụ được
+                self.rejected += 1
+                client_socket.close()
+                if self.rejected % 100 == 1:
+                    log.warning('⚠️ Đạt giới hạn {limit} kết nối, đã từ chối {rejected}', limit=self.max_connections,
+                                rejected=self.rejected)
+                continue
+
+            client_socket.setblocking(False)
+            configure_socket(client_socket)
+            conn = _Connection(client_socket, f"{addr[0]}:{addr[1]}")
+            self.connections[client_socket.fileno()] = conn
+            self.selector.register(client_socket, selectors.EVENT_READ, conn)
+
+    def _on_readable(self, conn: _Connection):
+        try:
+            n = conn.sock.recv_into(self._recv_view)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            self._close(conn)
+            return
+        if not n:
+            self._close(conn)
+            return
+        if self.draining:
+            return  # Đang dừng: bỏ request gửi tới sau khi ngừng nhận
+
+        conn.last_active = time.monotonic()
+        conn.recv_buffer += self._recv_view[:n]
+        self._dispatch_next(conn)
+
+    def _parse_frames(self, conn: _Connection):
+        """Tách frame hoàn chỉnh khỏi recv_buffer vào conn.pending.
+
+        v2: chỉ tách khi không có request nào đang chạy (HELLO có thể đổi version
+        của các frame phía sau). v3: tách đến khi pending đủ max_pending, phần còn lại
+        nằm trong recv_buffer tới lần sau.
+        Header khai báo body > max_frame_size -> FrameTooLarge.
+        """
+        buffer = conn.recv_buffer
+        state = conn.state
+        offset = 0
+        while len(buffer) - offset >= state.header_size:
+            if state.version == PROTOCOL_V2 and (conn.inflight or conn.pending):
+                break
+            if len(conn.pending) >= self.max_pending:
+                break
+            length, request_id, flags = unpack_header(buffer[offset:offset + state.header_size], state.version)
+            if length > self.max_frame_size:
+                raise FrameTooLarge(f'Frame {length} bytes vượt giới hạn {self.max_frame_size} bytes')
+            start = offset + state.header_size
+            if len(buffer) - start < length:
+                break
+            # Kèm lúc nhận: hạn chót (budget_ms) tính cả thời gian chờ worker
+            conn.pending.append((request_id, flags, buffer[start:start + length], time.monotonic()))
+            offset = start + length
+        if offset:
+            del buffer[:offset]
+
+    # ---------- Worker ----------
+
+    def _dispatch_next(self, conn: _Connection):
+        if conn.closed:
+            return
+        try:
+            self._parse_frames(conn)
+        except FrameTooLarge as e:
+            log.warning('Đóng {connection}: {error}', connection=conn.connection_id, error=e)
+            self._close(conn)
+            return
+        limit = 1 if conn.state.version == PROTOCOL_V2 else self.max_inflight
+        # Client không đọc response: giữ frame trong pending thay vì chạy thêm và nối vào send_buffer
+        while conn.pending and conn.inflight < limit and len(conn.send_buffer) < self.send_buffer_limit:
+            conn.inflight += 1
+            request_id, flags, body, received = conn.pending.popleft()
+            self.executor.submit(self._run, conn, request_id, flags, body, received)
+        self._update_events(conn)
+
+    def _run(self, conn: _Connection, request_id: int, flags: int, body: bytes, received: float):
+        """Chạy trong worker thread; kết quả là (header, body) để loop nối thẳng vào send_buffer"""
+        version = conn.state.version  # Đọc trước: HELLO đổi version sau khi đã trả lời
+        try:
+            response = self.server.handle_frame(body, conn.connection_id, conn.state, flags, received)
+            if response is not None:
+                response = (pack_header(len(response[0]), version, request_id, response[1]), response[0])
+        except Exception as e:
+            log.error('Lỗi xử lý {connection}: {error}', connection=conn.connection_id, error=e)
+            response = None
+        self._completed.append((conn, response))
+        try:
+            self._wakeup_w.send(b'\0')
+        except (BlockingIOError, InterruptedError):
+            pass  # Buffer đầy = loop chắc chắn sẽ thức dậy
+        except OSError:
+            pass  # Loop đã đóng
+
+    def _drain_wakeup(self):
+        try:
+            while self._wakeup_r.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def _process_completed(self):
+        while self._completed:
+            conn, response = self._completed.popleft()
+            if conn.closed:
+                continue
+            conn.inflight -= 1
+            conn.last_active = time.monotonic()
+            if response:
+                conn.send_buffer += response[0]
+                conn.send_buffer += response[1]
+                self._flush(conn)
+            self._dispatch_next(conn)
+
+    # ---------- Ghi ----------
+
+    def _flush(self, conn: _Connection):
+        if conn.send_buffer:
+            try:
+                sent = conn.sock.send(conn.send_buffer)
+                del conn.send_buffer[:sent]
+            except (BlockingIOError, InterruptedError):
+                pass
+            except OSError:
+                self._close(conn)
+                return
+
+        self._update_events(conn)
+
+    def _update_events(self, conn: _Connection):
+        """Đăng ký lại event theo trạng thái: WRITE khi còn response chờ gửi; READ khi chưa bị backpressure"""
+        if conn.closed:
+            return
+        events = selectors.EVENT_WRITE if conn.send_buffer else 0
+        if self._wants_read(conn):
+            events |= selectors.EVENT_READ
+        if events == conn.events:
+            return
+        if not events:
+            self.selector.unregister(conn.sock)
+        elif not conn.events:
+            self.selector.register(conn.sock, events, conn)
+        else:
+            self.selector.modify(conn.sock, events, conn)
+        conn.events = events
+
+    def _wants_read(self, conn: _Connection) -> bool:
+        if len(conn.pending) >= self.max_pending or len(conn.send_buffer) >= self.send_buffer_limit:
+            return False
+        # v2: frame kế tiếp đã nằm trong buffer, chỉ tách sau khi request đang chạy trả lời
+        return not (conn.state.version == PROTOCOL_V2 and conn.inflight and conn.recv_buffer)
+
+    # ---------- Đóng ----------
+
+    def _close_idle(self, now: float):
+        if self.reaper is not None:
+            timeout, pressure = self.reaper.timeout(len(self.connections))
+        else:
+            timeout, pressure = self.idle_timeout, False
+        if timeout <= 0:
+            return
+        expired = [conn for conn in self.connections.values()
+                   if not conn.inflight and now - conn.last_active > timeout]
+        for conn in expired:
+            log.info('Đóng kết nối idle{reason}: {connection}', reason=' (áp lực bộ nhớ / kết nối)' if pressure else '',
+                     connection=conn.connection_id)
+            self._close(conn)
+        if self.reaper is not None and expired:
+            self.reaper.record(len(expired), pressure)
+
+    def _close(self, conn: _Connection):
+        if conn.closed:
+            return
+        conn.closed = True
+        self.connections.pop(conn.sock.fileno(), None)
+        try:
+            self.selector.unregister(conn.sock)
+        except (KeyError, ValueError):
+            pass
+        conn.sock.close()
+
+    def close(self):
+        for conn in list(self.connections.values()):
+            self._close(conn)
+        try:
+            self.selector.unregister(self.listen_socket)
+        except (KeyError, ValueError):
+            pass
+        self.selector.close()
+        self.executor.shutdown(wait=False)
+        self._wakeup_r.close()
+        self._wakeup_w.close()
+
+    def get_stats(self) -> dict:
+        return {
+            'connections': len(self.connections),
+            'rejected': self.rejected,
+            'max_connections': self.max_connections
+        }
@@ -1,38 +1,118 @@
-"""TCP + UDP Server cho hệ thống đặt vé xe khách (Protocol v2: Message Framing)"""
+"""TCP + UDP Server cho hệ thống đặt vé xe khách (Protocol v2: Message Framing, v3: Pipelining)"""
 
 import socket
 import threading
-import json
 import time
 import os
 import sys
-import struct
+from concurrent.futures import ThreadPoolExecutor
 
-# Thêm thư mục hiện tại vào sys.path
+# Thêm thư mục hiện tại vào sys.path (+ thư mục gốc cho module common dùng chung với client)
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, current_dir)
+sys.path.insert(1, os.path.dirname(current_dir))
 
 from route_manager import RouteManager
 from trip_manager import TripManager
 from seat_manager import SeatManager
 from booking_manager import BookingManager
+from idempotency_cache import IdempotencyCache
+from commands import build_command_registry
+from frame_codec import FrameCodec
+from rate_limiter import RateLimiter
+from idle_reaper import IdleReaper
+from metrics import FanoutCounter, ServerMetrics
+import deadlines
+import profiler
+from seat_map_cache import SeatMapCache
+from seat_authority import SeatReplica
+from cluster import check_topology
+from selector_loop import SelectorServingLoop
+from graceful_shutdown import close_reading, flush_state, format_report, install_signal_handlers, wait_until
 from file_upload import FileUploadHandler
 from email_service import EmailService
-from config import SERVER_CONFIG, EMAIL_CONFIG
+from config import SERVER_CONFIG, EMAIL_CONFIG, IDEMPOTENCY_CONFIG, CLUSTER_CONFIG, LOGGING_CONFIG, TRACING_CONFIG
+from common.protocol import (ConnectionState, END_USER_FIELD, HELLO_COMMAND, PING_COMMAND, PROTOCOL_V2, PROTOCOL_V3,
+                             TRACE_FIELD)
+from common import logger, tracing
+from common.framing import FrameReader, configure_socket, send_frame
+
+log = logger.get('TCP')
 
 
 class BusBookingServer:
-    def __init__(self, tcp_port=55555, udp_port=55556):
+    def __init__(self, tcp_port=55555, udp_port=55556, authority=None, state_dir=None):
         self.tcp_port = tcp_port
         self.udp_port = udp_port
         self.host = '0.0.0.0'
+        logger.configure(**LOGGING_CONFIG)
+        tracing.configure(**TRACING_CONFIG)
         
         self.data_dir = os.path.join(current_dir, 'data')
+        # Ghế / đơn / idempotency; shard của cluster dùng thư mục riêng, catalog vẫn ở data_dir
+        self.state_dir = state_dir or self.data_dir
         self.upload_dir = os.path.join(current_dir, 'uploads')
         
         self.route_manager = RouteManager(self.data_dir)
         self.trip_manager = TripManager(self.data_dir)
-        self.seat_manager = SeatManager(self.data_dir)
+        self.file_handler = FileUploadHandler(self.upload_dir)
+        
+        # Worker (worker_processes > 1): ghế / đơn nằm ở process authority, ở đây chỉ giữ bản sao ghế
+        self.authority = authority
+        if authority is None:
+            self._init_booking_state()
+        else:
+            self.seat_manager = SeatReplica(authority)
+            self.email_service = None
+            self.booking_manager = None
+            self.idempotency_cache = None
+        self.seat_maps = SeatMapCache(self.seat_manager)  # Seat map mã hóa sẵn theo version từng chuyến
+        
+        # Bảng dispatch lệnh dùng chung với các transport khác (TCP/SSL/Async/gRPC)
+        self.commands = build_command_registry(self)
+        if authority is not None:
+            authority.install(self.commands)
+        self.frame_codec = FrameCodec(self.commands, SERVER_CONFIG['compression_threshold'],
+                                      SERVER_CONFIG['response_cache_size'])
+        self.rate_limiter = RateLimiter(self.commands)  # Token bucket theo session / kết nối
+        self.metrics = ServerMetrics(self)  # Lệnh STATS + HTTP /metrics (METRICS_PORT)
+        self.udp_fanout = FanoutCounter()
+        
+        self.tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.tcp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if authority is not None:
+            # Mọi worker bind cùng cổng, kernel chia đều kết nối mới
+            self.tcp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        
+        self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        
+        self.running = False
+        self.stopped = False
+        self.clients = {}  # connection_id -> socket (mode 'thread'; stop() ngừng đọc từng kết nối)
+        self.grpc_server = None
+        self.serving_mode = SERVER_CONFIG['serving_mode']
+        self.max_connections = SERVER_CONFIG['max_connections']
+        self.max_frame_size = SERVER_CONFIG['max_frame_size']
+        self.selector_loop = None
+        self.reaper = IdleReaper()  # Đóng kết nối idle, sớm hơn khi nhiều kết nối / RSS cao
+        
+        # Protocol v3: request pipelined của mọi kết nối chạy trên pool chung (mode 'thread')
+        self.pipeline_max_inflight = SERVER_CONFIG['pipeline_max_inflight']
+        self.pipeline_executor = ThreadPoolExecutor(
+            max_workers=SERVER_CONFIG['worker_threads'],
+            thread_name_prefix='pipeline'
+        )
+        
+        print("="*60)
+        print("HỆ THỐNG ĐẶT VÉ XE KHÁCH (IO FRAMING ENABLED)")
+        print("="*60)
+    
+    def _init_booking_state(self):
+        """Trạng thái ghế / đơn / email (process đơn hoặc authority của chế độ nhiều process)"""
+        if self.state_dir == self.data_dir:
+            check_topology(self.data_dir)  # data/shards/ còn trạng thái cluster -> không chạy trên data/ cũ
+        self.seat_manager = SeatManager(self.state_dir)
         
         # Initialize Email Service (optional - từ environment variables)
         # Khởi tạo Email Service với config từ environment variables
@@ -55,30 +135,27 @@ class BusBookingServer:
         else:
             print(f"[Server] ✅ Email service đã được cấu hình: {EMAIL_CONFIG['username']}")
         
-        self.booking_manager = BookingManager(self.data_dir, email_service=self.email_service)
-        self.file_handler = FileUploadHandler(self.upload_dir)
-        
-        self.tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.tcp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        
-        self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-        
-        self.running = False
-        self.clients = []
-        
-        print("="*60)
-        print("HỆ THỐNG ĐẶT VÉ XE KHÁCH (IO FRAMING ENABLED)")
-        print("="*60)
+        self.booking_manager = BookingManager(self.state_dir, email_service=self.email_service)
+        self.idempotency_cache = IdempotencyCache(
+            self.state_dir,
+            max_entries=IDEMPOTENCY_CONFIG['max_entries'],
+            ttl=IDEMPOTENCY_CONFIG['ttl_seconds']
+        )
     
     def start(self):
         self.running = True
         self.tcp_socket.bind((self.host, self.tcp_port))
-        self.tcp_socket.listen(5)
-        print(f"[TCP Server] Lắng nghe trên {self.host}:{self.tcp_port}")
+        self.tcp_socket.listen(SERVER_CONFIG['listen_backlog'])
+        print(f"[TCP Server] Lắng nghe trên {self.host}:{self.tcp_port} (mode: {self.serving_mode})")
+        self.metrics.start_http()
         
-        threading.Thread(target=self.udp_broadcast_loop, daemon=True).start()
-        threading.Thread(target=self.cleanup_loop, daemon=True).start()
+        if self.authority is None:
+            threading.Thread(target=self.udp_broadcast_loop, daemon=True).start()
+            threading.Thread(target=self.cleanup_loop, daemon=True).start()
+        elif not self.authority.start_feed(self.seat_manager):
+            print("[Worker] ⚠️ Chưa nhận được snapshot ghế từ authority, vẫn tiếp tục")
+        if self.serving_mode != 'selector':
+            threading.Thread(target=self.idle_reap_loop, daemon=True).start()
         
         # Start gRPC server (optional - nếu muốn dùng)
         try:
@@ -96,169 +173,241 @@ class BusBookingServer:
         
         print("\n[Server] Sẵn sàng phục vụ!\n")
         
+        if self.serving_mode == 'selector':
+            # 1 thread I/O cho mọi kết nối + worker pool cố định
+            self.selector_loop = SelectorServingLoop(
+                self,
+                self.tcp_socket,
+                max_workers=SERVER_CONFIG['worker_threads'],
+                max_connections=self.max_connections,
+                idle_timeout=SERVER_CONFIG['idle_timeout'],
+                reaper=self.reaper,
+                max_inflight=self.pipeline_max_inflight,
+                max_frame_size=self.max_frame_size,
+                send_buffer_limit=SERVER_CONFIG['send_buffer_limit']
+            )
+            try:
+                self.selector_loop.serve_forever()
+            except KeyboardInterrupt:
+                self.stop()
+            return
+        
         while self.running:
             try:
                 client_socket, addr = self.tcp_socket.accept()
-                print(f"[TCP] Kết nối: {addr}")
+                if len(self.clients) >= self.max_connections:
+                    log.warning('⚠️ Đạt giới hạn {limit} kết nối, từ chối {addr}', limit=self.max_connections, addr=addr)
+                    client_socket.close()
+                    continue
+                log.info('Kết nối: {addr}', addr=addr)
                 threading.Thread(target=self.handle_client, args=(client_socket, addr), daemon=True).start()
             except KeyboardInterrupt:
                 self.stop()
                 break
             except Exception as e:
-                print(f"[Server] Lỗi accept: {e}")
-
-    def _recv_n_bytes(self, sock, n):
-        """Đọc chính xác n bytes từ socket"""
-        data = b''
-        while len(data) < n:
-            try:
-                chunk = sock.recv(n - len(data))
-                if not chunk: return None
-                data += chunk
-            except Exception:
-                return None
-        return data
+                if self.running:
+                    print(f"[Server] Lỗi accept: {e}")
 
     def handle_client(self, client_socket, client_address):
         connection_id = f"{client_address[0]}:{client_address[1]}"
-        self.clients.append(connection_id)
+        self.clients[connection_id] = client_socket
+        self.reaper.track(connection_id, lambda: close_reading(client_socket))
+        
+        state = ConnectionState()
+        reader = FrameReader(client_socket, self.max_frame_size)
+        send_lock = threading.Lock()
+        inflight = threading.BoundedSemaphore(self.pipeline_max_inflight)
         
         try:
-            client_socket.settimeout(300.0)
+            configure_socket(client_socket)
+            client_socket.settimeout(SERVER_CONFIG['idle_timeout'])
             while self.running:
-                # 1. Đọc header (4 bytes độ dài)
-                length_data = self._recv_n_bytes(client_socket, 4)
-                if not length_data: break
-                
-                length = struct.unpack('!I', length_data)[0]
-                
-                # 2. Đọc body (JSON payload)
-                body_data = self._recv_n_bytes(client_socket, length)
-                if not body_data: break
-                
+                # 1. Đọc frame: header (v2: 4 bytes độ dài, v3: + request_id + flags) + body
                 try:
-                    request = json.loads(body_data.decode('utf-8'))
-                    command = request.get('command')
-                    
-                    # FIX: Session ID Priority
-                    session_id = request.get('session_id')
-                    if session_id:
-                        client_id = session_id
-                    else:
-                        client_id = connection_id
-                        print(f"[TCP] ⚠️ Client {connection_id} missing SessionID (Old Client?)")
-
-                    print(f"[TCP] {client_id} -> {command}")
-                    
-                    # Gọi process_command với client_id chuẩn
-                    response = self.process_command(command, request, client_id)
-                    
-                    # 3. Gửi response (Header + Body)
-                    resp_bytes = json.dumps(response).encode('utf-8')
-                    header = struct.pack('!I', len(resp_bytes))
-                    
-                    client_socket.sendall(header)
-                    client_socket.sendall(resp_bytes)
-                    
-                except json.JSONDecodeError:
-                    print(f"[TCP] Lỗi JSON từ {connection_id}")
+                    frame = reader.read_frame(state.version)
+                except OSError:
+                    break  # Idle timeout / client reset
+                if frame is None: break
+                request_id, flags, body_data = frame
+                received = time.monotonic()  # Mốc tính hạn chót (budget_ms) của request
+                self.reaper.touch(connection_id)
+                
+                # 2. Gửi response (Header + Body trong 1 lần ghi)
+                if state.version == PROTOCOL_V2:
+                    response = self.handle_frame(body_data, connection_id, state, flags, received)
+                    if response:
+                        send_frame(client_socket, response[0], PROTOCOL_V2)
+                    self.reaper.touch(connection_id)
                     continue
+                
+                # v3: xử lý song song trên pool, trả lời khi xong (có thể không theo thứ tự)
+                inflight.acquire()
+                self.pipeline_executor.submit(
+                    self._handle_pipelined, client_socket, send_lock, inflight,
+                    body_data, request_id, flags, connection_id, state, received
+                )
                     
         except Exception as e:
-            print(f"[TCP] Lỗi {connection_id}: {e}")
+            log.error('Lỗi {connection}: {error}', connection=connection_id, error=e)
         finally:
-            if connection_id in self.clients: self.clients.remove(connection_id)
+            # Request pipelined của kết nối gửi xong response rồi mới đóng socket (drain khi dừng server)
+            deadline = time.monotonic() + SERVER_CONFIG['shutdown_timeout']
+            for _ in range(self.pipeline_max_inflight):
+                if not inflight.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                    break
+            self.clients.pop(connection_id, None)
+            self.reaper.forget(connection_id)
             client_socket.close()
-            print(f"[TCP] Ngắt kết nối: {connection_id}")
+            log.info('Ngắt kết nối: {connection}', connection=connection_id)
+    
+    def _handle_pipelined(self, client_socket, send_lock, inflight, body_data, request_id, request_flags,
+                          connection_id, state, received=None):
+        """Worker: xử lý 1 request v3 rồi gửi response kèm request_id"""
+        try:
+            body, flags = self.handle_frame(body_data, connection_id, state, request_flags, received)
+            with send_lock:
+                send_frame(client_socket, body, PROTOCOL_V3, request_id, flags)
+            self.reaper.touch(connection_id)
+        except OSError:
+            pass  # Client đã ngắt kết nối
+        except Exception as e:
+            log.error('Lỗi xử lý pipelined {connection}: {error}', connection=connection_id, error=e)
+        finally:
+            inflight.release()
+    
+    def handle_frame(self, body_data: bytes, connection_id: str, state: ConnectionState, flags: int = 0,
+                     received: float = None):
+        """Xử lý 1 frame request, trả về (body response, flags) - chưa có header.
+        
+        Dùng chung cho mode 'thread' (handle_client) và mode 'selector' (worker pool).
+        Body lỗi: v2 trả None (không trả lời như trước), v3 trả lỗi để client không phải đợi.
+        received: lúc nhận frame (time.monotonic) - hạn chót = received + budget_ms của request.
+        Request / response mã hóa + nén theo thương lượng của kết nối (frame_codec.py).
+        Request mang traceparent: span 'tcp <lệnh>' tính từ lúc nhận frame (con: chờ hàng đợi, giải mã).
+        """
+        decode_start = time.monotonic()
+        try:
+            request = self.frame_codec.decode_request(body_data, flags, state)
+        except (ValueError, UnicodeDecodeError):
+            log.warning('Lỗi JSON từ {connection}', connection=connection_id)
+            if state.version == PROTOCOL_V2:
+                return None
+            return self.frame_codec.invalid_request(state)
+        decoded = time.monotonic()
+        command = request.get('command')
+        
+        if command == HELLO_COMMAND:
+            return self.frame_codec.hello(request, state)
+        if command == PING_COMMAND:
+            return self.frame_codec.pong(state)
+        
+        with tracing.start_trace(f'tcp {command}', request.get(TRACE_FIELD), start=received or decode_start,
+                                 connection=connection_id) as trace:
+            if received is not None:
+                trace.child('tcp.queue', received, decode_start)
+            trace.child('decode', decode_start, decoded, bytes=len(body_data))
+            return self._handle_request(command, request, connection_id, state, received)
     
-    def process_command(self, command: str, request: dict, client_id: str) -> dict:
-        if command == 'GET_CITIES':
-            return self.route_manager.get_all_cities()
-        elif command == 'SEARCH_ROUTES':
-            return {'routes': self.route_manager.search_routes(request.get('from_city'), request.get('to_city'))}
-        elif command == 'GET_DATES':
-            return {'dates': self.trip_manager.get_available_dates(request.get('route_id'))}
-        elif command == 'SEARCH_TRIPS':
-            trips = self.trip_manager.search_trips(request.get('route_id'), request.get('date'))
-            for trip in trips:
-                # OPTIMIZATION: Không init ghế ở đây để tránh IO disk chậm
-                # Nếu chưa init -> coi như còn trống tất cả
-                if trip['id'] in self.seat_manager.seats_data:
-                    trip['available_seats'] = self.seat_manager.get_available_seats_count(trip['id'])
-                else:
-                    trip['available_seats'] = trip.get('total_seats', 40)
-            return {'trips': trips}
-        elif command == 'GET_SEATS':
-            return {'seats': self.seat_manager.get_trip_seats(request.get('trip_id'))}
-        elif command == 'SELECT_SEAT':
-            return self.seat_manager.select_seat(request.get('trip_id'), request.get('seat_id'), client_id)
-        elif command == 'UNSELECT_SEAT':
-            return self.seat_manager.unselect_seat(request.get('trip_id'), request.get('seat_id'), client_id)
-        elif command == 'BOOK_SEATS':
-            import time
-            t_start = time.time()
-            seat_res = self.seat_manager.book_seats(request.get('trip_id'), request.get('seat_ids', []), client_id)
-            
-            if seat_res['success']:
-                # Idempotency check
-                if seat_res.get('action') == 'existing':
-                    print(f"[Profiling] Book Existing took {time.time()-t_start:.4f}s")
-                    return seat_res
+    def _handle_request(self, command: str, request: dict, connection_id: str, state: ConnectionState,
+                        received: float = None):
+        """Request đã giải mã (không phải HELLO / PING) -> (body response, flags)"""
+        # FIX: Session ID Priority
+        session_id = request.get('session_id')
+        if session_id:
+            client_id = session_id
+        else:
+            client_id = connection_id
+            log.warning('⚠️ Client {connection} missing SessionID (Old Client?)', connection=connection_id)
 
-                # Lấy thông tin trip và route để gửi email
-                trip_id = request.get('trip_id')
-                trip_info = self.trip_manager.get_trip_by_id(trip_id)
-                route_info = None
-                if trip_info:
-                    route_info = self.route_manager.get_route_by_id(trip_info.get('route_id'))
-                
-                booking_res = self.booking_manager.create_booking(
-                    trip_id,
-                    request.get('seat_ids'),
-                    request.get('customer_info'),
-                    trip_info=trip_info,
-                    route_info=route_info
-                )
-                print(f"[Profiling] Book New took {time.time()-t_start:.4f}s")
-                return booking_res
-                
-            return seat_res
-        elif command == 'UPLOAD_FILE':
-            return self.file_handler.save_file(request.get('filename'), bytes.fromhex(request.get('file_data')), request.get('booking_id'))
-        elif command == 'GET_TRIP_INFO':
-            trip_info = self.trip_manager.get_trip_by_id(request.get('trip_id'))
-            if trip_info:
-                return {'success': True, 'trip': trip_info}
-            return {'success': False, 'error': 'Trip not found'}
-        return {'error': f'Unknown command: {command}'}
+        log.info('{client} -> {command}', client=client_id, command=command)
+        
+        # Vượt token bucket của session / kết nối: từ chối trước cả cache và handler
+        if not self.rate_limiter.admit(command, client_id, connection_id, request.get(END_USER_FIELD)):
+            return self.frame_codec.rate_limited(state)
+        
+        # Lệnh catalog: trả thẳng bytes đã mã hóa nếu có trong cache
+        cache_key, cached = self.frame_codec.lookup(command, request, state)
+        if cached:
+            return cached
+        
+        # Gọi process_command với client_id chuẩn (quá hạn chót -> registry trả EXPIRED, không chạy handler);
+        # lệnh quản trị (PROFILE / MEMORY) kiểm tra địa chỉ kết nối qua profiler.caller
+        with profiler.caller(connection_id):
+            response = self.process_command(command, request, client_id, deadlines.from_request(request, received))
+        
+        return self.frame_codec.encode_response(command, response, state, cache_key)
+    
+    def process_command(self, command: str, request: dict, client_id: str, deadline: float = None) -> dict:
+        """Process commands qua command registry dùng chung"""
+        return self.commands.dispatch(command, request, client_id, deadline=deadline)
     
     def udp_broadcast_loop(self):
         while self.running:
             try:
                 all_seats = self.seat_manager.seats_data
                 if all_seats:
-                    # Giới hạn 50 chuyến
-                    limited = dict(list(all_seats.items())[:50])
-                    msg = {'type': 'SEAT_UPDATE', 'timestamp': time.time(), 'seats_data': limited}
-                    data = json.dumps(msg).encode('utf-8')
+                    # Giới hạn 50 chuyến; JSON từng chuyến lấy từ cache, chỉ mã hóa lại chuyến có ghế đổi
+                    data = self.seat_maps.broadcast_payload(list(all_seats)[:50], time.time())
                     if len(data) < 64000:
                         self.udp_socket.sendto(data, ('<broadcast>', self.udp_port))
+                        self.udp_fanout.add(1, len(data))
                 time.sleep(2)
             except: pass
     
     def cleanup_loop(self):
         while self.running:
             self.seat_manager.cleanup_expired_locks(300)
+            self.file_handler.cleanup_expired_uploads()
             time.sleep(60)
 
-    def stop(self):
+    def idle_reap_loop(self):
+        """Mode 'thread': đóng (ngừng đọc) kết nối idle -> thread của kết nối nhận EOF và tự dọn"""
+        while self.running:
+            self.reaper.reap()
+            time.sleep(self.reaper.interval)
+
+    def stop(self, timeout: float = None):
+        """Dừng có drain (graceful_shutdown.py): ngừng nhận kết nối -> xong request đang xử lý -> flush ghi nền
+
+        Mode 'selector': gọi từ thread chạy selector loop (start() / main thread).
+        """
+        if self.stopped: return
+        self.stopped = True
         self.running = False
+        timeout = SERVER_CONFIG['shutdown_timeout'] if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        inflight = self.commands.inflight
+        print(f"[Server] Đang dừng: ngừng nhận kết nối mới, đợi request đang xử lý (tối đa {timeout:g}s)...")
         try: self.tcp_socket.close()
         except: pass
+        
+        grpc_stopped = self.grpc_server.stop(timeout) if self.grpc_server is not None else None
+        if self.selector_loop is not None:
+            self.selector_loop.drain(deadline)
+        else:
+            for client_socket in list(self.clients.values()):
+                close_reading(client_socket)
+            wait_until(lambda: not self.clients, deadline)
+        if grpc_stopped is not None:
+            grpc_stopped.wait(max(0.0, deadline - time.monotonic()))
+        wait_until(lambda: not self.commands.inflight, deadline)
+        abandoned = self.commands.inflight
+        self.pipeline_executor.shutdown(wait=False)
+        
+        flushed = flush_state(self, SERVER_CONFIG['shutdown_flush_timeout'])
+        tracing.flush()
+        logger.flush()
+        self.metrics.stop_http()
         try: self.udp_socket.close()
         except: pass
+        print(f"[Server] ✅ Đã dừng: {format_report(inflight, abandoned, flushed)}")
 
 if __name__ == '__main__':
-    server = BusBookingServer()
-    try: server.start()
-    except KeyboardInterrupt: server.stop()
+    if SERVER_CONFIG['worker_processes'] > 1 or CLUSTER_CONFIG['shards']:
+        from worker_processes import serve_multiprocess
+        serve_multiprocess('tcp', SERVER_CONFIG['worker_processes'])
+    else:
+        install_signal_handlers()
+        server = BusBookingServer()
+        try: server.start()
+        except KeyboardInterrupt: server.stop()
@@ -3,61 +3,109 @@
 Chức năng:
 - Wrap TCP socket với SSL/TLS encryption
 - Hỗ trợ certificate authentication
-- Giữ nguyên protocol message framing
+- Giữ nguyên protocol message framing (v2); chấp nhận v3 sau HELLO nhưng xử lý tuần tự
+  (SSL socket không an toàn khi đọc/ghi từ nhiều thread)
 """
 
 import socket
 import ssl
 import threading
-import json
 import time
 import os
 import sys
-import struct
 
-# Thêm thư mục hiện tại vào sys.path
+# Thêm thư mục hiện tại vào sys.path (+ thư mục gốc cho module common dùng chung với client)
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, current_dir)
+sys.path.insert(1, os.path.dirname(current_dir))
 
 from route_manager import RouteManager
 from trip_manager import TripManager
 from seat_manager import SeatManager
 from booking_manager import BookingManager
+from idempotency_cache import IdempotencyCache
+from commands import build_command_registry
+from frame_codec import FrameCodec
+from rate_limiter import RateLimiter
+from metrics import FanoutCounter, ServerMetrics
+import deadlines
+import profiler
+from seat_map_cache import SeatMapCache
+from seat_authority import SeatReplica
+from cluster import check_topology
 from file_upload import FileUploadHandler
 from email_service import EmailService
-from config import SSL_CONFIG, SERVER_CONFIG, EMAIL_CONFIG
+from graceful_shutdown import close_reading, flush_state, format_report, install_signal_handlers, wait_until
+from config import SSL_CONFIG, SERVER_CONFIG, EMAIL_CONFIG, IDEMPOTENCY_CONFIG, CLUSTER_CONFIG, LOGGING_CONFIG, TRACING_CONFIG
+from common.protocol import ConnectionState, END_USER_FIELD, HELLO_COMMAND, PING_COMMAND, PROTOCOL_V2, TRACE_FIELD
+from common import logger, tracing
+from common.framing import FrameReader, configure_socket, send_frame
+
+log = logger.get('SSL TCP')
 
 
 class SSLBusBookingServer:
     """TCP Server với SSL/TLS encryption"""
     
-    def __init__(self, tcp_port=None, udp_port=None, cert_file=None, key_file=None):
+    def __init__(self, tcp_port=None, udp_port=None, cert_file=None, key_file=None, authority=None,
+                 state_dir=None):
         self.tcp_port = tcp_port or SERVER_CONFIG['tcp_port']
         self.udp_port = udp_port or SERVER_CONFIG['udp_port']
         self.host = SERVER_CONFIG['host']
+        logger.configure(**LOGGING_CONFIG)
+        tracing.configure(**TRACING_CONFIG)
         
         # SSL Configuration
         self.cert_file = cert_file or SSL_CONFIG['cert_file']
         self.key_file = key_file or SSL_CONFIG['key_file']
         
         self.data_dir = os.path.join(current_dir, 'data')
+        # Ghế / đơn / idempotency; shard của cluster dùng thư mục riêng, catalog vẫn ở data_dir
+        self.state_dir = state_dir or self.data_dir
         self.upload_dir = os.path.join(current_dir, 'uploads')
         
         self.route_manager = RouteManager(self.data_dir)
         self.trip_manager = TripManager(self.data_dir)
-        self.seat_manager = SeatManager(self.data_dir)
-        
-        # Initialize Email Service với config từ environment variables
-        self.email_service = EmailService(
-            smtp_server=EMAIL_CONFIG['smtp_server'],
-            smtp_port=EMAIL_CONFIG['smtp_port'],
-            username=EMAIL_CONFIG['username'],
-            password=EMAIL_CONFIG['password'],
-            use_tls=EMAIL_CONFIG['use_tls']
-        )
-        self.booking_manager = BookingManager(self.data_dir, email_service=self.email_service)
         self.file_handler = FileUploadHandler(self.upload_dir)
         
+        # Worker (worker_processes > 1): ghế / đơn nằm ở process authority, ở đây chỉ giữ bản sao ghế
+        self.authority = authority
+        if authority is None:
+            if self.state_dir == self.data_dir:
+                check_topology(self.data_dir)  # data/shards/ còn trạng thái cluster -> không chạy trên data/ cũ
+            self.seat_manager = SeatManager(self.state_dir)
+            
+            # Initialize Email Service với config từ environment variables
+            self.email_service = EmailService(
+                smtp_server=EMAIL_CONFIG['smtp_server'],
+                smtp_port=EMAIL_CONFIG['smtp_port'],
+                username=EMAIL_CONFIG['username'],
+                password=EMAIL_CONFIG['password'],
+                use_tls=EMAIL_CONFIG['use_tls']
+            )
+            self.booking_manager = BookingManager(self.state_dir, email_service=self.email_service)
+            self.idempotency_cache = IdempotencyCache(
+                self.state_dir,
+                max_entries=IDEMPOTENCY_CONFIG['max_entries'],
+                ttl=IDEMPOTENCY_CONFIG['ttl_seconds']
+            )
+        else:
+            self.seat_manager = SeatReplica(authority)
+            self.email_service = None
+            self.booking_manager = None
+            self.idempotency_cache = None
+        self.seat_maps = SeatMapCache(self.seat_manager)  # Seat map mã hóa sẵn theo version từng chuyến
+        
+        # Bảng dispatch lệnh dùng chung với các transport khác (TCP/SSL/Async/gRPC)
+        self.commands = build_command_registry(self)
+        if authority is not None:
+            authority.install(self.commands)
+        self.frame_codec = FrameCodec(self.commands, SERVER_CONFIG['compression_threshold'],
+                                      SERVER_CONFIG['response_cache_size'])
+        self.rate_limiter = RateLimiter(self.commands)  # Token bucket theo session / kết nối
+        self.metrics = ServerMetrics(self)  # Lệnh STATS + HTTP /metrics (METRICS_PORT)
+        self.udp_fanout = FanoutCounter()
+        
         # SSL Context
         self.ssl_context = None
         self._setup_ssl_context()
@@ -65,13 +113,17 @@ class SSLBusBookingServer:
         # TCP Socket (sẽ được wrap với SSL khi accept)
         self.tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.tcp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if authority is not None:
+            # Mọi worker bind cùng cổng, kernel chia đều kết nối mới
+            self.tcp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         
         # UDP Socket (không cần SSL)
         self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
         
         self.running = False
-        self.clients = []
+        self.stopped = False
+        self.clients = {}  # connection_id -> SSL socket (stop() ngừng đọc từng kết nối)
         
         print("="*60)
         print("HỆ THỐNG ĐẶT VÉ XE KHÁCH (SSL/TLS ENABLED)")
@@ -121,22 +173,26 @@ class SSLBusBookingServer:
         
         self.running = True
         self.tcp_socket.bind((self.host, self.tcp_port))
-        self.tcp_socket.listen(5)
+        self.tcp_socket.listen(SERVER_CONFIG['listen_backlog'])
         print(f"[SSL TCP Server] Lắng nghe trên {self.host}:{self.tcp_port} (SSL/TLS enabled)")
+        self.metrics.start_http()
         
-        threading.Thread(target=self.udp_broadcast_loop, daemon=True).start()
-        threading.Thread(target=self.cleanup_loop, daemon=True).start()
+        if self.authority is None:
+            threading.Thread(target=self.udp_broadcast_loop, daemon=True).start()
+            threading.Thread(target=self.cleanup_loop, daemon=True).start()
+        elif not self.authority.start_feed(self.seat_manager):
+            print("[Worker] ⚠️ Chưa nhận được snapshot ghế từ authority, vẫn tiếp tục")
         print("\n[SSL Server] Sẵn sàng phục vụ!\n")
         
         while self.running:
             try:
                 client_socket, addr = self.tcp_socket.accept()
-                print(f"[SSL TCP] Kết nối từ: {addr}")
+                log.info('Kết nối từ: {addr}', addr=addr)
                 
                 # Wrap socket với SSL
                 try:
                     ssl_socket = self.ssl_context.wrap_socket(client_socket, server_side=True)
-                    print(f"[SSL TCP] ✅ SSL handshake thành công với {addr}")
+                    log.info('✅ SSL handshake thành công với {addr}', addr=addr)
                     
                     # Xử lý client trong thread riêng
                     threading.Thread(
@@ -145,139 +201,98 @@ class SSLBusBookingServer:
                         daemon=True
                     ).start()
                 except ssl.SSLError as e:
-                    print(f"[SSL TCP] ❌ SSL handshake thất bại với {addr}: {e}")
+                    log.warning('❌ SSL handshake thất bại với {addr}: {error}', addr=addr, error=e)
                     client_socket.close()
                     
             except KeyboardInterrupt:
                 self.stop()
                 break
             except Exception as e:
-                print(f"[SSL Server] Lỗi accept: {e}")
-    
-    def _recv_n_bytes(self, sock, n):
-        """Đọc chính xác n bytes từ socket"""
-        data = b''
-        while len(data) < n:
-            try:
-                chunk = sock.recv(n - len(data))
-                if not chunk:
-                    return None
-                data += chunk
-            except Exception:
-                return None
-        return data
+                if self.running:
+                    print(f"[SSL Server] Lỗi accept: {e}")
     
     def handle_client(self, ssl_socket, client_address):
         """Handle SSL client connection (giống như TCP server thông thường)"""
         connection_id = f"{client_address[0]}:{client_address[1]}"
-        self.clients.append(connection_id)
+        self.clients[connection_id] = ssl_socket
+        state = ConnectionState()
+        reader = FrameReader(ssl_socket, SERVER_CONFIG['max_frame_size'])
         
         try:
-            ssl_socket.settimeout(300.0)
+            configure_socket(ssl_socket)
+            ssl_socket.settimeout(SERVER_CONFIG['idle_timeout'])
             while self.running:
-                # 1. Đọc header (4 bytes độ dài)
-                length_data = self._recv_n_bytes(ssl_socket, 4)
-                if not length_data:
-                    break
-                
-                length = struct.unpack('!I', length_data)[0]
-                
-                # 2. Đọc body (JSON payload)
-                body_data = self._recv_n_bytes(ssl_socket, length)
-                if not body_data:
+                # 1. Đọc frame: header (v2: 4 bytes độ dài, v3: + request_id + flags) + body
+                version = state.version  # HELLO đổi version sau khi đã trả lời
+                try:
+                    frame = reader.read_frame(version)
+                except OSError:
+                    break  # Idle timeout / client reset
+                if frame is None:
                     break
+                request_id, flags, body_data = frame
+                received = time.monotonic()  # Mốc tính hạn chót (budget_ms) của request
                 
                 try:
-                    request = json.loads(body_data.decode('utf-8'))
+                    request = self.frame_codec.decode_request(body_data, flags, state)
+                    decoded = time.monotonic()
                     command = request.get('command')
                     
-                    session_id = request.get('session_id')
-                    if session_id:
-                        client_id = session_id
-                    else:
-                        client_id = connection_id
+                    if command == HELLO_COMMAND:
+                        send_frame(ssl_socket, self.frame_codec.hello(request, state)[0], version)
+                        continue
+                    if command == PING_COMMAND:
+                        send_frame(ssl_socket, self.frame_codec.pong(state)[0], version)
+                        continue
                     
-                    print(f"[SSL TCP] {client_id} -> {command}")
+                    # Request mang traceparent: span 'ssl <lệnh>' từ lúc nhận frame tới khi gửi xong response
+                    with tracing.start_trace(f'ssl {command}', request.get(TRACE_FIELD), start=received,
+                                             connection=connection_id) as trace:
+                        trace.child('decode', received, decoded, bytes=len(body_data))
+                        
+                        session_id = request.get('session_id')
+                        if session_id:
+                            client_id = session_id
+                        else:
+                            client_id = connection_id
+                        
+                        log.info('{client} -> {command}', client=client_id, command=command)
+                        
+                        # Xử lý command (vượt rate limit: response từ chối mã hóa sẵn;
+                        # lệnh catalog: lấy bytes đã mã hóa từ cache nếu có)
+                        cache_key, cached = None, None
+                        if not self.rate_limiter.admit(command, client_id, connection_id, request.get(END_USER_FIELD)):
+                            cached = self.frame_codec.rate_limited(state)
+                        else:
+                            cache_key, cached = self.frame_codec.lookup(command, request, state)
+                        if cached:
+                            resp_bytes, resp_flags = cached
+                        else:
+                            with profiler.caller(connection_id):
+                                response = self.process_command(command, request, client_id,
+                                                                deadlines.from_request(request, received))
+                            resp_bytes, resp_flags = self.frame_codec.encode_response(command, response, state, cache_key)
+                        
+                        # 2. Gửi response (Header + Body trong 1 lần ghi), v3 kèm request_id + flags
+                        send_frame(ssl_socket, resp_bytes, version, request_id, resp_flags)
                     
-                    # Xử lý command
-                    response = self.process_command(command, request, client_id)
-                    
-                    # 3. Gửi response (Header + Body)
-                    resp_bytes = json.dumps(response).encode('utf-8')
-                    header = struct.pack('!I', len(resp_bytes))
-                    
-                    ssl_socket.sendall(header)
-                    ssl_socket.sendall(resp_bytes)
-                    
-                except json.JSONDecodeError:
-                    print(f"[SSL TCP] Lỗi JSON từ {connection_id}")
+                except (ValueError, UnicodeDecodeError):
+                    log.warning('Lỗi JSON từ {connection}', connection=connection_id)
+                    if version != PROTOCOL_V2:
+                        error, error_flags = self.frame_codec.invalid_request(state)
+                        send_frame(ssl_socket, error, version, request_id, error_flags)
                     continue
                     
         except Exception as e:
-            print(f"[SSL TCP] Lỗi {connection_id}: {e}")
+            log.error('Lỗi {connection}: {error}', connection=connection_id, error=e)
         finally:
-            if connection_id in self.clients:
-                self.clients.remove(connection_id)
+            self.clients.pop(connection_id, None)
             ssl_socket.close()
-            print(f"[SSL TCP] Ngắt kết nối: {connection_id}")
+            log.info('Ngắt kết nối: {connection}', connection=connection_id)
     
-    def process_command(self, command: str, request: dict, client_id: str) -> dict:
-        """Process commands (giống như TCP server thông thường)"""
-        if command == 'GET_CITIES':
-            return self.route_manager.get_all_cities()
-        elif command == 'SEARCH_ROUTES':
-            return {'routes': self.route_manager.search_routes(request.get('from_city'), request.get('to_city'))}
-        elif command == 'GET_DATES':
-            return {'dates': self.trip_manager.get_available_dates(request.get('route_id'))}
-        elif command == 'SEARCH_TRIPS':
-            trips = self.trip_manager.search_trips(request.get('route_id'), request.get('date'))
-            for trip in trips:
-                if trip['id'] in self.seat_manager.seats_data:
-                    trip['available_seats'] = self.seat_manager.get_available_seats_count(trip['id'])
-                else:
-                    trip['available_seats'] = trip.get('total_seats', 40)
-            return {'trips': trips}
-        elif command == 'GET_SEATS':
-            return {'seats': self.seat_manager.get_trip_seats(request.get('trip_id'))}
-        elif command == 'SELECT_SEAT':
-            return self.seat_manager.select_seat(request.get('trip_id'), request.get('seat_id'), client_id)
-        elif command == 'UNSELECT_SEAT':
-            return self.seat_manager.unselect_seat(request.get('trip_id'), request.get('seat_id'), client_id)
-        elif command == 'BOOK_SEATS':
-            import time
-            t_start = time.time()
-            seat_res = self.seat_manager.book_seats(request.get('trip_id'), request.get('seat_ids', []), client_id)
-            
-            if seat_res['success']:
-                if seat_res.get('action') == 'existing':
-                    print(f"[Profiling] Book Existing took {time.time()-t_start:.4f}s")
-                    return seat_res
-                
-                trip_id = request.get('trip_id')
-                trip_info = self.trip_manager.get_trip_by_id(trip_id)
-                route_info = None
-                if trip_info:
-                    route_info = self.route_manager.get_route_by_id(trip_info.get('route_id'))
-                
-                booking_res = self.booking_manager.create_booking(
-                    trip_id,
-                    request.get('seat_ids'),
-                    request.get('customer_info'),
-                    trip_info=trip_info,
-                    route_info=route_info
-                )
-                print(f"[Profiling] Book New took {time.time()-t_start:.4f}s")
-                return booking_res
-                
-            return seat_res
-        elif command == 'UPLOAD_FILE':
-            return self.file_handler.save_file(request.get('filename'), bytes.fromhex(request.get('file_data')), request.get('booking_id'))
-        elif command == 'GET_TRIP_INFO':
-            trip_info = self.trip_manager.get_trip_by_id(request.get('trip_id'))
-            if trip_info:
-                return {'success': True, 'trip': trip_info}
-            return {'success': False, 'error': 'Trip not found'}
-        return {'error': f'Unknown command: {command}'}
+    def process_command(self, command: str, request: dict, client_id: str, deadline: float = None) -> dict:
+        """Process commands qua command registry dùng chung"""
+        return self.commands.dispatch(command, request, client_id, deadline=deadline)
     
     def udp_broadcast_loop(self):
         """UDP broadcast loop (không thay đổi)"""
@@ -285,11 +300,10 @@ class SSLBusBookingServer:
             try:
                 all_seats = self.seat_manager.seats_data
                 if all_seats:
-                    limited = dict(list(all_seats.items())[:50])
-                    msg = {'type': 'SEAT_UPDATE', 'timestamp': time.time(), 'seats_data': limited}
-                    data = json.dumps(msg).encode('utf-8')
+                    data = self.seat_maps.broadcast_payload(list(all_seats)[:50], time.time())
                     if len(data) < 64000:
                         self.udp_socket.sendto(data, ('<broadcast>', self.udp_port))
+                        self.udp_fanout.add(1, len(data))
                 time.sleep(2)
             except:
                 pass
@@ -298,25 +312,51 @@ class SSLBusBookingServer:
         """Cleanup loop (không thay đổi)"""
         while self.running:
             self.seat_manager.cleanup_expired_locks(300)
+            self.file_handler.cleanup_expired_uploads()
             time.sleep(60)
     
-    def stop(self):
-        """Stop server"""
+    def stop(self, timeout: float = None):
+        """Dừng có drain (graceful_shutdown.py): ngừng nhận kết nối -> xong request đang xử lý -> flush ghi nền"""
+        if self.stopped:
+            return
+        self.stopped = True
         self.running = False
+        timeout = SERVER_CONFIG['shutdown_timeout'] if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        inflight = self.commands.inflight
+        print(f"[SSL Server] Đang dừng: ngừng nhận kết nối mới, đợi request đang xử lý (tối đa {timeout:g}s)...")
         try:
             self.tcp_socket.close()
         except:
             pass
+        
+        # Mỗi kết nối xử lý tuần tự: ngừng đọc -> thread gửi xong response hiện tại rồi tự đóng
+        for ssl_socket in list(self.clients.values()):
+            close_reading(ssl_socket)
+        wait_until(lambda: not self.clients, deadline)
+        wait_until(lambda: not self.commands.inflight, deadline)
+        abandoned = self.commands.inflight
+        
+        flushed = flush_state(self, SERVER_CONFIG['shutdown_flush_timeout'])
+        tracing.flush()
+        logger.flush()
+        self.metrics.stop_http()
         try:
             self.udp_socket.close()
         except:
             pass
+        print(f"[SSL Server] ✅ Đã dừng: {format_report(inflight, abandoned, flushed)}")
 
 
 if __name__ == '__main__':
-    server = SSLBusBookingServer()
-    try:
-        server.start()
-    except KeyboardInterrupt:
-        server.stop()
+    if SERVER_CONFIG['worker_processes'] > 1 or CLUSTER_CONFIG['shards']:
+        from worker_processes import serve_multiprocess
+        serve_multiprocess('ssl', SERVER_CONFIG['worker_processes'])
+    else:
+        install_signal_handlers()
+        server = SSLBusBookingServer()
+        try:
+            server.start()
+        except KeyboardInterrupt:
+            server.stop()
 
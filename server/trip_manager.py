@@ -17,6 +17,7 @@ class TripManager:
         self.data_dir = data_dir
         self.trips_file = os.path.join(data_dir, 'trips.json')
         self.trips: List[Dict] = []
+        self.version = 0  # Tăng mỗi lần load lại -> cache response catalog hết hạn
         self.load_trips()
     
     def load_trips(self):
@@ -31,6 +32,7 @@ class TripManager:
         except json.JSONDecodeError as e:
             print(f"[TripManager] Lỗi đọc file JSON: {e}")
             self.trips = []
+        self.version += 1
     
     def get_all_trips(self) -> List[Dict]:
         """Lấy tất cả chuyến"""
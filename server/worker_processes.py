@@ -0,0 +1,133 @@
+"""Worker Processes - Chạy N process worker cùng cổng (SO_REUSEPORT) + 1 process authority
+
+Chức năng:
+- Process chính: tạo server đầy đủ nhưng không lắng nghe client, làm authority (seat_authority.py):
+  giữ ghế / đơn, chạy UDP broadcast và dọn ghế hết hạn (1 lần cho cả hệ thống)
+- N worker (spawn): server cùng loại (TCP hoặc SSL) với SeatReplica, socket lắng nghe bật SO_REUSEPORT
+  -> kernel chia kết nối mới cho các worker; GRPC_ENABLED=true thì mỗi worker bind chung cổng gRPC
+- Worker chết -> tự spawn lại; process chính dừng (Ctrl+C / SIGTERM) -> dừng mọi worker
+  (SIGTERM tới worker = dừng có drain, xem graceful_shutdown.py), sau đó authority flush ghi nền
+- Worker tự thoát khi process chính mất (không để lại process mồ côi giữ cổng)
+- CLUSTER_SHARDS có giá trị: không có authority cục bộ, worker là front end của cluster (cluster.py)
+
+Chỉ chạy trên hệ điều hành có SO_REUSEPORT + Unix socket (Linux, BSD, macOS); nơi khác chạy 1 process.
+
+Ví dụ:
+    WORKER_PROCESSES=4 python server/server.py
+"""
+
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from config import CLUSTER_CONFIG, SERVER_CONFIG
+from graceful_shutdown import install_signal_handlers
+from seat_authority import AuthorityClient, SeatAuthority
+
+
+def _create_server(transport: str, tcp_port: int, udp_port: int, authority: AuthorityClient = None):
+    if transport == 'ssl':
+        from ssl_server import SSLBusBookingServer
+        return SSLBusBookingServer(tcp_port=tcp_port, udp_port=udp_port, authority=authority)
+    from server import BusBookingServer
+    return BusBookingServer(tcp_port=tcp_port, udp_port=udp_port, authority=authority)
+
+
+def exit_with_parent():
+    """Process cha chết (kể cả bị kill -9) -> process hiện tại thoát theo"""
+    parent = multiprocessing.parent_process()
+    if parent is not None:
+        threading.Thread(target=lambda: (parent.join(), os._exit(0)), daemon=True).start()
+
+
+def _worker_main(transport: str, addresses: list, tcp_port: int, udp_port: int, index: int):
+    """Entry point của process worker"""
+    from cluster import authority_for
+    exit_with_parent()
+    install_signal_handlers()
+
+    server = _create_server(transport, tcp_port, udp_port, authority_for(addresses))
+    print(f"[Worker {index}] pid {os.getpid()} phục vụ cổng {tcp_port}")
+    try:
+        server.start()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+def serve_multiprocess(transport: str = 'tcp', workers: int = None, tcp_port: int = None, udp_port: int = None,
+                       shards: list = None):
+    """Chạy `workers` process worker (block đến khi dừng)
+
+    shards rỗng: authority trong process hiện tại; có shards (mặc định CLUSTER_SHARDS): worker chuyển
+    lệnh tới shard sở hữu chuyến, process hiện tại chỉ giám sát worker.
+    """
+    workers = workers or SERVER_CONFIG['worker_processes']
+    tcp_port = tcp_port or SERVER_CONFIG['tcp_port']
+    udp_port = udp_port or SERVER_CONFIG['udp_port']
+    shards = CLUSTER_CONFIG['shards'] if shards is None else shards
+
+    if not hasattr(socket, 'SO_REUSEPORT') or not hasattr(socket, 'AF_UNIX'):
+        if shards:
+            print("[Workers] ❌ Front end của cluster cần SO_REUSEPORT (Linux, BSD, macOS)")
+            return
+        print("[Workers] ⚠️ Hệ điều hành không hỗ trợ SO_REUSEPORT / Unix socket, chạy 1 process")
+        server = _create_server(transport, tcp_port, udp_port)
+        try:
+            server.start()
+        except KeyboardInterrupt:
+            server.stop()
+        return
+
+    app = authority = None
+    if shards:
+        addresses = shards
+    else:
+        addresses = [SERVER_CONFIG['authority_socket'] or os.path.join(
+            tempfile.gettempdir(), f'bus_booking_authority_{tcp_port}.sock')]
+        app = _create_server(transport, tcp_port, udp_port)
+        authority = SeatAuthority(app, addresses[0])
+        authority.start()
+        app.running = True
+        threading.Thread(target=app.udp_broadcast_loop, daemon=True).start()
+        threading.Thread(target=app.cleanup_loop, daemon=True).start()
+
+    # spawn: process chính đã có thread (executor ghi disk, authority) -> không fork
+    context = multiprocessing.get_context('spawn')
+
+    def spawn(index: int):
+        process = context.Process(target=_worker_main, args=(transport, addresses, tcp_port, udp_port, index),
+                                  name=f'worker-{index}', daemon=True)
+        process.start()
+        return process
+
+    processes = [spawn(i) for i in range(workers)]
+    if shards:
+        print(f"[Workers] ✅ {workers} front end ({transport}) trên cổng {tcp_port}, cluster {len(shards)} shard")
+    else:
+        print(f"[Workers] ✅ {workers} worker ({transport}) trên cổng {tcp_port}, authority pid {os.getpid()}")
+
+    # SIGTERM -> SystemExit -> finally dừng worker (mặc định SIGTERM giết process chính, bỏ lại worker)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        while True:
+            time.sleep(1)
+            for i, process in enumerate(processes):
+                if not process.is_alive():
+                    print(f"[Workers] ⚠️ Worker {i} (pid {process.pid}) dừng với mã {process.exitcode}, khởi động lại")
+                    processes[i] = spawn(i)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("[Workers] Đang dừng các worker...")
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join(SERVER_CONFIG['shutdown_timeout'] + 5)
+        if authority is not None:
+            authority.stop()
+            app.stop()
@@ -0,0 +1,221 @@
+"""Trace Report - In các trace chậm nhất từ file span JSONL (common/tracing.py)
+
+Bật tracing ở cả client và server (TRACING_ENABLED=true), chạy tải, rồi:
+    python trace_report.py slowest                       # đọc client/traces, server/traces, traces/
+    python trace_report.py slowest --name "POST /api/book" --top 5
+    python trace_report.py slowest --trace <trace_id>    # trace ID lấy từ header X-Trace-Id
+
+Mỗi trace in cây span (offset từ đầu trace, thời gian, service) + bảng thời gian tự thân theo
+(service, tên span) - thời gian span trừ phần nằm trong span con: cho biết thời gian nằm ở Flask, NetworkHandler,
+hàng đợi TCP, chờ slot scheduler, lock ghế, BookingManager hay ghi disk.
+
+Collector OpenTelemetry tại chỗ (OTLP/HTTP JSON), cho nhiều process / máy gửi span về 1 file:
+    python trace_report.py collect --port 4318 --out traces/collector.jsonl
+    TRACE_COLLECTOR_URL=http://<host>:4318/v1/traces python server/server.py
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from common.tracing import from_otlp
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_FILES = [os.path.join(ROOT_DIR, 'client', 'traces', '*.jsonl'),
+                 os.path.join(ROOT_DIR, 'server', 'traces', '*.jsonl'),
+                 os.path.join(ROOT_DIR, 'traces', '*.jsonl')]
+
+
+def load_spans(patterns):
+    """Đọc span từ các file / glob; dòng hỏng (file đang được ghi dở) bị bỏ qua"""
+    spans = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)) or ([pattern] if os.path.isfile(pattern) else []):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        spans.append(json.loads(line))
+                    except ValueError:
+                        continue
+    return spans
+
+
+class Trace:
+    def __init__(self, trace_id: str, spans: list):
+        self.trace_id = trace_id
+        self.spans = sorted(spans, key=lambda span: span['start'])
+        ids = {span['span_id'] for span in spans}
+        self.children = defaultdict(list)
+        self.roots = []
+        for span in self.spans:
+            if span.get('parent_id') in ids:
+                self.children[span['parent_id']].append(span)
+            else:
+                self.roots.append(span)
+        self.start = self.spans[0]['start']
+        # Trace đủ (có span gốc không cha, vd route Flask): thời gian của span gốc;
+        # thiếu phần client (chỉ có file server): từ span đầu tới span cuối
+        complete = [span for span in self.roots if not span.get('parent_id')]
+        if complete:
+            self.root = complete[0]
+            self.duration = self.root['duration_ms']
+        else:
+            self.root = self.roots[0]
+            self.duration = max(_end(span) for span in self.spans) * 1000 - self.start * 1000
+
+    def self_times(self) -> dict:
+        """(service, tên span) -> tổng thời gian tự thân (ms): thời gian span trừ phần giao với span con"""
+        totals = defaultdict(float)
+        for span in self.spans:
+            covered = sum(_overlap(span, child) for child in self.children[span['span_id']])
+            totals[span.get('service'), span['name']] += max(0.0, span['duration_ms'] - covered)
+        return totals
+
+
+def _end(span) -> float:
+    return span['start'] + span['duration_ms'] / 1000
+
+
+def _overlap(parent, child) -> float:
+    return max(0.0, min(_end(parent), _end(child)) - max(parent['start'], child['start'])) * 1000
+
+
+def _format_attrs(attrs: dict) -> str:
+    return ' '.join(f'{key}={value}' for key, value in attrs.items())
+
+
+def print_trace(trace: Trace):
+    started = datetime.fromtimestamp(trace.start).strftime('%H:%M:%S.%f')[:-3]
+    print(f"\n{trace.duration:9.1f} ms  {trace.root['name']}  trace={trace.trace_id}  ({started}, "
+          f"{len(trace.spans)} span)")
+
+    def walk(span, depth: int):
+        offset = (span['start'] - trace.start) * 1000
+        print(f"  {offset:+9.1f} {span['duration_ms']:9.2f} ms  {'  ' * depth}{span['name']:<{max(8, 32 - 2 * depth)}}"
+              f" [{span.get('service')}:{span.get('pid')}] {_format_attrs(span.get('attrs') or {})}")
+        for child in trace.children[span['span_id']]:
+            walk(child, depth + 1)
+
+    for root in trace.roots:
+        walk(root, 0)
+
+
+def slowest(args):
+    spans = load_spans(args.files or DEFAULT_FILES)
+    if not spans:
+        print(f"[Trace] Không có span nào trong {', '.join(args.files or DEFAULT_FILES)}")
+        print("[Trace] Bật tracing: TRACING_ENABLED=true cho cả client và server")
+        return 1
+
+    grouped = defaultdict(list)
+    for span in spans:
+        grouped[span['trace_id']].append(span)
+    traces = [Trace(trace_id, group) for trace_id, group in grouped.items()
+              if args.trace is None or trace_id.startswith(args.trace)]
+    if args.name:
+        traces = [trace for trace in traces if args.name in trace.root['name']]
+    if args.since:
+        cutoff = time.time() - args.since * 60
+        traces = [trace for trace in traces if trace.start >= cutoff]
+    traces.sort(key=lambda trace: trace.duration, reverse=True)
+    top = traces[:args.top]
+
+    durations = sorted(trace.duration for trace in traces)
+    if durations:
+        print(f"[Trace] {len(traces)} trace, p50 {durations[len(durations) // 2]:.1f} ms, "
+              f"p99 {durations[min(len(durations) - 1, len(durations) * 99 // 100)]:.1f} ms, "
+              f"max {durations[-1]:.1f} ms")
+    for trace in top:
+        print_trace(trace)
+
+    if top:
+        totals = defaultdict(float)
+        for trace in top:
+            for name, value in trace.self_times().items():
+                totals[name] += value
+        grand = sum(totals.values()) or 1.0
+        print(f"\nThời gian tự thân theo span ({len(top)} trace chậm nhất):")
+        for (service, name), value in sorted(totals.items(), key=lambda item: item[1], reverse=True)[:args.breakdown]:
+            print(f"  {service:<14}{name:<36}{value / len(top):>10.2f} ms/trace {value / grand:>7.1%}")
+    return 0
+
+
+class _CollectorHandler(BaseHTTPRequestHandler):
+    """POST /v1/traces (OTLP/HTTP JSON) -> nối span vào file JSONL"""
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/v1/traces':
+            self.send_error(404)
+            return
+        if 'json' not in self.headers.get('Content-Type', ''):
+            self.send_error(415, 'Chỉ hỗ trợ OTLP/HTTP JSON (Content-Type: application/json)')
+            return
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            spans = from_otlp(body)
+        except (ValueError, KeyError, TypeError) as e:
+            self.send_error(400, str(e))
+            return
+        lines = ''.join(json.dumps(span, ensure_ascii=False) + '\n' for span in spans)
+        with self.server.write_lock:
+            with open(self.server.out, 'a', encoding='utf-8') as f:
+                f.write(lines)
+        self.server.received += len(spans)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, format, *args):
+        pass
+
+
+def collect(args):
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    server = ThreadingHTTPServer((args.host, args.port), _CollectorHandler)
+    server.out = args.out
+    server.write_lock = threading.Lock()
+    server.received = 0
+    print(f"[Trace] Collector OTLP/HTTP JSON: http://{args.host}:{args.port}/v1/traces -> {args.out}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"[Trace] Đã nhận {server.received} span")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='mode', required=True)
+
+    report = commands.add_parser('slowest', help='In các trace chậm nhất')
+    report.add_argument('files', nargs='*', help='File / glob JSONL (mặc định: client/traces, server/traces, traces/)')
+    report.add_argument('--top', type=int, default=10)
+    report.add_argument('--name', help='Chỉ trace có span gốc chứa chuỗi này, vd "POST /api/book"')
+    report.add_argument('--trace', help='Chỉ trace có ID bắt đầu bằng chuỗi này')
+    report.add_argument('--since', type=float, help='Chỉ trace trong N phút gần nhất')
+    report.add_argument('--breakdown', type=int, default=15, help='Số dòng bảng thời gian tự thân')
+    report.set_defaults(run=slowest)
+
+    collector = commands.add_parser('collect', help='Collector OTLP/HTTP JSON tại chỗ')
+    collector.add_argument('--host', default='127.0.0.1')
+    collector.add_argument('--port', type=int, default=4318)
+    collector.add_argument('--out', default=os.path.join(ROOT_DIR, 'traces', 'collector.jsonl'))
+    collector.set_defaults(run=collect)
+
+    args = parser.parse_args()
+    return args.run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())